@@ -6,88 +6,233 @@
 
 #include "../h/beamform.h" 
 #include "../h/error.h"
+#include "../h/simd.h"
 
 #include <string.h>
 #include <stdlib.h>
 
+/*
+ *  Everything that is needed to beamform one line of an image. 
+ *  Passed to the worker threads by beamform_image_mt().
+ */
+typedef struct{
+   TFocusLineCollection *flc;
+   TApoLineCollection *alc;
+   TSysParams *sys;
+   double time;           /* Time of the first sample                   */
+   void **rf_data;        /* The RF data, one pointer per channel        */
+   ui32 no_samples;       /* Number of samples per channel               */
+   ui32 pixel_element;    /* Transmit element for pixel based focusing   */
+   TTransmit *tx;         /* Transmitted wave (STA, plane waves), or NULL */
+   TTransmit point;       /* 'tx' for a transmit element or position     */
+   ui32 use_apo;          /* Whether to call the apodizing routines      */
+   ui32 out_start;        /* First output sample of every line           */
+   ui32 out_count;        /* Number of output samples, see window_end()  */
+   TFilterBank *fb;       /* Filter bank interpolation, or NULL (linear) */
+   TThreadPool *pool;     /* The pool running the job                    */
+   TDelayScratch *scratch;/* One per thread of 'pool'                    */
+   ui32 failed;           /* Set by a task that failed, see dynamic_tables() */
+   double **bf_lines;     /* The output lines                            */
+}TBeamformJob;
+
+
+/*
+ *  Several frames beamformed with the same settings. Task 'i' of the
+ *  thread pool is line 'i % no_lines' of frame 'i / no_lines'.
+ */
+typedef struct{
+   TBeamformJob *frames;  /* One job per frame                          */
+   ui32 no_lines;         /* Number of lines per frame                  */
+   TParallelFunc line_kernel; /* The line dispatcher                    */
+}TFramesJob;
+
+
+/*
+ *  One image beamformed with several speeds of sound. Every speed has
+ *  its own system parameters, and copies of the focus time lines with
+ *  their own delays and dynamic tables. Task 'i' of the thread pool is
+ *  line 'i % no_lines' of speed 'first + i / no_lines'.
+ */
+typedef struct{
+   TFocusLineCollection *flc; /* The focusing set up by the user        */
+   TFocusLineCollection *speed_flc; /* Focusing per speed               */
+   TSysParams *speed_sys; /* System parameters per speed                */
+   TBeamformJob *frames;  /* One job per speed                          */
+   double **paths;        /* focus_path_lengths() or dynamic_path_terms()
+                             per line, or NULL                          */
+   ui32 no_lines;         /* Number of lines per image                  */
+   ui32 no_samples;       /* Number of samples per channel              */
+   ui32 first;            /* First speed of the present run             */
+}TSpeedsJob;
+
+
+/*
+ *  Synthetic transmit aperture. All emissions are beamformed with the
+ *  same settings, and task 'i' of the thread pool sums line 'i' of all
+ *  of them into the high resolution image.
+ */
+typedef struct{
+   TBeamformJob *emissions;  /* One job per emission                    */
+   ui32 no_emissions;     /* Number of emissions                        */
+   ui32 *elements;        /* Transmit element per emission, or NULL     */
+   TApoLineCollection *salc; /* Sum apodization                         */
+   TParallelFunc line_kernel; /* The line dispatcher                    */
+   double **lo_res;       /* Scratch line per task, shared by the jobs  */
+   double **hi_res;       /* The output lines                           */
+}TStaJob;
+
+
+/*
+ *   Fixed point arithmetic for the BFT_ACC_FIXED accumulator. The
+ *   interpolation and apodization coefficients are rounded to 
+ *   BFT_FIXED_SHIFT fractional bits. The apodization values must be
+ *   in the range (-2, 2).
+ */
+#define BFT_FIXED_SHIFT  14
+#define BFT_FIXED_ONE    (1 << BFT_FIXED_SHIFT)
+#define FIXED(x)         ((si32)floor((x)*BFT_FIXED_ONE + 0.5))
+
+
 /*********************************************************************
- * FUNCTION  : beamform_line_times(ftl, sys, time, rf_data, no_samples )
- * ABSTRACT  : beamform one line, which has multiple focal points in
- *             one line.  The number of output samples is equal to 
- *             the number of samples recorded by the individual elements
- * ARGUMENTS : ftl - Pointer to Focus Time Line
- *             sys - Pointer to System Paramaters
- *             time - The receive time of the first sample
- *             rf_data - 2D array with data. The number of columns is 
- *                       equal to the number of elements of the 
- *                       transducer, and the number of rows is equal to 
- *                       the number of samples.
- *             no_samples - The number of samples in one recorded, and
- *                          respectively beamformed scan line.
- * RETURNS  : The function allocates memory for the beamformed scan 
- *            line and returns the pointer to it.
+ * FUNCTION  : fixed_weights()
+ * ABSTRACT  : The coefficients of a focal or apodization zone, 
+ *             converted to fixed point once per zone.
+ * ARGUMENTS : w - Where to store the 'n' weights
+ *             x - The coefficients
+ * RETURNS   : w
  *********************************************************************/
-
-double* beamform_line_times(TFocusTimeLine *ftl, TSysParams* sys,
-                        double time, double **rf_data, ui32 no_samples) 
+static si32* fixed_weights(si32 *w, const float *x, ui32 n)
 {
-  double *bf_line;
-  ui32 os;         /*  Index of output sample       */
-  ui32 o_abs_s;    /*  Output absolut index         */
-  ui32 is1;        /*  Index of input sample1       */
-  si32 *d;         /*  Pointer to the delays        */
-  double *a;       /*  Coefficient for linear interpolation */
-  double A;        /*  One apodization value        */
-  ui32 id;         /*  Index of delay               */
-  ui32 ind;        /*  Index of next delay          */
-  ui32 no_elements;/*  Number of XDC elements       */
-  ui32 ic;         /*  Index of channel             */
-    
-  bf_line = (double *) malloc(no_samples * sizeof(double));
-  o_abs_s = (ui32)floor(time * sys->fs);
-  id = 0;
-  ind = id + 1;
-  no_elements = ftl->xdc->no_elements;
-  
-  /*
-   *   Find the first useful set of delays for beamforming. 
-   *   This is the set with the biggest starting time
-   *   which  is less than 'time'
-   */  
-  while( (ftl->delay[ind].time < o_abs_s)) {  ind ++; id ++;}
-  
-  d = ftl->delay[id].d;
-  a = ftl->delay[id].a;
+  ui32 i;
 
-  /*
-   *   Beamdorm the output line one sample at a time. 
-   */    
-  for (os = 0; os < no_samples; o_abs_s++, os ++)
-  {  
-     bf_line[os] = 0;
-     if (o_abs_s > ftl->delay[ind].time) 
-     {
-        ind ++; id ++;
-        d = ftl->delay[id].d;
-        a = ftl->delay[id].a;
-     }
+  for (i = 0; i < n; i ++)
+     w[i] = FIXED(x[i]);
+  return w;
+}
 
-     for (ic = 0; ic < no_elements; ic ++ )
-       {  
-          is1  = os - d[ic];
-          if (is1 < no_samples)
-          {
-             A = a[ic];
-             bf_line[os] +=  (double)rf_data[ic][is1] * (1-A)
-                           + (double)rf_data[ic][is1-1] * A;
-          }
-       }  
-  }
 
-  return bf_line;
+/*********************************************************************
+ * FUNCTION  : window_end()
+ * RETURNS   : The end of the window of 'out_count' output samples from
+ *             'out_start', clipped to a line with 'len' samples. 
+ *             (ui32)-1 for 'out_count' means up to the end of the line.
+ *********************************************************************/
+static ui32 window_end(ui32 out_start, ui32 out_count, ui32 len)
+{
+  if (out_start > len) return len;
+  if (out_count > len - out_start) return len;
+  return out_start + out_count;
 }
 
 
+/*
+ *   Instantiate the line beamforming kernels. The double precision
+ *   kernels for double samples keep their original names, all other
+ *   combinations are private to this file and are selected by 
+ *   beamform_image_typed(). With a double accumulator, the channels
+ *   are summed by the rows of simd.h for every type of samples.
+ */
+#define WEIGHT_T         float
+#define WEIGHT(x)        (x)
+#define ZONE_WEIGHTS(w,x,n)  ((void)(n), (x))     /* As they are, w unused */
+
+#define ACC_T            double
+#define KERNEL_SCOPE
+#define INTERP(s1,s2,A)  ((double)(s1)*(1-(double)(A)) + (double)(s2)*(double)(A))
+#define APODIZE(v,apo)   ((v)*(double)(apo))
+#define FROM_DOUBLE(v)   (v)
+#define SIMD_ROWS        1
+
+#define RF_T             double
+#define KERNEL(name)     name
+#define TIMES_ROW        times_row
+#define DYNAMIC_ROW      dynamic_row
+#include "beamform_lines.inc"
+#undef RF_T
+#undef KERNEL
+#undef TIMES_ROW
+#undef DYNAMIC_ROW
+#undef KERNEL_SCOPE
+
+#define KERNEL_SCOPE     static
+
+#define RF_T             float
+#define KERNEL(name)     name##_f32
+#define TIMES_ROW        times_row_f32
+#define DYNAMIC_ROW      dynamic_row_f32
+#include "beamform_lines.inc"
+#undef RF_T
+#undef KERNEL
+#undef TIMES_ROW
+#undef DYNAMIC_ROW
+
+#define RF_T             si16
+#define KERNEL(name)     name##_i16
+#define TIMES_ROW        times_row_i16
+#define DYNAMIC_ROW      dynamic_row_i16
+#include "beamform_lines.inc"
+#undef RF_T
+#undef KERNEL
+#undef TIMES_ROW
+#undef DYNAMIC_ROW
+#undef ACC_T
+#undef INTERP
+#undef APODIZE
+#undef FROM_DOUBLE
+#undef SIMD_ROWS
+
+#define SIMD_ROWS        0
+
+#define ACC_T            float
+#define INTERP(s1,s2,A)  ((float)(s1)*(1-(float)(A)) + (float)(s2)*(float)(A))
+#define APODIZE(v,apo)   ((v)*(float)(apo))
+#define FROM_DOUBLE(v)   ((float)(v))
+
+#define RF_T             float
+#define KERNEL(name)     name##_f32_facc
+#include "beamform_lines.inc"
+#undef RF_T
+#undef KERNEL
+
+#define RF_T             si16
+#define KERNEL(name)     name##_i16_facc
+#include "beamform_lines.inc"
+#undef RF_T
+#undef KERNEL
+#undef ACC_T
+#undef INTERP
+#undef APODIZE
+#undef FROM_DOUBLE
+#undef WEIGHT_T
+#undef WEIGHT
+#undef ZONE_WEIGHTS
+
+#define WEIGHT_T         si32
+#define WEIGHT(x)        FIXED(x)
+#define ZONE_WEIGHTS(w,x,n)  fixed_weights(w, x, n)
+
+#define ACC_T            si32
+#define INTERP(s1,s2,A)  (((si32)(s1)*(BFT_FIXED_ONE - (A))                 \
+                          + (si32)(s2)*(A)) >> BFT_FIXED_SHIFT)
+#define APODIZE(v,apo)   (((v)*(apo)) >> BFT_FIXED_SHIFT)
+#define FROM_DOUBLE(v)   ((si32)floor((v) + 0.5))
+
+#define RF_T             si16
+#define KERNEL(name)     name##_i16_fixed
+#include "beamform_lines.inc"
+#undef RF_T
+#undef KERNEL
+#undef ACC_T
+#undef INTERP
+#undef APODIZE
+#undef FROM_DOUBLE
+#undef WEIGHT_T
+#undef WEIGHT
+#undef ZONE_WEIGHTS
+#undef KERNEL_SCOPE
+#undef SIMD_ROWS
+
+
 /*********************************************************************
  * FUNCTION : apodize_fix(atl, rf_data, no_samples, no_channels)
  * ABSTRACT : Apply apodization on the rf_data. The input array gets 
@@ -101,7 +246,7 @@ double* beamform_line_times(TFocusTimeLine *ftl, TSysParams* sys,
 double** apodize_fix(TApoTimeLine *atl, double **rf_data,
                                      ui32 no_samples, ui32 no_channels)
 {
-  double *a;           /*  pointer to the apodization coefficients   */
+  float *a;            /*  pointer to the apodization coefficients   */
   ui32 is;             /*  Index of sample                           */
   ui32 ic;             /*  Index of channel                          */
     
@@ -121,605 +266,20 @@ double** apodize_fix(TApoTimeLine *atl, double **rf_data,
 }
 
 
-/*********************************************************************
- * FUNCTION : beamform_apo_line_times(ftl, atl, sysm time, rf_data,
- *                                    no_samples)
- * ABSTRACT : Beamforms and apodizes a line.
- * ARGUMENTS: ftl - Focus Time Line
- *            atl - Apodization Time Line
- *            sys - System parameters
- *            time - Time of the reception of the first sample
- *            rf_data - 2D array with RF data.
- *            no_samples - Number of samples in one scan line.
- * RETURNS  : The function allocates memory for the beamformed RF line
- *            and returns a pointer to it.
- * 
- *********************************************************************/
-
-double* beamform_apo_line_times(TFocusTimeLine *ftl, TApoTimeLine* atl,
-                            TSysParams* sys, double time, 
-                            double **rf_data, ui32 no_samples) 
-{
-  double *bf_line;
-  ui32 os;                /*  Index of output sample       */
-  ui32 o_abs_s;           /*  Output absolut index         */
-  ui32 is1;               /*  Index of input sample1       */
-  si32 *d;                /*  Pointer to the delays        */
-  double *a;              /*  Apodization array            */
-  double A;               /*  One apodization value        */
-  ui32 id;                /*  Index of delay               */
-  ui32 ind;               /*  Index of next delay          */
-  ui32 no_elements;       /*  No of elements in XDC        */
-  ui32 ic;                /*  Index of channel             */
-  ui32 ia;                /*  Index of apodization         */
-  ui32 ina;               /*  Index of next apodization    */
-  double* apo;            /*  Pointer to the apodization   */
-
-  
-  if (atl->no_times == 0){
-     return beamform_line_times(ftl,sys,time,rf_data,no_samples);
-  }
-  
-  bf_line = (double *) malloc(no_samples * sizeof(double));
-  o_abs_s = (ui32)floor(time * sys->fs);
-  id = 0; ind = 1; 
-  ia = 0; ina = 1;
-  
-  no_elements = ftl->xdc->no_elements;
-  
-  /*
-   *   Find the first useful set of delays for beamforming. 
-   *   This is the set with the biggest starting time
-   *   which  is less than 'time'
-   */  
-  while( ftl->delay[ind].time < o_abs_s ) {  ind ++; id ++;}
-  while( atl->a[ina].time < o_abs_s) {ina ++; ia ++;}
-  
-  d = ftl->delay[id].d;
-  a = ftl->delay[id].a;
-  apo = atl->a[ia].a;
-  
- 
-  
-  /*
-   *   Beamdorm the output line one sample at a time. 
-   */    
-  no_samples--;
-  bf_line[no_samples] = 0;  
-  for (os = 0; os < no_samples; o_abs_s++, os ++){  
-     bf_line[os] = 0;
-     if (o_abs_s > ftl->delay[ind].time) 
-     {
-        ind ++; id ++;
-        d = ftl->delay[id].d;
-        a = ftl->delay[id].a;
-     }
-
-
-     if (o_abs_s > atl->a[ina].time) 
-     {
-        ina ++; ia ++;
-        apo = atl->a[ia].a;
-     }
-
-     for (ic = 0; ic < no_elements; ic ++ ){  
-        is1  = os - d[ic];
-        if ((is1-1) < no_samples ){
-           double d;
-           A = a[ic];
-            d =  (double)rf_data[ic][is1] * (1-A)
-                                  + (double)rf_data[ic][is1-1] * A;           
-            bf_line[os] += d*apo[ic];
-          }
-     }  
-  }
-  
-  return bf_line;
-}
-
-
-
-/**********************************************************************
- * FUNCTION : beamform_apo_line_dynamic
- * ABSTRACT : Dynamically focus and apodize a scan line
- **********************************************************************/
-double* beamform_apo_line_dynamic(TFocusTimeLine *ftl, TApoTimeLine* atl,
-        TSysParams* sys, double time,  double **rf_data, ui32 no_samples)
-{
-
-  double *bf_line;     /* The beamformed line                          */
-  TTransducer* xdc;    /* Pointer to the transducer used to calc delays*/
-  TPoint3D p;          /* Current focal point                          */
-  double dX;           /* Increments of X, Y, Z per sample             */
-  double dY;
-  double dZ;
-  double dR;
-  
-  double sample_index; /* The true value of the input index            */
-  ui32 o_abs_s;        /* Absolute output index                        */
-  ui32 os;             /* Output index for bf_line                     */
-  ui32 is1;            /*is1, is2 - Input indeces of the used  samples */
-  ui32 ia;             /* Index of the currently used apodization      */
-  ui32 ina;            /* Index of the next apodization value          */
-  ui32 ic;             /* Index of channel                             */
-  double A;            /* Coefficient for linear interpolation         */
-  
-  double *apo;         /* Array with the current apodization values    */
-
-
-
-  
-  bf_line = (double*)malloc(no_samples*sizeof(double));
-  xdc = ftl->xdc;
-  
-  dR = sys->c / sys->fs / 2;
-  dX = tan(ftl->dir_xz);
-  dY = tan(ftl->dir_yz);
-  
-  dZ= dR/sqrt(1+dX*dX+dY*dY); /* dZ=sqrt(1+tan(dir_xz)^2+tan(dir_yz)^2)*/
-  dX*= dZ;                    /* dX = tan(dir_xz) * dZ                 */
-  dY*= dZ;                    /* dY = tan(dir_yz) * dZ                 */
-  
-  o_abs_s = (ui32)floor(time * sys->fs);    /* time => sample index    */
-
-  p.x = ftl->center.x + dX*o_abs_s;
-  p.y = ftl->center.y + dY*o_abs_s;
-  p.z = ftl->center.z + dZ*o_abs_s;
-  
-
-  if (atl->no_times==0){
-     msgprint("\007 For the time being the dynamic focusing is ");
-     msgprint("performed only on lines for which apodization is ");
-     msgprint("specified.\n");
-     return NULL;
-  }
-  
-  
-  ia = 0; ina = 1;
-  while( atl->a[ina].time < o_abs_s) {ina ++; ia ++;}
-  apo = atl->a[ia].a;
-  
-  no_samples--;
-  bf_line[no_samples] = 0;
-  for (os = 0; os < no_samples; o_abs_s++, os ++){
-     if (o_abs_s > atl->a[ina].time) {
-        ina ++; ia ++;
-        apo = atl->a[ia].a;
-     }
-
-     bf_line[os] = 0;
-     
-     for(ic = 0; ic < xdc->no_elements; ic ++){
-        sample_index = distance(&ftl->center, &p)*sys->fs;
-        sample_index -= distance(xdc->c+ic, &p)*sys->fs;
-        sample_index = os - (sample_index / sys->c);
-        is1 = (ui32)floor(sample_index);
-        if (is1 < no_samples-1){
-           A = sample_index - is1;
-           bf_line[os] += apo[ic]*(rf_data[ic][is1]*(1-A)
-                            + rf_data[ic][is1+1]*A);
-        }
-     }
-
-     p.x+=dX;
-     p.y+=dY;
-     p.z+=dZ;     
-  }
-  return bf_line;
-}
-
-/**********************************************************************
- * FUNCTION : beamform_line_dynamic
- * ABSTRACT : Dynamically focus  a scan line
- **********************************************************************/
-double* beamform_line_dynamic(TFocusTimeLine *ftl, 
-        TSysParams* sys, double time,  double **rf_data, ui32 no_samples)
-{
-
-  double *bf_line;     /* The beamformed line                          */
-  TTransducer* xdc;    /* Pointer to the transducer used to calc delays*/
-  TPoint3D p;          /* Current focal point                          */
-  double dX;           /* Increments of X, Y, Z per sample             */
-  double dY;
-  double dZ;
-  double dR;
-  
-  double sample_index; /* The true value of the input index            */
-  ui32 o_abs_s;        /* Absolute output index                        */
-  ui32 os;             /* Output index for bf_line                     */
-  ui32 is1;            /*is1, is2 - Input indeces of the used  samples */
-  ui32 ic;             /* Index of channel                             */
-  double A;            /* Coefficient for linear interpolation         */
-  
-  
-  bf_line = (double*)malloc(no_samples*sizeof(double));
-  xdc = ftl->xdc;
-  
-  dR = sys->c / sys->fs / 2;
-  dX = tan(ftl->dir_xz);
-  dY = tan(ftl->dir_yz);
-  
-  dZ= dR/sqrt(1+dX*dX+dY*dY); /* dZ=sqrt(1+tan(dir_xz)^2+tan(dir_yz)^2)*/
-  dX*= dZ;                    /* dX = tan(dir_xz) * dZ                 */
-  dY*= dZ;                    /* dY = tan(dir_yz) * dZ                 */
-  
-  o_abs_s = (ui32)floor(time * sys->fs);    /* time => sample index    */
-
-  p.x = ftl->center.x + dX*o_abs_s;
-  p.y = ftl->center.y + dY*o_abs_s;
-  p.z = ftl->center.z + dZ*o_abs_s;
-  
-  
-  no_samples--;
-  bf_line[no_samples] = 0;
-  for (os = 0; os < no_samples; o_abs_s++, os ++){
-
-     bf_line[os] = 0;
-     
-     for(ic = 0; ic < xdc->no_elements; ic ++){
-        sample_index = distance(&ftl->center, &p)*sys->fs;
-        sample_index -= distance(xdc->c+ic, &p)*sys->fs;
-        sample_index = os - (sample_index / sys->c);
-        is1 = (ui32)floor(sample_index);
-        if (is1 < no_samples-1){
-           A = sample_index - is1;
-           bf_line[os] += (rf_data[ic][is1]*(1-A)
-                            + rf_data[ic][is1+1]*A);
-        }
-     }
-
-     p.x+=dX;
-     p.y+=dY;
-     p.z+=dZ;     
-  }
-  return bf_line;
-}
-
-
-
-
-
-/**********************************************************************
- * FUNCTION : beamform_apo_line_dynamic_sta
- * ABSTRACT : Dynamically focus and apodize a scan line
- **********************************************************************/
-double* beamform_apo_line_dynamic_sta(TFocusTimeLine *ftl, TApoTimeLine* atl,
-        TSysParams* sys, double time,  double **rf_data, ui32 no_samples, TPoint3D *xmt)
-{
-
-  double *bf_line;     /* The beamformed line                          */
-  TTransducer* xdc;    /* Pointer to the transducer used to calc delays*/
-  TPoint3D p;          /* Current focal point                          */
-  double dX;           /* Increments of X, Y, Z per sample             */
-  double dY;
-  double dZ;
-  double dR;
-  
-  double sample_index; /* The true value of the input index            */
-  ui32 o_abs_s;        /* Absolute output index                        */
-  ui32 os;             /* Output index for bf_line                     */
-  ui32 is1;            /*is1, is2 - Input indeces of the used  samples */
-  ui32 ia;             /* Index of the currently used apodization      */
-  ui32 ina;            /* Index of the next apodization value          */
-  ui32 ic;             /* Index of channel                             */
-  double A;            /* Coefficient for linear interpolation         */
-  
-  double *apo;         /* Array with the current apodization values    */
-  double scaler;  
-  double sample_base_index;
-  double time_sample;
- 
-    
-    PFUNC
-  
-  bf_line = (double*)malloc(no_samples*sizeof(double));
-  xdc = ftl->xdc;
-  
-  dR = sys->c / sys->fs / 2;
-  dX = tan(ftl->dir_xz);
-  dY = tan(ftl->dir_yz);
-  
-  dZ= dR/sqrt(1+dX*dX+dY*dY); /* dZ=sqrt(1+tan(dir_xz)^2+tan(dir_yz)^2)*/
-  dX*= dZ;                    /* dX = tan(dir_xz) * dZ                 */
-  dY*= dZ;                    /* dY = tan(dir_yz) * dZ                 */
-  
-  o_abs_s = (ui32)floor(time * sys->fs);    /* time => sample index    */
-
-  p.x = ftl->center.x + dX*o_abs_s;
-  p.y = ftl->center.y + dY*o_abs_s;
-  p.z = ftl->center.z + dZ*o_abs_s;
-  
-
-  if (atl->no_times==0){
-     printf("\007 For the time being the dynamic focusing is ");
-     printf("performed only on lines for which apodization is ");
-     printf("specified.\n");
-     return NULL;
-  }
-  
-  
-  ia = 0; ina = 1;
-  while( atl->a[ina].time < o_abs_s) {ina ++; ia ++;}
-  apo = atl->a[ia].a;
-  
-  no_samples--;
-  
-  scaler = sys->fs / sys->c;
-  time_sample = time * sys->fs;
-  
-  bf_line[no_samples] = 0;
-  sample_base_index = 0;
-  
-  for (os = 0; os < no_samples; o_abs_s++, os ++){
-     double d;
-
-     if (o_abs_s > atl->a[ina].time) {
-        ina ++; ia ++;
-        apo = atl->a[ia].a;
-     }
-
-     
-     sample_base_index = distance(xmt, &p) * scaler - time_sample;
-     d = 0;  
-      
-     for(ic = 0; ic < xdc->no_elements; ic ++){
-        sample_index = distance(xdc->c+ic, &p)*scaler  + sample_base_index;
-        is1 = (ui32)floor(sample_index);
-        if (is1 < no_samples-1){
-           A = sample_index - is1;
-           d += apo[ic]*(rf_data[ic][is1]*(1-A)
-                       + rf_data[ic][is1+1]*A);
-        }
-     }
-      bf_line[os] = d;
-
-     p.x+=dX;
-     p.y+=dY;
-     p.z+=dZ;     
-  }
-  return bf_line;
-}
-
-
-
-/**********************************************************************
- * FUNCTION : beamform_line_dynamic_sta
- * ABSTRACT : Dynamically focus  a scan line
- **********************************************************************/
-double* beamform_line_dynamic_sta(TFocusTimeLine *ftl, 
-        TSysParams* sys, double time,  double **rf_data, ui32 no_samples, TPoint3D* xmt)
-{
-
-  double *bf_line;     /* The beamformed line                          */
-  TTransducer* xdc;    /* Pointer to the transducer used to calc delays*/
-  TPoint3D p;          /* Current focal point                          */
-  double dX;           /* Increments of X, Y, Z per sample             */
-  double dY;
-  double dZ;
-  double dR;
-  
-  double sample_index; /* The true value of the input index            */
-  ui32 os;             /* Output index for bf_line                     */
-  ui32 is1;            /*is1, is2 - Input indeces of the used  samples */
-  ui32 ic;             /* Index of channel                             */
-  double A;            /* Coefficient for linear interpolation         */
-  double scaler;  
-  double sample_base_index;
-  double time_sample;
-  
-  PFUNC
-  
-  bf_line = (double*)malloc(no_samples*sizeof(double));
-  xdc = ftl->xdc;
-  
-  dR = sys->c / sys->fs / 2;
-  dX = tan(ftl->dir_xz);
-  dY = tan(ftl->dir_yz);
-  
-  dZ= dR/sqrt(1+dX*dX+dY*dY); /* dZ=sqrt(1+tan(dir_xz)^2+tan(dir_yz)^2)*/
-  dX*= dZ;                    /* dX = tan(dir_xz) * dZ                 */
-  dY*= dZ;                    /* dY = tan(dir_yz) * dZ                 */
-  
-
- time_sample = time * sys->fs;
- 
-  
-  p.x = ftl->center.x + time_sample*dX;
-  p.y = ftl->center.y + time_sample*dY;
-  p.z = ftl->center.z + time_sample*dZ;
-  
-  
-  no_samples--;
-  bf_line[no_samples] = 0;
-  scaler = sys->fs / sys->c;
-  
-  
-  for (os = 0; os < no_samples; os ++){
-      double d;
-     
-      d = 0;
-     sample_base_index = distance(xmt, &p) * scaler - time_sample;
-      
-     for(ic = 0; ic < xdc->no_elements; ic ++){
-          sample_index = distance(xdc->c+ic, &p) * scaler + sample_base_index;
-        is1 = (ui32)floor(sample_index);
-        if (is1 < no_samples-1){
-           A = sample_index - is1;
-           bf_line[os] += (rf_data[ic][is1]*(1-A)
-                            + rf_data[ic][is1+1]*A);
-        }
-     }
-      bf_line[os] = d;
-     p.x+=dX;
-     p.y+=dY;
-     p.z+=dZ;     
-  }
-  
-  return bf_line;
-}
-
-
-/**********************************************************************
- * FUNCTION : beamform_line_pixels
- * ABSTRACT : Beamform a line using pixel-based focusing.
- **********************************************************************/
-double* beamform_line_pixels(TFocusTimeLine *ftl, TSysParams* sys,
-                        double time,  double **rf_data, ui32 no_samples
-                        ,ui32 element_no)
-{
-
-  double *bf_line;     /* The beamformed line                          */
-  TTransducer* xdc;    /* Pointer to the transducer used to calc delays*/
-  
-  double A;            /* Coefficient for linear interpolation         */
-  double xmt_index=0;    /* Index of the sample connected with the transmit */
-  double sample_index=0;
-  double start_index;
-  TPoint3D *p;        /* Focal point  */
-  ui32 is1;           /* Input sample */
-  ui32 is2;           /* Input sample  */
-  ui32 os;            /* Output sample */
-  ui32 ic;            /* Index of channel */
-  int flag; 
-  
-  
-  PFUNC
-  if (ftl->no_times < 1){
-     printf("beamform_line_pixels: \007 \n");
-     printf("Error: no focal points are specified.\n");
-     assert(ftl->no_times>1);
-  }
-  if (ftl->pixels == NULL){
-     printf("beamform_line_pixels: \007 \n");
-     printf("Error: NULL pointer to the pixels.");
-     assert(ftl->pixels);
-  }
-  printf("beamform_pixels:\n");
-  bf_line = (double*)malloc(ftl->no_times*sizeof(double));
-  
-  start_index = time * sys->fs;
-  xdc = ftl->xdc;
-  
-  flag = element_no >= xdc->no_elements;
-    
-  for (os = 0; os < ftl->no_times;  os ++){
-     bf_line[os] = 0;
-     p = ftl->pixels + os;
-      
-     if (element_no < xdc->no_elements){
-        xmt_index = distance(xdc->c+element_no, p)*sys->fs;
-        xmt_index =  (xmt_index / sys->c);
-     }
-
-     for(ic = 0; ic < xdc->no_elements; ic ++){
-        sample_index =  distance(xdc->c+ic, p)*sys->fs;
-        if (flag)
-          sample_index = 2*sample_index / sys->c - start_index;
-        else
-          sample_index =  (sample_index / sys->c) - start_index;
-  
-        sample_index += xmt_index;
-        
-        is1 = (ui32)floor(sample_index);
-        is2 = is1 - 1;
-        if (is2 < no_samples && is1 < no_samples){
-           A = sample_index - is1;
-           bf_line[os] += (rf_data[ic][is1]*(1-A)
-                            + rf_data[ic][is2]*A);
-        }
-     }
-  }
-  return bf_line;
-}
-
-
-/**********************************************************************
- * FUNCTION : beamform_apo_line_pixels
- * ABSTRACT : Beamform a line using pixel-based focusing.
- **********************************************************************/
-double* beamform_apo_line_pixels(TFocusTimeLine *ftl, TApoTimeLine* atl, TSysParams* sys,
-                        double time,  double **rf_data, ui32 no_samples,
-                        ui32 element_no)
-{
-
-  double *bf_line;     /* The beamformed line                          */
-  TTransducer* xdc;    /* Pointer to the transducer used to calc delays*/
-  
-  double A;            /* Coefficient for linear interpolation         */
-  
-  double sample_index=0;
-  double start_index=0;
-  double xmt_index = 0;
-  TPoint3D *p;        /* Focal point  */
-  ui32 ia, ina;       /* Index of apodization value and next apodization value */
-  ui32 is1;           /* Input sample */
-  ui32 is2;           /* Input sample  */
-  ui32 os;            /* Output sample */
-  ui32 ic;            /* Index of channel */
-  double apo=1;         /* The apodization value to apply  */
-  int flag;  
-  
-  if (ftl->no_times < 1){
-     printf("beamform_apo_line_pixels: \007 \n");
-     printf("Error: no focal points are specified.\n");
-     assert(ftl->no_times>1);
-  }
-  if (ftl->pixels == NULL){
-     printf("beamform_apo_line_pixels: \007 \n");
-     printf("Error: NULL pointer to the pixels.");
-     assert(ftl->pixels);
-  }
-  
-  bf_line = (double*)malloc(ftl->no_times*sizeof(double));
-  
-  start_index = time * sys->fs;
-  
-  xdc = ftl->xdc;
-  flag =element_no >= xdc->no_elements ;
-  for (os = 0; os < ftl->no_times;  os ++){
-     bf_line[os] = 0;
-     p = ftl->pixels + os;
-     if (element_no < xdc->no_elements){
-        xmt_index = distance(xdc->c+element_no, p)*sys->fs;
-        xmt_index =  (xmt_index / sys->c);
-     }
-
-     for(ic = 0; ic < xdc->no_elements; ic ++){
-        sample_index = distance(xdc->c+ic, p)*sys->fs;
-        if (flag)
-          sample_index = 2*sample_index / sys->c - start_index;
-        else
-          sample_index =  (sample_index / sys->c) - start_index;
-        ia = 0; ina = 1;
-        while( atl->a[ina].time < sample_index) {ina ++; ia ++;}
-        apo = atl->a[ia].a[ic];
-        sample_index += xmt_index;
-        is1 = (ui32)floor(sample_index);
-        is2 = is1 + 1;
-        if (is2 < no_samples && is1 < no_samples){
-           A = sample_index - is1;
-           bf_line[os] += apo*(rf_data[ic][is1]*(1-A)
-                            + rf_data[ic][is2]*A);
-        }
-     }
-  }
-  return bf_line;
-}
-
-
-
 
 
 /*********************************************************************
  * FUNCTION : sum_lines_time
  * ABSTRACT : Sum 2 already beamformed lines into a new one.
+ *            The result is stored in 'sum_line'. If 'sum_line' is 
+ *            NULL, memory is allocated by the function.
  *********************************************************************/
 double* sum_lines_time(TFocusTimeLine *ftl, TApoTimeLine* atl, TSysParams* sys, 
                       double* rf_line1, ui32 element1, 
                       double* rf_line2, ui32 element2,
-                      double time,      ui32 no_samples)
+                      double time,      ui32 no_samples,
+                      double* sum_line)
 {
-   double* sum_line;
    double d1, A1;     /* Delay and weighting coefficient */
    double d2, A2;     /* Delay and weighting coefficient */
    double apo1;       /* Apodization value               */
@@ -755,8 +315,12 @@ double* sum_lines_time(TFocusTimeLine *ftl, TApoTimeLine* atl, TSysParams* sys,
    
    
    /* Allocate the memory for the output line and check  */
-   sum_line = (double*)calloc(no_samples, sizeof(double));
-   assert(sum_line);
+   if (sum_line == NULL){
+      sum_line = (double*)calloc(no_samples, sizeof(double));
+      assert(sum_line);
+   }else{
+      memset(sum_line, 0, no_samples*sizeof(double));
+   }
    
    /* What would the sample index be, if time was =0     */  
    o_abs_s = (ui32)(time * sys->fs);
@@ -802,18 +366,19 @@ double* sum_lines_time(TFocusTimeLine *ftl, TApoTimeLine* atl, TSysParams* sys,
 
 
 /*********************************************************************
- * FUNCTION : sum_images
- * ABSTRACT : Sum to low-resoltuion images in one high-resolution image
+ * FUNCTION : sum_images_into
+ * ABSTRACT : Sum to low-resoltuion images in one high-resolution image.
+ *            The lines are stored in 'sum_lines', which has one 
+ *            pointer per line. NULL pointers are replaced by memory
+ *            allocated by the function.
+ * RETURNS  : 'sum_lines', or NULL in case of wrong settings.
  *********************************************************************/
-double **sum_images(TFocusLineCollection *flc, TApoLineCollection *alc,
+double **sum_images_into(TFocusLineCollection *flc, TApoLineCollection *alc,
                     TSysParams* sys,
                     double **rf1, ui32 element1,
                     double **rf2, ui32 element2, 
-                    double time, ui32 no_samples)
-
-
+                    double time, ui32 no_samples, double **sum_lines)
 {
-   double **sum_lines;
    ui32 line_no;
   /*
    *   Filter the input parameters for wrong settings
@@ -832,40 +397,94 @@ double **sum_images(TFocusLineCollection *flc, TApoLineCollection *alc,
   }
   
    
-   sum_lines = (double**)calloc(flc->no_focus_time_lines,sizeof(double*));
-   assert(sum_lines);
    for (line_no = 0; line_no < flc->no_focus_time_lines; line_no ++){
      sum_lines[line_no] = sum_lines_time(flc->ftl+line_no, alc->atl+line_no, sys, 
                                    rf1[line_no], element1, rf2[line_no], element2,
-                                   time, no_samples);
+                                   time, no_samples, sum_lines[line_no]);
    }
    return sum_lines;
 }
 
 
 /*********************************************************************
- * FUNCTION  : beamform_image()
- * ABSTRACT  : beamforms a whole image
- *
+ * FUNCTION : sum_images
+ * ABSTRACT : Sum to low-resoltuion images in one high-resolution image
  *********************************************************************/
-double** beamform_image(TFocusLineCollection *flc, TApoLineCollection* alc,
-         TSysParams* sys, double time, double **rf_data, ui32 no_samples,
-         ui32 element_no, TPoint3D *xmt)
+double **sum_images(TFocusLineCollection *flc, TApoLineCollection *alc,
+                    TSysParams* sys,
+                    double **rf1, ui32 element1,
+                    double **rf2, ui32 element2, 
+                    double time, ui32 no_samples)
+
+
 {
-  double **bf_lines;      /* The collection of beamformed lines         */
+   double **sum_lines;
+   double **res;
+
+   sum_lines = (double**)calloc(flc->no_focus_time_lines,sizeof(double*));
+   assert(sum_lines);
+   res = sum_images_into(flc, alc, sys, rf1, element1, rf2, element2,
+                         time, no_samples, sum_lines);
+   if (res == NULL) free(sum_lines);
+   return res;
+}
+
+
+
+
+
+/*********************************************************************
+ * FUNCTION  : image_line_kernel()
+ * ABSTRACT  : Choose the line dispatcher for a sample and accumulator
+ *             type.
+ * RETURNS   : Pointer to the dispatcher, or NULL if the combination is
+ *             not supported.
+ *********************************************************************/
+static TParallelFunc image_line_kernel(ui32 sample_type, ui32 acc_type)
+{
+  switch (sample_type){
+     case BFT_FLOAT64:
+        if (acc_type == BFT_ACC_DOUBLE) return beamform_image_line;
+        break;
+     case BFT_FLOAT32:
+        if (acc_type == BFT_ACC_DOUBLE) return beamform_image_line_f32;
+        if (acc_type == BFT_ACC_FLOAT)  return beamform_image_line_f32_facc;
+        break;
+     case BFT_INT16:
+        if (acc_type == BFT_ACC_DOUBLE) return beamform_image_line_i16;
+        if (acc_type == BFT_ACC_FLOAT)  return beamform_image_line_i16_facc;
+        if (acc_type == BFT_ACC_FIXED)  return beamform_image_line_i16_fixed;
+        break;
+  }
+  return NULL;
+}
+
+
+/*********************************************************************
+ * FUNCTION  : prepare_job()
+ * ABSTRACT  : Check the settings and fill in the description of the 
+ *             beamforming of one image. The transmitted wave is 'wave',
+ *             or if it is NULL, the transmit element or position. 
+ * RETURNS   : The line dispatcher for the sample and accumulator types,
+ *             or NULL in case of wrong settings.
+ *********************************************************************/
+static TParallelFunc prepare_job(TBeamformJob *job, TThreadPool *pool,
+         TFocusLineCollection *flc, TApoLineCollection* alc,
+         TSysParams* sys, double time, void **rf_data, ui32 sample_type,
+         ui32 acc_type, ui32 no_samples, ui32 element_no, TPoint3D *xmt,
+         TTransmit *wave, double **bf_lines)
+{
+  TParallelFunc line_kernel;
   ui32 max_no_apo_times=0;
   ui32 i;
-  TPoint3D* elem;
-  
-  PFUNC
   
   /*
    *   Filter the input parameters for wrong settings
    */
   if (flc->no_focus_time_lines != alc->no_apo_time_lines){
      eprintf("\007 beamform_image:\n");
-     eprintf("Error : the number of apodization lines and the number of ");
-     eprintf("focus lines must be the same \n");
+     eprintf("Error : the number of apodization lines and the number of "
+             "focus lines must be the same \n");
      return NULL;
   }
   
@@ -874,92 +493,673 @@ double** beamform_image(TFocusLineCollection *flc, TApoLineCollection* alc,
      eprintf("Error : the number of defined lines is 0\n");
      return NULL;
   }
-  
-    
-  bf_lines = (double**)calloc(flc->no_focus_time_lines,sizeof(double*));
-  if (bf_lines == NULL){
+
+  line_kernel = image_line_kernel(sample_type, acc_type);
+  if (line_kernel == NULL){
      eprintf("\007 beamform_image:\n");
-     eprintf("Errot : cannot allocate memory for the output image\n");
+     eprintf("Error : unsupported accumulator %u for samples of type %u. "
+             "BFT_ACC_FLOAT needs BFT_FLOAT32 or BFT_INT16 samples, "
+             "BFT_ACC_FIXED needs BFT_INT16 samples\n", acc_type, sample_type);
+     return NULL;
+  }
+
+  if (flc->interpolation == BFT_INTERP_FILTER_BANK && 
+      (!flc->use_filter_bank || flc->filter_bank.Nf == 0 || 
+       flc->filter_bank.Ntaps == 0)){
+     eprintf("\007 beamform_image:\n");
+     eprintf("Error : the interpolation with a filter bank needs a "
+             "filter bank. Set it first \n");
      return NULL;
   }
   
-  
-  
-  elem = xmt;
-  
+  job->pool = pool;
+  job->scratch = NULL;
+  job->failed = FALSE;
+  job->flc = flc;
+  job->alc = alc;
+  job->sys = sys;
+  job->time = time;
+  job->rf_data = rf_data;
+  job->no_samples = no_samples;
+  job->tx = wave;
+  job->bf_lines = bf_lines;
+  job->out_start = 0;
+  job->out_count = (ui32)-1;
+  job->fb = (flc->interpolation == BFT_INTERP_FILTER_BANK) ?
+            &flc->filter_bank : NULL;
+
+  if (wave == NULL && (xmt != NULL || element_no < 64000)) {
+     job->point.type = BFT_TX_POINT;
+     job->point.angle = 0.0;
+     job->point.point = (xmt != NULL) ? *xmt : flc->ftl[0].xdc->c[element_no];
+     job->tx = &job->point;
+  }
 
   /*
-   *   Take decision which beamforming routine will be used
+   *   Take decision which beamforming routine will be used. 
+   *   If a single line is beamformed, the pixel based focusing uses
+   *   'element_no' as transmit element.
    */
-   
-   if (flc->no_focus_time_lines == 1){
-        if (element_no < 64000 && elem==NULL) {
-            elem = flc->ftl->xdc->c+element_no;	
-        }
-      if( flc->ftl->dynamic == TRUE){
-         if (alc->atl->no_times > 0)
-            if (elem!=NULL)
-              bf_lines[0] = beamform_apo_line_dynamic_sta(flc->ftl,alc->atl,sys,time,rf_data,no_samples, elem);
-                else
-              bf_lines[0] = beamform_apo_line_dynamic(flc->ftl,alc->atl,sys,time,rf_data,no_samples);
-         else
-                if (elem != NULL)
-              bf_lines[0] = beamform_line_dynamic_sta(flc->ftl,sys,time,rf_data,no_samples, elem);
-                else
-              bf_lines[0] = beamform_line_dynamic(flc->ftl,sys,time,rf_data,no_samples);
-                
-      }else if(flc->ftl->pixel == TRUE){
-         if (alc->atl->no_times > 0)
-              bf_lines[0] = beamform_apo_line_pixels(flc->ftl,alc->atl,sys,time,rf_data,no_samples,element_no);
-         else
-              bf_lines[0] = beamform_line_pixels(flc->ftl,sys,time,rf_data,no_samples,element_no);
-      }else{
-         if (alc->atl->no_times > 0)
-            bf_lines[0] = beamform_apo_line_times(flc->ftl,alc->atl,sys,time,rf_data,no_samples);
-         else
-            bf_lines[0] = beamform_line_times(flc->ftl,sys,time,rf_data,no_samples);
-      }
-   }else{
-   /* First determine whether we have to call apodize or beamform_apo_ ... */
-      for (i = 0; i < alc->no_apo_time_lines; i++)
-          if(alc->atl[i].no_times > max_no_apo_times)
-              max_no_apo_times = alc->atl[i].no_times;
+  for (i = 0; i < alc->no_apo_time_lines; i++)
+     if(alc->atl[i].no_times > max_no_apo_times)
+        max_no_apo_times = alc->atl[i].no_times;
 
-    if (element_no < 64000 && elem==NULL) {
-            elem = flc->ftl[0].xdc->c+element_no;	
+  job->use_apo = (max_no_apo_times > 0);
+  job->pixel_element = (flc->no_focus_time_lines == 1) ? element_no : (ui32)-1;
+
+  return line_kernel;
+}
+
+
+/*********************************************************************
+ * FUNCTION  : dynamic_line_setup()
+ * ABSTRACT  : Task of the thread pool. Calculate the delay table of 
+ *             line 'i', if it is dynamically focused.
+ *********************************************************************/
+static void dynamic_line_setup(void *arg, ui32 i)
+{
+  TBeamformJob *job = (TBeamformJob*)arg;
+  TFocusTimeLine *ftl = job->flc->ftl + i;
+
+  if (ftl->dynamic == TRUE
+      && dynamic_table(ftl, job->sys, job->time, job->no_samples) == NULL)
+     job->failed = TRUE;
+}
+
+
+/*********************************************************************
+ * FUNCTION  : dynamic_tables()
+ * ABSTRACT  : Calculate the delay tables of the dynamically focused 
+ *             lines of a job in parallel, before the lines are 
+ *             beamformed. The beamforming then only reads them.
+ * RETURNS   : FALSE if there is not enough memory for a table.
+ *********************************************************************/
+static ui32 dynamic_tables(TBeamformJob *job)
+{
+  job->failed = FALSE;
+  thread_pool_run(job->pool, job->flc->no_focus_time_lines,
+                  dynamic_line_setup, job);
+  return !job->failed;
+}
+
+
+/*********************************************************************
+ * FUNCTION  : beamform_image_typed()
+ * ABSTRACT  : beamforms a whole image into memory supplied by the 
+ *             caller. The RF samples can be double, float or 16 bit
+ *             integers, and the sums can be accumulated in double,
+ *             float or fixed point precision. The lines are 
+ *             distributed among the threads in 'pool'. Every line is
+ *             beamformed by exactly one thread, hence the result does
+ *             not depend on the number of threads.
+ * ARGUMENTS : pool - Thread pool. If NULL, the lines are beamformed
+ *                    one after another by the calling thread.
+ *             rf_data - One pointer per channel to the samples.
+ *             sample_type - BFT_FLOAT64, BFT_FLOAT32 or BFT_INT16
+ *             acc_type - BFT_ACC_DOUBLE, BFT_ACC_FLOAT or BFT_ACC_FIXED.
+ *                    BFT_ACC_FLOAT is possible for BFT_FLOAT32 and 
+ *                    BFT_INT16 data, BFT_ACC_FIXED only for BFT_INT16.
+ *             bf_lines - Array with one pointer per line, where the 
+ *                    beamformed lines are stored. Every line must have
+ *                    room for 'no_samples' samples, or for the number
+ *                    of pixels if pixel based focusing is used. NULL 
+ *                    pointers are replaced by memory allocated by the
+ *                    beamforming routines.
+ *             The rest of the arguments are as for beamform_image()
+ * RETURNS   : 'bf_lines' or NULL in case of wrong settings.
+ *********************************************************************/
+double** beamform_image_typed(TThreadPool *pool, TFocusLineCollection *flc,
+         TApoLineCollection* alc, TSysParams* sys, double time,
+         void **rf_data, ui32 sample_type, ui32 acc_type,
+         ui32 no_samples, ui32 element_no, TPoint3D *xmt,
+         double **bf_lines)
+{
+  TBeamformJob job;
+  TParallelFunc line_kernel;
+  
+  PFUNC
+  
+  line_kernel = prepare_job(&job, pool, flc, alc, sys, time, rf_data,
+                            sample_type, acc_type, no_samples, element_no,
+                            xmt, NULL, bf_lines);
+  if (line_kernel == NULL)
+     return NULL;
+  job.scratch = new_delay_scratch(flc, thread_pool_size(pool));
+  if (job.scratch == NULL)
+     return NULL;
+
+  if (dynamic_tables(&job))
+     thread_pool_run(pool, flc->no_focus_time_lines, line_kernel, &job);
+  else
+     bf_lines = NULL;
+
+  del_delay_scratch(job.scratch);
+  return bf_lines;
+}
+
+
+/*********************************************************************
+ * FUNCTION  : beamform_frame_line()
+ * ABSTRACT  : Beamform one line of one frame. Task of the thread pool.
+ *********************************************************************/
+static void beamform_frame_line(void *arg, ui32 i)
+{
+  TFramesJob *job = (TFramesJob*)arg;
+
+  job->line_kernel(job->frames + i / job->no_lines, i % job->no_lines);
+}
+
+
+/*********************************************************************
+ * FUNCTION  : beamform_frames_typed()
+ * ABSTRACT  : beamforms a number of frames, recorded with the same
+ *             setup, into memory supplied by the caller. All lines of
+ *             all frames are distributed among the threads in 'pool'.
+ *             Consecutive frames with the same start time are 
+ *             beamformed in one run, and share the delay tables of
+ *             the dynamically focused lines. The tables are calculated
+ *             before the threads are started, so that the threads only
+ *             read them.
+ * ARGUMENTS : times - Time of the first sample, one per frame.
+ *             rf_data - 'no_elements' pointers to the channels of the
+ *                    first frame, followed by those of the second 
+ *                    frame etc.
+ *             bf_lines - 'no_lines' pointers to the lines of the first
+ *                    frame, followed by those of the second frame etc.
+ *                    See beamform_image_typed().
+ *             out_start, out_count - Window of output samples, which
+ *                    are beamformed. Every line must have room for
+ *                    'out_count' samples, and bf_lines[i][0] is output
+ *                    sample 'out_start'. Use 0 and (ui32)-1 for the 
+ *                    whole lines.
+ *             The rest of the arguments are as for beamform_image_typed()
+ * RETURNS   : 'bf_lines' or NULL in case of wrong settings.
+ *********************************************************************/
+double** beamform_frames_typed(TThreadPool *pool, TFocusLineCollection *flc,
+         TApoLineCollection* alc, TSysParams* sys, double *times,
+         void **rf_data, ui32 sample_type, ui32 acc_type, ui32 no_frames,
+         ui32 no_samples, ui32 no_elements, ui32 element_no, TPoint3D *xmt,
+         ui32 out_start, ui32 out_count, double **bf_lines)
+{
+  TFramesJob job;
+  TBeamformJob *frame;
+  TDelayScratch *scratch;
+  ui32 no_lines;
+  ui32 first, last;    /* Frames beamformed in one run                */
+  ui32 f;
+
+  PFUNC
+
+  if (no_frames == 0)
+     return bf_lines;
+
+  no_lines = flc->no_focus_time_lines;
+  job.frames = (TBeamformJob*)malloc(no_frames*sizeof(TBeamformJob));
+  assert(job.frames);
+  job.no_lines = no_lines;
+
+  for (f = 0; f < no_frames; f++){
+     job.line_kernel = prepare_job(job.frames + f, pool, flc, alc, sys,
+                            times[f], rf_data + f*no_elements, sample_type,
+                            acc_type, no_samples, element_no, xmt, NULL,
+                            bf_lines + f*no_lines);
+     if (job.line_kernel == NULL){
+        free(job.frames);
+        return NULL;
+     }
+     job.frames[f].out_start = out_start;
+     job.frames[f].out_count = out_count;
+  }
+
+  scratch = new_delay_scratch(flc, thread_pool_size(pool));
+  if (scratch == NULL){
+     free(job.frames);
+     return NULL;
+  }
+  for (f = 0; f < no_frames; f++)
+     job.frames[f].scratch = scratch;
+
+  for (first = 0; first < no_frames; first = last){
+     for (last = first + 1; last < no_frames; last++)
+        if (times[last] != times[first]) break;
+
+     frame = job.frames + first;
+     if (!dynamic_tables(frame)){
+        bf_lines = NULL;
+        break;
+     }
+
+     job.frames = frame;
+     thread_pool_run(pool, (last - first)*no_lines, beamform_frame_line, &job);
+     job.frames = frame - first;
+  }
+
+  del_delay_scratch(scratch);
+  free(job.frames);
+  return bf_lines;
+}
+
+
+/*********************************************************************
+ * FUNCTION  : speed_dependent()
+ * RETURNS   : Whether the delays of a line with focal zones depend on
+ *             the speed of sound, i.e. they are set from focal points.
+ *********************************************************************/
+static ui32 speed_dependent(TFocusTimeLine *ftl)
+{
+  return !ftl->dynamic && !ftl->pixel && ftl->focus != NULL
+         && ftl->no_times > 0;
+}
+
+
+/*********************************************************************
+ * FUNCTION  : speed_paths()
+ * ABSTRACT  : Task of the thread pool. The part of the delays of line
+ *             'i', which is common to all speeds of sound. If there is
+ *             not enough memory, it stays NULL, and speed_line_setup()
+ *             fails.
+ *********************************************************************/
+static void speed_paths(void *arg, ui32 i)
+{
+  TSpeedsJob *job = (TSpeedsJob*)arg;
+  TFocusTimeLine *ftl = job->flc->ftl + i;
+
+  if (speed_dependent(ftl)){
+     job->paths[i] = (double*)malloc(
+           ((size_t)ftl->no_times*ftl->xdc->no_elements + 1)*sizeof(double));
+     if (job->paths[i] != NULL)
+        focus_path_lengths(ftl, job->speed_sys, job->paths[i]);  /* Same fs */
+  }else if (ftl->dynamic == TRUE){
+     job->paths[i] = (double*)malloc(
+           (2*(size_t)ftl->xdc->no_elements + 1)*sizeof(double));
+     if (job->paths[i] != NULL)
+        dynamic_path_terms(ftl, job->paths[i]);
+  }
+}
+
+
+/*********************************************************************
+ * FUNCTION  : speed_line_setup()
+ * ABSTRACT  : Task of the thread pool. Calculate the delays of one line
+ *             for one speed of sound, from the parts common to all
+ *             speeds.
+ *********************************************************************/
+static void speed_line_setup(void *arg, ui32 i)
+{
+  TSpeedsJob *job = (TSpeedsJob*)arg;
+  ui32 k = job->first + i / job->no_lines;
+  ui32 l = i % job->no_lines;
+  TFocusTimeLine *ftl = job->speed_flc[k].ftl + l;
+  double *paths = job->paths[l];
+
+  if (speed_dependent(job->flc->ftl + l)){
+     ftl->delay = (paths != NULL) ?
+          focus_speed_delays(job->flc->ftl + l, job->speed_sys + k, paths)
+          : NULL;
+     if (ftl->delay == NULL)
+        job->frames[k].failed = TRUE;
+  }else if (ftl->dynamic == TRUE
+           && (paths == NULL
+               || dynamic_speed_table(ftl, job->speed_sys + k,
+                         job->frames[k].time, job->no_samples, paths) == NULL))
+     job->frames[k].failed = TRUE;
+}
+
+
+/*
+ *  Memory for the delay tables of dynamically focused lines of all
+ *  speeds of sound, which are beamformed in one run.
+ */
+#define SPEED_TABLE_BYTES   ((size_t)256 << 20)
+
+
+/*********************************************************************
+ * FUNCTION  : beamform_speeds_typed()
+ * ABSTRACT  : Beamform one image with several speeds of sound, e.g. to
+ *             find the one giving the sharpest image. The result for a
+ *             speed is the same as from beamform_frames_typed() after
+ *             setting up the focusing with that speed of sound.
+ *             The geometry of the focal zones and of the dynamic
+ *             focusing is calculated once, and only scaled by fs/c for
+ *             every speed. The delays of every speed and line are
+ *             calculated in parallel. All lines of all speeds are then
+ *             distributed among the threads. If there are dynamically
+ *             focused lines, the speeds are beamformed in runs, whose
+ *             delay tables fit in SPEED_TABLE_BYTES, at least one speed
+ *             per run.
+ * ARGUMENTS : c_values - The speeds of sound
+ *             no_c - Number of speeds
+ *             bf_lines - 'no_lines' pointers to the lines of the first
+ *                    speed, followed by those of the second speed etc.
+ *             The rest of the arguments are as for beamform_frames_typed()
+ * RETURNS   : 'bf_lines' or NULL in case of wrong settings, or if the
+ *             delays for a speed do not fit in MAX_DELAY samples.
+ *********************************************************************/
+double** beamform_speeds_typed(TThreadPool *pool, TFocusLineCollection *flc,
+         TApoLineCollection* alc, TSysParams* sys, double *c_values,
+         ui32 no_c, double time, void **rf_data, ui32 sample_type,
+         ui32 acc_type, ui32 no_samples, ui32 element_no, TPoint3D *xmt,
+         ui32 out_start, ui32 out_count, double **bf_lines)
+{
+  TSpeedsJob job;
+  TFramesJob run;
+  TDelayScratch *scratch;
+  TFocusTimeLine *ftl;
+  ui32 no_lines = flc->no_focus_time_lines;
+  ui32 group;          /* Number of speeds beamformed in one run        */
+  size_t table_bytes = 0; /* Delay tables of one speed                   */
+  ui32 k, l;
+
+  PFUNC
+
+  if (no_c == 0)
+     return bf_lines;
+
+  job.frames = (TBeamformJob*)malloc(no_c*sizeof(TBeamformJob));
+  assert(job.frames);
+  run.line_kernel = prepare_job(job.frames, pool, flc, alc, sys, time,
+                            rf_data, sample_type, acc_type, no_samples,
+                            element_no, xmt, NULL, bf_lines);
+  scratch = (run.line_kernel != NULL) ?
+            new_delay_scratch(flc, thread_pool_size(pool)) : NULL;
+  if (scratch == NULL){
+     free(job.frames);
+     return NULL;
+  }
+
+  job.speed_flc = (TFocusLineCollection*)malloc(no_c*sizeof(TFocusLineCollection));
+  job.speed_sys = (TSysParams*)malloc(no_c*sizeof(TSysParams));
+  job.paths = (double**)calloc(no_lines + 1, sizeof(double*));
+  assert(job.speed_flc && job.speed_sys && job.paths);
+  job.flc = flc;
+  job.no_lines = no_lines;
+  job.no_samples = no_samples;
+
+  for (k = 0; k < no_c; k++){
+     job.speed_sys[k] = *sys;
+     job.speed_sys[k].c = c_values[k];
+     job.speed_flc[k] = *flc;
+     job.speed_flc[k].ftl = (TFocusTimeLine*)malloc(
+                               (no_lines + 1)*sizeof(TFocusTimeLine));
+     assert(job.speed_flc[k].ftl);
+     for (l = 0; l < no_lines; l++){
+        ftl = job.speed_flc[k].ftl + l;
+        *ftl = flc->ftl[l];
+        memset(&ftl->dyn, 0, sizeof(TDynamicTable));
+        if (k == 0 && ftl->dynamic == TRUE)
+           table_bytes += (size_t)no_samples*(ftl->xdc->no_elements*8
+                                              + sizeof(TPoint3D));
+     }
+
+     prepare_job(job.frames + k, pool, job.speed_flc + k, alc,
+                 job.speed_sys + k, time, rf_data, sample_type, acc_type,
+                 no_samples, element_no, xmt, NULL, bf_lines + k*no_lines);
+     job.frames[k].scratch = scratch;
+     job.frames[k].out_start = out_start;
+     job.frames[k].out_count = out_count;
+  }
+
+  thread_pool_run(pool, no_lines, speed_paths, &job);
+
+  group = no_c;
+  if (table_bytes > 0 && SPEED_TABLE_BYTES / table_bytes < no_c)
+     group = (SPEED_TABLE_BYTES < table_bytes) ? 1
+             : (ui32)(SPEED_TABLE_BYTES / table_bytes);
+
+  run.no_lines = no_lines;
+  for (job.first = 0; job.first < no_c; job.first += group){
+     if (group > no_c - job.first) group = no_c - job.first;
+     thread_pool_run(pool, group*no_lines, speed_line_setup, &job);
+     for (k = job.first; k < job.first + group; k++)
+        if (job.frames[k].failed) bf_lines = NULL;
+
+     run.frames = job.frames + job.first;
+     if (bf_lines != NULL)
+        thread_pool_run(pool, group*no_lines, beamform_frame_line, &run);
+
+     for (k = job.first; k < job.first + group; k++){
+        for (l = 0; l < no_lines; l++){
+           ftl = job.speed_flc[k].ftl + l;
+           if (speed_dependent(flc->ftl + l)) free(ftl->delay);
+           if (bf_lines != NULL && k + group < no_c){
+              ftl->dyn.valid = FALSE;      /* Memory for the next run */
+              job.speed_flc[k + group].ftl[l].dyn = ftl->dyn;
+           }else
+              del_dynamic_table(&ftl->dyn);
         }
-      if (max_no_apo_times > 0){
-         for(i = 0; i < flc->no_focus_time_lines; i++){
-            if (flc->ftl[i].dynamic == TRUE){
-                    if (elem!=NULL)
-                bf_lines[i] = beamform_apo_line_dynamic_sta(flc->ftl+i,alc->atl+i,sys,time,rf_data,no_samples, elem);
-                    else
-                bf_lines[i] = beamform_apo_line_dynamic(flc->ftl+i,alc->atl+i,sys,time,rf_data,no_samples);
-            }else if(flc->ftl[i].pixel == TRUE){
-                bf_lines[i] = beamform_apo_line_pixels(flc->ftl+i,alc->atl+i,sys,time,rf_data,no_samples,-1);
-            }else{
-                bf_lines[i] = beamform_apo_line_times(flc->ftl+i,alc->atl+i,sys,time,rf_data,no_samples);
-            }    
-         }
-      }else{
-         for(i = 0; i < flc->no_focus_time_lines; i++){
-             if (flc->ftl[i].dynamic == TRUE){
-                    if (elem != NULL)
-                bf_lines[i] = beamform_line_dynamic_sta(flc->ftl+i,sys,time,rf_data,no_samples, elem);
-                    else
-                bf_lines[i] = beamform_line_dynamic(flc->ftl+i,sys,time,rf_data,no_samples);
-             }else if(flc->ftl[i].pixel == TRUE){
-                bf_lines[i] = beamform_line_pixels(flc->ftl+i,sys,time,rf_data,no_samples,-1);
-             }else{
-               bf_lines[i] = beamform_line_times(flc->ftl+i,sys,time,rf_data,no_samples);
-             }  
-         }
      }
-   }
+     if (bf_lines == NULL) break;
+  }
+
+  for (l = 0; l < no_lines; l++)
+     if (job.paths[l] != NULL) free(job.paths[l]);
+  for (k = 0; k < no_c; k++)
+     free(job.speed_flc[k].ftl);
+  del_delay_scratch(scratch);
+  free(job.frames);
+  free(job.speed_flc);
+  free(job.speed_sys);
+  free(job.paths);
   return bf_lines;
 }
 
 
+/*********************************************************************
+ * FUNCTION  : beamform_sta_line()
+ * ABSTRACT  : Beamform line 'i' of every emission into a scratch line,
+ *             and add it to the high resolution line. Task of the
+ *             thread pool. Lines with focal zones are added as in
+ *             add_images(), dynamically focused lines are summed.
+ *********************************************************************/
+static void beamform_sta_line(void *arg, ui32 i)
+{
+  TStaJob *job = (TStaJob*)arg;
+  TBeamformJob *e = job->emissions;
+  TFocusTimeLine *ftl = e->flc->ftl + i;
+  TApoTimeLine *satl = job->salc->atl + i;
+  ui32 no_samples = e->no_samples;
+  double *hi = job->hi_res[i];
+  double *lo;
+  ui32 k, os;
+
+  lo = (double*)malloc(no_samples*sizeof(double));
+  assert(lo);
+  memset(hi, 0, no_samples*sizeof(double));
+
+  for (k = 0; k < job->no_emissions; k++){
+     e = job->emissions + k;
+     job->lo_res[i] = lo;
+     job->line_kernel(e, i);
+     if (job->lo_res[i] == NULL) continue;
+
+     if (ftl->dynamic == TRUE){
+        for (os = 0; os < no_samples; os++)
+           hi[os] += lo[os];
+     }else if (satl->no_times > 0){
+        add_apo_lines_time(ftl, satl, e->sys, hi, lo, job->elements[k],
+                           e->time, no_samples);
+     }else{
+        add_lines_time(ftl, e->sys, hi, lo, job->elements[k],
+                       e->time, no_samples);
+     }
+  }
+  free(lo);
+}
+
+
+/*********************************************************************
+ * FUNCTION  : beamform_sta_typed()
+ * ABSTRACT  : Synthetic transmit aperture imaging. Beamforms all
+ *             emissions of one frame and sums them into a high 
+ *             resolution image, without making the low resolution
+ *             images. Gives the same result as beamforming every
+ *             emission, and adding it with add_images() (lines with
+ *             focal zones), or summing the images (dynamically focused
+ *             lines). The lines are distributed among the threads in
+ *             'pool', and every thread keeps one scratch line.
+ * ARGUMENTS : salc - The sum apodization, used for the lines with focal
+ *                    zones.
+ *             rf_data - 'no_elements' pointers to the channels of the
+ *                    first emission, followed by those of the second 
+ *                    emission etc.
+ *             elements - Transmit element of every emission, or NULL.
+ *             tx - Transmitted wave of every emission (a transmit 
+ *                    position, a plane or a diverging wave). Used if 
+ *                    'elements' is NULL. Lines with focal zones need
+ *                    the transmit elements.
+ *             hi_res - One pointer per line to 'no_samples' samples.
+ *             The rest of the arguments are as for beamform_image_typed()
+ * RETURNS   : 'hi_res' or NULL in case of wrong settings.
+ *********************************************************************/
+double** beamform_sta_typed(TThreadPool *pool, TFocusLineCollection *flc,
+         TApoLineCollection* alc, TApoLineCollection* salc, TSysParams* sys,
+         double time, void **rf_data, ui32 sample_type, ui32 acc_type,
+         ui32 no_emissions, ui32 no_samples, ui32 no_elements,
+         ui32 *elements, TTransmit *tx, double **hi_res)
+{
+  TStaJob job;
+  TDelayScratch *scratch;
+  TFocusTimeLine *ftl;
+  ui32 no_lines;
+  ui32 k, i;
+
+  PFUNC
+
+  no_lines = flc->no_focus_time_lines;
+  if (salc->no_apo_time_lines != no_lines){
+     eprintf("\007 beamform_sta:\n");
+     eprintf("Error : the number of sum apodization lines and the number ");
+     eprintf("of focus lines must be the same \n");
+     return NULL;
+  }
+
+  for (i = 0; i < no_lines; i++){
+     ftl = flc->ftl + i;
+     if (ftl->pixel == TRUE){
+        eprintf("\007 beamform_sta:\n");
+        eprintf("Error : pixel based focusing is not supported \n");
+        return NULL;
+     }
+     if (ftl->dynamic != TRUE && elements == NULL){
+        eprintf("\007 beamform_sta:\n");
+        eprintf("Error : lines with focal zones need the transmit ");
+        eprintf("elements \n");
+        return NULL;
+     }
+  }
+
+  if (elements == NULL && tx == NULL){
+     eprintf("\007 beamform_sta:\n");
+     eprintf("Error : no transmit elements or waves \n");
+     return NULL;
+  }
+
+  if (no_emissions == 0 || no_lines == 0)
+     return hi_res;
+
+  job.emissions = (TBeamformJob*)malloc(no_emissions*sizeof(TBeamformJob));
+  job.lo_res = (double**)calloc(no_lines, sizeof(double*));
+  assert(job.emissions && job.lo_res);
+  job.no_emissions = no_emissions;
+  job.elements = elements;
+  job.salc = salc;
+  job.hi_res = hi_res;
+
+  for (k = 0; k < no_emissions; k++){
+     if (elements != NULL && elements[k] >= no_elements){
+        eprintf("\007 beamform_sta:\n");
+        eprintf("Error : transmit element %d does not exist \n", elements[k]);
+        job.line_kernel = NULL;
+     }else{
+        job.line_kernel = prepare_job(job.emissions + k, pool, flc, alc,
+                            sys, time, rf_data + k*no_elements, sample_type,
+                            acc_type, no_samples,
+                            (elements != NULL) ? elements[k] : (ui32)-1,
+                            NULL, (elements != NULL) ? NULL : tx + k,
+                            job.lo_res);
+     }
+     if (job.line_kernel == NULL){
+        free(job.emissions);
+        free(job.lo_res);
+        return NULL;
+     }
+  }
+
+  scratch = new_delay_scratch(flc, thread_pool_size(pool));
+  if (scratch == NULL){
+     free(job.emissions);
+     free(job.lo_res);
+     return NULL;
+  }
+  for (k = 0; k < no_emissions; k++)
+     job.emissions[k].scratch = scratch;
+
+  if (dynamic_tables(job.emissions))
+     thread_pool_run(pool, no_lines, beamform_sta_line, &job);
+  else
+     hi_res = NULL;
+
+  del_delay_scratch(scratch);
+  free(job.emissions);
+  free(job.lo_res);
+  return hi_res;
+}
+
+
+/*********************************************************************
+ * FUNCTION  : beamform_image_into()
+ * ABSTRACT  : beamforms a whole image of double RF data into memory
+ *             supplied by the caller. See beamform_image_typed().
+ *********************************************************************/
+double** beamform_image_into(TThreadPool *pool, TFocusLineCollection *flc,
+         TApoLineCollection* alc, TSysParams* sys, double time,
+         double **rf_data, ui32 no_samples, ui32 element_no, TPoint3D *xmt,
+         double **bf_lines)
+{
+  return beamform_image_typed(pool, flc, alc, sys, time, (void**)rf_data,
+                              BFT_FLOAT64, BFT_ACC_DOUBLE, no_samples,
+                              element_no, xmt, bf_lines);
+}
+
+
+/*********************************************************************
+ * FUNCTION  : beamform_image_mt()
+ * ABSTRACT  : beamforms a whole image, using the threads in 'pool'.
+ *             Memory is allocated for every beamformed line.
+ *********************************************************************/
+double** beamform_image_mt(TThreadPool *pool, TFocusLineCollection *flc,
+         TApoLineCollection* alc, TSysParams* sys, double time,
+         double **rf_data, ui32 no_samples, ui32 element_no, TPoint3D *xmt)
+{
+  double **bf_lines;      /* The collection of beamformed lines         */
+  double **res;
+
+  bf_lines = (double**)calloc(flc->no_focus_time_lines,sizeof(double*));
+  if (bf_lines == NULL){
+     eprintf("\007 beamform_image:\n");
+     eprintf("Errot : cannot allocate memory for the output image\n");
+     return NULL;
+  }
+
+  res = beamform_image_into(pool, flc, alc, sys, time, rf_data, no_samples,
+                            element_no, xmt, bf_lines);
+  if (res == NULL) free(bf_lines);
+  return res;
+}
+
+
+/*********************************************************************
+ * FUNCTION  : beamform_image()
+ * ABSTRACT  : beamforms a whole image
+ *
+ *********************************************************************/
+double** beamform_image(TFocusLineCollection *flc, TApoLineCollection* alc,
+         TSysParams* sys, double time, double **rf_data, ui32 no_samples,
+         ui32 element_no, TPoint3D *xmt)
+{
+  return beamform_image_mt(NULL, flc, alc, sys, time, rf_data, no_samples,
+                           element_no, xmt);
+}
 
 
 
@@ -0,0 +1,202 @@
+/*********************************************************************
+ * NAME     : envelope.c
+ * ABSTRACT : Envelope detection and log compression of beamformed
+ *            lines. Both are done in the library, right after the
+ *            beamforming, so that a B-mode frame does not travel
+ *            through several passes over full frame temporaries.
+ *********************************************************************/
+
+#include "../h/envelope.h"
+#include "../h/beamform.h"
+#include "../h/error.h"
+
+#include <math.h>
+#include <stdlib.h>
+#include <string.h>
+
+#ifndef M_PI
+#define M_PI 3.14159265358979323846
+#endif
+
+
+/*
+ *  Everything that is needed to process the lines of one frame
+ */
+typedef struct{
+   TEnvelope *env;
+   double **lines;        /* The lines. Their envelope is stored in place */
+   ui32 no_samples;       /* Number of (complex) samples per line          */
+   double *hilbert;       /* Coefficients h[0] .. h[M] of the filter       */
+   ui32 half;             /* M = (no_taps - 1)/2                           */
+   double *line_max;      /* Largest envelope of every line               */
+   double reference;      /* Envelope at 0 dB                              */
+   void *out;
+   ui32 out_type;
+}TEnvelopeJob;
+
+
+/*********************************************************************
+ * FUNCTION  : hilbert_filter()
+ * ABSTRACT  : Calculate the coefficients h[k], k = 0..half, of a
+ *            Hamming windowed Hilbert filter with 2*half + 1 taps.
+ *            The filter is antisymmetric, h[-k] = -h[k], and every
+ *            other coefficient is 0.
+ *********************************************************************/
+static void hilbert_filter(double *h, ui32 half)
+{
+  ui32 k;
+
+  for (k = 0; k <= half; k ++){
+     if (k % 2 == 0)
+        h[k] = 0;
+     else
+        h[k] = 2/(M_PI*k) * (0.54 + 0.46*cos(M_PI*k/half));
+  }
+}
+
+
+/*********************************************************************
+ * FUNCTION  : envelope_line()
+ * ABSTRACT  : Replace line 'i' with its envelope, and find its
+ *            maximum. The samples of an RF line are needed by the
+ *            filter after they are overwritten, so they are copied.
+ *            Task of the thread pool.
+ *********************************************************************/
+static void envelope_line(void *arg, ui32 i)
+{
+  TEnvelopeJob *job = (TEnvelopeJob*)arg;
+  double *line = job->lines[i];
+  ui32 no_samples = job->no_samples;
+  ui32 half = job->half;
+  double *x;
+  double q;            /* Hilbert transform of the line                 */
+  double e;
+  double mx = 0;
+  ui32 n, k;
+
+  if (job->env->iq){
+     for (n = 0; n < no_samples; n ++){
+        e = sqrt(line[2*n]*line[2*n] + line[2*n + 1]*line[2*n + 1]);
+        line[n] = e;
+        if (e > mx) mx = e;
+     }
+     job->line_max[i] = mx;
+     return;
+  }
+
+  x = (double*)malloc(((size_t)no_samples + 1)*sizeof(double));
+  assert(x);
+  memcpy(x, line, no_samples*sizeof(double));
+
+  for (n = 0; n < no_samples; n ++){
+     q = 0;
+     for (k = 1; k <= half; k += 2){
+        if (n >= k) q += job->hilbert[k]*x[n - k];
+        if (n + k < no_samples) q -= job->hilbert[k]*x[n + k];
+     }
+     e = sqrt(x[n]*x[n] + q*q);
+     line[n] = e;
+     if (e > mx) mx = e;
+  }
+  job->line_max[i] = mx;
+  free(x);
+}
+
+
+/*********************************************************************
+ * FUNCTION  : compress_line()
+ * ABSTRACT  : Log compress the envelope of line 'i' into row 'i' of
+ *            the output. The levels between the reference and
+ *            'dynamic_range' dB below it are shown, the others are
+ *            clipped. Task of the thread pool.
+ *********************************************************************/
+static void compress_line(void *arg, ui32 i)
+{
+  TEnvelopeJob *job = (TEnvelopeJob*)arg;
+  double *line = job->lines[i];
+  double range = job->env->dynamic_range;
+  double floor_level = job->reference * pow(10, -range/20);
+  double db;
+  float *f32 = (float*)job->out + (size_t)i*job->no_samples;
+  unsigned char *u8 = (unsigned char*)job->out + (size_t)i*job->no_samples;
+  ui32 n;
+
+  for (n = 0; n < job->no_samples; n ++){
+     if (line[n] <= floor_level)
+        db = -range;
+     else if (line[n] >= job->reference)
+        db = 0;
+     else
+        db = 20*log10(line[n]/job->reference);
+
+     if (job->out_type == BFT_UINT8)
+        u8[n] = (unsigned char)((db + range)*255/range + 0.5);
+     else
+        f32[n] = (float)db;
+  }
+}
+
+
+/*********************************************************************
+ * FUNCTION  : envelope_lines()
+ * ABSTRACT  : Detect the envelope of the lines, and log compress it.
+ *            The envelopes are stored in the lines, and the compressed
+ *            image in 'out'.
+ * ARGUMENTS : env - Settings. With env->iq, every line has I and Q of
+ *                   'no_samples' samples interleaved, otherwise it has
+ *                   'no_samples' RF samples.
+ *             out - 'no_lines' rows of 'no_samples' display samples
+ *             out_type - BFT_FLOAT32 (dB) or BFT_UINT8
+ * RETURNS   : 'no_lines', or 0 in case of wrong settings
+ *********************************************************************/
+ui32 envelope_lines(TThreadPool *pool, TEnvelope *env, double **lines,
+                    ui32 no_lines, ui32 no_samples, void *out,
+                    ui32 out_type)
+{
+  TEnvelopeJob job;
+  ui32 i;
+
+  PFUNC
+  if (out_type != BFT_FLOAT32 && out_type != BFT_UINT8){
+     eprintf("\007 envelope_lines:\n");
+     eprintf("Error : the display samples are BFT_FLOAT32 or BFT_UINT8\n");
+     return 0;
+  }
+  if (!(env->dynamic_range > 0)){
+     eprintf("\007 envelope_lines:\n");
+     eprintf("Error : the dynamic range must be positive\n");
+     return 0;
+  }
+  if (!env->iq && (env->no_taps < 3 || env->no_taps % 2 == 0)){
+     eprintf("\007 envelope_lines:\n");
+     eprintf("Error : the Hilbert filter needs an odd number of taps >= 3\n");
+     return 0;
+  }
+
+  job.env = env;
+  job.lines = lines;
+  job.no_samples = no_samples;
+  job.half = env->iq ? 0 : (env->no_taps - 1)/2;
+  job.hilbert = (double*)malloc((job.half + 1)*sizeof(double));
+  job.line_max = (double*)malloc(((size_t)no_lines + 1)*sizeof(double));
+  assert(job.hilbert && job.line_max);
+  job.out = out;
+  job.out_type = out_type;
+  if (!env->iq) hilbert_filter(job.hilbert, job.half);
+
+  thread_pool_run(pool, no_lines, envelope_line, &job);
+
+  job.reference = env->reference;
+  if (!(job.reference > 0)){
+     job.reference = 0;
+     for (i = 0; i < no_lines; i ++)
+        if (job.line_max[i] > job.reference) job.reference = job.line_max[i];
+     if (job.reference == 0) job.reference = 1;
+  }
+
+  thread_pool_run(pool, no_lines, compress_line, &job);
+
+  free(job.hilbert);
+  free(job.line_max);
+  return no_lines;
+}
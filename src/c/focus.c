@@ -12,9 +12,12 @@
 #include "../h/sys_params.h"
 #include "../h/geometry.h"
 #include "../h/error.h"
+#include "../h/threads.h"
+#include "../h/simd.h"
 
 #include <math.h>
 #include <stdlib.h>
+#include <string.h>
 
 
 
@@ -26,24 +29,73 @@ void del_apodization(TApodization *a)
 {
   PFUNC
   if (a->a!=NULL) free(a->a);
+  if (a->active!=NULL) free(a->active);
   a->a = NULL;
+  a->active = NULL;
+  a->no_active = 0;
   a->time = 0.0;
 }
 
 
+/*********************************************************************
+ * FUNCTION  : set_active_channels
+ * ABSTRACT  : Make the list of channels with non-zero apodization.
+ *             The beamforming routines skip all other channels.
+ *********************************************************************/
+static void set_active_channels(TApodization *a, ui32 no_elements)
+{
+  ui32 ic;
+
+  a->no_active = 0;
+  for (ic = 0; ic < no_elements; ic ++)
+     if (a->a[ic] != 0.0) a->active[a->no_active ++] = ic;
+}
+
+
+
+/*********************************************************************
+ * FUNCTION  : new_apo_zones
+ * ABSTRACT  : Allocate the apodization zones of one line, and the 
+ *             closing zone, in one block. The zones are followed by
+ *             their coefficients and lists of active channels, zone 
+ *             after zone, so a line is set up with one allocation and
+ *             released with one free(). 
+ * RETURNS   : The zones. Only the closing zone is initialized.
+ *********************************************************************/
+static TApodization* new_apo_zones(ui32 no_times, ui32 no_elements)
+{
+  TApodization *zones;
+  float *a;
+  ui32 *active;
+  size_t n = (size_t)(no_times + 1)*no_elements;
+  ui32 i;
+
+  zones = (TApodization*)malloc((no_times + 1)*sizeof(TApodization)
+              + n*sizeof(float) + (n + no_times + 1)*sizeof(ui32));
+  assert(zones);
+  a = (float*)(zones + no_times + 1);
+  active = (ui32*)(a + n);
+  for (i = 0; i <= no_times; i ++){
+     zones[i].time = 0.0;
+     zones[i].a = a + (size_t)i*no_elements;
+     zones[i].no_active = 0;
+     zones[i].active = active + (size_t)i*(no_elements + 1);
+  }
+  memset(zones[no_times].a, 0, no_elements*sizeof(float));
+  zones[no_times].time = MAX_SAMPLE_NO;
+  return zones;
+}
+
+
 
 /*********************************************************************
  * FUNCTION  : del_apo_time_line
+ * ABSTRACT  : Release the zones allocated by new_apo_zones()
  *********************************************************************/
 void del_apo_time_line(TApoTimeLine* al)
 {
   PFUNC
-  if (al->a!=NULL) {
-     for(;al->no_times>0;al->no_times--)
-        del_apodization(al->a + al->no_times - 1);
-     free(al->a);
-  }
-  
+  if (al->a!=NULL) free(al->a);
   al->no_times = 0;
   al->a = NULL;
 }
@@ -67,7 +119,9 @@ void del_apo_line_collection(TApoLineCollection* alc)
  
 /*********************************************************************
  * FUNCTION  : del_delay
- * ABSTRACT  : Delete one delay
+ * ABSTRACT  : Delete one delay, whose arrays are allocated separately.
+ *             The delays of the focus time lines are allocated by
+ *             new_delays() and are released by del_focus_time_line().
  *********************************************************************/
 void del_delay(TDelay* d) 
 {
@@ -83,9 +137,8 @@ void del_delay(TDelay* d)
 void del_filter_bank(TFilterBank* fb)
 {
   PFUNC
- /* if (fb->bank != NULL) free(fb->bank);
+  if (fb->bank != NULL) free(fb->bank);
   if (fb->coefs != NULL) free(fb->coefs);
- */ 
   fb->Ntaps = 0;
   fb->Nf = 0;
   fb->bank = NULL;
@@ -94,6 +147,135 @@ void del_filter_bank(TFilterBank* fb)
 
 
 
+/*********************************************************************
+ * FUNCTION  : find_delay
+ * ABSTRACT  : Binary search for the focal zone which follows the one
+ *             used at 'sample'. The start times of the zones must be
+ *             increasing. The last entry of 'delay' is the end marker.
+ * RETURNS   : The smallest index ind >= 1 with delay[ind].time >= sample,
+ *             or no_times if there is none. The used zone is ind - 1.
+ *********************************************************************/
+ui32 find_delay(TFocusTimeLine *ftl, double sample)
+{
+  ui32 lo = 1;
+  ui32 hi = ftl->no_times;
+  ui32 mid;
+
+  while (lo < hi){
+     mid = lo + (hi - lo)/2;
+     if (ftl->delay[mid].time < sample) lo = mid + 1;
+     else hi = mid;
+  }
+  return lo;
+}
+
+
+
+/*********************************************************************
+ * FUNCTION  : find_apodization
+ * ABSTRACT  : Same as find_delay(), for the apodization zones.
+ *********************************************************************/
+ui32 find_apodization(TApoTimeLine *atl, double sample)
+{
+  ui32 lo = 1;
+  ui32 hi = atl->no_times;
+  ui32 mid;
+
+  while (lo < hi){
+     mid = lo + (hi - lo)/2;
+     if (atl->a[mid].time < sample) lo = mid + 1;
+     else hi = mid;
+  }
+  return lo;
+}
+
+
+
+/*********************************************************************
+ * FUNCTION  : del_dynamic_table
+ * ABSTRACT  : Release the cached delays of a dynamically focused line
+ *********************************************************************/
+void del_dynamic_table(TDynamicTable* t)
+{
+  PFUNC
+  if (t->point != NULL) free(t->point);
+  if (t->index != NULL) free(t->index);
+  if (t->frac != NULL) free(t->frac);
+  t->point = NULL;
+  t->index = NULL;
+  t->frac = NULL;
+  t->valid = FALSE;
+}
+
+
+/*********************************************************************
+ * FUNCTION  : new_delays
+ * ABSTRACT  : Allocate the focal zones of one line, and the closing 
+ *             zone, in one block. The zones are followed by the integer
+ *             parts (16 bits) and the coefficients (float) of their 
+ *             delays, zone after zone. Setting up a line with many 
+ *             zones costs a single allocation, and the delays of 
+ *             consecutive zones are next to each other in memory.
+ * ARGUMENTS : focus - If not NULL, room for one focal point per zone is
+ *                     reserved in the block, and returned in *focus.
+ * RETURNS   : The zones. Only the closing zone is initialized.
+ *********************************************************************/
+static TDelay* new_delays(ui32 no_times, ui32 no_elements, TPoint3D **focus)
+{
+  TDelay *delay;
+  TPoint3D *points;
+  float *a;
+  si16 *d;
+  size_t n = (size_t)(no_times + 1)*no_elements;
+  size_t no_points = (focus != NULL) ? no_times : 0;
+  ui32 i;
+
+  delay = (TDelay*)malloc((no_times + 1)*sizeof(TDelay)
+              + no_points*sizeof(TPoint3D) 
+              + n*(sizeof(float) + sizeof(si16)));
+  assert(delay);
+  points = (TPoint3D*)(delay + no_times + 1);
+  a = (float*)(points + no_points);
+  d = (si16*)(a + n);
+  if (focus != NULL) *focus = points;
+  for (i = 0; i <= no_times; i ++){
+     delay[i].time = 0.0;
+     delay[i].a = a + (size_t)i*no_elements;
+     delay[i].d = d + (size_t)i*no_elements;
+  }
+  memset(delay[no_times].a, 0, no_elements*sizeof(float));
+  memset(delay[no_times].d, 0, no_elements*sizeof(si16));
+  delay[no_times].time = MAX_SAMPLE_NO;
+  return delay;
+}
+
+
+/*********************************************************************
+ * FUNCTION  : delay_fits
+ * ABSTRACT  : Whether the integer part of a delay in samples can be
+ *             stored in TDelay.d
+ *********************************************************************/
+static ui32 delay_fits(double sample_delay)
+{
+  return fabs(sample_delay) < MAX_DELAY;
+}
+
+
+/*********************************************************************
+ * FUNCTION  : delays_too_long
+ * ABSTRACT  : Report that some delays of line 'line_no' do not fit in
+ *             TDelay.d, and release the zones allocated for them.
+ * RETURNS   : FALSE
+ *********************************************************************/
+static ui32 delays_too_long(TDelay *delay, ui32 line_no)
+{
+  free(delay);
+  eprintf("\007 Error : the delays of line %u do not fit in %d samples."
+          " The line is not changed.\n", line_no, MAX_DELAY);
+  return FALSE;
+}
+
+
 /*********************************************************************
  * FUNCTION  : del_focus_time_line
  * ABSTRACT  : delete a focus time line. 
@@ -102,14 +284,13 @@ void del_filter_bank(TFilterBank* fb)
 void del_focus_time_line(TFocusTimeLine* p)
 { 
    PFUNC
-   if(p->delay!=NULL)
-   {
-     for(; p->no_times > 0; p->no_times--)
-        del_delay(p->delay + p->no_times-1);
-     free(p->delay);
-     p->delay = NULL;
-   }
+   if(p->delay!=NULL) free(p->delay);
    if(p->pixels!=NULL) free(p->pixels);
+   p->delay = NULL;
+   p->focus = NULL;
+   p->pixels = NULL;
+   p->no_times = 0;
+   del_dynamic_table(&p->dyn);
 }
 
 
@@ -168,6 +349,7 @@ void set_center_focus(TFocusLineCollection *flc, TPoint3D *p, ui32 line_no)
       flc->ftl[line_no].center.x = p->x;
       flc->ftl[line_no].center.y = p->y;
       flc->ftl[line_no].center.z = p->z;
+      flc->ftl[line_no].dyn.valid = FALSE;
    }else{
       errprintf("%s","Error: line_no is out of range \n");
    }
@@ -188,12 +370,343 @@ void set_dynamic_focus(TFocusLineCollection *flc, TTransducer* xdc,
       flc->ftl[line_no].dynamic = TRUE;
       flc->ftl[line_no].pixel = FALSE;
       flc->ftl[line_no].xdc = xdc;
+      flc->ftl[line_no].dyn.valid = FALSE;
    }else{
       errprintf("%s,","\"line_no\" is out of range \n");
    }
 }
 
 
+/*********************************************************************
+ * FUNCTION  : dynamic_path_terms
+ * ABSTRACT  : The part of the receive delays of a dynamically focused
+ *             line, which does not depend on the speed of sound. The
+ *             focal point of absolute output sample n is at the 
+ *             distance n*c/(2*fs) from the center, in the direction u
+ *             of the line. With r = center - element, the delay of an
+ *             element in samples is then
+ *
+ *                sqrt((fs/c)^2 * |r|^2 + n * fs/c * r.u + n^2/4)
+ *
+ * ARGUMENTS : ftl - The line. Must be dynamically focused.
+ *             terms - Room for 2*no_elements values. Out: |r|^2 of
+ *                     every element, followed by r.u of every element.
+ *********************************************************************/
+void dynamic_path_terms(TFocusTimeLine *ftl, double *terms)
+{
+  TTransducer *xdc = ftl->xdc;
+  TPoint3D u;          /* Direction of the line                        */
+  TPoint3D r;          /* From the element to the center               */
+  double len;
+  ui32 ic;
+
+  u.x = tan(ftl->dir_xz);
+  u.y = tan(ftl->dir_yz);
+  len = sqrt(1 + u.x*u.x + u.y*u.y);
+  u.x /= len;
+  u.y /= len;
+  u.z = 1/len;
+
+  for (ic = 0; ic < xdc->no_elements; ic ++){
+     r.x = ftl->center.x - xdc->c[ic].x;
+     r.y = ftl->center.y - xdc->c[ic].y;
+     r.z = ftl->center.z - xdc->c[ic].z;
+     terms[ic] = r.x*r.x + r.y*r.y + r.z*r.z;
+     terms[xdc->no_elements + ic] = r.x*u.x + r.y*u.y + r.z*u.z;
+  }
+}
+
+
+/*********************************************************************
+ * FUNCTION  : dynamic_speed_table
+ * ABSTRACT  : dynamic_table() with the terms of dynamic_path_terms()
+ *             given, e.g. shared by several speeds of sound. The 
+ *             delays are the same as from dynamic_table(). The memory
+ *             of a previous table of the same size is reused.
+ * ARGUMENTS : terms - From dynamic_path_terms() for the line
+ *             The rest of the arguments are as for dynamic_table()
+ * RETURNS   : As for dynamic_table()
+ *********************************************************************/
+TDynamicTable* dynamic_speed_table(TFocusTimeLine *ftl, TSysParams* sys,
+                     double time, ui32 no_samples, double *terms)
+{
+  TDynamicTable *t = &ftl->dyn;
+  TTransducer *xdc = ftl->xdc;
+  TPoint3D p;          /* Current focal point                          */
+  double dX;           /* Increments of X, Y, Z per sample             */
+  double dY;
+  double dZ;
+  double dR;
+  double scale;        /* Conversion from distance to samples          */
+  double scale2;       /* scale^2                                      */
+  double n;            /* Absolute output index                        */
+  double *ru = terms + xdc->no_elements;
+  const TSimdKernels *simd = simd_kernels();
+  double sample_index; /* The receive delay in samples                 */
+  ui32 o_abs_s;        /* Absolute output index                        */
+  ui32 os;             /* Output index                                 */
+  ui32 ic;             /* Index of channel                             */
+  ui32 no_rows;        /* Number of output samples with delays         */
+  ui32 *index;
+  float *frac;
+
+  if (t->valid && t->no_samples == no_samples
+      && t->c == sys->c && t->fs == sys->fs && t->time == time
+      && t->xdc_version == xdc->version)
+     return t;
+
+  PFUNC
+  no_rows = (no_samples > 0) ? no_samples - 1 : 0;
+  if (t->index != NULL && t->no_samples == no_samples
+      && t->no_elements == xdc->no_elements)
+     t->valid = FALSE;                  /* Same size, the memory is reused */
+  else{
+     del_dynamic_table(t);
+     t->point = (TPoint3D*)malloc((no_rows + 1)*sizeof(TPoint3D));
+     t->index = (ui32*)malloc(((size_t)no_rows*xdc->no_elements + 1)*sizeof(ui32));
+     t->frac = (float*)malloc(((size_t)no_rows*xdc->no_elements + 1)*sizeof(float));
+  }
+  if (t->point == NULL || t->index == NULL || t->frac == NULL){
+     eprintf("\007 Error : cannot allocate %lu bytes for the delays of a "
+             "dynamically focused line\n",
+             (unsigned long)((size_t)no_rows*xdc->no_elements*8));
+     del_dynamic_table(t);
+     return NULL;
+  }
+  
+  dR = sys->c / sys->fs / 2;
+  dX = tan(ftl->dir_xz);
+  dY = tan(ftl->dir_yz);
+  
+  dZ= dR/sqrt(1+dX*dX+dY*dY); /* dZ=sqrt(1+tan(dir_xz)^2+tan(dir_yz)^2)*/
+  dX*= dZ;                    /* dX = tan(dir_xz) * dZ                 */
+  dY*= dZ;                    /* dY = tan(dir_yz) * dZ                 */
+  
+  o_abs_s = (ui32)floor(time * sys->fs);    /* time => sample index    */
+
+  p.x = ftl->center.x + dX*o_abs_s;
+  p.y = ftl->center.y + dY*o_abs_s;
+  p.z = ftl->center.z + dZ*o_abs_s;
+
+  scale = sys->fs / sys->c;
+  scale2 = scale*scale;
+
+  index = t->index;
+  frac = t->frac;
+  for (os = 0; os < no_rows; os ++){
+     t->point[os] = p;
+     n = (double)o_abs_s + os;
+     if (simd->table_row != NULL){
+        simd->table_row(index, frac, terms, ru, scale2, n*scale, n*n/4,
+                        xdc->no_elements);
+        index += xdc->no_elements;
+        frac += xdc->no_elements;
+     }else{
+        for(ic = 0; ic < xdc->no_elements; ic ++){
+           sample_index = terms[ic]*scale2 + n*scale*ru[ic] + n*n/4;
+           sample_index = (sample_index > 0) ? sqrt(sample_index) : 0;
+           *index = (ui32)sample_index;
+           *frac = (float)(sample_index - *index);
+           if (*frac >= 1.0f){         /* Rounded up to the next sample */
+              *index += 1;
+              *frac = 0.0f;
+           }
+           index ++; frac ++;
+        }
+     }
+
+     p.x+=dX;
+     p.y+=dY;
+     p.z+=dZ;
+  }
+
+  t->valid = TRUE;
+  t->no_samples = no_samples;
+  t->no_elements = xdc->no_elements;
+  t->xdc_version = xdc->version;
+  t->c = sys->c;
+  t->fs = sys->fs;
+  t->time = time;
+  return t;
+}
+
+
+/*********************************************************************
+ * FUNCTION  : dynamic_table
+ * ABSTRACT  : Get the receive delays of a dynamically focused line.
+ *             The table is calculated only if the speed of sound, the
+ *             sampling frequency, the start time, the number of
+ *             samples or the transducer have changed since the last
+ *             call. Otherwise the cached table is returned. The
+ *             fractional part of a delay is kept in single precision,
+ *             so that an entry takes 8 bytes.
+ * ARGUMENTS : ftl - The focus time line. Must be dynamically focused.
+ *             sys - System parameters
+ *             time - Time of the first sample
+ *             no_samples - Number of samples per channel
+ * RETURNS   : Pointer to the table, or NULL if there is not enough
+ *             memory for it. The table has no_samples - 1 rows with one
+ *             entry per element, (no_samples - 1)*no_elements*8 bytes.
+ *             The last output sample is always 0 and has no delays.
+ *********************************************************************/
+TDynamicTable* dynamic_table(TFocusTimeLine *ftl, TSysParams* sys,
+                     double time, ui32 no_samples)
+{
+  TDynamicTable *t = &ftl->dyn;
+  double *terms;
+
+  if (t->valid && t->no_samples == no_samples
+      && t->c == sys->c && t->fs == sys->fs && t->time == time
+      && t->xdc_version == ftl->xdc->version)
+     return t;
+
+  terms = (double*)malloc((2*(size_t)ftl->xdc->no_elements + 1)*sizeof(double));
+  if (terms == NULL){
+     eprintf("%s", "\007 Error : cannot allocate the delays of a "
+             "dynamically focused line\n");
+     return NULL;
+  }
+  dynamic_path_terms(ftl, terms);
+  t = dynamic_speed_table(ftl, sys, time, no_samples, terms);
+  free(terms);
+  return t;
+}
+
+
+/*********************************************************************
+ * FUNCTION  : new_delay_scratch
+ * ABSTRACT  : Allocate one TDelayScratch per thread, with room for the
+ *             channels of every line of 'flc'. The lines beamformed by
+ *             a thread use its scratch in turn, so nothing is 
+ *             allocated per line.
+ * ARGUMENTS : flc - The focusing
+ *             no_threads - Number of threads, see thread_pool_size()
+ * RETURNS   : The array, to be released with del_delay_scratch(), or
+ *             NULL if there is not enough memory.
+ *********************************************************************/
+TDelayScratch* new_delay_scratch(TFocusLineCollection *flc, ui32 no_threads)
+{
+  TDelayScratch *scratch;
+  ui32 size = 1;       /* Room for the channels of every line          */
+  ui32 i;
+
+  for (i = 0; i < flc->no_focus_time_lines; i++)
+     if (flc->ftl[i].xdc->no_elements >= size)
+        size = flc->ftl[i].xdc->no_elements + 1;
+
+  scratch = (TDelayScratch*)malloc(no_threads*sizeof(TDelayScratch));
+  if (scratch != NULL){
+     scratch[0].index = (ui32*)malloc((size_t)no_threads*size*sizeof(ui32));
+     scratch[0].frac = (double*)malloc((size_t)no_threads*size*sizeof(double));
+     scratch[0].weights = (si32*)malloc((size_t)no_threads*2*size*sizeof(si32));
+  }
+  if (scratch == NULL || scratch[0].index == NULL || scratch[0].frac == NULL
+      || scratch[0].weights == NULL){
+     eprintf("\007 new_delay_scratch:\n");
+     eprintf("Error : cannot allocate memory for the delays of the lines\n");
+     del_delay_scratch(scratch);
+     return NULL;
+  }
+
+  for (i = 1; i < no_threads; i++){
+     scratch[i].index = scratch[0].index + (size_t)i*size;
+     scratch[i].frac = scratch[0].frac + (size_t)i*size;
+     scratch[i].weights = scratch[0].weights + (size_t)i*2*size;
+  }
+  return scratch;
+}
+
+
+/*********************************************************************
+ * FUNCTION  : del_delay_scratch
+ * ABSTRACT  : Release the memory allocated by new_delay_scratch()
+ *********************************************************************/
+void del_delay_scratch(TDelayScratch *scratch)
+{
+  if (scratch == NULL) return;
+  if (scratch[0].index != NULL) free(scratch[0].index);
+  if (scratch[0].frac != NULL) free(scratch[0].frac);
+  if (scratch[0].weights != NULL) free(scratch[0].weights);
+  free(scratch);
+}
+
+
+/*********************************************************************
+ * FUNCTION  : dynamic_shift
+ * ABSTRACT  : Delay of the transmit of output sample 'os' of a
+ *             dynamically focused line, to be added to the receive
+ *             delays of the table returned by dynamic_table(). Without
+ *             a transmitted wave, the transmit is from the center of
+ *             the focus, and the input sample is 'os' plus the
+ *             difference of the receive path and the path from the
+ *             center. With a wave, it is the sum of the two paths, 
+ *             minus the start time.
+ * ARGUMENTS : ftl - The focus time line, after dynamic_table()
+ *             os - Output sample, less than the number of rows
+ *             tx - The transmitted wave (synthetic aperture, plane
+ *                  waves), or NULL
+ *             base - Out: integer part of the delay. A delay before 
+ *                  the first sample wraps around to a large value.
+ * RETURNS   : The fractional part of the delay, 0 <= shift < 1
+ *********************************************************************/
+double dynamic_shift(TFocusTimeLine *ftl, ui32 os, TTransmit *tx,
+                     ui32 *base)
+{
+  TDynamicTable *t = &ftl->dyn;
+  double shift;
+
+  if (tx != NULL)
+     shift = transmit_distance(tx, t->point + os)*t->fs/t->c
+             - t->time*t->fs;
+  else
+     shift = os - distance(&ftl->center, t->point + os)*t->fs/t->c;
+  *base = (ui32)(si32)floor(shift);
+  return shift - floor(shift);
+}
+
+
+/*********************************************************************
+ * FUNCTION  : dynamic_delays
+ * ABSTRACT  : Delays of output sample 'os' of a dynamically focused
+ *             line, the sum of the receive delays from the table and 
+ *             dynamic_shift(), see TSimdDynamicRow in simd.h. The
+ *             vectorized sums add the two themselves, this is for the
+ *             code that is not vectorized.
+ * ARGUMENTS : ftl, os, tx - See dynamic_shift()
+ *             index - Out: index of the first interpolated sample of
+ *                  every channel
+ *             frac - Out: coefficient for linear interpolation of
+ *                  every channel
+ *********************************************************************/
+void dynamic_delays(TFocusTimeLine *ftl, ui32 os, TTransmit *tx,
+                    ui32 *index, double *frac)
+{
+  TDynamicTable *t = &ftl->dyn;
+  ui32 no_elements = ftl->xdc->no_elements;
+  ui32 *rx_index = t->index + (size_t)os*no_elements;
+  float *rx_frac = t->frac + (size_t)os*no_elements;
+  double shift;        /* Fractional part of the transmit delay        */
+  ui32 base;           /* Integer part of the same                     */
+  const TSimdKernels *simd = simd_kernels();
+  ui32 carry;          /* Whether the fractions add up to a sample     */
+  double A;
+  ui32 ic;
+
+  shift = dynamic_shift(ftl, os, tx, &base);
+  if (simd->delays_row != NULL){
+     simd->delays_row(index, frac, rx_index, rx_frac, base, shift,
+                      no_elements);
+     return;
+  }
+  for (ic = 0; ic < no_elements; ic ++){
+     A = rx_frac[ic] + shift;
+     carry = (A >= 1);
+     index[ic] = rx_index[ic] + base + carry;
+     frac[ic] = A - carry;
+  }
+}
+
+
 /*********************************************************************
  * FUNCTION : set_focus_times(flc,sys,xdc,times,delays,no_times,line_no)
  * ABSTRACT : Set the delays for focusing one line
@@ -204,52 +717,51 @@ void set_dynamic_focus(TFocusLineCollection *flc, TTransducer* xdc,
  *                    the associated delay is valid
  *            delays - array with the delays. One row per time.
  *            line_no - Number of line for which we set the delays
+ * RETURNS  : TRUE, or FALSE if the line is out of range or a delay 
+ *            does not fit in MAX_DELAY samples. The line is then not
+ *            changed.
  *********************************************************************/
-void set_focus_times(TFocusLineCollection *flc, TSysParams* sys, 
+ui32 set_focus_times(TFocusLineCollection *flc, TSysParams* sys, 
                      TTransducer* xdc, double* times, double *delays, 
                      ui32 no_times,  ui32 line_no)
 {
    ui32 i, j;
+   ui32 fits = TRUE;
    double sample_delay;
+   TDelay *delay;
    PFUNC
    assert_xdc(xdc);
    if (line_no < flc->no_focus_time_lines){
-      if(flc->ftl[line_no].no_times > 0) 
-         del_focus_time_line(flc->ftl + line_no);
-      flc->ftl[line_no].delay = (TDelay*)calloc(no_times + 1,sizeof(TDelay));
-      
-		
-		flc->ftl[line_no].no_times = no_times;
-      flc->ftl[line_no].dynamic = FALSE;
-      flc->ftl[line_no].pixel = FALSE;
-      flc->ftl[line_no].xdc = xdc;
+      delay = new_delays(no_times, xdc->no_elements, NULL);
       for (i = 0; i < no_times; i++ )
       {
-         flc->ftl[line_no].delay[i].d = 
-                       (si32*) malloc(xdc->no_elements*sizeof(si32));
-         assert(flc->ftl[line_no].delay[i].d);
-         flc->ftl[line_no].delay[i].a = 
-                       (double*) malloc(xdc->no_elements*sizeof(double));
-         assert(flc->ftl[line_no].delay[i].a);
-         flc->ftl[line_no].delay[i].time = *times * sys->fs;
+         delay[i].time = *times * sys->fs;
          for(j = 0; j < xdc->no_elements; j ++)
          {  
             sample_delay = *delays ++;
             sample_delay *= sys->fs;
-            flc->ftl[line_no].delay[i].d[j] = (si32)floor(sample_delay);
-            flc->ftl[line_no].delay[i].a[j] = ceil(sample_delay) - sample_delay;
+            fits = fits && delay_fits(sample_delay);
+            delay[i].d[j] = (si16)floor(sample_delay);
+            delay[i].a[j] = (float)(ceil(sample_delay) - sample_delay);
          }
          times ++;
       }
-      
-      flc->ftl[line_no].delay[no_times].d = (si32*) calloc(xdc->no_elements,sizeof(si32));
-      assert(flc->ftl[line_no].delay[no_times].d);
-      flc->ftl[line_no].delay[no_times].a = (double*) calloc(xdc->no_elements,sizeof(double));
-      assert(flc->ftl[line_no].delay[no_times].a);
-      flc->ftl[line_no].delay[no_times].time = MAX_SAMPLE_NO;
+      if (!fits)
+         return delays_too_long(delay, line_no);
+
+      if(flc->ftl[line_no].no_times > 0) 
+         del_focus_time_line(flc->ftl + line_no);
+      flc->ftl[line_no].delay = delay;
+      flc->ftl[line_no].focus = NULL;
+      flc->ftl[line_no].no_times = no_times;
+      flc->ftl[line_no].dynamic = FALSE;
+      flc->ftl[line_no].pixel = FALSE;
+      flc->ftl[line_no].xdc = xdc;
    }else{
       errprintf("%s","\"line_no\" is out of range \n");
+      return FALSE;
    }
+   return TRUE;
 }                     
 
 
@@ -264,58 +776,63 @@ void set_focus_times(TFocusLineCollection *flc, TSysParams* sys,
  *             points - Focal points
  *             no_times - Number of focal zones.
  *             line_no - Number of line which we are setting.
+ * RETURNS   : See set_focus_times()
  **********************************************************************/
-void set_focus(TFocusLineCollection *flc, TSysParams* sys, 
+ui32 set_focus(TFocusLineCollection *flc, TSysParams* sys, 
                      TTransducer* xdc, double* times, TPoint3D *points, 
                      ui32 no_times,  ui32 line_no)
 {
    ui32 i, j;
+   ui32 fits = TRUE;
    double sample_delay;
+   double center_delay;    /* Distance from the center to the focus, 
+                              times fs                                */
    TPoint3D *center;
+   TPoint3D *focus;
+   TDelay *delay;
 
    PFUNC
    assert_xdc(xdc);
    if (line_no < flc->no_focus_time_lines){
-      if(flc->ftl[line_no].no_times > 0) 
-              del_focus_time_line(flc->ftl + line_no);
-      flc->ftl[line_no].delay = (TDelay*)calloc(no_times+1,sizeof(TDelay));
-      flc->ftl[line_no].no_times = no_times;
-      flc->ftl[line_no].dynamic = FALSE;
-      flc->ftl[line_no].pixel = FALSE;
-      flc->ftl[line_no].xdc = xdc;
-      
+      delay = new_delays(no_times, xdc->no_elements, &focus);
       center = &flc->ftl[line_no].center;
       
       for (i = 0; i < no_times; i++ )
       {
-         flc->ftl[line_no].delay[i].d = (si32*) malloc(xdc->no_elements*sizeof(si32));
-         assert(flc->ftl[line_no].delay[i].d);
-         flc->ftl[line_no].delay[i].a = (double*) malloc(xdc->no_elements*sizeof(double));
-         assert(flc->ftl[line_no].delay[i].a);
-
-         flc->ftl[line_no].delay[i].time = *times * sys->fs;
+         focus[i] = *points;
+         delay[i].time = *times * sys->fs;
+         center_delay = distance(center, points)*sys->fs;
          for(j = 0; j < xdc->no_elements; j ++)
          {  
-            sample_delay = distance(center, points)*sys->fs;
+            sample_delay = center_delay;
             sample_delay -= distance(xdc->c+j, points)*sys->fs;
             sample_delay = sample_delay / sys->c;
              
-            flc->ftl[line_no].delay[i].d[j] = (si32)floor(sample_delay);
-            flc->ftl[line_no].delay[i].a[j] = sample_delay - floor(sample_delay);
+            fits = fits && delay_fits(sample_delay);
+            delay[i].d[j] = (si16)floor(sample_delay);
+            delay[i].a[j] = (float)(sample_delay - floor(sample_delay));
          }
          
          points ++;
          times ++;
       }
-      flc->ftl[line_no].delay[no_times].d = (si32*) calloc(xdc->no_elements,sizeof(si32));
-      assert(flc->ftl[line_no].delay[no_times].d);
-      flc->ftl[line_no].delay[no_times].a = (double*) calloc(xdc->no_elements,sizeof(double));
-      assert(flc->ftl[line_no].delay[no_times].a);
-      flc->ftl[line_no].delay[no_times].time = MAX_SAMPLE_NO;
+      if (!fits)
+         return delays_too_long(delay, line_no);
+
+      if(flc->ftl[line_no].no_times > 0) 
+              del_focus_time_line(flc->ftl + line_no);
+      flc->ftl[line_no].delay = delay;
+      flc->ftl[line_no].focus = focus;
+      flc->ftl[line_no].two_way = FALSE;
+      flc->ftl[line_no].no_times = no_times;
+      flc->ftl[line_no].dynamic = FALSE;
+      flc->ftl[line_no].pixel = FALSE;
+      flc->ftl[line_no].xdc = xdc;
    }else{
       errprintf("%s", "\"line_no\" is out of range \n");
+      return FALSE;
    }
-   
+   return TRUE;
 }
 
 /**********************************************************************
@@ -329,58 +846,134 @@ void set_focus(TFocusLineCollection *flc, TSysParams* sys,
  *             points - Focal points
  *             no_times - Number of focal zones.
  *             line_no - Number of line which we are setting.
+ * RETURNS   : See set_focus_times()
  **********************************************************************/
-void set_focus_2way(TFocusLineCollection *flc, TSysParams* sys, 
+ui32 set_focus_2way(TFocusLineCollection *flc, TSysParams* sys, 
                       TTransducer* xdc, double* times, TPoint3D *points, 
                       ui32 no_times,  ui32 line_no)
 {
    ui32 i, j;
+   ui32 fits = TRUE;
    double sample_delay;
+   double center_delay;    /* Distance from the center to the focus, 
+                              times fs                                */
    TPoint3D *center;
-   
+   TPoint3D *focus;
+   TDelay *delay;
+
    PFUNC
    assert_xdc(xdc);
    if (line_no < flc->no_focus_time_lines){
-      if(flc->ftl[line_no].no_times > 0) 
-              del_focus_time_line(flc->ftl + line_no);
-      flc->ftl[line_no].delay = (TDelay*)calloc(no_times+1,sizeof(TDelay));
-      flc->ftl[line_no].no_times = no_times;
-      flc->ftl[line_no].dynamic = FALSE;
-      flc->ftl[line_no].pixel = FALSE;
-      flc->ftl[line_no].xdc = xdc;
-      
+      delay = new_delays(no_times, xdc->no_elements, &focus);
       center = &flc->ftl[line_no].center;
       
       for (i = 0; i < no_times; i++ )
       {
-         flc->ftl[line_no].delay[i].d = (si32*) malloc(xdc->no_elements*sizeof(si32));
-         assert(flc->ftl[line_no].delay[i].d);
-         flc->ftl[line_no].delay[i].a = (double*) malloc(xdc->no_elements*sizeof(double));
-         assert(flc->ftl[line_no].delay[i].a);
-
-         flc->ftl[line_no].delay[i].time = *times * sys->fs;
+         focus[i] = *points;
+         delay[i].time = *times * sys->fs;
+         center_delay = distance(center, points)*sys->fs;
          for(j = 0; j < xdc->no_elements; j ++)
          {  
-            sample_delay = distance(center, points)*sys->fs;
+            sample_delay = center_delay;
             sample_delay -= distance(xdc->c+j, points)*sys->fs;
             sample_delay = 2*sample_delay / sys->c;
              
-            flc->ftl[line_no].delay[i].d[j] = (si32)floor(sample_delay);
-            flc->ftl[line_no].delay[i].a[j] = sample_delay - floor(sample_delay);
+            fits = fits && delay_fits(sample_delay);
+            delay[i].d[j] = (si16)floor(sample_delay);
+            delay[i].a[j] = (float)(sample_delay - floor(sample_delay));
          }
          
          points ++;
          times ++;
       }
-      flc->ftl[line_no].delay[no_times].d = (si32*) calloc(xdc->no_elements,sizeof(si32));
-      assert(flc->ftl[line_no].delay[no_times].d);
-      flc->ftl[line_no].delay[no_times].a = (double*) calloc(xdc->no_elements,sizeof(double));
-      assert(flc->ftl[line_no].delay[no_times].a);
-      flc->ftl[line_no].delay[no_times].time = MAX_SAMPLE_NO;
+      if (!fits)
+         return delays_too_long(delay, line_no);
+
+      if(flc->ftl[line_no].no_times > 0) 
+              del_focus_time_line(flc->ftl + line_no);
+      flc->ftl[line_no].delay = delay;
+      flc->ftl[line_no].focus = focus;
+      flc->ftl[line_no].two_way = TRUE;
+      flc->ftl[line_no].no_times = no_times;
+      flc->ftl[line_no].dynamic = FALSE;
+      flc->ftl[line_no].pixel = FALSE;
+      flc->ftl[line_no].xdc = xdc;
    }else{
       errprintf("%s", "\"line_no\" is out of range \n");
+      return FALSE;
    }
-   
+   return TRUE;
+}
+
+
+/**********************************************************************
+ * FUNCTION  : focus_path_lengths
+ * ABSTRACT  : The part of the delays of a line set by set_focus() or
+ *             set_focus_2way(), which does not depend on the speed of
+ *             sound: the difference between the distances from the 
+ *             center and from the element to the focal point, times fs.
+ *             The delay in samples is this value divided by c, or
+ *             2 times it for set_focus_2way().
+ * ARGUMENTS : ftl - The line. ftl->focus must not be NULL.
+ *             paths - Room for no_times * no_elements values, which are
+ *                     stored zone after zone.
+ **********************************************************************/
+void focus_path_lengths(TFocusTimeLine *ftl, TSysParams* sys, double *paths)
+{
+   TTransducer *xdc = ftl->xdc;
+   double center_delay;
+   ui32 i, j;
+
+   for (i = 0; i < ftl->no_times; i++){
+      center_delay = distance(&ftl->center, ftl->focus + i)*sys->fs;
+      for (j = 0; j < xdc->no_elements; j ++){
+         *paths = center_delay;
+         *paths -= distance(xdc->c+j, ftl->focus + i)*sys->fs;
+         paths ++;
+      }
+   }
+}
+
+
+/**********************************************************************
+ * FUNCTION  : focus_speed_delays
+ * ABSTRACT  : Delays of a line set by set_focus() or set_focus_2way()
+ *             for another speed of sound, sys->c. The line is not 
+ *             changed. The delays are the same as if the line had been
+ *             set up with that speed of sound.
+ * ARGUMENTS : ftl - The line. ftl->focus must not be NULL.
+ *             paths - Calculated by focus_path_lengths()
+ * RETURNS   : The zones, to be released with free(), or NULL if the 
+ *             delays do not fit in TDelay.d
+ **********************************************************************/
+TDelay* focus_speed_delays(TFocusTimeLine *ftl, TSysParams* sys,
+                           double *paths)
+{
+   ui32 no_elements = ftl->xdc->no_elements;
+   TDelay *delay;
+   double sample_delay;
+   ui32 i, j;
+
+   delay = new_delays(ftl->no_times, no_elements, NULL);
+   for (i = 0; i < ftl->no_times; i++){
+      delay[i].time = ftl->delay[i].time;
+      for (j = 0; j < no_elements; j ++){
+         sample_delay = *paths ++;
+         if (ftl->two_way)
+            sample_delay = 2*sample_delay / sys->c;
+         else
+            sample_delay = sample_delay / sys->c;
+         if (!delay_fits(sample_delay)){
+            free(delay);
+            eprintf("\007 Error : the delays for c = %g m/s do not fit in "
+                    "%d samples\n", sys->c, MAX_DELAY);
+            return NULL;
+         }
+         delay[i].d[j] = (si16)floor(sample_delay);
+         delay[i].a[j] = (float)(sample_delay - floor(sample_delay));
+      }
+   }
+   return delay;
 }
 
 
@@ -442,46 +1035,29 @@ void set_apodization(TApoLineCollection *alc, TSysParams* sys,
                      ui32 no_times,  ui32 line_no)
 {
    ui32 i, j;
-   int different;
-	int zero_times;
-	int to_delete;
+   TApoTimeLine *atl;
 		
    PFUNC
    assert_xdc(xdc);
 	
    if (line_no < alc->no_apo_time_lines){
-		zero_times = alc->atl[line_no].no_times == 0;
-		different = alc->atl[line_no].no_times != no_times;
-   	to_delete = !zero_times && different;
-	   if(!zero_times && different) del_apo_time_line(alc->atl + line_no);
-		
-		if (zero_times || to_delete){
-			alc->atl[line_no].a = (TApodization*)calloc(no_times + 1,sizeof(TApodization));
-	      alc->atl[line_no].no_times = no_times;
-      	for (i = 0; i < no_times; i++ )
-      	{
-         	alc->atl[line_no].a[i].a = 
-                       (double*) malloc(xdc->no_elements*sizeof(double));
-         	assert(alc->atl[line_no].a[i].a);
-         
-         	alc->atl[line_no].a[i].time = *times * sys->fs;
-         
-         	for(j = 0; j < xdc->no_elements; j ++)
-            	alc->atl[line_no].a[i].a[j] = *apo++;
-         	times ++;
-			}
-		}else{
-      	for (i = 0; i < no_times; i++ )
-      	{
-         	alc->atl[line_no].a[i].time = *times * sys->fs;
-         	for(j = 0; j < xdc->no_elements; j ++)
-            	alc->atl[line_no].a[i].a[j] = *apo++;
-         	times ++;
-			}
-		}
-      alc->atl[line_no].a[no_times].a= (double*) calloc(xdc->no_elements,sizeof(double));
-  		assert(alc->atl[line_no].a[no_times].a);
-     	alc->atl[line_no].a[no_times].time = MAX_SAMPLE_NO;
+      atl = alc->atl + line_no;
+      /*
+       *  The zones are reused if their number does not change
+       */
+      if (atl->a == NULL || atl->no_times != no_times){
+         del_apo_time_line(atl);
+         atl->a = new_apo_zones(no_times, xdc->no_elements);
+         atl->no_times = no_times;
+      }
+      for (i = 0; i < no_times; i++ )
+      {
+         atl->a[i].time = *times * sys->fs;
+         for(j = 0; j < xdc->no_elements; j ++)
+            atl->a[i].a[j] = (float)*apo++;
+         set_active_channels(atl->a + i, xdc->no_elements);
+         times ++;
+      }
    }else{
       errprintf("%s", "\"line_no\" is out of range \n");
    }
@@ -489,6 +1065,134 @@ void set_apodization(TApoLineCollection *alc, TSysParams* sys,
 
 
 
+/*
+ *  Focusing or apodization of many lines, set in parallel
+ */
+typedef struct{
+   TFocusLineCollection *flc;
+   TApoLineCollection *alc;
+   TSysParams *sys;
+   TTransducer *xdc;
+   TPoint3D *centers;      /* One per line, or NULL                     */
+   double *times;          /* 'no_times' per line                       */
+   TPoint3D *points;       /* Focal points, 'no_times' per line         */
+   double *apo;            /* 'no_times' rows of no_elements per line   */
+   ui32 no_times;
+   ui32 failed;            /* Set if the focus of a line is not set     */
+}TLinesJob;
+
+
+static void focus_line_task(void *arg, ui32 line_no)
+{
+   TLinesJob *job = (TLinesJob*)arg;
+   size_t first = (size_t)line_no*job->no_times;
+
+   if (job->centers != NULL)
+      set_center_focus(job->flc, job->centers + line_no, line_no);
+   if (!set_focus(job->flc, job->sys, job->xdc, job->times + first,
+                  job->points + first, job->no_times, line_no))
+      job->failed = TRUE;
+}
+
+
+static void apodization_line_task(void *arg, ui32 line_no)
+{
+   TLinesJob *job = (TLinesJob*)arg;
+   size_t first = (size_t)line_no*job->no_times;
+
+   set_apodization(job->alc, job->sys, job->xdc, job->times + first,
+                   job->apo + first*job->xdc->no_elements, job->no_times,
+                   line_no);
+}
+
+
+/**********************************************************************
+ * FUNCTION  : set_focus_lines
+ * ABSTRACT  : Set the center focus and the focal points of lines 
+ *             0 .. no_lines-1, as set_center_focus() and set_focus() 
+ *             do for one line. The lines are distributed among the 
+ *             threads in 'pool'.
+ * ARGUMENTS : pool - Threads, or NULL
+ *             centers - Center focus of every line, or NULL to keep 
+ *                       the present ones.
+ *             times - 'no_times' times per line, line after line
+ *             points - 'no_times' focal points per line
+ *             no_times - Number of focal zones of every line
+ *             no_lines - Number of lines to set
+ * RETURNS   : 1, or 0 if there are not that many lines, or if the 
+ *             delays of a line do not fit in MAX_DELAY samples. 
+ **********************************************************************/
+ui32 set_focus_lines(TThreadPool *pool, TFocusLineCollection *flc, 
+                     TSysParams* sys, TTransducer* xdc, TPoint3D *centers,
+                     double* times, TPoint3D *points, ui32 no_times,
+                     ui32 no_lines)
+{
+   TLinesJob job;
+
+   PFUNC
+   assert_xdc(xdc);
+   if (no_lines > flc->no_focus_time_lines){
+      eprintf("\007 set_focus_lines:\n");
+      eprintf("Error : %u lines are set, but there are only %u\n",
+              no_lines, flc->no_focus_time_lines);
+      return 0;
+   }
+
+   job.flc = flc;
+   job.alc = NULL;
+   job.sys = sys;
+   job.xdc = xdc;
+   job.centers = centers;
+   job.times = times;
+   job.points = points;
+   job.apo = NULL;
+   job.no_times = no_times;
+   job.failed = FALSE;
+   thread_pool_run(pool, no_lines, focus_line_task, &job);
+   return !job.failed;
+}
+
+
+/**********************************************************************
+ * FUNCTION  : set_apodization_lines
+ * ABSTRACT  : Set the apodization of lines 0 .. no_lines-1, as 
+ *             set_apodization() does for one line, using the threads
+ *             in 'pool'.
+ * ARGUMENTS : times - 'no_times' times per line, line after line
+ *             apo - 'no_times' rows of no_elements values per line
+ * RETURNS   : 1, or 0 if there are not that many lines.
+ **********************************************************************/
+ui32 set_apodization_lines(TThreadPool *pool, TApoLineCollection *alc,
+                     TSysParams* sys, TTransducer* xdc, double* times,
+                     double *apo, ui32 no_times, ui32 no_lines)
+{
+   TLinesJob job;
+
+   PFUNC
+   assert_xdc(xdc);
+   if (no_lines > alc->no_apo_time_lines){
+      eprintf("\007 set_apodization_lines:\n");
+      eprintf("Error : %u lines are set, but there are only %u\n",
+              no_lines, alc->no_apo_time_lines);
+      return 0;
+   }
+
+   job.flc = NULL;
+   job.alc = alc;
+   job.sys = sys;
+   job.xdc = xdc;
+   job.centers = NULL;
+   job.times = times;
+   job.points = NULL;
+   job.apo = apo;
+   job.no_times = no_times;
+   job.failed = FALSE;
+   thread_pool_run(pool, no_lines, apodization_line_task, &job);
+   return 1;
+}
+
+
+
 /**********************************************************************
  * FUNCTION : set filter bank
  * ABSTRACT : Setting the filter bank. Filter banks are used for 
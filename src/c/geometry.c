@@ -5,6 +5,8 @@
 
 #include "../h/geometry.h"
 
+#include <stdlib.h>
+
 double distance( TPoint3D *p1, TPoint3D *p2)
 { double dx,dy,dz;
   dx = (p1->x - p2->x)*(p1->x - p2->x);
@@ -12,3 +14,49 @@ double distance( TPoint3D *p1, TPoint3D *p2)
   dz = (p1->z - p2->z)*(p1->z - p2->z);
   return sqrt(dx + dy + dz);
 }
+
+
+/******************************************************************
+ * FUNCTION : transmit_distance
+ * ABSTRACT : Path travelled by the transmitted wave to point 'p'.
+ ******************************************************************/
+double transmit_distance(TTransmit *tx, TPoint3D *p)
+{
+  TPoint3D origin = {0.0, 0.0, 0.0};
+
+  switch (tx->type){
+     case BFT_TX_PLANE:
+        return p->x*sin(tx->angle) + p->z*cos(tx->angle);
+     case BFT_TX_DIVERGING:
+        return distance(&tx->point, p) - distance(&tx->point, &origin);
+     default:
+        return distance(&tx->point, p);
+  }
+}
+
+
+/******************************************************************
+ * FUNCTION : transmit_waves
+ * ABSTRACT : One wave per steering angle. If 'source' is 0 the waves
+ *            are plane, otherwise they are diverging from a virtual
+ *            source at distance 'source' behind the origin, in the
+ *            direction given by the angle.
+ * RETURNS  : Array allocated with malloc().
+ ******************************************************************/
+TTransmit* transmit_waves(double *angles, ui32 no_angles, double source)
+{
+  TTransmit *tx;
+  ui32 i;
+
+  tx = (TTransmit*)malloc((no_angles + 1)*sizeof(TTransmit));
+  if (tx == NULL) return NULL;
+
+  for (i = 0; i < no_angles; i ++){
+     tx[i].type = (source == 0.0) ? BFT_TX_PLANE : BFT_TX_DIVERGING;
+     tx[i].angle = angles[i];
+     tx[i].point.x = -source*sin(angles[i]);
+     tx[i].point.y = 0.0;
+     tx[i].point.z = -source*cos(angles[i]);
+  }
+  return tx;
+}
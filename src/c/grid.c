@@ -0,0 +1,249 @@
+/*********************************************************************
+ * NAME     : grid.c
+ * ABSTRACT : Pixel based beamforming of a rectilinear grid. The
+ *            squared distances from every element to the grid lines
+ *            along x, y and z are calculated once per call, so the
+ *            distance from an element to a pixel costs two additions
+ *            and a square root.
+ *********************************************************************/
+
+#include "../h/grid.h"
+#include "../h/beamform.h"
+#include "../h/error.h"
+#include "../h/simd.h"
+
+#include <math.h>
+#include <stddef.h>
+#include <stdlib.h>
+#include <string.h>
+
+
+/*
+ *  Everything that is needed to beamform the columns of a grid.
+ */
+typedef struct{
+   TPixelGrid *grid;
+   TTransducer *xdc;
+   void **rf_data;        /* The RF data, one pointer per channel and
+                             transmit, ordered as [it*no_elements + ic] */
+   ui32 no_samples;       /* Number of samples per channel              */
+   double *apo;           /* Apodization per channel, or NULL           */
+   double start_index;    /* Time of the first sample, in samples       */
+   double rx_scale;       /* Receive distance => samples                */
+   double tx_scale;       /* Transmit distance => samples               */
+   ui32 element_no;       /* Transmit element, or >= no_elements        */
+   TTransmit *tx;         /* Transmitted waves, or NULL                 */
+   ui32 no_tx;            /* Number of transmits, summed in the output  */
+   double *dx2;           /* (x[ix] - c[ic].x)^2 at [ic*nx + ix]        */
+   double *dy2;           /* (y[iy] - c[ic].y)^2 at [ic*ny + iy]        */
+   double *dz2;           /* (z[iz] - c[ic].z)^2 at [ic*nz + iz]        */
+   double *out;           /* The beamformed grid                        */
+   TSimdGridRow grid_row; /* Vectorized channel loop, or NULL           */
+}TGridJob;
+
+
+/*********************************************************************
+ * FUNCTION : grid_transmit
+ * ABSTRACT : Transmit part of the sample index of the pixels in one
+ *            column for transmit 'it', minus the index of the first
+ *            sample. If neither a transmit element, nor a transmitted 
+ *            wave is given, the receive distance is used twice 
+ *            (rx_scale), and the transmit part is 0.
+ *********************************************************************/
+static void grid_transmit(TGridJob *job, ui32 ix, ui32 iy, ui32 it,
+                          double *tx)
+{
+  TPixelGrid *grid = job->grid;
+  TPoint3D p;
+  double dxy2;
+  ui32 el = job->element_no;
+  ui32 iz;
+
+  if (el < job->xdc->no_elements){
+     dxy2 = job->dx2[el*grid->nx + ix] + job->dy2[el*grid->ny + iy];
+     for (iz = 0; iz < grid->nz; iz ++)
+        tx[iz] = sqrt(dxy2 + job->dz2[el*grid->nz + iz])*job->tx_scale
+                 - job->start_index;
+  }else if (job->tx != NULL){
+     p.x = grid->x[ix];
+     p.y = grid->y[iy];
+     for (iz = 0; iz < grid->nz; iz ++){
+        p.z = grid->z[iz];
+        tx[iz] = transmit_distance(job->tx + it, &p)*job->tx_scale
+                 - job->start_index;
+     }
+  }else{
+     for (iz = 0; iz < grid->nz; iz ++)
+        tx[iz] = -job->start_index;
+  }
+}
+
+
+/*
+ *   Instantiate the column kernel for the supported sample types
+ */
+#define RF_T             double
+#define KERNEL(name)     name
+#define SIMD_ROWS        1
+#include "grid_column.inc"
+#undef RF_T
+#undef KERNEL
+#undef SIMD_ROWS
+
+#define SIMD_ROWS        0
+
+#define RF_T             float
+#define KERNEL(name)     name##_f32
+#include "grid_column.inc"
+#undef RF_T
+#undef KERNEL
+
+#define RF_T             si16
+#define KERNEL(name)     name##_i16
+#include "grid_column.inc"
+#undef RF_T
+#undef KERNEL
+#undef SIMD_ROWS
+
+
+/*********************************************************************
+ * FUNCTION : axis_table
+ * ABSTRACT : Squared distances along one axis from every element to
+ *            every grid line. 'offset' selects the coordinate of the
+ *            element (x, y or z).
+ *********************************************************************/
+static double* axis_table(TTransducer *xdc, double *lines, ui32 no_lines,
+                          size_t offset)
+{
+  double *t;
+  double d;
+  double c;
+  ui32 ic, i;
+
+  t = (double*)malloc(((size_t)xdc->no_elements*no_lines + 1)*sizeof(double));
+  assert(t);
+  for (ic = 0; ic < xdc->no_elements; ic ++){
+     c = *(double*)((char*)(xdc->c + ic) + offset);
+     for (i = 0; i < no_lines; i ++){
+        d = lines[i] - c;
+        t[ic*no_lines + i] = d*d;
+     }
+  }
+  return t;
+}
+
+
+/*********************************************************************
+ * FUNCTION  : grid_run()
+ * ABSTRACT  : Common part of beamform_grid() and beamform_grid_waves().
+ *             The transmit element is used if it is < no_elements, 
+ *             otherwise the waves in 'tx', if it is not NULL.
+ *********************************************************************/
+static double* grid_run(TThreadPool *pool, TPixelGrid *grid,
+        TTransducer *xdc, TSysParams *sys, double time, void **rf_data,
+        ui32 sample_type, ui32 no_samples, double *apo, ui32 element_no,
+        TTransmit *tx, ui32 no_tx, double *out)
+{
+  TGridJob job;
+  TParallelFunc kernel;
+
+  PFUNC
+  switch (sample_type){
+     case BFT_FLOAT64: kernel = grid_column;     break;
+     case BFT_FLOAT32: kernel = grid_column_f32; break;
+     case BFT_INT16:   kernel = grid_column_i16; break;
+     default:
+        eprintf("\007 beamform_grid:\n");
+        eprintf("Error : unsupported type of samples\n");
+        return NULL;
+  }
+
+  job.grid = grid;
+  job.xdc = xdc;
+  job.rf_data = rf_data;
+  job.no_samples = no_samples;
+  job.apo = apo;
+  job.start_index = time*sys->fs;
+  job.tx_scale = sys->fs/sys->c;
+  job.element_no = element_no;
+  job.tx = tx;
+  job.no_tx = no_tx;
+  job.out = out;
+  job.grid_row = simd_kernels()->grid_row;
+
+  if (element_no < xdc->no_elements || tx != NULL)
+     job.rx_scale = job.tx_scale;
+  else
+     job.rx_scale = 2*job.tx_scale;
+
+  job.dx2 = axis_table(xdc, grid->x, grid->nx, offsetof(TPoint3D, x));
+  job.dy2 = axis_table(xdc, grid->y, grid->ny, offsetof(TPoint3D, y));
+  job.dz2 = axis_table(xdc, grid->z, grid->nz, offsetof(TPoint3D, z));
+
+  thread_pool_run(pool, grid->nx*grid->ny, kernel, &job);
+
+  free(job.dx2);
+  free(job.dy2);
+  free(job.dz2);
+  return out;
+}
+
+
+/*********************************************************************
+ * FUNCTION  : beamform_grid_waves()
+ * ABSTRACT  : Beamform all pixels of a rectilinear grid, and sum the
+ *             images of several transmitted waves, e.g. compounding of
+ *             plane waves. For every column of the grid, the transmit
+ *             part of the delays is calculated once per wave.
+ * ARGUMENTS : rf_data - 'no_elements' pointers to the channels of the
+ *                   first wave, followed by those of the second wave etc.
+ *             tx - The transmitted waves.
+ *             no_tx - Number of waves.
+ *             The rest of the arguments are as for beamform_grid().
+ * RETURNS   : 'out' or NULL for an unsupported sample type.
+ *********************************************************************/
+double* beamform_grid_waves(TThreadPool *pool, TPixelGrid *grid,
+        TTransducer *xdc, TSysParams *sys, double time, void **rf_data,
+        ui32 sample_type, ui32 no_samples, double *apo, TTransmit *tx,
+        ui32 no_tx, double *out)
+{
+  return grid_run(pool, grid, xdc, sys, time, rf_data, sample_type,
+                  no_samples, apo, (ui32)-1, tx, no_tx, out);
+}
+
+
+/*********************************************************************
+ * FUNCTION  : beamform_grid()
+ * ABSTRACT  : Beamform all pixels of a rectilinear grid. The columns
+ *             of the grid are distributed among the threads in 'pool'.
+ * ARGUMENTS : grid - The pixels to beamform.
+ *             xdc - Transducer, with one element per channel of data.
+ *             time - Time of the first sample
+ *             rf_data - One pointer per channel to the samples
+ *             sample_type - BFT_FLOAT64, BFT_FLOAT32 or BFT_INT16
+ *             apo - Apodization per channel, or NULL.
+ *             element_no - Transmit element. Used if < no_elements.
+ *             xmt - Transmit position. Used if not NULL, and no
+ *                   transmit element is given.
+ *             If there is no transmit element and position, the
+ *             transmit path is assumed equal to the receive path.
+ *             out - nx*ny*nz values, see TPixelGrid.
+ * RETURNS   : 'out' or NULL for an unsupported sample type.
+ *********************************************************************/
+double* beamform_grid(TThreadPool *pool, TPixelGrid *grid,
+        TTransducer *xdc, TSysParams *sys, double time, void **rf_data,
+        ui32 sample_type, ui32 no_samples, double *apo, ui32 element_no,
+        TPoint3D *xmt, double *out)
+{
+  TTransmit point;
+
+  if (element_no < xdc->no_elements || xmt == NULL)
+     return grid_run(pool, grid, xdc, sys, time, rf_data, sample_type,
+                     no_samples, apo, element_no, NULL, 1, out);
+
+  point.type = BFT_TX_POINT;
+  point.angle = 0.0;
+  point.point = *xmt;
+  return grid_run(pool, grid, xdc, sys, time, rf_data, sample_type,
+                  no_samples, apo, element_no, &point, 1, out);
+}
@@ -5,19 +5,65 @@
 #include "sys_params.h"
 #include "transducer.h"
 #include "motion.h"
+#include "threads.h"
+#include "plan.h"
+#include "stream.h"
+#include "iq.h"
+#include "envelope.h"
+#include "scan.h"
+#include "grid.h"
+#include "simd.h"
 #include "if_bft.h"
 
+#include <math.h>
 #include <signal.h>
 #include <string.h>
 #include <stdlib.h>
 
+#ifndef M_PI
+#define M_PI 3.14159265358979323846
+#endif
+
+
+/*
+ *  One beamforming setup. Every context has its own focusing,
+ *  apodization, system parameters, threads and transducers, so that
+ *  several setups can be kept at the same time. A context must not be
+ *  used by two threads at the same time, but different contexts can.
+ */
+typedef struct bft_context{
+    TSysParams sys;
+
+    TFocusLineCollection *flc;
+    TApoLineCollection *alc;
+    TApoLineCollection *salc;   /* Sum apo-line collection*/
+
+    TThreadPool *pool;          /* Workers used by bft_beamform */
+    double no_threads;          /* Set by bft_threads()         */
+    double f0;                  /* Demodulation of the IQ data  */
+    double decimation;          /* Decimation of the IQ data    */
+    double dynamic_range;       /* Of the B-mode images, in dB  */
+    double reference;           /* Envelope at 0 dB, 0 - maximum */
+    double hilbert_taps;        /* Taps of the Hilbert filter   */
+
+    /*
+     *  Arrays of pointers to the channels and lines of the caller's data.
+     *  They are kept between the calls, so that beamforming into a buffer
+     *  supplied by the caller does not allocate memory.
+     */
+    void **in_ptrs;
+    void **out_ptrs;
+    ui32 in_ptrs_len;
+    ui32 out_ptrs_len;
+
+    double *frame;              /* Lines of a B-mode image      */
+    size_t frame_len;
 
+    TScanTable scan;            /* Cached by bft_scan_convert   */
+}TBftContext;
 
-static TSysParams sys;
 
-static TFocusLineCollection *flc = NULL;
-static TApoLineCollection *alc = NULL;
-static TApoLineCollection *salc = NULL;   /* Sum apo-line collection*/
+static TBftContext *dflt = NULL;   /* Used by the functions without context */
 
 static int initialized = FALSE;
 static int suppress_msg = FALSE;
@@ -27,7 +73,7 @@ static int suppress_msg = FALSE;
         msgprint(msg);\
         assert(x && msg);\
         }\
-    
+
 
 #define BFT_INITIALIZE\
     if (!initialized) {\
@@ -49,6 +95,96 @@ void bft_at_abort(int sig_no)
 }
 
 
+/** Allocate a context with the default settings: fs = 40 MHz,
+ *  c = 1540 m/s, one line and one thread.
+ */
+static TBftContext* context_new(void)
+{
+    TBftContext* c;
+
+    c = (TBftContext*)calloc(1, sizeof(TBftContext));
+    myassert(c != NULL, "Could not allocate a context\n");
+
+    c->sys.fs = 40e6;
+    c->sys.c = 1540;
+    c->decimation = 1;
+    c->dynamic_range = 60;
+    c->hilbert_taps = 31;
+
+    c->flc = (TFocusLineCollection *)calloc(1, sizeof(TFocusLineCollection));
+    assert(c->flc != NULL);
+    c->alc = (TApoLineCollection*)calloc(1, sizeof(TApoLineCollection));
+    assert(c->alc != NULL);
+    set_no_lines(c->alc, c->flc, 1);
+
+    c->salc = (TApoLineCollection*)calloc(1, sizeof(TApoLineCollection));
+    assert(c->salc != NULL);
+    set_no_lines(c->salc, c->flc, 1);
+    c->flc->use_filter_bank = 0;
+
+    c->no_threads = 1;
+
+    return c;
+}
+
+
+/** Release a context and the transducers created through it.
+ */
+static void context_del(TBftContext* c)
+{
+    if (c->flc != NULL){
+#ifdef DEBUG
+        printf("Freeing Focusing settings \n");
+#endif
+        del_focus_line_collection(c->flc);
+        free(c->flc); c->flc = NULL;
+    }
+
+    if (c->alc != NULL){
+#ifdef DEBUG
+        printf("Freeing all apodization settings \n");
+#endif
+        del_apo_line_collection(c->alc);
+        free(c->alc); c->alc = NULL;
+    }
+
+    if (c->salc != NULL){
+#ifdef DEBUG
+        printf("Freeing all summation apodization settings \n");
+#endif
+        del_apo_line_collection(c->salc);
+        free(c->salc); c->salc = NULL;
+    }
+
+    if (c->pool != NULL){
+        thread_pool_del(c->pool);
+        c->pool = NULL;
+    }
+
+    free(c->in_ptrs);
+    free(c->out_ptrs);
+    free(c->frame);
+    del_scan_table(&c->scan);
+
+#ifdef DEBUG
+    printf("Freeing all transducers \n");
+#endif
+    bft_free_owned_xdc(c);
+    free(c);
+}
+
+
+/** The context to work on. NULL selects the default context.
+ */
+static TBftContext* get_context(void* ctx)
+{
+    if (ctx != NULL) return (TBftContext*)ctx;
+
+    BFT_INITIALIZE;
+    return dflt;
+}
+
+
 void bft_init(TMsgFunc msg, ui32 suppress)
 {
     SetMsgFunc(msg);
@@ -72,20 +208,9 @@ void bft_init(TMsgFunc msg, ui32 suppress)
         msgprint("*                                                            *\n");
         msgprint("**************************************************************\n");
     }
-    
-    sys.fs = 40e6;
-    sys.c = 1540;
-
-    flc = (TFocusLineCollection *)calloc(1, sizeof(TFocusLineCollection));
-    assert(flc != NULL);
-    alc = (TApoLineCollection*)calloc(1, sizeof(TApoLineCollection));
-    assert(alc != NULL);
-    set_no_lines(alc, flc, 1);
 
-    salc = (TApoLineCollection*)calloc(1, sizeof(TApoLineCollection));
-    assert(salc != NULL);
-    set_no_lines(salc, flc, 1);
-    flc->use_filter_bank = 0;
+    dflt = context_new();
+    simd_select(simd_detect());
 
     signal(SIGABRT, bft_at_abort);
     initialized = TRUE;
@@ -103,34 +228,10 @@ static void bft_at_exit(void)
 #ifdef  MALLOC_CHECK_
     printf("MALLOC_CHECK_ is %d \n", MALLOC_CHECK_);
 #endif
-    if (flc != NULL){
-#ifdef DEBUG   
-        printf("Freeing Focusing settings \n");
-#endif      
-        del_focus_line_collection(flc);
-        free(flc); flc = NULL;
-    }
-
-    if (alc != NULL){
-#ifdef DEBUG   
-        printf("Freeing all apodization settings \n");
-#endif      
-        del_apo_line_collection(alc);
-        free(alc); alc = NULL;
-    }
-
-    if (salc != NULL){
-#ifdef DEBUG   
-        printf("Freeing all summation apodization settings \n");
-#endif      
-        del_apo_line_collection(salc);
-        free(alc); salc = NULL;
+    if (dflt != NULL){
+        context_del(dflt);
+        dflt = NULL;
     }
-
-#ifdef DEBUG   
-    printf("Freeing all transducers \n");
-#endif   
-    bft_free_all_xdc();
     initialized = FALSE;
 
     msgprint("**************************************************************\n");
@@ -146,19 +247,41 @@ void bft_end(void)
 }
 
 
-double bft_param(char* id, double val)
+void* bft_context_new(void)
+{
+    return context_new();
+}
+
+
+void bft_context_free(void* ctx)
 {
+    if (ctx == NULL || ctx == dflt) {
+        eprintf("The default context is released by bft_end() \n");
+        return;
+    }
+    context_del((TBftContext*)ctx);
+}
+
+
+double bft_ctx_param(void* ctx, char* id, double val)
+{
+    TBftContext* c = get_context(ctx);
     struct {
         char id[80];
         double* valptr;
     } lut[] = {
-            { "fs", &sys.fs },
-            { "c",  &sys.c },
+            { "fs", &c->sys.fs },
+            { "c",  &c->sys.c },
+            { "threads", &c->no_threads },
+            { "f0", &c->f0 },
+            { "decimation", &c->decimation },
+            { "dynamic_range", &c->dynamic_range },
+            { "reference", &c->reference },
+            { "hilbert_taps", &c->hilbert_taps },
     };
 
     int nparam = sizeof(lut) / sizeof(lut[0]);
 
-    BFT_INITIALIZE
     if (id == NULL) {
         eprintf("Found null pointer \n");
         return -val;
@@ -166,6 +289,9 @@ double bft_param(char* id, double val)
 
     for (int n = 0; n < nparam; n++) {
         if (!strncmp(id, lut[n].id, sizeof(lut[0].id))) {
+            if (lut[n].valptr == &c->no_threads) {
+                return bft_ctx_threads(c, (ui32)val);
+            }
             *lut[n].valptr = val;
             return val;
         }
@@ -175,275 +301,1510 @@ double bft_param(char* id, double val)
     return -val;
 }
 
-ui32 bft_no_lines(ui32 no_lines)
+
+ui32 bft_ctx_threads(void* ctx, ui32 threads)
+{
+    TBftContext* c = get_context(ctx);
+
+    if (c->pool != NULL) {
+        thread_pool_del(c->pool);
+        c->pool = NULL;
+    }
+
+    if (threads != 1) {
+        c->pool = thread_pool_new(threads);
+    }
+
+    c->no_threads = thread_pool_size(c->pool);
+    return (ui32)c->no_threads;
+}
+
+
+/**
+ *  Selects how bft_beamform interpolates between the samples:
+ *  BFT_INTERP_LINEAR or BFT_INTERP_FILTER_BANK (set by bft_set_filter_bank).
+ *  The grid, plan, stream and IQ beamformers fail with the filter bank.
+ *  Returns the previous mode, or (ui32)-1 if 'mode' is unknown.
+ */
+ui32 bft_ctx_interpolation(void* ctx, ui32 mode)
+{
+    TBftContext* c = get_context(ctx);
+    ui32 previous = c->flc->interpolation;
+
+    if (mode != BFT_INTERP_LINEAR && mode != BFT_INTERP_FILTER_BANK) {
+        eprintf("\007 bft_interpolation:\n");
+        eprintf("Error : unknown interpolation %u \n", mode);
+        return (ui32)-1;
+    }
+
+    c->flc->interpolation = mode;
+    return previous;
+}
+
+
+/** The focusing of the context, with the interpolation 'interp' of one
+ *  call (BFT_INTERP_CONTEXT for the mode of the context). The copy 
+ *  shares the lines with the context, which is not changed, so that
+ *  other threads can beamform with it at the same time.
+ *  Returns FALSE if 'interp' is unknown.
+ */
+static ui32 call_focusing(TBftContext* c, ui32 interp,
+    TFocusLineCollection* flc)
+{
+    *flc = *c->flc;
+    if (interp == BFT_INTERP_CONTEXT) {
+        return TRUE;
+    }
+    if (interp != BFT_INTERP_LINEAR && interp != BFT_INTERP_FILTER_BANK) {
+        eprintf("Unknown interpolation %u \n", interp);
+        return FALSE;
+    }
+    flc->interpolation = interp;
+    return TRUE;
+}
+
+
+/** The grid, plan, stream and IQ beamformers interpolate linearly only.
+ *  Returns FALSE, with a message naming the beamformer 'name', if the
+ *  context is set to interpolate with the filter bank.
+ */
+static ui32 linear_only(TBftContext* c, const char* name)
 {
-    BFT_INITIALIZE
+    if (c->flc->interpolation != BFT_INTERP_LINEAR) {
+        eprintf("%s interpolates linearly only. Set the interpolation to "
+            "BFT_INTERP_LINEAR first \n", name);
+        return FALSE;
+    }
+    return TRUE;
+}
+
+
+ui32 bft_ctx_no_lines(void* ctx, ui32 no_lines)
+{
+    TBftContext* c = get_context(ctx);
 
-    set_no_lines(alc, flc, no_lines);
-    set_no_lines(salc, flc, no_lines);
+    set_no_lines(c->alc, c->flc, no_lines);
+    set_no_lines(c->salc, c->flc, no_lines);
 
     return no_lines;
 }
 
 
-void* bft_xdc(double* centers, ui32 nelem)
+void* bft_ctx_xdc(void* ctx, double* centers, ui32 nelem)
 {
-    BFT_INITIALIZE;
-    return bft_transducer(nelem, (TPoint3D*)centers);
+    TBftContext* c = get_context(ctx);
+    return bft_transducer_owned(c, nelem, (TPoint3D*)centers);
 }
 
 
-void bft_xdc_free(void* xdc)
+void bft_ctx_xdc_free(void* ctx, void* xdc)
 {
-    BFT_INITIALIZE;
+    get_context(ctx);
     bft_free_xdc((TTransducer*) xdc);
 }
 
 
-void bft_center_focus(double* point, ui32 line_no)
+void bft_ctx_center_focus(void* ctx, double* point, ui32 line_no)
 {
-    BFT_INITIALIZE;
+    TBftContext* c = get_context(ctx);
+    set_center_focus(c->flc, (TPoint3D*)point, line_no);
+}
 
-    set_center_focus(flc, (TPoint3D*)point, line_no);
+
+ui32 bft_ctx_focus(void* ctx, void* xdc, double* times, double* focus,
+    ui32 no_times, ui32 line_no)
+{
+    TBftContext* c = get_context(ctx);
+    return set_focus(c->flc, &c->sys, (TTransducer*)xdc, times, (TPoint3D*)focus, no_times, line_no);
 }
 
 
-void bft_focus(void* xdc, double* times, double* focus, ui32 no_times, ui32 line_no)
+void bft_ctx_focus_pixel(void* ctx, void* xdc, double* points, ui32 no_points,
+    ui32 line_no)
 {
-    BFT_INITIALIZE;
-    set_focus(flc, &sys, (TTransducer*)xdc, times, (TPoint3D*)focus, no_times, line_no);
+    TBftContext* c = get_context(ctx);
+    set_focus_pixel(c->flc, &c->sys, (TTransducer*)xdc, (TPoint3D*)points, no_points, line_no);
 }
 
 
-void bft_focus_pixel(void* xdc, double* points, ui32 no_points, ui32 line_no)
+ui32 bft_ctx_focus_2way(void* ctx, void* xdc, double* times, double* delays,
+    ui32 no_times, ui32 line_no)
 {
-    BFT_INITIALIZE;
-    set_focus_pixel(flc, &sys, (TTransducer*)xdc, (TPoint3D*)points, no_points, line_no);
+    TBftContext* c = get_context(ctx);
+    return set_focus_2way(c->flc, &c->sys, (TTransducer*)xdc, times, (TPoint3D*)delays, no_times, line_no);
 }
 
 
-void bft_focus_2way(void* xdc, double* times, double* delays, ui32 no_times, ui32 line_no)
+ui32 bft_ctx_focus_times(void* ctx, void* xdc, double* times, double* delays,
+    ui32 no_times, ui32 line_no)
 {
-    BFT_INITIALIZE;
-    set_focus_times(flc, &sys, xdc, times, delays, no_times, line_no);
+    TBftContext* c = get_context(ctx);
+    return set_focus_times(c->flc, &c->sys, (TTransducer*)xdc, times, delays, no_times, line_no);
 }
 
 
-void bft_focus_times(void* xdc, double* times, double* delays, ui32 no_times, ui32 line_no)
+void bft_ctx_apodization(void* ctx, void* xdc, double* times,
+    double* apodization, ui32 no_times, ui32 line_no)
 {
-    BFT_INITIALIZE;
-    set_focus_times(flc, &sys, (TTransducer*)xdc, times, delays, no_times, line_no);
+    TBftContext* c = get_context(ctx);
+    set_apodization(c->alc, &c->sys, (TTransducer*)xdc, times, apodization, no_times, line_no);
 }
 
 
-void bft_apodization(void* xdc, double* times, double* apodization, ui32 no_times, ui32 line_no)
+void bft_ctx_sum_apodization(void* ctx, void* xdc, double* times,
+    double* apodization, ui32 no_times, ui32 line_no)
 {
-    BFT_INITIALIZE;
-    set_apodization(alc, &sys, (TTransducer*)xdc, times, apodization, no_times, line_no);
+    TBftContext* c = get_context(ctx);
+    set_apodization(c->salc, &c->sys, (TTransducer*)xdc, times, apodization, no_times, line_no);
 }
 
 
-void bft_sum_apodization(void* xdc, double* times, double* apodization, ui32 no_times, ui32 line_no)
+/** Focus line 'line_no' dynamically. The receive delays are kept in a
+ *  table, which is calculated when the line is first beamformed, see
+ *  dynamic_table(). The table of a line takes (no_samples - 1) *
+ *  no_elements * 8 bytes, e.g. 3 MB for 4096 samples and 96 elements.
+ *  The beamforming fails if it cannot be allocated.
+ */
+void bft_ctx_dynamic_focus(void* ctx, void* xdc, ui32 line_no,
+    double dir_xz, double dir_yz)
 {
-    BFT_INITIALIZE;
-    set_apodization(alc, &sys, (TTransducer*)xdc, times, apodization, no_times, line_no);
+    TBftContext* c = get_context(ctx);
+    set_dynamic_focus(c->flc, xdc, line_no, dir_xz, dir_yz);
 }
 
 
-void bft_dynamic_focus(void* xdc, ui32 line_no, double dir_xz, double dir_yz)
+/** Set the center focus and the focal points of lines 0 .. no_lines-1
+ *  in one call. 'times' has no_times values per line, and 'focus' has
+ *  no_times points (x, y, z) per line. 'centers' can be NULL.
+ *  The delays are calculated by the threads of the context.
+ */
+ui32 bft_ctx_focus_lines(void* ctx, void* xdc, double* centers,
+    double* times, double* focus, ui32 no_times, ui32 no_lines)
 {
-    BFT_INITIALIZE;
-    set_dynamic_focus(flc, xdc, line_no, dir_xz, dir_yz);
+    TBftContext* c = get_context(ctx);
+    return set_focus_lines(c->pool, c->flc, &c->sys, (TTransducer*)xdc,
+        (TPoint3D*)centers, times, (TPoint3D*)focus, no_times, no_lines);
 }
 
 
-double* bft_beamform(ui32* no_lines, ui32 *no_out_samples, double* data, double Time, ui32 no_samples, 
-    ui32 no_elements, ui32 element_no, double* xmt)
+/** Set the apodization of lines 0 .. no_lines-1 in one call. 'times'
+ *  has no_times values per line, and 'apodization' has no_times rows
+ *  of one value per element for every line.
+ */
+ui32 bft_ctx_apodization_lines(void* ctx, void* xdc, double* times,
+    double* apodization, ui32 no_times, ui32 no_lines)
 {
-    double* beam = NULL;
-    double* ptr = NULL;
-    double** rf_data = NULL;
-    double** bf_data = NULL;
+    TBftContext* c = get_context(ctx);
+    return set_apodization_lines(c->pool, c->alc, &c->sys,
+        (TTransducer*)xdc, times, apodization, no_times, no_lines);
+}
 
-    BFT_INITIALIZE;
 
-    rf_data = (double**)calloc(no_elements, sizeof(** rf_data));
-    myassert(rf_data != NULL, "Could not allocate pointers to RF data\n");
+ui32 bft_ctx_sum_apodization_lines(void* ctx, void* xdc, double* times,
+    double* apodization, ui32 no_times, ui32 no_lines)
+{
+    TBftContext* c = get_context(ctx);
+    return set_apodization_lines(c->pool, c->salc, &c->sys,
+        (TTransducer*)xdc, times, apodization, no_times, no_lines);
+}
+
 
-    for (ui32 n = 0; n < no_elements; n++) {
-        rf_data[n] = data + n * no_samples;
+/** Dynamic focusing of lines 0 .. no_lines-1, with one center focus
+ *  and one pair of directions per line. 'centers' can be NULL.
+ */
+ui32 bft_ctx_dynamic_focus_lines(void* ctx, void* xdc, double* centers,
+    double* dir_xz, double* dir_yz, ui32 no_lines)
+{
+    TBftContext* c = get_context(ctx);
+
+    if (no_lines > c->flc->no_focus_time_lines) {
+        eprintf("%d lines are set, but there are only %d \n", no_lines,
+            c->flc->no_focus_time_lines);
+        return 0;
     }
 
-    bf_data = beamform_image(
-        flc, alc, &sys, Time, rf_data, no_samples, element_no, (TPoint3D*)xmt);
-    myassert(bf_data != 0, "Calculations did not allocate mem for result.\n");
+    for (ui32 n = 0; n < no_lines; n++) {
+        if (centers != NULL) {
+            set_center_focus(c->flc, (TPoint3D*)centers + n, n);
+        }
+        set_dynamic_focus(c->flc, (TTransducer*)xdc, n, dir_xz[n], dir_yz[n]);
+    }
+    return 1;
+}
 
-    free(rf_data);
 
-    //TODO: How to handle the case when pixel == TRUE for more than 1 line
-    if ((flc->no_focus_time_lines == 1) && (flc->ftl[0].pixel == TRUE)) {
-        no_samples = flc->ftl[0].no_times;
+/** Phased array sector scan, as bft_scan_phased.m. The number of lines
+ *  is set to 'no_lines', evenly spread over 'sector' radians (degrees
+ *  if sector > pi). Every line has 'no_focal_zones' focal points up to
+ *  'depth', and its center focus at the origin. Every line gets the
+ *  apodization with 'no_apo_times' rows in 'apodization', and a sum
+ *  apodization of 1 for all elements.
+ */
+ui32 bft_ctx_scan_phased(void* ctx, void* xdc, double sector,
+    ui32 no_lines, double depth, ui32 no_focal_zones, double* apo_times,
+    double* apodization, ui32 no_apo_times)
+{
+    TBftContext* c = get_context(ctx);
+    TTransducer* x = (TTransducer*)xdc;
+    size_t no_zones = (size_t)no_lines * no_focal_zones;
+    size_t apo_len;
+    double* times;
+    double* focus;
+    double* apo_t;
+    double* apo;
+    double* ones;
+    double zero = 0.0;
+    double theta;
+    double dr;
+    double r;
+    ui32 ok;
+
+    assert_xdc(x);
+    if (no_lines == 0 || no_focal_zones == 0) {
+        eprintf("A sector scan needs at least one line and focal zone \n");
+        return 0;
+    }
+    if (sector > M_PI) {
+        sector = sector * M_PI / 180;
     }
-    
-    beam = (double*)malloc(flc->no_focus_time_lines * no_samples * sizeof(double));
-    
-    myassert(beam != NULL, "Could not allocate beam\n");
 
-    ptr = beam;
-    for (ui32 n = 0; n < flc->no_focus_time_lines; n++) {
-        memcpy(ptr, bf_data[n], no_samples*sizeof(beam[0]));
-        ptr += no_samples;
-        free(bf_data[n]);
+    apo_len = (size_t)no_apo_times * x->no_elements;
+    times = (double*)malloc((no_zones + 1) * sizeof(double));
+    focus = (double*)malloc((3 * no_zones + 1) * sizeof(double));
+    apo_t = (double*)malloc(((size_t)no_lines * no_apo_times + 1) * sizeof(double));
+    apo = (double*)malloc((no_lines * apo_len + 1) * sizeof(double));
+    ones = (double*)malloc((x->no_elements + 1) * sizeof(double));
+    myassert((times != NULL && focus != NULL && apo_t != NULL
+        && apo != NULL && ones != NULL), "Could not allocate the sector scan\n");
+
+    /* Focal zones at r = dr .. depth, valid after 2*r/c - dr/c */
+    dr = (no_focal_zones > 1) ? depth / (no_focal_zones - 1) : depth;
+    for (ui32 n = 0; n < no_lines; n++) {
+        theta = (no_lines > 1) ? sector * n / (no_lines - 1) - sector / 2 : 0;
+        for (ui32 z = 0; z < no_focal_zones; z++) {
+            size_t k = (size_t)n * no_focal_zones + z;
+            r = (no_focal_zones > 1)
+                ? dr + (depth - dr) * z / (no_focal_zones - 1) : depth;
+            times[k] = 2 * r / c->sys.c - dr / c->sys.c;
+            focus[3 * k] = r * sin(theta);
+            focus[3 * k + 1] = 0;
+            focus[3 * k + 2] = r * cos(theta);
+        }
+        memcpy(apo_t + (size_t)n * no_apo_times, apo_times,
+            no_apo_times * sizeof(double));
+        memcpy(apo + n * apo_len, apodization, apo_len * sizeof(double));
+    }
+    for (ui32 e = 0; e < x->no_elements; e++) {
+        ones[e] = 1.0;
     }
 
-    free(bf_data);
+    set_no_lines(c->alc, c->flc, no_lines);
+    set_no_lines(c->salc, c->flc, no_lines);
 
-    *no_out_samples = no_samples;
-    *no_lines = flc->no_focus_time_lines;
+    ok = set_focus_lines(c->pool, c->flc, &c->sys, x, NULL, times,
+        (TPoint3D*)focus, no_focal_zones, no_lines)
+        && set_apodization_lines(c->pool, c->alc, &c->sys, x, apo_t, apo,
+        no_apo_times, no_lines);
+    for (ui32 n = 0; ok && n < no_lines; n++) {
+        set_apodization(c->salc, &c->sys, x, &zero, ones, 1, n);
+    }
 
-    return beam;
+    free(times);
+    free(focus);
+    free(apo_t);
+    free(apo);
+    free(ones);
+    return ok;
 }
 
 
-double * bft_sum_images(double* data1, ui32 element1, double* data2,
-    ui32 element2, double time, ui32 no_samples)
+/** Point the entries of a cached array of pointers to consecutive rows
+ *  of 'data'. Every row is 'row_bytes' bytes long. The array grows if
+ *  it has less than 'no_rows' entries.
+ */
+static void** set_row_ptrs(void*** ptrs, ui32* len, void* data,
+    ui32 no_rows, size_t row_bytes)
 {
-    double** rf1 = NULL;
-    double** rf2 = NULL;
-    double ** hi_res = NULL;
-    double * hi_res_data = NULL;
-    double *ptr = NULL;
-
-    BFT_INITIALIZE;
+    if (*len < no_rows) {
+        void** p = (void**)realloc(*ptrs, no_rows * sizeof(void*));
+        myassert(p != NULL, "Could not allocate pointers to data rows\n");
+        *ptrs = p;
+        *len = no_rows;
+    }
 
-    rf1 = (double**)malloc(flc->no_focus_time_lines*sizeof(double*));
-    myassert(rf1, "Could not allocate memory for RF1");
-  
-    rf2 = (double**)malloc(flc->no_focus_time_lines * sizeof(double*));
-    if (rf2 == NULL) {
-        free(rf1); 
-        myassert(rf2, "Could not allocate memory for RF2");
-    }
-    
-    for (ui32 i = 0; i < flc->no_focus_time_lines; i++){
-        rf1[i] = data1 + no_samples * i;
-        rf2[i] = data2 + no_samples * i;
+    for (ui32 n = 0; n < no_rows; n++) {
+        (*ptrs)[n] = (char*)data + n * row_bytes;
     }
-    
-    hi_res = sum_images(flc, alc, &sys, rf1, element1, rf2, element2,time, no_samples );
 
-    hi_res_data = (double*)calloc( no_samples * flc->no_focus_time_lines ,sizeof(double));
-    myassert(hi_res_data != NULL, "Could not allocate output result");
-    ptr = hi_res_data;
+    return *ptrs;
+}
 
-    for (ui32 i = 0; i<flc->no_focus_time_lines; i++){
-        memcpy(ptr, hi_res[i], no_samples * sizeof(ptr[0]));
-        ptr += no_samples;
-        free(hi_res[i]);
+
+/** Size in bytes of one sample of type 'data_type' (BFT_FLOAT64,
+ *  BFT_FLOAT32 or BFT_INT16). Returns 0 for an unknown type.
+ */
+static size_t sample_size(ui32 data_type)
+{
+    switch (data_type) {
+    case BFT_FLOAT64: return sizeof(double);
+    case BFT_FLOAT32: return sizeof(float);
+    case BFT_INT16:   return sizeof(si16);
     }
+    return 0;
+}
 
-    free(hi_res);
-    free(rf1);
-    free(rf2);
 
-    return hi_res_data;
+/** Number of output samples of one line: the number of pixels for pixel
+ *  based focusing, otherwise the number of input samples.
+ */
+static ui32 line_length(TFocusTimeLine* ftl, ui32 no_samples)
+{
+    return (ftl->pixel == TRUE) ? ftl->no_times : no_samples;
 }
 
 
-void bft_add_images(double *hires, double *lores, ui32 no_samples, double time, ui32 element)
+/** The output has the samples of the longest line. Without pixel based
+ *  focusing these are the input samples.
+ */
+void bft_ctx_beamform_size(void* ctx, ui32* no_lines, ui32 *no_out_samples,
+    ui32 no_samples)
 {
-   double **lo_res = NULL;
-   double **hi_res = NULL;
+    TBftContext* c = get_context(ctx);
+    ui32 longest = (c->flc->no_focus_time_lines == 0) ? no_samples : 0;
 
-   BFT_INITIALIZE;
-
-   hi_res = (double **) malloc(flc->no_focus_time_lines * sizeof( double * ) );
-   myassert(hi_res, "Canno get");
+    for (ui32 i = 0; i < c->flc->no_focus_time_lines; i++) {
+        if (line_length(c->flc->ftl + i, no_samples) > longest) {
+            longest = line_length(c->flc->ftl + i, no_samples);
+        }
+    }
 
-   lo_res = (double **) malloc(flc->no_focus_time_lines * sizeof( double * ) );
+    *no_out_samples = longest;
+    *no_lines = c->flc->no_focus_time_lines;
+}
 
-   if ( lo_res == NULL ) { free(hi_res); abort(); }
 
-   for ( ui32 i = 0; i < flc->no_focus_time_lines; i++ ) {
-      lo_res[i] = lores + no_samples * i;
-      hi_res[i] = hires + no_samples * i;
-   }
+/** Zero the samples of the output window out_start .. out_start +
+ *  out_count - 1, which lie beyond the end of a shorter line. The
+ *  beamformers leave them unwritten. 'out' has 'no_rows' rows, row n
+ *  is line n % no_lines, and a sample has 'values' doubles.
+ */
+static void clear_line_ends(TBftContext* c, double* out, ui32 no_rows,
+    ui32 out_start, ui32 out_count, ui32 no_samples, ui32 values)
+{
+    ui32 no_lines = c->flc->no_focus_time_lines;
 
-   add_images(flc, salc, &sys, hi_res, lo_res, element, time, no_samples);
+    for (ui32 n = 0; n < no_rows; n++) {
+        ui32 len = line_length(c->flc->ftl + n % no_lines, no_samples);
+        ui32 first = (len > out_start) ? len - out_start : 0;
 
-   free(hi_res);
-   free(lo_res);
+        if (first < out_count) {
+            memset(out + ((size_t)n * out_count + first) * values, 0,
+                (size_t)(out_count - first) * values * sizeof(out[0]));
+        }
+    }
 }
 
 
-void bft_sub_images(double *hires, double *lores, ui32 no_samples, double time, ui32 element)
+/** Beamform 'no_frames' frames, and keep the output samples out_start ..
+ *  out_start + out_count - 1 of every line. The samples are 
+ *  interpolated as given by 'interp': BFT_INTERP_LINEAR, 
+ *  BFT_INTERP_FILTER_BANK, or BFT_INTERP_CONTEXT for the mode set by 
+ *  bft_ctx_interpolation().
+ */
+ui32 bft_ctx_beamform_window(void* ctx, double* out, ui32 no_frames,
+    ui32 no_lines, ui32 out_start, ui32 out_count, void* data,
+    ui32 data_type, ui32 acc_type, ui32 interp, double* times,
+    ui32 no_samples, ui32 no_elements, ui32 element_no, double* xmt)
 {
-    double **lo_res = NULL;
-    double **hi_res = NULL;
+    TBftContext* c = get_context(ctx);
+    TFocusLineCollection flc;
+    ui32 lines;
+    ui32 out_samples;
+    size_t size;
+    void** rf_data = NULL;
+    double** bf_data = NULL;
 
-    BFT_INITIALIZE;
+    bft_ctx_beamform_size(c, &lines, &out_samples, no_samples);
+    if (lines != no_lines) {
+        eprintf("Output must have %d lines \n", lines);
+        return 0;
+    }
+    if (out_start > out_samples || out_count > out_samples - out_start) {
+        eprintf("The window of output samples must lie within %d samples \n",
+            out_samples);
+        return 0;
+    }
 
-    hi_res = (double **)malloc(flc->no_focus_time_lines * sizeof(double *));
-    myassert(hi_res, "Canno get");
+    size = sample_size(data_type);
+    if (size == 0) {
+        eprintf("Unknown type of the RF data : %d \n", data_type);
+        return 0;
+    }
+    if (!call_focusing(c, interp, &flc)) {
+        return 0;
+    }
 
-    lo_res = (double **)malloc(flc->no_focus_time_lines * sizeof(double *));
+    rf_data = set_row_ptrs(&c->in_ptrs, &c->in_ptrs_len, data,
+        no_frames * no_elements, no_samples * size);
+    bf_data = (double**)set_row_ptrs(&c->out_ptrs, &c->out_ptrs_len, out,
+        no_frames * no_lines, out_count * sizeof(double));
 
-    if (lo_res == NULL) { free(hi_res); abort(); }
+    bf_data = beamform_frames_typed(c->pool, &flc, c->alc, &c->sys, times,
+        rf_data, data_type, acc_type, no_frames, no_samples, no_elements,
+        element_no, (TPoint3D*)xmt, out_start, out_count, bf_data);
+    if (bf_data == NULL) {
+        return 0;
+    }
 
-    for (ui32 i = 0; i < flc->no_focus_time_lines; i++) {
-        lo_res[i] = lores + no_samples * i;
-        hi_res[i] = hires + no_samples * i;
+    for (ui32 n = 0; n < no_frames * no_lines; n++) {
+        if (bf_data[n] == NULL) {
+            memset(out + n * out_count, 0, out_count * sizeof(out[0]));
+        }
     }
+    clear_line_ends(c, out, no_frames * no_lines, out_start, out_count,
+        no_samples, 1);
 
-    sub_images(flc, alc, &sys, hi_res, lo_res, element, time, no_samples);
+    return no_lines;
 }
 
 
-void bft_set_filter_bank(double* coef, ui32 Nf, ui32 Ntaps)
+ui32 bft_ctx_beamform_frames(void* ctx, double* out, ui32 no_frames,
+    ui32 no_lines, ui32 no_out_samples, void* data, ui32 data_type,
+    ui32 acc_type, double* times, ui32 no_samples, ui32 no_elements,
+    ui32 element_no, double* xmt)
 {
-    BFT_INITIALIZE;
-    myassert(coef != NULL, "Received a null pointer \n");
-    set_filter_bank(flc, Nf, Ntaps, coef);
+    TBftContext* c = get_context(ctx);
+    ui32 lines;
+    ui32 out_samples;
+
+    bft_ctx_beamform_size(c, &lines, &out_samples, no_samples);
+    if (lines != no_lines || out_samples != no_out_samples) {
+        eprintf("Output must have %d lines with %d samples each \n",
+            lines, out_samples);
+        return 0;
+    }
+
+    return bft_ctx_beamform_window(c, out, no_frames, no_lines, 0,
+        no_out_samples, data, data_type, acc_type, BFT_INTERP_CONTEXT, times,
+        no_samples, no_elements, element_no, xmt);
 }
 
 
-double* bft_delay(double*src, ui32 src_len, double* times, double* delays, ui32 times_len, 
-    double src_start_time, double dest_start_time, ui32 dest_len, ui32 method)
+/** Beamform one acquisition with 'no_c' speeds of sound. The lines of
+ *  the first speed are stored first in 'out'. The output window and
+ *  'interp' are as for bft_ctx_beamform_window(). The speed of sound of
+ *  the context is not changed.
+ */
+ui32 bft_ctx_beamform_speeds(void* ctx, double* out, ui32 no_c,
+    double* c_values, ui32 no_lines, ui32 out_start, ui32 out_count,
+    void* data, ui32 data_type, ui32 acc_type, ui32 interp, double Time,
+    ui32 no_samples, ui32 no_elements, ui32 element_no, double* xmt)
 {
+    TBftContext* c = get_context(ctx);
+    TFocusLineCollection flc;
+    ui32 lines;
+    ui32 out_samples;
+    size_t size;
+    void** rf_data = NULL;
+    double** bf_data = NULL;
 
-    switch (method)
-    {
-    case 0:
-        myassert(&flc->filter_bank != NULL, "Set filter bank first !\n");
-        return delay_line_filter(
-            &sys, &flc->filter_bank, times, delays,
-            times_len, src, src_len, src_start_time,
-            dest_start_time, dest_len);
+    bft_ctx_beamform_size(c, &lines, &out_samples, no_samples);
+    if (lines != no_lines) {
+        eprintf("Output must have %d lines \n", lines);
+        return 0;
+    }
+    if (out_start > out_samples || out_count > out_samples - out_start) {
+        eprintf("The window of output samples must lie within %d samples \n",
+            out_samples);
+        return 0;
+    }
+    for (ui32 k = 0; k < no_c; k++) {
+        if (!(c_values[k] > 0)) {
+            eprintf("The speeds of sound must be positive \n");
+            return 0;
+        }
+    }
 
-    default:
-        return delay_line_linear(
-            &sys, times, delays, times_len, src,
-            src_len, src_start_time,
-            dest_start_time, dest_len);
+    size = sample_size(data_type);
+    if (size == 0) {
+        eprintf("Unknown type of the RF data : %d \n", data_type);
+        return 0;
+    }
+    if (!call_focusing(c, interp, &flc)) {
+        return 0;
     }
 
-}
+    rf_data = set_row_ptrs(&c->in_ptrs, &c->in_ptrs_len, data,
+        no_elements, no_samples * size);
+    bf_data = (double**)set_row_ptrs(&c->out_ptrs, &c->out_ptrs_len, out,
+        no_c * no_lines, out_count * sizeof(double));
 
+    bf_data = beamform_speeds_typed(c->pool, &flc, c->alc, &c->sys,
+        c_values, no_c, Time, rf_data, data_type, acc_type, no_samples,
+        element_no, (TPoint3D*)xmt, out_start, out_count, bf_data);
+    if (bf_data == NULL) {
+        return 0;
+    }
 
-void bft_xdc_set(void* xdc, double* centers, ui32 no_elements)
-{
-    BFT_INITIALIZE;
-    
-    myassert(xdc != NULL, "XDC is a null pointer\n");
-    myassert(centers != NULL, "centers is a null pointer\n");
-    bft_transducer_set(xdc, no_elements, (TPoint3D*) centers);
+    for (ui32 n = 0; n < no_c * no_lines; n++) {
+        if (bf_data[n] == NULL) {
+            memset(out + n * out_count, 0, out_count * sizeof(out[0]));
+        }
+    }
+    clear_line_ends(c, out, no_c * no_lines, out_start, out_count,
+        no_samples, 1);
+
+    return no_lines;
 }
 
 
-void bft_free_mem(void * ptr)
+/** Beamform IQ data, demodulated with the frequency 'f0' and sampled at
+ *  fs/decimation (see bft_param). 'data' has 'no_elements' channels
+ *  of 'no_samples' complex samples. Every line of 'out' has 2 values,
+ *  I and Q, per output sample.
+ */
+ui32 bft_ctx_beamform_iq(void* ctx, double* out, ui32 no_lines, void* data,
+    ui32 data_type, double Time, ui32 no_samples, ui32 no_elements,
+    ui32 element_no, double* xmt)
 {
-    myassert(ptr != NULL, "NULL pointer passed");
-    if (ptr != NULL){
-        free(ptr);
+    TBftContext* c = get_context(ctx);
+    ui32 lines;
+    ui32 out_samples;
+    size_t size;
+    void** iq_data = NULL;
+    double** bf_data = NULL;
+
+    bft_ctx_beamform_size(c, &lines, &out_samples, no_samples);
+    if (lines != no_lines) {
+        eprintf("Output must have %d lines \n", lines);
+        return 0;
+    }
+
+    switch (data_type) {
+    case BFT_COMPLEX128: size = 2 * sizeof(double); break;
+    case BFT_COMPLEX64:  size = 2 * sizeof(float);  break;
+    default:
+        eprintf("Unknown type of the IQ data : %d \n", data_type);
+        return 0;
+    }
+    if (!linear_only(c, "bft_beamform_iq")) {
+        return 0;
     }
+    if (!(c->decimation >= 1) || c->decimation != floor(c->decimation)) {
+        eprintf("The decimation must be a positive integer \n");
+        return 0;
+    }
+
+    iq_data = set_row_ptrs(&c->in_ptrs, &c->in_ptrs_len, data,
+        no_elements, no_samples * size);
+    bf_data = (double**)set_row_ptrs(&c->out_ptrs, &c->out_ptrs_len, out,
+        no_lines, 2 * out_samples * sizeof(double));
+
+    if (beamform_iq(c->pool, c->flc, c->alc, &c->sys, c->f0,
+            (ui32)c->decimation, Time, iq_data, data_type, no_samples,
+            element_no, (TPoint3D*)xmt, bf_data) == NULL) {
+        return 0;
+    }
+    clear_line_ends(c, out, no_lines, 0, out_samples, no_samples, 2);
+    return no_lines;
+}
+
+
+/** Beamform a B-mode image. RF data are beamformed and their envelope
+ *  is found with a Hilbert filter; IQ data (BFT_COMPLEX128/64) are
+ *  beamformed as by bft_ctx_beamform_iq() and their envelope is the
+ *  magnitude. The envelope is log compressed as set by bft_param
+ *  ("dynamic_range", "reference", "hilbert_taps") and stored in 'out'
+ *  as BFT_FLOAT32 (dB) or BFT_UINT8.
+ */
+ui32 bft_ctx_beamform_bmode(void* ctx, void* out, ui32 out_type,
+    ui32 no_lines, void* data, ui32 data_type, ui32 acc_type, double Time,
+    ui32 no_samples, ui32 no_elements, ui32 element_no, double* xmt)
+{
+    TBftContext* c = get_context(ctx);
+    TEnvelope env;
+    ui32 lines;
+    ui32 out_samples;
+    size_t len;
+    ui32 ok;
+    double** bf_data = NULL;
+
+    bft_ctx_beamform_size(c, &lines, &out_samples, no_samples);
+    if (lines != no_lines) {
+        eprintf("Output must have %d lines \n", lines);
+        return 0;
+    }
+
+    env.iq = (data_type == BFT_COMPLEX128 || data_type == BFT_COMPLEX64);
+    env.no_taps = (ui32)c->hilbert_taps;
+    env.dynamic_range = c->dynamic_range;
+    env.reference = c->reference;
+
+    /* The lines are beamformed into a buffer kept by the context */
+    len = (size_t)no_lines * out_samples * (env.iq ? 2 : 1);
+    if (c->frame_len < len) {
+        double* f = (double*)realloc(c->frame, len * sizeof(double));
+        myassert(f != NULL, "Could not allocate the B-mode lines\n");
+        c->frame = f;
+        c->frame_len = len;
+    }
+
+    if (env.iq) {
+        ok = bft_ctx_beamform_iq(c, c->frame, no_lines, data, data_type,
+            Time, no_samples, no_elements, element_no, xmt);
+    } else {
+        ok = bft_ctx_beamform_typed(c, c->frame, no_lines, out_samples,
+            data, data_type, acc_type, Time, no_samples, no_elements,
+            element_no, xmt);
+    }
+    if (ok == 0) {
+        return 0;
+    }
+
+    bf_data = (double**)set_row_ptrs(&c->out_ptrs, &c->out_ptrs_len,
+        c->frame, no_lines, out_samples * (env.iq ? 2 : 1) * sizeof(double));
+    return envelope_lines(c->pool, &env, bf_data, no_lines, out_samples,
+        out, out_type);
+}
+
+
+/** Convert a frame of lines, beamformed with the current focusing, to
+ *  the Cartesian image with the pixels (x[ix], 0, z[iz]). The image is
+ *  stored in out[ix*nz + iz], with the type of the lines (BFT_FLOAT64,
+ *  BFT_FLOAT32 or BFT_UINT8). The interpolation table is kept by the
+ *  context until the geometry changes.
+ */
+ui32 bft_ctx_scan_convert(void* ctx, void* out, void* lines,
+    ui32 data_type, ui32 no_lines, ui32 no_samples, double Time,
+    double* x, ui32 nx, double* z, ui32 nz)
+{
+    TBftContext* c = get_context(ctx);
+
+    if (no_lines != c->flc->no_focus_time_lines) {
+        eprintf("The frame must have %d lines \n",
+            c->flc->no_focus_time_lines);
+        return 0;
+    }
+
+    if (scan_table(c->pool, &c->scan, c->flc, &c->sys, Time, no_samples,
+            x, nx, z, nz) == NULL
+        || scan_convert(c->pool, &c->scan, lines, data_type, out) == NULL) {
+        return 0;
+    }
+    return nx * nz;
+}
+
+
+/** Sum the emissions, given by their transmit elements or waves.
+ */
+static ui32 beamform_emissions(TBftContext* c, double* out, ui32 no_lines,
+    ui32 no_out_samples, void* data, ui32 data_type, ui32 acc_type,
+    double Time, ui32 no_samples, ui32 no_elements, ui32 no_emissions,
+    ui32* elements, TTransmit* tx)
+{
+    ui32 lines;
+    ui32 out_samples;
+    size_t size;
+    void** rf_data = NULL;
+    double** hi_res = NULL;
+
+    bft_ctx_beamform_size(c, &lines, &out_samples, no_samples);
+    if (lines != no_lines || out_samples != no_out_samples
+            || no_out_samples != no_samples) {
+        eprintf("Output must have %d lines with %d samples each \n",
+            lines, no_samples);
+        return 0;
+    }
+
+    size = sample_size(data_type);
+    if (size == 0) {
+        eprintf("Unknown type of the RF data : %d \n", data_type);
+        return 0;
+    }
+
+    rf_data = set_row_ptrs(&c->in_ptrs, &c->in_ptrs_len, data,
+        no_emissions * no_elements, no_samples * size);
+    hi_res = (double**)set_row_ptrs(&c->out_ptrs, &c->out_ptrs_len, out,
+        no_lines, no_samples * sizeof(double));
+
+    hi_res = beamform_sta_typed(c->pool, c->flc, c->alc, c->salc, &c->sys,
+        Time, rf_data, data_type, acc_type, no_emissions, no_samples,
+        no_elements, elements, tx, hi_res);
+    if (hi_res == NULL) {
+        return 0;
+    }
+
+    if (no_emissions == 0) {
+        memset(out, 0, no_lines * no_samples * sizeof(out[0]));
+    }
+
+    return no_lines;
+}
+
+
+ui32 bft_ctx_beamform_sta(void* ctx, double* out, ui32 no_lines,
+    ui32 no_out_samples, void* data, ui32 data_type, ui32 acc_type,
+    double Time, ui32 no_samples, ui32 no_elements, ui32 no_emissions,
+    ui32* elements, double* xmt)
+{
+    TBftContext* c = get_context(ctx);
+    TTransmit* tx = NULL;
+    ui32 res;
+
+    if (elements == NULL && xmt != NULL) {
+        tx = (TTransmit*)calloc(no_emissions + 1, sizeof(TTransmit));
+        myassert(tx != NULL, "Could not allocate the transmit positions\n");
+        for (ui32 k = 0; k < no_emissions; k++) {
+            tx[k].type = BFT_TX_POINT;
+            tx[k].point = ((TPoint3D*)xmt)[k];
+        }
+    }
+
+    res = beamform_emissions(c, out, no_lines, no_out_samples, data,
+        data_type, acc_type, Time, no_samples, no_elements, no_emissions,
+        elements, tx);
+
+    free(tx);
+    return res;
+}
+
+
+ui32 bft_ctx_beamform_waves(void* ctx, double* out, ui32 no_lines,
+    ui32 no_out_samples, void* data, ui32 data_type, ui32 acc_type,
+    double Time, ui32 no_samples, ui32 no_elements, ui32 no_angles,
+    double* angles, double source)
+{
+    TBftContext* c = get_context(ctx);
+    TTransmit* tx = NULL;
+    ui32 res;
+
+    myassert((angles != NULL || no_angles == 0), "angles is a null pointer\n");
+    tx = transmit_waves(angles, no_angles, source);
+    myassert(tx != NULL, "Could not allocate the transmitted waves\n");
+
+    res = beamform_emissions(c, out, no_lines, no_out_samples, data,
+        data_type, acc_type, Time, no_samples, no_elements, no_angles,
+        NULL, tx);
+
+    free(tx);
+    return res;
+}
+
+
+ui32 bft_ctx_beamform_typed(void* ctx, double* out, ui32 no_lines,
+    ui32 no_out_samples, void* data, ui32 data_type, ui32 acc_type,
+    double Time, ui32 no_samples, ui32 no_elements, ui32 element_no,
+    double* xmt)
+{
+    return bft_ctx_beamform_frames(ctx, out, 1, no_lines, no_out_samples,
+        data, data_type, acc_type, &Time, no_samples, no_elements,
+        element_no, xmt);
+}
+
+
+ui32 bft_ctx_beamform_out(void* ctx, double* out, ui32 no_lines,
+    ui32 no_out_samples, double* data, double Time, ui32 no_samples,
+    ui32 no_elements, ui32 element_no, double* xmt)
+{
+    return bft_ctx_beamform_typed(ctx, out, no_lines, no_out_samples, data,
+        BFT_FLOAT64, BFT_ACC_DOUBLE, Time, no_samples, no_elements,
+        element_no, xmt);
+}
+
+
+/** Check the arguments of the grid beamforming, and describe the grid.
+ *  Returns the size of one sample, or 0 in case of an error.
+ */
+static size_t grid_setup(TPixelGrid* grid, TTransducer* t, ui32 data_type,
+    ui32 no_elements, double* x, ui32 nx, double* y, ui32 ny, double* z,
+    ui32 nz)
+{
+    static double y0 = 0.0;
+    size_t size;
+
+    myassert(is_xdc_valid(t), "Invalid transducer\n");
+    if (t->no_elements != no_elements) {
+        eprintf("The data must have one row per element (%d) \n",
+            t->no_elements);
+        return 0;
+    }
+
+    size = sample_size(data_type);
+    if (size == 0) {
+        eprintf("Unknown type of the RF data : %d \n", data_type);
+        return 0;
+    }
+
+    /* A 2-D grid lies in the plane y = 0 */
+    if (y == NULL || ny == 0) {
+        y = &y0;
+        ny = 1;
+    }
+
+    grid->nx = nx;
+    grid->ny = ny;
+    grid->nz = nz;
+    grid->x = x;
+    grid->y = y;
+    grid->z = z;
+    return size;
+}
+
+
+ui32 bft_ctx_beamform_grid(void* ctx, double* out, void* xdc, void* data,
+    ui32 data_type, double Time, ui32 no_samples, ui32 no_elements,
+    double* x, ui32 nx, double* y, ui32 ny, double* z, ui32 nz,
+    double* apo, ui32 element_no, double* xmt)
+{
+    TBftContext* c = get_context(ctx);
+    TPixelGrid grid;
+    size_t size;
+    void** rf_data = NULL;
+
+    size = grid_setup(&grid, (TTransducer*)xdc, data_type, no_elements,
+        x, nx, y, ny, z, nz);
+    if (size == 0 || !linear_only(c, "bft_beamform_grid")) {
+        return 0;
+    }
+
+    rf_data = set_row_ptrs(&c->in_ptrs, &c->in_ptrs_len, data, no_elements,
+        no_samples * size);
+    if (beamform_grid(c->pool, &grid, (TTransducer*)xdc, &c->sys, Time,
+            rf_data, data_type, no_samples, apo, element_no, (TPoint3D*)xmt,
+            out) == NULL) {
+        return 0;
+    }
+
+    return grid.nx * grid.ny * grid.nz;
+}
+
+
+ui32 bft_ctx_beamform_grid_waves(void* ctx, double* out, void* xdc,
+    void* data, ui32 data_type, double Time, ui32 no_samples,
+    ui32 no_elements, double* x, ui32 nx, double* y, ui32 ny, double* z,
+    ui32 nz, double* apo, ui32 no_angles, double* angles, double source)
+{
+    TBftContext* c = get_context(ctx);
+    TPixelGrid grid;
+    TTransmit* tx = NULL;
+    size_t size;
+    void** rf_data = NULL;
+    double* res;
+
+    size = grid_setup(&grid, (TTransducer*)xdc, data_type, no_elements,
+        x, nx, y, ny, z, nz);
+    if (size == 0 || !linear_only(c, "bft_beamform_grid_waves")) {
+        return 0;
+    }
+
+    myassert((angles != NULL || no_angles == 0), "angles is a null pointer\n");
+    tx = transmit_waves(angles, no_angles, source);
+    myassert(tx != NULL, "Could not allocate the transmitted waves\n");
+
+    rf_data = set_row_ptrs(&c->in_ptrs, &c->in_ptrs_len, data,
+        no_angles * no_elements, no_samples * size);
+    res = beamform_grid_waves(c->pool, &grid, (TTransducer*)xdc, &c->sys,
+        Time, rf_data, data_type, no_samples, apo, tx, no_angles, out);
+    free(tx);
+
+    return (res == NULL) ? 0 : grid.nx * grid.ny * grid.nz;
+}
+
+
+void* bft_ctx_plan(void* ctx, ui32 no_samples, ui32 no_elements, double Time,
+    ui32 element_no, double* xmt)
+{
+    TBftContext* c = get_context(ctx);
+    ui32 no_lines;
+    ui32 no_out_samples;
+
+    if (!linear_only(c, "bft_plan")) {
+        return NULL;
+    }
+    bft_ctx_beamform_size(c, &no_lines, &no_out_samples, no_samples);
+    return new_beamform_plan(c->flc, c->alc, &c->sys, Time, no_samples,
+        no_elements, no_out_samples, element_no, (TPoint3D*)xmt);
+}
+
+
+void bft_plan_size(void* plan, ui32* no_lines, ui32* no_out_samples)
+{
+    myassert(plan != NULL, "plan is a null pointer\n");
+    *no_lines = ((TBeamformPlan*)plan)->no_lines;
+    *no_out_samples = ((TBeamformPlan*)plan)->no_out_samples;
+}
+
+
+ui32 bft_ctx_plan_execute(void* ctx, void* plan, double* out, double* data)
+{
+    TBftContext* c = get_context(ctx);
+
+    myassert(plan != NULL, "plan is a null pointer\n");
+    execute_beamform_plan(c->pool, (TBeamformPlan*)plan, data, out);
+    return ((TBeamformPlan*)plan)->no_lines;
+}
+
+
+void bft_plan_free(void* plan)
+{
+    del_beamform_plan((TBeamformPlan*)plan);
+}
+
+
+void* bft_ctx_stream(void* ctx, ui32 no_samples, ui32 no_elements,
+    double Time, ui32 element_no, double* xmt)
+{
+    TBftContext* c = get_context(ctx);
+
+    if (!linear_only(c, "bft_stream")) {
+        return NULL;
+    }
+    return new_beamform_stream(c->flc, c->alc, &c->sys, Time, no_samples,
+        no_elements, element_no, (TPoint3D*)xmt);
+}
+
+
+ui32 bft_stream_push(void* stream, void* data, ui32 data_type,
+    ui32 block_len)
+{
+    myassert(stream != NULL, "stream is a null pointer\n");
+    myassert((data != NULL || block_len == 0), "data is a null pointer\n");
+    return beamform_stream_push((TBeamformStream*)stream, data, data_type,
+        block_len);
+}
+
+
+void bft_stream_size(void* stream, ui32* no_lines, ui32* no_ready,
+    ui32* no_done)
+{
+    TBeamformStream* s = (TBeamformStream*)stream;
+
+    myassert(stream != NULL, "stream is a null pointer\n");
+    *no_lines = s->no_lines;
+    *no_ready = beamform_stream_ready(s);
+    *no_done = s->done;
+}
+
+
+ui32 bft_ctx_stream_beamform(void* ctx, void* stream, double* out)
+{
+    TBftContext* c = get_context(ctx);
+
+    myassert(stream != NULL, "stream is a null pointer\n");
+    return beamform_stream_run(c->pool, (TBeamformStream*)stream, out);
+}
+
+
+void bft_stream_free(void* stream)
+{
+    del_beamform_stream((TBeamformStream*)stream);
+}
+
+
+double* bft_ctx_beamform(void* ctx, ui32* no_lines, ui32 *no_out_samples,
+    double* data, double Time, ui32 no_samples, ui32 no_elements,
+    ui32 element_no, double* xmt)
+{
+    TBftContext* c = get_context(ctx);
+    double* beam = NULL;
+
+    bft_ctx_beamform_size(c, no_lines, no_out_samples, no_samples);
+
+    beam = (double*)malloc(*no_lines * *no_out_samples * sizeof(double));
+    myassert(beam != NULL, "Could not allocate beam\n");
+
+    bft_ctx_beamform_out(c, beam, *no_lines, *no_out_samples, data, Time,
+        no_samples, no_elements, element_no, xmt);
+
+    return beam;
+}
+
+
+ui32 bft_ctx_sum_images_out(void* ctx, double* out, double* data1,
+    ui32 element1, double* data2, ui32 element2, double time, ui32 no_samples)
+{
+    TBftContext* c = get_context(ctx);
+    TFocusLineCollection* flc = c->flc;
+    double** rf1 = NULL;
+    double** rf2 = NULL;
+    double** hi_res = NULL;
+
+    /* The first half of the cached pointers is for data1, the second for data2 */
+    rf1 = (double**)set_row_ptrs(&c->in_ptrs, &c->in_ptrs_len, data1,
+        2 * flc->no_focus_time_lines, no_samples * sizeof(double));
+    rf2 = rf1 + flc->no_focus_time_lines;
+    for (ui32 i = 0; i < flc->no_focus_time_lines; i++) {
+        rf2[i] = data2 + no_samples * i;
+    }
+
+    hi_res = (double**)set_row_ptrs(&c->out_ptrs, &c->out_ptrs_len, out,
+        flc->no_focus_time_lines, no_samples * sizeof(double));
+
+    hi_res = sum_images_into(flc, c->alc, &c->sys, rf1, element1, rf2,
+        element2, time, no_samples, hi_res);
+
+    return (hi_res == NULL) ? 0 : flc->no_focus_time_lines;
+}
+
+
+double * bft_ctx_sum_images(void* ctx, double* data1, ui32 element1,
+    double* data2, ui32 element2, double time, ui32 no_samples)
+{
+    TBftContext* c = get_context(ctx);
+    double * hi_res_data = NULL;
+
+    hi_res_data = (double*)calloc( no_samples * c->flc->no_focus_time_lines ,sizeof(double));
+    myassert(hi_res_data != NULL, "Could not allocate output result");
+
+    bft_ctx_sum_images_out(c, hi_res_data, data1, element1, data2, element2,
+        time, no_samples);
+
+    return hi_res_data;
+}
+
+
+void bft_ctx_add_images(void* ctx, double *hires, double *lores,
+    ui32 no_samples, double time, ui32 element)
+{
+   TBftContext* c = get_context(ctx);
+   TFocusLineCollection* flc = c->flc;
+   double **lo_res = NULL;
+   double **hi_res = NULL;
+
+   hi_res = (double **) malloc(flc->no_focus_time_lines * sizeof( double * ) );
+   myassert(hi_res, "Canno get");
+
+   lo_res = (double **) malloc(flc->no_focus_time_lines * sizeof( double * ) );
+
+   if ( lo_res == NULL ) { free(hi_res); abort(); }
+
+   for ( ui32 i = 0; i < flc->no_focus_time_lines; i++ ) {
+      lo_res[i] = lores + no_samples * i;
+      hi_res[i] = hires + no_samples * i;
+   }
+
+   add_images(flc, c->salc, &c->sys, hi_res, lo_res, element, time, no_samples);
+
+   free(hi_res);
+   free(lo_res);
+}
+
+
+void bft_ctx_sub_images(void* ctx, double *hires, double *lores,
+    ui32 no_samples, double time, ui32 element)
+{
+    TBftContext* c = get_context(ctx);
+    TFocusLineCollection* flc = c->flc;
+    double **lo_res = NULL;
+    double **hi_res = NULL;
+
+    hi_res = (double **)malloc(flc->no_focus_time_lines * sizeof(double *));
+    myassert(hi_res, "Canno get");
+
+    lo_res = (double **)malloc(flc->no_focus_time_lines * sizeof(double *));
+
+    if (lo_res == NULL) { free(hi_res); abort(); }
+
+    for (ui32 i = 0; i < flc->no_focus_time_lines; i++) {
+        lo_res[i] = lores + no_samples * i;
+        hi_res[i] = hires + no_samples * i;
+    }
+
+    sub_images(flc, c->alc, &c->sys, hi_res, lo_res, element, time, no_samples);
+
+    free(hi_res);
+    free(lo_res);
+}
+
+
+void bft_ctx_set_filter_bank(void* ctx, double* coef, ui32 Nf, ui32 Ntaps)
+{
+    TBftContext* c = get_context(ctx);
+    myassert(coef != NULL, "Received a null pointer \n");
+    set_filter_bank(c->flc, Nf, Ntaps, coef);
+}
+
+
+double* bft_ctx_delay(void* ctx, double*src, ui32 src_len, double* times,
+    double* delays, ui32 times_len, double src_start_time,
+    double dest_start_time, ui32 dest_len, ui32 method)
+{
+    TBftContext* c = get_context(ctx);
+
+    switch (method)
+    {
+    case 0:
+        myassert(&c->flc->filter_bank != NULL, "Set filter bank first !\n");
+        return delay_line_filter(
+            &c->sys, &c->flc->filter_bank, times, delays,
+            times_len, src, src_len, src_start_time,
+            dest_start_time, dest_len);
+
+    default:
+        return delay_line_linear(
+            &c->sys, times, delays, times_len, src,
+            src_len, src_start_time,
+            dest_start_time, dest_len);
+    }
+
+}
+
+
+/**
+ *  Delays 'no_lines' lines into 'out' (dest_len samples per line). Every
+ *  line has its own 'times_len' times and delays. The lines are delayed
+ *  by the threads of the context.
+ */
+ui32 bft_ctx_delay_lines(void* ctx, double* out, double* src, ui32 no_lines,
+    ui32 src_len, double* times, double* delays, ui32 times_len,
+    double src_start_time, double dest_start_time, ui32 dest_len,
+    ui32 method)
+{
+    TBftContext* c = get_context(ctx);
+    TFilterBank* fb = NULL;
+
+    myassert((out != NULL && src != NULL && times != NULL && delays != NULL),
+        "Received a null pointer \n");
+
+    if (method == 0) {
+        if (!c->flc->use_filter_bank) {
+            eprintf("\007 bft_delay_lines:\n");
+            eprintf("Error : set the filter bank first \n");
+            return 0;
+        }
+        fb = &c->flc->filter_bank;
+    }
+
+    return delay_lines(c->pool, &c->sys, fb, no_lines, src, src_len,
+        times, delays, times_len, src_start_time, dest_start_time,
+        out, dest_len);
+}
+
+
+void bft_ctx_xdc_set(void* ctx, void* xdc, double* centers, ui32 no_elements)
+{
+    get_context(ctx);
+
+    myassert(xdc != NULL, "XDC is a null pointer\n");
+    myassert(centers != NULL, "centers is a null pointer\n");
+    bft_transducer_set(xdc, no_elements, (TPoint3D*) centers);
+}
+
+
+void bft_free_mem(void * ptr)
+{
+    myassert(ptr != NULL, "NULL pointer passed");
+    if (ptr != NULL){
+        free(ptr);
+    }
+}
+
+
+ui32 bft_simd(ui32 level)
+{
+    BFT_INITIALIZE;
+    return simd_select(level);
+}
+
+
+/*
+ *  The functions below work on the default context, which is created
+ *  by bft_init().
+ */
+
+double bft_param(char* id, double val)
+{
+    return bft_ctx_param(NULL, id, val);
+}
+
+ui32 bft_threads(ui32 threads)
+{
+    return bft_ctx_threads(NULL, threads);
+}
+
+ui32 bft_interpolation(ui32 mode)
+{
+    return bft_ctx_interpolation(NULL, mode);
+}
+
+ui32 bft_no_lines(ui32 no_lines)
+{
+    return bft_ctx_no_lines(NULL, no_lines);
+}
+
+void* bft_xdc(double* centers, ui32 nelem)
+{
+    return bft_ctx_xdc(NULL, centers, nelem);
+}
+
+void bft_xdc_free(void* xdc)
+{
+    bft_ctx_xdc_free(NULL, xdc);
+}
+
+void bft_center_focus(double* point, ui32 line_no)
+{
+    bft_ctx_center_focus(NULL, point, line_no);
+}
+
+ui32 bft_focus(void* xdc, double* times, double* focus, ui32 no_times, ui32 line_no)
+{
+    return bft_ctx_focus(NULL, xdc, times, focus, no_times, line_no);
+}
+
+void bft_focus_pixel(void* xdc, double* points, ui32 no_points, ui32 line_no)
+{
+    bft_ctx_focus_pixel(NULL, xdc, points, no_points, line_no);
+}
+
+ui32 bft_focus_2way(void* xdc, double* times, double* delays, ui32 no_times, ui32 line_no)
+{
+    return bft_ctx_focus_2way(NULL, xdc, times, delays, no_times, line_no);
+}
+
+ui32 bft_focus_times(void* xdc, double* times, double* delays, ui32 no_times, ui32 line_no)
+{
+    return bft_ctx_focus_times(NULL, xdc, times, delays, no_times, line_no);
+}
+
+void bft_apodization(void* xdc, double* times, double* apodization, ui32 no_times, ui32 line_no)
+{
+    bft_ctx_apodization(NULL, xdc, times, apodization, no_times, line_no);
+}
+
+void bft_sum_apodization(void* xdc, double* times, double* apodization, ui32 no_times, ui32 line_no)
+{
+    bft_ctx_sum_apodization(NULL, xdc, times, apodization, no_times, line_no);
+}
+
+void bft_dynamic_focus(void* xdc, ui32 line_no, double dir_xz, double dir_yz)
+{
+    bft_ctx_dynamic_focus(NULL, xdc, line_no, dir_xz, dir_yz);
+}
+
+ui32 bft_focus_lines(void* xdc, double* centers, double* times, double* focus,
+    ui32 no_times, ui32 no_lines)
+{
+    return bft_ctx_focus_lines(NULL, xdc, centers, times, focus, no_times,
+        no_lines);
+}
+
+ui32 bft_apodization_lines(void* xdc, double* times, double* apodization,
+    ui32 no_times, ui32 no_lines)
+{
+    return bft_ctx_apodization_lines(NULL, xdc, times, apodization, no_times,
+        no_lines);
+}
+
+ui32 bft_sum_apodization_lines(void* xdc, double* times, double* apodization,
+    ui32 no_times, ui32 no_lines)
+{
+    return bft_ctx_sum_apodization_lines(NULL, xdc, times, apodization,
+        no_times, no_lines);
+}
+
+ui32 bft_dynamic_focus_lines(void* xdc, double* centers, double* dir_xz,
+    double* dir_yz, ui32 no_lines)
+{
+    return bft_ctx_dynamic_focus_lines(NULL, xdc, centers, dir_xz, dir_yz,
+        no_lines);
+}
+
+ui32 bft_scan_phased(void* xdc, double sector, ui32 no_lines, double depth,
+    ui32 no_focal_zones, double* apo_times, double* apodization,
+    ui32 no_apo_times)
+{
+    return bft_ctx_scan_phased(NULL, xdc, sector, no_lines, depth,
+        no_focal_zones, apo_times, apodization, no_apo_times);
+}
+
+void bft_beamform_size(ui32* no_lines, ui32 *no_out_samples, ui32 no_samples)
+{
+    bft_ctx_beamform_size(NULL, no_lines, no_out_samples, no_samples);
+}
+
+ui32 bft_beamform_typed(double* out, ui32 no_lines, ui32 no_out_samples,
+    void* data, ui32 data_type, ui32 acc_type, double Time, ui32 no_samples,
+    ui32 no_elements, ui32 element_no, double* xmt)
+{
+    return bft_ctx_beamform_typed(NULL, out, no_lines, no_out_samples, data,
+        data_type, acc_type, Time, no_samples, no_elements, element_no, xmt);
+}
+
+ui32 bft_beamform_frames(double* out, ui32 no_frames, ui32 no_lines,
+    ui32 no_out_samples, void* data, ui32 data_type, ui32 acc_type,
+    double* times, ui32 no_samples, ui32 no_elements, ui32 element_no,
+    double* xmt)
+{
+    return bft_ctx_beamform_frames(NULL, out, no_frames, no_lines,
+        no_out_samples, data, data_type, acc_type, times, no_samples,
+        no_elements, element_no, xmt);
+}
+
+ui32 bft_beamform_window(double* out, ui32 no_frames, ui32 no_lines,
+    ui32 out_start, ui32 out_count, void* data, ui32 data_type,
+    ui32 acc_type, ui32 interp, double* times, ui32 no_samples,
+    ui32 no_elements, ui32 element_no, double* xmt)
+{
+    return bft_ctx_beamform_window(NULL, out, no_frames, no_lines, out_start,
+        out_count, data, data_type, acc_type, interp, times, no_samples,
+        no_elements, element_no, xmt);
+}
+
+ui32 bft_beamform_speeds(double* out, ui32 no_c, double* c_values,
+    ui32 no_lines, ui32 out_start, ui32 out_count, void* data,
+    ui32 data_type, ui32 acc_type, ui32 interp, double Time,
+    ui32 no_samples, ui32 no_elements, ui32 element_no, double* xmt)
+{
+    return bft_ctx_beamform_speeds(NULL, out, no_c, c_values, no_lines,
+        out_start, out_count, data, data_type, acc_type, interp, Time,
+        no_samples, no_elements, element_no, xmt);
+}
+
+ui32 bft_beamform_iq(double* out, ui32 no_lines, void* data, ui32 data_type,
+    double Time, ui32 no_samples, ui32 no_elements, ui32 element_no,
+    double* xmt)
+{
+    return bft_ctx_beamform_iq(NULL, out, no_lines, data, data_type, Time,
+        no_samples, no_elements, element_no, xmt);
+}
+
+ui32 bft_beamform_bmode(void* out, ui32 out_type, ui32 no_lines,
+    void* data, ui32 data_type, ui32 acc_type, double Time,
+    ui32 no_samples, ui32 no_elements, ui32 element_no, double* xmt)
+{
+    return bft_ctx_beamform_bmode(NULL, out, out_type, no_lines, data,
+        data_type, acc_type, Time, no_samples, no_elements, element_no, xmt);
+}
+
+ui32 bft_scan_convert(void* out, void* lines, ui32 data_type,
+    ui32 no_lines, ui32 no_samples, double Time, double* x, ui32 nx,
+    double* z, ui32 nz)
+{
+    return bft_ctx_scan_convert(NULL, out, lines, data_type, no_lines,
+        no_samples, Time, x, nx, z, nz);
+}
+
+ui32 bft_beamform_sta(double* out, ui32 no_lines, ui32 no_out_samples,
+    void* data, ui32 data_type, ui32 acc_type, double Time, ui32 no_samples,
+    ui32 no_elements, ui32 no_emissions, ui32* elements, double* xmt)
+{
+    return bft_ctx_beamform_sta(NULL, out, no_lines, no_out_samples, data,
+        data_type, acc_type, Time, no_samples, no_elements, no_emissions,
+        elements, xmt);
+}
+
+ui32 bft_beamform_grid_waves(double* out, void* xdc, void* data,
+    ui32 data_type, double Time, ui32 no_samples, ui32 no_elements,
+    double* x, ui32 nx, double* y, ui32 ny, double* z, ui32 nz,
+    double* apo, ui32 no_angles, double* angles, double source)
+{
+    return bft_ctx_beamform_grid_waves(NULL, out, xdc, data, data_type, Time,
+        no_samples, no_elements, x, nx, y, ny, z, nz, apo, no_angles, angles,
+        source);
+}
+
+ui32 bft_beamform_waves(double* out, ui32 no_lines, ui32 no_out_samples,
+    void* data, ui32 data_type, ui32 acc_type, double Time, ui32 no_samples,
+    ui32 no_elements, ui32 no_angles, double* angles, double source)
+{
+    return bft_ctx_beamform_waves(NULL, out, no_lines, no_out_samples, data,
+        data_type, acc_type, Time, no_samples, no_elements, no_angles,
+        angles, source);
+}
+
+ui32 bft_beamform_out(double* out, ui32 no_lines, ui32 no_out_samples,
+    double* data, double Time, ui32 no_samples, ui32 no_elements,
+    ui32 element_no, double* xmt)
+{
+    return bft_ctx_beamform_out(NULL, out, no_lines, no_out_samples, data,
+        Time, no_samples, no_elements, element_no, xmt);
+}
+
+ui32 bft_beamform_grid(double* out, void* xdc, void* data, ui32 data_type,
+    double Time, ui32 no_samples, ui32 no_elements, double* x, ui32 nx,
+    double* y, ui32 ny, double* z, ui32 nz, double* apo, ui32 element_no,
+    double* xmt)
+{
+    return bft_ctx_beamform_grid(NULL, out, xdc, data, data_type, Time,
+        no_samples, no_elements, x, nx, y, ny, z, nz, apo, element_no, xmt);
+}
+
+void* bft_plan(ui32 no_samples, ui32 no_elements, double Time,
+    ui32 element_no, double* xmt)
+{
+    return bft_ctx_plan(NULL, no_samples, no_elements, Time, element_no, xmt);
+}
+
+ui32 bft_plan_execute(void* plan, double* out, double* data)
+{
+    return bft_ctx_plan_execute(NULL, plan, out, data);
+}
+
+void* bft_stream(ui32 no_samples, ui32 no_elements, double Time,
+    ui32 element_no, double* xmt)
+{
+    return bft_ctx_stream(NULL, no_samples, no_elements, Time, element_no,
+        xmt);
+}
+
+ui32 bft_stream_beamform(void* stream, double* out)
+{
+    return bft_ctx_stream_beamform(NULL, stream, out);
+}
+
+double* bft_beamform(ui32* no_lines, ui32 *no_out_samples, double* data, double Time, ui32 no_samples,
+    ui32 no_elements, ui32 element_no, double* xmt)
+{
+    return bft_ctx_beamform(NULL, no_lines, no_out_samples, data, Time,
+        no_samples, no_elements, element_no, xmt);
+}
+
+ui32 bft_sum_images_out(double* out, double* data1, ui32 element1,
+    double* data2, ui32 element2, double time, ui32 no_samples)
+{
+    return bft_ctx_sum_images_out(NULL, out, data1, element1, data2, element2,
+        time, no_samples);
+}
+
+double * bft_sum_images(double* data1, ui32 element1, double* data2,
+    ui32 element2, double time, ui32 no_samples)
+{
+    return bft_ctx_sum_images(NULL, data1, element1, data2, element2, time,
+        no_samples);
+}
+
+void bft_add_images(double *hires, double *lores, ui32 no_samples, double time, ui32 element)
+{
+    bft_ctx_add_images(NULL, hires, lores, no_samples, time, element);
+}
+
+void bft_sub_images(double *hires, double *lores, ui32 no_samples, double time, ui32 element)
+{
+    bft_ctx_sub_images(NULL, hires, lores, no_samples, time, element);
+}
+
+void bft_set_filter_bank(double* coef, ui32 Nf, ui32 Ntaps)
+{
+    bft_ctx_set_filter_bank(NULL, coef, Nf, Ntaps);
+}
+
+double* bft_delay(double*src, ui32 src_len, double* times, double* delays, ui32 times_len,
+    double src_start_time, double dest_start_time, ui32 dest_len, ui32 method)
+{
+    return bft_ctx_delay(NULL, src, src_len, times, delays, times_len,
+        src_start_time, dest_start_time, dest_len, method);
+}
+
+ui32 bft_delay_lines(double* out, double* src, ui32 no_lines, ui32 src_len,
+    double* times, double* delays, ui32 times_len, double src_start_time,
+    double dest_start_time, ui32 dest_len, ui32 method)
+{
+    return bft_ctx_delay_lines(NULL, out, src, no_lines, src_len, times,
+        delays, times_len, src_start_time, dest_start_time, dest_len, method);
+}
+
+void bft_xdc_set(void* xdc, double* centers, ui32 no_elements)
+{
+    bft_ctx_xdc_set(NULL, xdc, centers, no_elements);
 }
@@ -0,0 +1,146 @@
+/*********************************************************************
+ * NAME     : iq.c
+ * ABSTRACT : Beamforming of complex baseband (IQ) data. The IQ data
+ *            are the analytic signals of the channels multiplied by
+ *            exp(-j*2*pi*f0*t), t being the time of the sample, and
+ *            decimated. The beamformed lines are demodulated in the
+ *            same way at the times of their samples, so that a line
+ *            is the IQ signal of the line beamformed from the RF data.
+ *********************************************************************/
+
+#include "../h/iq.h"
+#include "../h/beamform.h"
+#include "../h/error.h"
+
+#include <math.h>
+#include <stdlib.h>
+#include <string.h>
+
+#ifndef M_PI
+#define M_PI 3.14159265358979323846
+#endif
+
+
+/*
+ *  Everything that is needed to beamform the lines of an IQ image.
+ */
+typedef struct{
+   TFocusLineCollection *flc;
+   TApoLineCollection *alc;
+   TSysParams *sys;       /* The full sampling frequency                */
+   TSysParams iq_sys;     /* The sampling frequency of the IQ data      */
+   double f0;             /* Demodulation frequency                     */
+   ui32 decimation;       /* Full rate samples per IQ sample            */
+   double time;           /* Time of the first sample                   */
+   void **iq_data;        /* The IQ data, one pointer per channel       */
+   ui32 no_samples;       /* Number of IQ samples per channel           */
+   ui32 pixel_element;    /* Transmit element for pixel based focusing  */
+   TTransmit *tx;         /* Transmit for dynamic focusing, or NULL     */
+   TTransmit point;       /* 'tx' for a transmit element or position    */
+   TThreadPool *pool;     /* The pool running the job                   */
+   TDelayScratch *scratch;/* One per thread of 'pool'                   */
+   ui32 failed;           /* Set if a delay table could not be allocated */
+   double **bf_lines;     /* The output lines, I and Q interleaved      */
+}TIqJob;
+
+
+/*
+ *   Instantiate the line kernels for the supported sample types
+ */
+#define IQ_T             double
+#define KERNEL(name)     name
+#include "iq_lines.inc"
+#undef IQ_T
+#undef KERNEL
+
+#define IQ_T             float
+#define KERNEL(name)     name##_c64
+#include "iq_lines.inc"
+#undef IQ_T
+#undef KERNEL
+
+
+/*********************************************************************
+ * FUNCTION  : beamform_iq()
+ * ABSTRACT  : Beamform an image from IQ data. The focusing and the
+ *            apodization are set as for the RF data, with the full
+ *            sampling frequency sys->fs. The lines are distributed
+ *            among the threads in 'pool'.
+ * ARGUMENTS : f0 - Demodulation frequency
+ *             decimation - The IQ data are sampled at
+ *                    sys->fs/decimation.
+ *             time - Time of the first IQ sample
+ *             iq_data - One pointer per channel to the IQ samples
+ *             sample_type - BFT_COMPLEX128 or BFT_COMPLEX64
+ *             no_samples - Number of IQ samples per channel
+ *             element_no, xmt - Transmit element or position, as for
+ *                    beamform_image_typed().
+ *             bf_lines - One pointer per line to 2*no_samples values,
+ *                    or 2 per pixel for pixel based focusing. The
+ *                    output samples are at the IQ sampling frequency,
+ *                    with I and Q interleaved.
+ * RETURNS   : 'bf_lines' or NULL in case of wrong settings, or if there
+ *             is not enough memory.
+ *********************************************************************/
+double** beamform_iq(TThreadPool *pool, TFocusLineCollection *flc,
+        TApoLineCollection *alc, TSysParams *sys, double f0, ui32 decimation,
+        double time, void **iq_data, ui32 sample_type, ui32 no_samples,
+        ui32 element_no, TPoint3D *xmt, double **bf_lines)
+{
+  TIqJob job;
+  TParallelFunc kernel;
+
+  PFUNC
+  switch (sample_type){
+     case BFT_COMPLEX128: kernel = iq_line;     break;
+     case BFT_COMPLEX64:  kernel = iq_line_c64; break;
+     default:
+        eprintf("\007 beamform_iq:\n");
+        eprintf("Error : unsupported type of samples\n");
+        return NULL;
+  }
+
+  if (decimation == 0){
+     eprintf("\007 beamform_iq:\n");
+     eprintf("Error : the decimation must be at least 1\n");
+     return NULL;
+  }
+
+  if (flc->no_focus_time_lines != alc->no_apo_time_lines
+      || flc->no_focus_time_lines == 0){
+     eprintf("\007 beamform_iq:\n");
+     eprintf("Error : the number of apodization lines and focus lines ");
+     eprintf("must be the same, and not 0 \n");
+     return NULL;
+  }
+
+  job.flc = flc;
+  job.alc = alc;
+  job.sys = sys;
+  job.iq_sys = *sys;
+  job.iq_sys.fs = sys->fs/decimation;
+  job.f0 = f0;
+  job.decimation = decimation;
+  job.time = time;
+  job.iq_data = iq_data;
+  job.no_samples = no_samples;
+  job.bf_lines = bf_lines;
+  job.tx = NULL;
+
+  if (xmt != NULL || element_no < 64000) {
+     job.point.type = BFT_TX_POINT;
+     job.point.angle = 0.0;
+     job.point.point = (xmt != NULL) ? *xmt : flc->ftl[0].xdc->c[element_no];
+     job.tx = &job.point;
+  }
+  job.pixel_element = (flc->no_focus_time_lines == 1) ? element_no : (ui32)-1;
+  job.pool = pool;
+  job.failed = FALSE;
+  job.scratch = new_delay_scratch(flc, thread_pool_size(pool));
+  if (job.scratch == NULL)
+     return NULL;
+
+  thread_pool_run(pool, flc->no_focus_time_lines, kernel, &job);
+  del_delay_scratch(job.scratch);
+  return job.failed ? NULL : bf_lines;
+}
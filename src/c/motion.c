@@ -8,9 +8,191 @@
 #include "../h/sys_params.h" 
 #include "../h/geometry.h"
 #include "../h/error.h"
+#include "../h/motion.h"
+#include "../h/simd.h"
 
 #include <math.h>
 #include <stdlib.h>
+#include <string.h>
+
+
+/*
+ *   Several lines delayed with the same settings. Task 'i' of the 
+ *   thread pool is line 'i'.
+ */
+typedef struct{
+  TSysParams *sys;
+  TFilterBank *fb;       /* Filter bank, or NULL for linear interpolation */
+  double *times;         /* 'no_delays' per line                          */
+  double *delays;        /* 'no_delays' per line                          */
+  ui32 no_delays;
+  double *src;           /* 'src_no_samples' per line                     */
+  ui32 src_no_samples;
+  double src_start_time;
+  double dest_start_time;
+  double *out;           /* 'dest_no_samples' per line                    */
+  ui32 dest_no_samples;
+}TDelayJob;
+
+
+/**********************************************************************
+ * FUNCTION : switch_sample
+ * ABSTRACT : The first absolute output sample 'o_abs_s', for which 
+ *            o_abs_s/fs > time, i.e. at which the delay valid after 
+ *            'time' is used. This replaces a division per sample by
+ *            one per delay.
+ **********************************************************************/
+static ui32 switch_sample(double time, double fs)
+{
+  double s = floor(time*fs);
+
+  if (s < 0) return 0;
+  if (s >= 4294967295.0) return 0xFFFFFFFF;
+
+  while (s < 4294967295.0 && s/fs <= time) s ++;
+  while (s > 0 && (s - 1)/fs > time) s --;
+  return (ui32)s;
+}
+
+
+/**********************************************************************
+ * FUNCTION : filter_row
+ * ABSTRACT : Scalar version of TSimdFilterRow (simd.h)
+ **********************************************************************/
+static void filter_row(double *out, const double *src, const double *h,
+                       ui32 ntaps, ui32 n)
+{
+  double sum;
+  ui32 o, j;
+
+  for (o = 0; o < n; o ++){
+     sum = 0.0;
+     for (j = 0; j < ntaps; j ++)
+        sum += h[j]*src[o + j];
+     out[o] = sum;
+  }
+}
+
+
+/**********************************************************************
+ * FUNCTION : delay_line_into
+ *
+ * ABSTRACT : Delay the samples of a whole line into 'out', by linear
+ *            interpolation between two samples, or by a filter bank. 
+ *            Both are a FIR filter, whose coefficients change only with
+ *            the delay. The output samples between two changes of the
+ *            delay are therefore filtered in one run, with the 
+ *            vectorized filter of simd.h. The samples, for which the 
+ *            filter would read outside the input line, are 0.
+ *            The filters of the bank are applied as in the beamforming
+ *            (see TFilterBank in focus.h): an output sample at the
+ *            fractional input index n - mu is interpolated from the 
+ *            input samples n - Ntaps/2 .. n - Ntaps/2 + Ntaps - 1 by the
+ *            filter mu*Nf. The filter of simd.h takes the coefficients
+ *            in the order of the samples, so the filter is reversed.
+ *
+ * ARGUMENTS: fb - Filter bank, or NULL for linear interpolation
+ *            out - 'dest_no_samples' output samples
+ *            The rest are as for delay_line_linear().
+ **********************************************************************/
+static void delay_line_into(TSysParams *sys, TFilterBank* fb,
+                            double *times, double *delays, ui32 no_delays,
+                            double *src, ui32 src_no_samples,
+                            double src_start_time, double dest_start_time,
+                            double *out, ui32 dest_no_samples)
+{
+  TSimdFilterRow simd_row = simd_kernels()->filter_row;
+  ui32 oi;               /* Output sample                              */
+  ui32 end;              /* End of the run of samples with one delay   */
+  ui32 ii;               /* Last input sample, read for output 'oi'    */
+  ui32 o_abs_s;          /* Absolute time output sample                */
+  ui32 o_start_s;        /* Absolute time of output sample 0           */
+  ui32 i_start_s;        /* The sample number corresponding to src_start_time*/
+  ui32 next_s = 0;       /* Absolute sample, at which the delay changes */
+  ui32 delay_no = 0;
+  ui32 changed = 1;      /* The delay has changed                      */
+  ui32 ntaps;
+  ui32 bank_no;          /* Filter of the bank for the current delay   */
+  ui32 shift;            /* Offset of the last tap relative to the delay */
+  ui32 n, k;
+  double sample_delay;   /* The delay in samples       */
+  int int_delay;         /* Integer delay              */
+  double lin[2];         /* Coefficients of the linear interpolation */
+  double *rev = NULL;    /* Reversed filter of the bank */
+  double *h;             /* Filter coefficients        */
+
+  memset(out, 0, dest_no_samples*sizeof(double));
+  if (no_delays == 0) return;
+
+  if (fb != NULL){
+     ntaps = fb->Ntaps;
+     shift = ntaps - 1 - ntaps/2;
+     rev = (double*)malloc(ntaps*sizeof(double));
+     assert(rev != NULL);
+  }else{
+     ntaps = 2;
+     shift = 0;
+  }
+
+  o_start_s = (int)floor(dest_start_time*sys->fs);
+  i_start_s = (int)floor(src_start_time*sys->fs);
+  if (no_delays > 1) next_s = switch_sample(times[1], sys->fs);
+
+  for (oi = 0; oi < dest_no_samples; ){
+     o_abs_s = o_start_s + oi;
+     /*
+      *   Change the delays if necessary. The delay advances by at
+      *   most one zone per output sample.
+      */
+     if (delay_no < no_delays - 1 && o_abs_s >= next_s){
+        delay_no ++;
+        if (delay_no < no_delays - 1)
+           next_s = switch_sample(times[delay_no + 1], sys->fs);
+        changed = 1;
+     }
+     if (changed){
+        changed = 0;
+        sample_delay = delays[delay_no] * sys->fs;
+        int_delay = (int) floor(sample_delay);
+        if (fb != NULL){
+           bank_no = (ui32)((sample_delay - int_delay)*fb->Nf);
+           if (bank_no >= fb->Nf) bank_no = fb->Nf - 1;
+           for (k = 0; k < ntaps; k ++)
+              rev[k] = fb->bank[bank_no][ntaps - 1 - k];
+           h = rev;
+        }else{
+           lin[0] = sample_delay - int_delay;
+           lin[1] = 1.0 - lin[0];
+           h = lin;
+        }
+     }
+
+     end = dest_no_samples;
+     if (delay_no < no_delays - 1){
+        if (next_s <= o_abs_s) end = oi + 1;
+        else if (next_s - o_abs_s < end - oi) end = oi + (next_s - o_abs_s);
+     }
+
+     /*
+      *  Output 'oi' reads the input samples ii-ntaps+1 .. ii
+      */
+     ii = o_abs_s - int_delay - i_start_s + shift;
+     while (oi < end){
+        if (ii < src_no_samples && ii + 1 >= ntaps){
+           n = end - oi;
+           if (n > src_no_samples - ii) n = src_no_samples - ii;
+           if (simd_row != NULL)
+              simd_row(out + oi, src + ii + 1 - ntaps, h, ntaps, n);
+           else
+              filter_row(out + oi, src + ii + 1 - ntaps, h, ntaps, n);
+           oi += n; ii += n;
+        }else{
+           oi ++; ii ++;
+        }
+     }
+  }
+  free(rev);
+}
 
 
 /**********************************************************************
@@ -38,18 +220,7 @@ double* delay_line_linear(TSysParams *sys, double *times, double *delays,
                           double src_start_time, double dest_start_time,
                           ui32 dest_no_samples)
 {
-  ui32 oi;               /*  Output absolute sample  */
-  ui32 ii;               /*  Input sample*/
-  ui32 o_abs_s;          /*  Absolute time output sample */
-  ui32 i_start_s;        /* The sample number corresponding to src_start_time*/
-  ui32 delay_no = 0;
-  
   double * out;
-  double delay;          /* Current delay              */
-  double sample_delay;   /* The delay in samples       */
-  int int_delay;         /* Integer delay              */
-  double a1, a2;         /* Interpolation coefficients */
-  double cur_time;
 
   PFUNC
 
@@ -75,47 +246,14 @@ double* delay_line_linear(TSysParams *sys, double *times, double *delays,
   
 
   
-  out = (double*)calloc(dest_no_samples, sizeof(double));
+  out = (double*)calloc(dest_no_samples + 1, sizeof(double));
   if (out == NULL){
      errprintf("%s","Cannot allocate memory for the output line \n");
      goto dll_fail_1;
   }
   
-  
-  delay = delays[0];
-  
-  sample_delay = delay * sys->fs;
-
-  int_delay = (int) floor(sample_delay);
-    
-  a1 = sample_delay - int_delay;
-  a2 = 1.0 - a1;
-
-  o_abs_s = (int)floor(dest_start_time*sys->fs);
-  i_start_s = (int)floor(src_start_time*sys->fs);  
-  dprintf("src_no_samples :%d \n", src_no_samples);
-  for (oi = 0; oi < dest_no_samples; oi ++, o_abs_s++){
-     cur_time = o_abs_s/sys->fs;
-     
-     /*
-      *   Change the delays if necessary
-      */
-     if (delay_no < no_delays - 1){
-        if (cur_time > times[delay_no + 1]){
-  	        dprintf("%s\n","Changing the delay");
-           delay_no ++;
-           delay = delays[delay_no];
-           sample_delay = delay * sys->fs;
-           int_delay = (int) floor(sample_delay);
-           a1 = sample_delay - int_delay;
-           a2 = 1.0 - a1;
-        }
-     }
-     ii = o_abs_s - int_delay - i_start_s;
-     
-     if (ii < src_no_samples && (ii-1) < src_no_samples)
-        out[oi] = a2*src[ii] + a1*src[ii-1];
-  }
+  delay_line_into(sys, NULL, times, delays, no_delays, src, src_no_samples,
+                  src_start_time, dest_start_time, out, dest_no_samples);
   return out;
   
 /* 
@@ -136,21 +274,7 @@ double* delay_line_filter(TSysParams *sys, TFilterBank* fb,
                           double src_start_time, double dest_start_time,
                           ui32 dest_no_samples)
 {
-  
-  ui32 oi;
-  ui32 ii;
- 
-  ui32 o_abs_s;          /*  Absolute time output sample */
-  ui32 i_start_s;        /* The sample number corresponding to src_start_time*/
-  ui32 delay_no = 0;
-  ui32 jj;
   double * out;
-  double delay;          /* Current delay              */
-  double filter_delay;   /* The constant delay, introduced by the first coefficient of the filter*/
-  double sample_delay;   /* The delay in samples       */
-  int int_delay;         /* Integer delay              */
-  double cur_time;
-  int bank_no;
   
   PFUNC
   
@@ -188,56 +312,14 @@ double* delay_line_filter(TSysParams *sys, TFilterBank* fb,
   }
 
 
-  out = (double*)calloc(dest_no_samples, sizeof(double));
+  out = (double*)calloc(dest_no_samples + 1, sizeof(double));
   if (out == NULL){
      errprintf("%s","Cannot allocate memory for the output line \n");
      goto dlf_fail_1;
   }
   
-  filter_delay = (fb->Ntaps/2.0 + 1.0/(2.0*fb->Nf) - 1) / sys->fs;
-  
-  src_start_time -= filter_delay;
- //  dest_start_time += filter_delay; 
-  delay = delays[0];
-  
-  sample_delay = delay * sys->fs;
-
-  int_delay = (int) floor(sample_delay);
-      
-   
-  o_abs_s = (int)floor(dest_start_time*sys->fs);
-  i_start_s = (int)floor(src_start_time*sys->fs);  
-  dprintf("src_no_samples :%d \n", src_no_samples);
-  bank_no = (int)((sample_delay - int_delay)*fb->Nf);
- // bank_no = fb->Nf - bank_no -1;
-  
-  dprintf("sample_delay %f \n", sample_delay);
-  dprintf("int_delay %d \n", int_delay);
-  dprintf("Filter bank #%d \n", bank_no);
-  for (oi = 0; oi < dest_no_samples; oi ++, o_abs_s++){
-     cur_time = o_abs_s/sys->fs;
-     
-     /*
-      *   Change the delays if necessary
-      */
-     if (delay_no < no_delays - 1){
-        if (cur_time > times[delay_no + 1]){
-           delay_no ++;
-           delay = delays[delay_no];
-           sample_delay = delay * sys->fs;
-           int_delay = (int) floor(sample_delay);
-        }
-     }
-    
-     //ii = o_abs_s - int_delay - i_start_s+1;
-     ii = o_abs_s - int_delay - i_start_s + 1;
-     if (ii < src_no_samples && (ii-fb->Ntaps) < src_no_samples){
-        out[oi] = 0;
-        for (jj = 0; jj < fb->Ntaps; jj++){
-           out[oi] += fb->bank[bank_no][fb->Ntaps-jj+1]*src[ii - jj];
-        }
-     }
-  }
+  delay_line_into(sys, fb, times, delays, no_delays, src, src_no_samples,
+                  src_start_time, dest_start_time, out, dest_no_samples);
   return out;
 
   
@@ -246,6 +328,74 @@ dlf_fail_1:
 }
 
 
+/*********************************************************************
+ * FUNCTION : delay_line_task
+ * ABSTRACT : Delay line 'i'. Task of the thread pool.
+ *********************************************************************/
+static void delay_line_task(void *arg, ui32 i)
+{
+  TDelayJob *job = (TDelayJob*)arg;
+
+  delay_line_into(job->sys, job->fb,
+                  job->times + (size_t)i*job->no_delays,
+                  job->delays + (size_t)i*job->no_delays, job->no_delays,
+                  job->src + (size_t)i*job->src_no_samples,
+                  job->src_no_samples, job->src_start_time,
+                  job->dest_start_time,
+                  job->out + (size_t)i*job->dest_no_samples,
+                  job->dest_no_samples);
+}
+
+
+/*********************************************************************
+ * FUNCTION : delay_lines
+ * ABSTRACT : Delay every line of an image, e.g. to compensate for the
+ *            motion between the low resolution images of synthetic
+ *            aperture imaging. Every line has its own delays, and is
+ *            delayed as by delay_line_linear() or delay_line_filter().
+ *            The lines are distributed among the threads in 'pool'.
+ * ARGUMENTS: pool - Threads, or NULL
+ *            fb - Filter bank, or NULL for linear interpolation
+ *            no_lines - Number of lines
+ *            src - 'src_no_samples' samples per line, line after line
+ *            times, delays - 'no_delays' values per line
+ *            out - 'dest_no_samples' samples per line, supplied by the
+ *                  caller
+ *            The rest are as for delay_line_linear().
+ * RETURNS  : 1, or 0 if the filter bank is not set.
+ *********************************************************************/
+ui32 delay_lines(TThreadPool *pool, TSysParams *sys, TFilterBank* fb,
+                 ui32 no_lines, double *src, ui32 src_no_samples,
+                 double *times, double *delays, ui32 no_delays,
+                 double src_start_time, double dest_start_time,
+                 double *out, ui32 dest_no_samples)
+{
+  TDelayJob job;
+
+  PFUNC
+
+  if (fb != NULL && (fb->Nf == 0 || fb->Ntaps == 0)){
+     eprintf("\007 delay_lines:\n");
+     eprintf("Error : there is no filter bank set \n");
+     return 0;
+  }
+
+  job.sys = sys;
+  job.fb = fb;
+  job.times = times;
+  job.delays = delays;
+  job.no_delays = no_delays;
+  job.src = src;
+  job.src_no_samples = src_no_samples;
+  job.src_start_time = src_start_time;
+  job.dest_start_time = dest_start_time;
+  job.out = out;
+  job.dest_no_samples = dest_no_samples;
+  thread_pool_run(pool, no_lines, delay_line_task, &job);
+  return 1;
+}
+
+
 
 
 
@@ -7,12 +7,11 @@
 
 static TMsgFunc msg_func = NULL;      /* Debug function using normal characters */
 
-static char buffer[DBG_BUF_LEN];
-
 
 
 void  msgprint(const char *s, ...)
 {
+    char buffer[DBG_BUF_LEN];            /* On the stack, so that threads can print */
     va_list va;
     va_start(va, s);
     vsnprintf(buffer, DBG_BUF_LEN, s, va);
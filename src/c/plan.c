@@ -0,0 +1,648 @@
+/*********************************************************************
+ * NAME     : plan.c
+ * ABSTRACT : Beamforming plans. The delays and the apodization of all
+ *            lines are flattened into arrays of sample indices and
+ *            weights, which are reused for every frame.
+ *            The plan gives the same result as beamform_image() up to
+ *            rounding, since the apodization is multiplied into the
+ *            interpolation weights, which are stored as floats, and
+ *            the channels of a focal zone are added one after another.
+ *********************************************************************/
+
+#include "../h/plan.h"
+#include "../h/geometry.h"
+#include "../h/error.h"
+#include "../h/simd.h"
+
+#include <math.h>
+#include <stdlib.h>
+#include <string.h>
+
+
+/*********************************************************************
+ * FUNCTION : grow
+ * ABSTRACT : Reallocate an array to 'n' entries of 'size' bytes.
+ * RETURNS  : The array, or NULL if there is not enough memory. The old
+ *            array is then left as it is.
+ *********************************************************************/
+static void* grow(void *p, size_t n, size_t size)
+{
+  if (n > (size_t)-1 / size) return NULL;
+  return realloc(p, n*size);
+}
+
+
+/*********************************************************************
+ * FUNCTION : add_tap
+ * ABSTRACT : Append one pair of samples to the last run of the plan.
+ * RETURNS  : FALSE if there is not enough memory.
+ *********************************************************************/
+static ui32 add_tap(TBeamformPlan *plan, ui32 index, double w1, double w2)
+{
+  size_t max_taps;
+  ui32 *new_index;
+  float *new_w;
+
+  if (plan->no_taps == plan->max_taps){
+     max_taps = (plan->max_taps == 0) ? 1024 : 2*plan->max_taps;
+     if (max_taps < plan->max_taps) return FALSE;
+     new_index = (ui32*)grow(plan->index, max_taps, sizeof(ui32));
+     if (new_index == NULL) return FALSE;
+     plan->index = new_index;
+     new_w = (float*)grow(plan->w1, max_taps, sizeof(float));
+     if (new_w == NULL) return FALSE;
+     plan->w1 = new_w;
+     new_w = (float*)grow(plan->w2, max_taps, sizeof(float));
+     if (new_w == NULL) return FALSE;
+     plan->w2 = new_w;
+     plan->max_taps = max_taps;
+  }
+
+  plan->index[plan->no_taps] = index;
+  plan->w1[plan->no_taps] = (float)w1;
+  plan->w2[plan->no_taps] = (float)w2;
+  plan->no_taps ++;
+  return TRUE;
+}
+
+
+/*********************************************************************
+ * FUNCTION : add_run
+ * ABSTRACT : Start a run of 'n' output samples at 'os'. The following
+ *            taps belong to it. 'gather' as in TPlanRun.
+ * RETURNS  : FALSE if there is not enough memory.
+ *********************************************************************/
+static ui32 add_run(TBeamformPlan *plan, ui32 os, ui32 n, ui32 gather)
+{
+  size_t max_runs;
+  TPlanRun *new_runs;
+
+  if (plan->no_runs == plan->max_runs){
+     max_runs = (plan->max_runs == 0) ? 1024 : 2*plan->max_runs;
+     if (max_runs < plan->max_runs) return FALSE;
+     new_runs = (TPlanRun*)grow(plan->runs, max_runs, sizeof(TPlanRun));
+     if (new_runs == NULL) return FALSE;
+     plan->runs = new_runs;
+     plan->max_runs = max_runs;
+  }
+
+  plan->runs[plan->no_runs].os = os;
+  plan->runs[plan->no_runs].n = n;
+  plan->runs[plan->no_runs].gather = gather;
+  plan->runs[plan->no_runs].tap = plan->no_taps;
+  plan->no_runs ++;
+  return TRUE;
+}
+
+
+/*
+ *  Taps of a block of up to PLAN_BLOCK samples of a dynamically focused
+ *  or pixel line, before they are added to the plan
+ */
+typedef struct{
+   ui32 *index;            /* Tap of sample o of channel ic at          */
+   float *w1;              /* ic*PLAN_BLOCK + o                         */
+   float *w2;
+   ui32 *used;             /* Whether channel ic has any tap            */
+}TPlanBlock;
+
+
+/*********************************************************************
+ * FUNCTION : new_plan_block
+ * RETURNS  : FALSE if there is not enough memory.
+ *********************************************************************/
+static ui32 new_plan_block(TPlanBlock *block, ui32 no_elements)
+{
+  block->index = (ui32*)malloc(PLAN_BLOCK*no_elements*sizeof(ui32));
+  block->w1 = (float*)malloc(PLAN_BLOCK*no_elements*sizeof(float));
+  block->w2 = (float*)malloc(PLAN_BLOCK*no_elements*sizeof(float));
+  block->used = (ui32*)malloc(no_elements*sizeof(ui32));
+  return block->index != NULL && block->w1 != NULL && block->w2 != NULL
+         && block->used != NULL;
+}
+
+
+/*********************************************************************
+ * FUNCTION : del_plan_block
+ *********************************************************************/
+static void del_plan_block(TPlanBlock *block)
+{
+  free(block->index);
+  free(block->w1);
+  free(block->w2);
+  free(block->used);
+}
+
+
+/*********************************************************************
+ * FUNCTION : clear_plan_block
+ * ABSTRACT : Start a new block without taps. A sample of a channel
+ *            without a tap reads the first samples of the channel
+ *            with weight 0.
+ *********************************************************************/
+static void clear_plan_block(TPlanBlock *block, TBeamformPlan *plan,
+        ui32 no_elements)
+{
+  ui32 ic, o;
+
+  for (ic = 0; ic < no_elements; ic ++){
+     block->used[ic] = FALSE;
+     for (o = 0; o < PLAN_BLOCK; o ++){
+        block->index[ic*PLAN_BLOCK + o] = ic*plan->no_samples;
+        block->w1[ic*PLAN_BLOCK + o] = 0;
+        block->w2[ic*PLAN_BLOCK + o] = 0;
+     }
+  }
+}
+
+
+/*********************************************************************
+ * FUNCTION : set_block_tap
+ * ABSTRACT : Set the tap of sample 'o' of channel 'ic' in a block.
+ *********************************************************************/
+static void set_block_tap(TPlanBlock *block, ui32 ic, ui32 o, ui32 index,
+        double w1, double w2)
+{
+  block->used[ic] = TRUE;
+  block->index[ic*PLAN_BLOCK + o] = index;
+  block->w1[ic*PLAN_BLOCK + o] = (float)w1;
+  block->w2[ic*PLAN_BLOCK + o] = (float)w2;
+}
+
+
+/*********************************************************************
+ * FUNCTION : add_block
+ * ABSTRACT : Add a block of 'n' samples from 'os' on as a run, with
+ *            the taps of the channels that have any.
+ * RETURNS  : FALSE if there is not enough memory.
+ *********************************************************************/
+static ui32 add_block(TBeamformPlan *plan, TPlanBlock *block, ui32 os,
+        ui32 n, ui32 no_elements)
+{
+  ui32 ic, o, k;
+
+  if (!add_run(plan, os, n, TRUE)) return FALSE;
+  for (ic = 0; ic < no_elements; ic ++){
+     if (!block->used[ic]) continue;
+     for (o = 0, k = ic*PLAN_BLOCK; o < n; o ++, k ++)
+        if (!add_tap(plan, block->index[k], block->w1[k], block->w2[k]))
+           return FALSE;
+  }
+  return TRUE;
+}
+
+
+/*********************************************************************
+ * FUNCTION : plan_line_times
+ * ABSTRACT : Add the runs of a line with focal zones. Mirrors
+ *            beamform_line_times() and beamform_apo_line_times().
+ *            'atl' is NULL if the line is not apodized. A run ends
+ *            with a focal or apodization zone, or where a channel
+ *            enters or leaves the data.
+ * RETURNS  : FALSE if there is not enough memory.
+ *********************************************************************/
+static ui32 plan_line_times(TBeamformPlan *plan, TFocusTimeLine *ftl,
+        TApoTimeLine *atl, TSysParams *sys)
+{
+  ui32 no_samples = plan->no_samples;
+  ui32 limit = plan->no_samples - 1;
+  ui32 os;                /*  Index of output sample       */
+  ui32 o_abs_s;           /*  Output absolut index         */
+  ui32 is1;               /*  Index of input sample1       */
+  si16 *d;                /*  Pointer to the delays        */
+  float *a;               /*  Interpolation coefficients   */
+  float *apo = NULL;      /*  Pointer to the apodization   */
+  double A;
+  double w;               /*  Apodization of one channel   */
+  ui32 id, ind;           /*  Index of delay, next delay   */
+  ui32 ia = 0, ina = 1;   /*  Index of apodization, next   */
+  ui32 ic;                /*  Index of channel             */
+  ui32 new_run;           /*  Whether a run starts at os   */
+
+  o_abs_s = (ui32)floor(plan->time * sys->fs);
+  ind = find_delay(ftl, o_abs_s);
+  id = ind - 1;
+  d = ftl->delay[id].d;
+  a = ftl->delay[id].a;
+
+  if (atl != NULL){
+     ina = find_apodization(atl, o_abs_s);
+     ia = ina - 1;
+     apo = atl->a[ia].a;
+     no_samples--;          /* The last sample of an apodized line is 0 */
+  }
+
+  for (os = 0; os < no_samples && os < plan->no_out_samples;
+                                               o_abs_s++, os ++){
+     new_run = (os == 0);
+     if (o_abs_s > ftl->delay[ind].time){
+        ind ++; id ++;
+        d = ftl->delay[id].d;
+        a = ftl->delay[id].a;
+        new_run = TRUE;
+     }
+     if (atl != NULL && o_abs_s > atl->a[ina].time){
+        ina ++; ia ++;
+        apo = atl->a[ia].a;
+        new_run = TRUE;
+     }
+     for (ic = 0; ic < ftl->xdc->no_elements && !new_run; ic ++){
+        is1 = os - d[ic] - 1;
+        new_run = (is1 == 0 || is1 == limit);
+     }
+
+     if (!new_run){
+        plan->runs[plan->no_runs - 1].n ++;
+        continue;
+     }
+     if (!add_run(plan, os, 1, FALSE)) return FALSE;
+     for (ic = 0; ic < ftl->xdc->no_elements; ic ++){
+        is1 = os - d[ic];
+        if ((is1-1) < limit){
+           A = a[ic];
+           w = (apo == NULL) ? 1.0 : apo[ic];
+           if (w == 0.0) continue;
+           if (!add_tap(plan, ic*plan->no_samples + is1 - 1, A*w, (1-A)*w))
+              return FALSE;
+        }
+     }
+  }
+  return TRUE;
+}
+
+
+/*********************************************************************
+ * FUNCTION : plan_line_dynamic
+ * ABSTRACT : Add the runs of a dynamically focused line, using the
+ *            delays from dynamic_delays(). 'tx' is NULL unless the
+ *            line is beamformed for synthetic transmit aperture.
+ * RETURNS  : FALSE if there is not enough memory.
+ *********************************************************************/
+static ui32 plan_line_dynamic(TBeamformPlan *plan, TPlanBlock *block,
+        TFocusTimeLine *ftl, TApoTimeLine *atl, TSysParams *sys,
+        TTransmit *tx)
+{
+  ui32 *index;            /* Delays of the output sample   */
+  double *frac;
+  ui32 no_elements = ftl->xdc->no_elements;
+  ui32 no_samples = plan->no_samples - 1;
+  ui32 o_abs_s;           /*  Output absolut index         */
+  ui32 os;                /*  First sample of the block    */
+  ui32 n;                 /*  Samples in the block         */
+  ui32 o;                 /*  Index in the block           */
+  ui32 end;               /*  End of the line              */
+  ui32 is1;               /*  Index of input sample1       */
+  float *apo = NULL;      /*  Pointer to the apodization   */
+  double A;
+  double w;
+  ui32 ia = 0, ina = 1;   /*  Index of apodization, next   */
+  ui32 ic;                /*  Index of channel             */
+  ui32 ok = TRUE;
+
+  if (dynamic_table(ftl, sys, plan->time, plan->no_samples) == NULL)
+     return FALSE;
+  index = (ui32*)malloc((no_elements + 1)*sizeof(ui32));
+  frac = (double*)malloc((no_elements + 1)*sizeof(double));
+  if (index == NULL || frac == NULL){
+     free(index);
+     free(frac);
+     return FALSE;
+  }
+
+  o_abs_s = (ui32)floor(plan->time * sys->fs);
+  if (atl != NULL){
+     ina = find_apodization(atl, o_abs_s);
+     ia = ina - 1;
+     apo = atl->a[ia].a;
+  }
+
+  end = (no_samples < plan->no_out_samples) ? no_samples
+                                            : plan->no_out_samples;
+  for (os = 0; ok && os < end; os += n){
+     n = (end - os < PLAN_BLOCK) ? end - os : PLAN_BLOCK;
+     clear_plan_block(block, plan, no_elements);
+     for (o = 0; o < n; o_abs_s++, o ++){
+        if (atl != NULL && o_abs_s > atl->a[ina].time){
+           ina ++; ia ++;
+           apo = atl->a[ia].a;
+        }
+
+        dynamic_delays(ftl, os + o, tx, index, frac);
+        for (ic = 0; ic < no_elements; ic ++){
+           is1 = index[ic];
+           if (is1 < no_samples-1){
+              A = frac[ic];
+              w = (apo == NULL) ? 1.0 : apo[ic];
+              if (w == 0.0) continue;
+              set_block_tap(block, ic, o, ic*plan->no_samples + is1,
+                            (1-A)*w, A*w);
+           }
+        }
+     }
+     ok = add_block(plan, block, os, n, no_elements);
+  }
+  free(index);
+  free(frac);
+  return ok;
+}
+
+
+/*********************************************************************
+ * FUNCTION : plan_line_pixels
+ * ABSTRACT : Add the runs of a line with pixel based focusing. Mirrors
+ *            beamform_line_pixels() and beamform_apo_line_pixels().
+ * RETURNS  : FALSE if there is not enough memory.
+ *********************************************************************/
+static ui32 plan_line_pixels(TBeamformPlan *plan, TPlanBlock *block,
+        TFocusTimeLine *ftl, TApoTimeLine *atl, TSysParams *sys,
+        ui32 element_no)
+{
+  TTransducer *xdc = ftl->xdc;
+  ui32 no_samples = plan->no_samples;
+  double start_index = plan->time * sys->fs;
+  double xmt_index = 0;
+  double sample_index;
+  double A;
+  double w = 1.0;
+  TPoint3D *p;            /*  Focal point                  */
+  ui32 is1;               /*  Index of input sample1       */
+  ui32 ia;                /*  Index of apodization         */
+  ui32 os;                /*  First sample of the block    */
+  ui32 n;                 /*  Samples in the block         */
+  ui32 o;                 /*  Index in the block           */
+  ui32 end;               /*  End of the line              */
+  ui32 ic;                /*  Index of channel             */
+  int flag = element_no >= xdc->no_elements;
+
+  end = (ftl->no_times < plan->no_out_samples) ? ftl->no_times
+                                               : plan->no_out_samples;
+  for (os = 0; os < end; os += n){
+     n = (end - os < PLAN_BLOCK) ? end - os : PLAN_BLOCK;
+     clear_plan_block(block, plan, xdc->no_elements);
+     for (o = 0; o < n; o ++){
+        p = ftl->pixels + os + o;
+        if (!flag){
+           xmt_index = distance(xdc->c+element_no, p)*sys->fs;
+           xmt_index = (xmt_index / sys->c);
+        }
+
+        for (ic = 0; ic < xdc->no_elements; ic ++){
+           sample_index = distance(xdc->c+ic, p)*sys->fs;
+           if (flag)
+              sample_index = 2*sample_index / sys->c - start_index;
+           else
+              sample_index = (sample_index / sys->c) - start_index;
+
+           if (atl != NULL){
+              ia = find_apodization(atl, sample_index) - 1;
+              w = atl->a[ia].a[ic];
+           }
+           sample_index += xmt_index;
+           is1 = (ui32)floor(sample_index);
+           A = sample_index - is1;
+
+           if (atl != NULL){
+              if (is1 + 1 < no_samples && is1 < no_samples && w != 0.0)
+                 set_block_tap(block, ic, o, ic*no_samples + is1,
+                               (1-A)*w, A*w);
+           }else{
+              if (is1 - 1 < no_samples && is1 < no_samples)
+                 set_block_tap(block, ic, o, ic*no_samples + is1 - 1,
+                               A, 1-A);
+           }
+        }
+     }
+     if (!add_block(plan, block, os, n, xdc->no_elements)) return FALSE;
+  }
+  return TRUE;
+}
+
+
+/*********************************************************************
+ * FUNCTION : new_beamform_plan
+ * ABSTRACT : Compile the current focus and apodization settings into
+ *            a plan. The plan does not refer to 'flc' and 'alc', so
+ *            they can be changed afterwards without affecting it.
+ * ARGUMENTS: flc, alc, sys - The settings to compile
+ *            time - Time of the first input sample
+ *            no_samples - Number of input samples per element
+ *            no_elements - Number of elements (rows) in the input data
+ *            no_out_samples - Number of samples in every output line
+ *            element_no, xmt - Transmit element or position as for
+ *                     beamform_image()
+ * RETURNS  : Pointer to the plan or NULL in case of wrong settings, or
+ *            if there is not enough memory.
+ *********************************************************************/
+TBeamformPlan* new_beamform_plan(TFocusLineCollection *flc,
+        TApoLineCollection *alc, TSysParams *sys, double time,
+        ui32 no_samples, ui32 no_elements, ui32 no_out_samples,
+        ui32 element_no, TPoint3D *xmt)
+{
+  TBeamformPlan *plan;
+  TFocusTimeLine *ftl;
+  TApoTimeLine *atl;
+  ui32 max_no_apo_times = 0;
+  ui32 pixel_element;
+  TTransmit point;        /* The transmit element or position           */
+  TTransmit *tx = NULL;
+  TPlanBlock block;       /* Taps of dynamically focused and pixel lines */
+  ui32 ok;
+  ui32 i;
+
+  PFUNC
+  if (flc->no_focus_time_lines != alc->no_apo_time_lines
+      || flc->no_focus_time_lines == 0){
+     eprintf("%s", "Error : the focus and apodization lines are not set\n");
+     return NULL;
+  }
+  if ((double)no_samples*(no_elements + 1) >= 2147483648.0){
+     eprintf("%s", "Error : the data is too large for a plan, it must have "
+             "less than 2^31 samples\n");
+     return NULL;
+  }
+
+  for (i = 0; i < flc->no_focus_time_lines; i++){
+     if (flc->ftl[i].xdc == NULL
+         || flc->ftl[i].xdc->no_elements > no_elements){
+        eprintf("Error : line %d needs more elements than the data has\n", i);
+        return NULL;
+     }
+     if (alc->atl[i].no_times > max_no_apo_times)
+        max_no_apo_times = alc->atl[i].no_times;
+  }
+
+  if (xmt != NULL || element_no < 64000){
+     point.type = BFT_TX_POINT;
+     point.angle = 0.0;
+     point.point = (xmt != NULL) ? *xmt : flc->ftl[0].xdc->c[element_no];
+     tx = &point;
+  }
+  pixel_element = (flc->no_focus_time_lines == 1) ? element_no : (ui32)-1;
+
+  plan = (TBeamformPlan*)calloc(1, sizeof(TBeamformPlan));
+  if (plan == NULL){
+     eprintf("%s", "Error : not enough memory for the plan\n");
+     return NULL;
+  }
+  plan->no_lines = flc->no_focus_time_lines;
+  plan->no_out_samples = no_out_samples;
+  plan->no_samples = no_samples;
+  plan->no_elements = no_elements;
+  plan->time = time;
+  ok = new_plan_block(&block, no_elements);
+  plan->line = (size_t*)malloc((plan->no_lines + 1)*sizeof(size_t));
+  if (plan->line == NULL || !ok){
+     eprintf("%s", "Error : not enough memory for the plan\n");
+     del_plan_block(&block);
+     del_beamform_plan(plan);
+     return NULL;
+  }
+
+  /*
+   *   Same choice of routine as in beamform_image(). Lines without
+   *   apodization in an image with apodization are not apodized.
+   */
+  for (i = 0; i < plan->no_lines; i++){
+     ftl = flc->ftl + i;
+     atl = (max_no_apo_times > 0 && alc->atl[i].no_times > 0)
+                                                   ? alc->atl + i : NULL;
+     plan->line[i] = plan->no_runs;
+
+     if (ftl->dynamic == TRUE){
+        /* The apodizing routines skip lines without apodization */
+        ok = (max_no_apo_times > 0 && atl == NULL)
+             || plan_line_dynamic(plan, &block, ftl, atl, sys, tx);
+     }else if (ftl->pixel == TRUE){
+        ok = plan_line_pixels(plan, &block, ftl, atl, sys, pixel_element);
+     }else{
+        ok = plan_line_times(plan, ftl, atl, sys);
+     }
+     if (!ok){
+        eprintf("Error : not enough memory for the plan of line %d\n", i);
+        del_plan_block(&block);
+        del_beamform_plan(plan);
+        return NULL;
+     }
+  }
+  plan->line[plan->no_lines] = plan->no_runs;
+  del_plan_block(&block);
+
+  return plan;
+}
+
+
+/*********************************************************************
+ * FUNCTION : del_beamform_plan
+ *********************************************************************/
+void del_beamform_plan(TBeamformPlan *plan)
+{
+  PFUNC
+  if (plan == NULL) return;
+  free(plan->line);
+  free(plan->runs);
+  free(plan->index);
+  free(plan->w1);
+  free(plan->w2);
+  free(plan);
+}
+
+
+/*
+ *  Arguments of execute_line()
+ */
+typedef struct{
+   TBeamformPlan *plan;
+   double *data;
+   double *out;
+   TSimdRunRow run_row;   /* Vectorized runs, or NULL                   */
+   TSimdGatherRow gather_row;
+}TPlanJob;
+
+
+/*********************************************************************
+ * FUNCTION : run_row
+ * ABSTRACT : Scalar version of TSimdRunRow (simd.h)
+ *********************************************************************/
+static void run_row(double *out, const double *src, double w1, double w2,
+                    ui32 n)
+{
+  ui32 o;
+
+  for (o = 0; o < n; o ++)
+     out[o] += w1*src[o] + w2*src[o + 1];
+}
+
+
+/*********************************************************************
+ * FUNCTION : gather_row
+ * ABSTRACT : Scalar version of TSimdGatherRow (simd.h)
+ *********************************************************************/
+static void gather_row(double *out, const double *data, const ui32 *index,
+                       const float *w1, const float *w2, ui32 n)
+{
+  ui32 o;
+
+  for (o = 0; o < n; o ++)
+     out[o] += w1[o]*data[index[o]] + w2[o]*data[index[o] + 1];
+}
+
+
+/*********************************************************************
+ * FUNCTION : execute_line
+ * ABSTRACT : Calculate line number 'line' of a plan. The taps are added
+ *            one after another, to blocks of PLAN_BLOCK samples.
+ *********************************************************************/
+static void execute_line(void *arg, ui32 line)
+{
+  TPlanJob *job = (TPlanJob*)arg;
+  TBeamformPlan *plan = job->plan;
+  TSimdRunRow add_run = (job->run_row != NULL) ? job->run_row : run_row;
+  TSimdGatherRow add_gather = (job->gather_row != NULL) ? job->gather_row
+                                                        : gather_row;
+  double *out = job->out + (size_t)line*plan->no_out_samples;
+  double *data = job->data;
+  TPlanRun *run;
+  size_t r, k, end;
+  ui32 o, n;
+
+  memset(out, 0, plan->no_out_samples*sizeof(double));
+  for (r = plan->line[line]; r < plan->line[line + 1]; r++){
+     run = plan->runs + r;
+     end = (r + 1 < plan->no_runs) ? run[1].tap : plan->no_taps;
+     if (run->gather){
+        for (k = run->tap; k < end; k += run->n)
+           add_gather(out + run->os, data, plan->index + k, plan->w1 + k,
+                      plan->w2 + k, run->n);
+        continue;
+     }
+     for (o = 0; o < run->n; o += n){
+        n = (run->n - o < PLAN_BLOCK) ? run->n - o : PLAN_BLOCK;
+        for (k = run->tap; k < end; k++)
+           add_run(out + run->os + o, data + plan->index[k] + o,
+                   plan->w1[k], plan->w2[k], n);
+     }
+  }
+}
+
+
+/*********************************************************************
+ * FUNCTION : execute_beamform_plan
+ * ABSTRACT : Beamform one frame with a plan.
+ * ARGUMENTS: pool - Thread pool, which beamforms the lines, or NULL
+ *            plan - The plan
+ *            data - Input data. One row of 'no_samples' samples per
+ *                   element.
+ *            out - Output. One row of 'no_out_samples' per line.
+ *********************************************************************/
+void execute_beamform_plan(TThreadPool *pool, TBeamformPlan *plan,
+        double *data, double *out)
+{
+  TPlanJob job;
+
+  job.plan = plan;
+  job.data = data;
+  job.out = out;
+  job.run_row = simd_kernels()->run_row;
+  job.gather_row = simd_kernels()->gather_row;
+  thread_pool_run(pool, plan->no_lines, execute_line, &job);
+}
@@ -0,0 +1,331 @@
+/*********************************************************************
+ * NAME     : scan.c
+ * ABSTRACT : Scan conversion of beamformed lines to a Cartesian image.
+ *            The interpolation table is calculated once for the
+ *            geometry of the lines and the pixels, and every frame is
+ *            then a gather of four samples per pixel. The columns of
+ *            the image are distributed among the threads of the pool.
+ *********************************************************************/
+
+#include "../h/scan.h"
+#include "../h/beamform.h"
+#include "../h/envelope.h"
+#include "../h/error.h"
+
+#include <math.h>
+#include <stdlib.h>
+#include <string.h>
+
+
+#define NO_OFFSET  ((ui32)-1)
+
+
+/*
+ *  A frame of lines and the image it is converted to
+ */
+typedef struct{
+   TScanTable *t;
+   void *lines;
+   ui32 sample_type;
+   void *out;
+}TScanJob;
+
+
+/*********************************************************************
+ * FUNCTION  : line_geometry()
+ * ABSTRACT  : Find the origin and the unit direction of a line. A line
+ *             focused with focal points points to its last focal point,
+ *             other lines are steered by dir_xz and dir_yz as in the
+ *             dynamic focusing.
+ *********************************************************************/
+static void line_geometry(TFocusTimeLine *ftl, TPoint3D *center,
+                          TPoint3D *dir)
+{
+  TPoint3D *f;
+  double len;
+
+  *center = ftl->center;
+  if (!ftl->dynamic && ftl->focus != NULL && ftl->no_times > 0){
+     f = ftl->focus + ftl->no_times - 1;
+     dir->x = f->x - center->x;
+     dir->y = f->y - center->y;
+     dir->z = f->z - center->z;
+  }else{
+     dir->x = tan(ftl->dir_xz);
+     dir->y = tan(ftl->dir_yz);
+     dir->z = 1;
+  }
+
+  len = sqrt(dir->x*dir->x + dir->y*dir->y + dir->z*dir->z);
+  if (len > 0){
+     dir->x /= len;
+     dir->y /= len;
+     dir->z /= len;
+  }
+}
+
+
+/*********************************************************************
+ * FUNCTION  : side()
+ * ABSTRACT  : Signed distance in the xz-plane from line 'i' to the
+ *             pixel (x, z). Its sign tells on which side of the line
+ *             the pixel is.
+ *********************************************************************/
+static double side(TScanTable *t, ui32 i, double x, double z)
+{
+  TPoint3D *c = t->center + i;
+  TPoint3D *u = t->dir + i;
+
+  return u->z*(x - c->x) - u->x*(z - c->z);
+}
+
+
+/*********************************************************************
+ * FUNCTION  : line_sample()
+ * ABSTRACT  : Fractional index of the sample of line 'i' at the
+ *             projection of the pixel (x, z) on the line. Sample 'n' is
+ *             at the distance (floor(time*fs) + n)*c/(2*fs) from the
+ *             origin, as in the dynamic focusing.
+ *********************************************************************/
+static double line_sample(TScanTable *t, ui32 i, double x, double z)
+{
+  TPoint3D *c = t->center + i;
+  TPoint3D *u = t->dir + i;
+  double uxz2 = u->x*u->x + u->z*u->z;  /* Projection of u on the plane */
+  double r;
+
+  if (!(uxz2 > 0)) return -1;
+  r = (u->x*(x - c->x) + u->z*(z - c->z)) / uxz2;
+  return r * 2*t->fs/t->c - floor(t->time*t->fs);
+}
+
+
+/*********************************************************************
+ * FUNCTION  : table_column()
+ * ABSTRACT  : Calculate the interpolation table of column 'ix'. The
+ *             signed distance of a pixel changes monotonically from the
+ *             first to the last line, so the two lines around it are
+ *             found by bisection. Task of the thread pool.
+ *********************************************************************/
+static void table_column(void *arg, ui32 ix)
+{
+  TScanTable *t = (TScanTable*)arg;
+  ui32 last = t->no_lines - 1;
+  double x = t->x[ix];
+  double z;
+  double d0, d1, dm;   /* Signed distances to the lines                */
+  double s0, s1;       /* Fractional sample indices on the two lines   */
+  double w;            /* Weight of the second line                    */
+  ui32 lo, hi, mid;
+  ui32 *offset;
+  double *wt;
+  ui32 iz;
+
+  for (iz = 0; iz < t->nz; iz ++){
+     z = t->z[iz];
+     offset = t->offset + 2*((size_t)ix*t->nz + iz);
+     wt = t->w + 4*((size_t)ix*t->nz + iz);
+     offset[0] = offset[1] = NO_OFFSET;
+
+     d0 = side(t, 0, x, z);
+     d1 = side(t, last, x, z);
+     if ((d0 > 0 && d1 > 0) || (d0 < 0 && d1 < 0) || (d0 == 0 && d1 == 0))
+        continue;
+
+     lo = 0;
+     hi = last;
+     if (d0 == 0){     /* On the first line */
+        hi = 1;
+        d1 = side(t, hi, x, z);
+     }
+     while (hi - lo > 1){
+        mid = (lo + hi)/2;
+        dm = side(t, mid, x, z);
+        if ((dm > 0) == (d0 > 0) && dm != 0){
+           lo = mid;
+           d0 = dm;
+        }else{
+           hi = mid;
+           d1 = dm;
+        }
+     }
+
+     s0 = line_sample(t, lo, x, z);
+     s1 = line_sample(t, hi, x, z);
+     if (!(s0 >= 0 && s1 >= 0 && s0 < t->no_samples - 1
+           && s1 < t->no_samples - 1))
+        continue;
+
+     w = d0/(d0 - d1);
+     offset[0] = lo*t->no_samples + (ui32)s0;
+     offset[1] = hi*t->no_samples + (ui32)s1;
+     wt[0] = (1 - w)*(1 - (s0 - floor(s0)));
+     wt[1] = (1 - w)*(s0 - floor(s0));
+     wt[2] = w*(1 - (s1 - floor(s1)));
+     wt[3] = w*(s1 - floor(s1));
+  }
+}
+
+
+/*********************************************************************
+ * FUNCTION  : del_scan_table()
+ * ABSTRACT  : Release the memory of the table
+ *********************************************************************/
+void del_scan_table(TScanTable *t)
+{
+  free(t->x);
+  free(t->z);
+  free(t->center);
+  free(t->dir);
+  free(t->offset);
+  free(t->w);
+  memset(t, 0, sizeof(TScanTable));
+}
+
+
+/*********************************************************************
+ * FUNCTION  : scan_table()
+ * ABSTRACT  : Get the interpolation table for the current geometry of
+ *             the lines. The table in 't' is recalculated only if the
+ *             lines, the system parameters, the time or the pixels
+ *             differ from the ones it was calculated for.
+ * ARGUMENTS : flc - The lines. Lines with pixel based focusing can not
+ *                   be scan converted.
+ *             time - Time of the first sample of the lines
+ *             no_samples - Number of samples per line
+ *             x, nx, z, nz - The pixels, see TScanTable
+ * RETURNS   : 't', or NULL in case of wrong settings
+ *********************************************************************/
+TScanTable* scan_table(TThreadPool *pool, TScanTable *t,
+        TFocusLineCollection *flc, TSysParams *sys, double time,
+        ui32 no_samples, double *x, ui32 nx, double *z, ui32 nz)
+{
+  ui32 no_lines = flc->no_focus_time_lines;
+  size_t no_pixels = (size_t)nx*nz;
+  TPoint3D center, dir;
+  ui32 same;
+  ui32 i;
+
+  if (no_lines < 2 || no_samples < 2){
+     eprintf("\007 scan_table:\n");
+     eprintf("Error : scan conversion needs 2 lines with 2 samples\n");
+     return NULL;
+  }
+  for (i = 0; i < no_lines; i ++){
+     if (flc->ftl[i].pixel == TRUE){
+        eprintf("\007 scan_table:\n");
+        eprintf("Error : lines with pixel based focusing are not scanned\n");
+        return NULL;
+     }
+  }
+
+  same = t->valid && t->no_lines == no_lines && t->no_samples == no_samples
+         && t->c == sys->c && t->fs == sys->fs && t->time == time
+         && t->nx == nx && t->nz == nz
+         && !memcmp(t->x, x, nx*sizeof(double))
+         && !memcmp(t->z, z, nz*sizeof(double));
+  for (i = 0; same && i < no_lines; i ++){
+     line_geometry(flc->ftl + i, &center, &dir);
+     same = !memcmp(&center, t->center + i, sizeof(TPoint3D))
+            && !memcmp(&dir, t->dir + i, sizeof(TPoint3D));
+  }
+  if (same) return t;
+
+  PFUNC
+  del_scan_table(t);
+  t->x = (double*)malloc((nx + 1)*sizeof(double));
+  t->z = (double*)malloc((nz + 1)*sizeof(double));
+  t->center = (TPoint3D*)malloc(no_lines*sizeof(TPoint3D));
+  t->dir = (TPoint3D*)malloc(no_lines*sizeof(TPoint3D));
+  t->offset = (ui32*)malloc((2*no_pixels + 1)*sizeof(ui32));
+  t->w = (double*)malloc((4*no_pixels + 1)*sizeof(double));
+  assert(t->x && t->z && t->center && t->dir && t->offset && t->w);
+
+  memcpy(t->x, x, nx*sizeof(double));
+  memcpy(t->z, z, nz*sizeof(double));
+  for (i = 0; i < no_lines; i ++)
+     line_geometry(flc->ftl + i, t->center + i, t->dir + i);
+  t->no_lines = no_lines;
+  t->no_samples = no_samples;
+  t->c = sys->c;
+  t->fs = sys->fs;
+  t->time = time;
+  t->nx = nx;
+  t->nz = nz;
+
+  thread_pool_run(pool, nx, table_column, t);
+  t->valid = TRUE;
+  return t;
+}
+
+
+/*
+ *  Gather the pixels of column 'ix' from lines of type T
+ */
+#define GATHER(T, ROUND)                                                  \
+  {                                                                       \
+     T *in = (T*)job->lines;                                              \
+     T *out = (T*)job->out + (size_t)ix*t->nz;                            \
+     double v;                                                            \
+     for (iz = 0; iz < t->nz; iz ++, offset += 2, w += 4){                \
+        if (offset[0] == NO_OFFSET){                                      \
+           out[iz] = 0;                                                   \
+           continue;                                                      \
+        }                                                                 \
+        v = w[0]*in[offset[0]] + w[1]*in[offset[0] + 1]                   \
+          + w[2]*in[offset[1]] + w[3]*in[offset[1] + 1];                  \
+        out[iz] = (T)(v + ROUND);                                         \
+     }                                                                    \
+  }
+
+
+/*********************************************************************
+ * FUNCTION  : scan_column()
+ * ABSTRACT  : Interpolate the pixels of column 'ix'. Task of the
+ *             thread pool.
+ *********************************************************************/
+static void scan_column(void *arg, ui32 ix)
+{
+  TScanJob *job = (TScanJob*)arg;
+  TScanTable *t = job->t;
+  ui32 *offset = t->offset + 2*(size_t)ix*t->nz;
+  double *w = t->w + 4*(size_t)ix*t->nz;
+  ui32 iz;
+
+  switch (job->sample_type){
+     case BFT_FLOAT64: GATHER(double, 0); break;
+     case BFT_FLOAT32: GATHER(float, 0); break;
+     case BFT_UINT8:   GATHER(unsigned char, 0.5); break;
+  }
+}
+
+
+/*********************************************************************
+ * FUNCTION  : scan_convert()
+ * ABSTRACT  : Convert one frame of lines to a Cartesian image.
+ * ARGUMENTS : t - Table returned by scan_table()
+ *             lines - t->no_lines lines of t->no_samples samples
+ *             sample_type - BFT_FLOAT64, BFT_FLOAT32 or BFT_UINT8,
+ *                   e.g. a B-mode image from envelope_lines()
+ *             out - t->nx * t->nz pixels of the same type
+ * RETURNS   : 'out', or NULL for an unknown type of the samples
+ *********************************************************************/
+void* scan_convert(TThreadPool *pool, TScanTable *t, void *lines,
+        ui32 sample_type, void *out)
+{
+  TScanJob job;
+
+  if (sample_type != BFT_FLOAT64 && sample_type != BFT_FLOAT32
+      && sample_type != BFT_UINT8){
+     eprintf("\007 scan_convert:\n");
+     eprintf("Error : unsupported type of samples\n");
+     return NULL;
+  }
+
+  job.t = t;
+  job.lines = lines;
+  job.sample_type = sample_type;
+  job.out = out;
+  thread_pool_run(pool, t->nx, scan_column, &job);
+  return out;
+}
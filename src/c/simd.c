@@ -0,0 +1,176 @@
+/*********************************************************************
+ * NAME     : simd.c
+ * ABSTRACT : Selection of the vectorized inner loops at run time.
+ *            The instruction sets supported by the CPU are detected
+ *            once, in bft_init() or at the first use of the table, and
+ *            the best compiled table is used by all beamforming kernels.
+ *********************************************************************/
+
+#include "../h/simd.h"
+
+#include <stddef.h>
+
+#if defined(_MSC_VER) && (defined(_M_X64) || defined(_M_IX86))
+  #include <intrin.h>
+  #include <immintrin.h>
+#endif
+
+
+/*********************************************************************
+ * FUNCTION  : reduce_sums()
+ * ABSTRACT  : Add the SIMD_LANES partial sums in the order given in
+ *             simd.h.
+ *********************************************************************/
+static double reduce_sums(double *p)
+{
+  ui32 n, k;
+
+  for (n = SIMD_LANES/2; n > 0; n /= 2)
+     for (k = 0; k < n; k ++)
+        p[k] += p[k + n];
+  return p[0];
+}
+
+
+/*
+ *   The scalar sums over the channels, for every type of samples
+ */
+#define SAMPLE_T         double
+#define ROW(name)        name##_none
+#include "simd_sums_none.inc"
+#undef SAMPLE_T
+#undef ROW
+
+#define SAMPLE_T         float
+#define ROW(name)        name##_f32_none
+#include "simd_sums_none.inc"
+#undef SAMPLE_T
+#undef ROW
+
+#define SAMPLE_T         si16
+#define ROW(name)        name##_i16_none
+#include "simd_sums_none.inc"
+#undef SAMPLE_T
+#undef ROW
+
+
+/*
+ *  Without vector instructions, only the sums over the channels have a
+ *  row function, so that they are added in the same order at all levels
+ */
+static const TSimdKernels simd_none = {BFT_SIMD_NONE, "none",
+                                       times_row_none, dynamic_row_none,
+                                       times_row_f32_none,
+                                       dynamic_row_f32_none,
+                                       times_row_i16_none,
+                                       dynamic_row_i16_none,
+                                       NULL, NULL, NULL, NULL, NULL, NULL};
+
+static const TSimdKernels *active = NULL;
+
+
+/*********************************************************************
+ * FUNCTION : simd_detect()
+ * ABSTRACT : The best instruction set supported by the CPU and the
+ *            operating system.
+ *********************************************************************/
+ui32 simd_detect(void)
+{
+#if (defined(__GNUC__) || defined(__clang__)) && (defined(__x86_64__) || defined(__i386__))
+  __builtin_cpu_init();
+  if (__builtin_cpu_supports("avx512f") && __builtin_cpu_supports("avx2"))
+     return BFT_SIMD_AVX512;
+  if (__builtin_cpu_supports("avx2"))
+     return BFT_SIMD_AVX2;
+  if (__builtin_cpu_supports("sse2"))
+     return BFT_SIMD_SSE2;
+  return BFT_SIMD_NONE;
+#elif defined(_MSC_VER) && (defined(_M_X64) || defined(_M_IX86))
+  int r[4];
+  unsigned __int64 xcr0 = 0;
+  ui32 level = BFT_SIMD_NONE;
+
+  __cpuid(r, 1);
+  if (r[3] & (1 << 26)) level = BFT_SIMD_SSE2;
+  if (!(r[2] & (1 << 27)))          /* OSXSAVE */
+     return level;
+  xcr0 = _xgetbv(0);
+
+  __cpuidex(r, 7, 0);
+  if ((xcr0 & 0x06) == 0x06 && (r[1] & (1 << 5)))
+     level = BFT_SIMD_AVX2;
+  if ((xcr0 & 0xe6) == 0xe6 && (r[1] & (1 << 16)) && level == BFT_SIMD_AVX2)
+     level = BFT_SIMD_AVX512;
+  return level;
+#else
+  return BFT_SIMD_NONE;
+#endif
+}
+
+
+/*********************************************************************
+ * FUNCTION : simd_select()
+ * ABSTRACT : Use the best table up to 'level', which is supported by
+ *            the CPU and compiled in. Level BFT_SIMD_NONE selects the
+ *            scalar code.
+ * RETURNS  : The selected level.
+ *********************************************************************/
+ui32 simd_select(ui32 level)
+{
+  const TSimdKernels *tables[] = {&simd_avx512, &simd_avx2, &simd_sse2};
+  const TSimdKernels *selected = &simd_none;
+  ui32 detected = simd_detect();
+  ui32 i;
+
+  if (level > detected) level = detected;
+
+  for (i = 0; i < sizeof(tables)/sizeof(tables[0]); i ++)
+     if (tables[i]->level <= level && tables[i]->times_row != NULL){
+        selected = tables[i];
+        break;
+     }
+  active = selected;
+  return active->level;
+}
+
+
+/*********************************************************************
+ * FUNCTION : simd_kernels()
+ * ABSTRACT : The selected table. Its functions are NULL if the scalar
+ *            code must be used. If no level has been selected yet, the
+ *            best one is.
+ *********************************************************************/
+const TSimdKernels* simd_kernels(void)
+{
+  if (active == NULL)
+     simd_select(simd_detect());
+  return active;
+}
+
+
+/*********************************************************************
+ * FUNCTION  : rf_stride()
+ * ABSTRACT  : Distance in samples between the data of two consecutive
+ *             channels, if all channels are in one block of memory,
+ *             one after another.
+ * RETURNS   : The stride, or 0 if the channels are not equidistant,
+ *             or the block is too large for 32 bit offsets.
+ *********************************************************************/
+ui32 rf_stride(void **rf_data, ui32 no_channels, ui32 sample_size)
+{
+  ptrdiff_t bytes;
+  ptrdiff_t stride;
+  ui32 ic;
+
+  if (no_channels < 2) return 0;
+
+  bytes = (char*)rf_data[1] - (char*)rf_data[0];
+  if (bytes <= 0 || bytes % sample_size != 0) return 0;
+  stride = bytes / sample_size;
+  if ((double)stride*(no_channels + 1) >= 2147483648.0) return 0;
+
+  for (ic = 2; ic < no_channels; ic ++)
+     if ((char*)rf_data[ic] - (char*)rf_data[ic-1] != bytes) return 0;
+
+  return (ui32)stride;
+}
@@ -0,0 +1,131 @@
+/*********************************************************************
+ * NAME     : simd_avx2.c
+ * ABSTRACT : Inner loops of the beamforming kernels for AVX2, four
+ *            doubles per instruction, with gathered samples.
+ *            The file must be compiled with AVX2 enabled (-mavx2 or
+ *            /arch:AVX2). Otherwise the table is empty. FMA must not
+ *            be used (-ffp-contract=off), so that the pixel grid stays
+ *            bit exact.
+ *********************************************************************/
+
+#include "../h/simd.h"
+
+#include <math.h>
+#include <stddef.h>
+
+#if defined(__AVX2__)
+
+#include <immintrin.h>
+
+#define VEC              __m256d
+#define VW               4
+#define IVEC             __m128i
+#define MASK             __m256d
+#define SIMD(name)       name##_avx2
+
+#define VZERO()          _mm256_setzero_pd()
+#define VSET1(x)         _mm256_set1_pd(x)
+#define VLOAD(p)         _mm256_loadu_pd(p)
+#define FLOAD(p)         _mm256_cvtps_pd(_mm_loadu_ps(p))
+#define VSTORE(p,v)      _mm256_storeu_pd(p,v)
+#define FSTORE(p,v)      _mm_storeu_ps(p, _mm256_cvtpd_ps(v))
+#define VADD(a,b)        _mm256_add_pd(a,b)
+#define VSUB(a,b)        _mm256_sub_pd(a,b)
+#define VMUL(a,b)        _mm256_mul_pd(a,b)
+#define VSQRT(a)         _mm256_sqrt_pd(a)
+#define VHSUM(a)         hsum_avx2(a)
+#define VMASKZ(m,a)      _mm256_and_pd(m,a)
+#define VRANGE(s,hi)     _mm256_and_pd(                                 \
+                            _mm256_cmp_pd(s, _mm256_setzero_pd(), _CMP_GE_OQ), \
+                            _mm256_cmp_pd(s, hi, _CMP_LT_OQ))
+#define VTRUNC(a)        _mm256_cvttpd_epi32(a)
+#define ITOV(i)          _mm256_cvtepi32_pd(i)
+
+#define ISET1(x)         _mm_set1_epi32(x)
+#define ILOAD(p)         _mm_loadu_si128((const __m128i*)(p))
+#define SLOAD(p)         _mm_cvtepi16_epi32(_mm_loadl_epi64((const __m128i*)(p)))
+#define ISTORE(p,i)      _mm_storeu_si128((__m128i*)(p), i)
+#define IADD(a,b)        _mm_add_epi32(a,b)
+#define ISUB(a,b)        _mm_sub_epi32(a,b)
+#define IBELOW(i,hi)     below_avx2(i,hi)
+#define GATHER2(rf,off,m,s1,s2)                                         \
+   do{                                                                  \
+     (s1) = _mm256_mask_i32gather_pd(_mm256_setzero_pd(), rf, off, m, 8); \
+     (s2) = _mm256_mask_i32gather_pd(_mm256_setzero_pd(), (rf) + 1, off, m, 8); \
+   }while(0)
+#define F32GATHER2(rf,off,m,s1,s2)  gather2_f32_avx2(rf, off, m, &(s1), &(s2))
+#define I16GATHER2(rf,off,m,s1,s2)  gather2_i16_avx2(rf, off, m, &(s1), &(s2))
+
+
+static double hsum_avx2(__m256d a)
+{
+  __m128d s = _mm_add_pd(_mm256_castpd256_pd128(a),
+                         _mm256_extractf128_pd(a, 1));
+  return _mm_cvtsd_f64(_mm_add_sd(s, _mm_unpackhi_pd(s, s)));
+}
+
+
+/*
+ *   Unsigned comparison, widened to 64 bit lanes
+ */
+static __m256d below_avx2(__m128i i, ui32 hi)
+{
+  __m128i bias = _mm_set1_epi32((si32)0x80000000);
+  __m128i m = _mm_cmplt_epi32(_mm_xor_si128(i, bias),
+                              _mm_set1_epi32((si32)(hi ^ 0x80000000)));
+  return _mm256_castsi256_pd(_mm256_cvtepi32_epi64(m));
+}
+
+/*
+ *   The 64 bit lanes of a mask, narrowed to 32 bits
+ */
+static __m128i narrow_avx2(__m256d m)
+{
+  __m256i even = _mm256_setr_epi32(0, 2, 4, 6, 0, 2, 4, 6);
+
+  return _mm256_castsi256_si128(
+            _mm256_permutevar8x32_epi32(_mm256_castpd_si256(m), even));
+}
+
+
+static void gather2_f32_avx2(const float *rf, __m128i off, __m256d m,
+                             __m256d *s1, __m256d *s2)
+{
+  __m128 m32 = _mm_castsi128_ps(narrow_avx2(m));
+
+  *s1 = _mm256_cvtps_pd(_mm_mask_i32gather_ps(_mm_setzero_ps(), rf, off,
+                                              m32, 4));
+  *s2 = _mm256_cvtps_pd(_mm_mask_i32gather_ps(_mm_setzero_ps(), rf + 1, off,
+                                              m32, 4));
+}
+
+
+/*
+ *   One 32 bit gather reads the samples off and off+1. They are the 
+ *   lower and the upper half of every lane.
+ */
+static void gather2_i16_avx2(const si16 *rf, __m128i off, __m256d m,
+                             __m256d *s1, __m256d *s2)
+{
+  __m128i pair = _mm_mask_i32gather_epi32(_mm_setzero_si128(),
+                                          (const int*)rf, off,
+                                          narrow_avx2(m), 2);
+
+  *s1 = _mm256_cvtepi32_pd(_mm_srai_epi32(_mm_slli_epi32(pair, 16), 16));
+  *s2 = _mm256_cvtepi32_pd(_mm_srai_epi32(pair, 16));
+}
+
+#include "simd_rows.inc"
+
+const TSimdKernels simd_avx2 = {BFT_SIMD_AVX2, "AVX2",
+   times_row_avx2, dynamic_row_avx2, times_row_f32_avx2,
+   dynamic_row_f32_avx2, times_row_i16_avx2, dynamic_row_i16_avx2,
+   delays_row_avx2, grid_row_avx2, filter_row_avx2,
+   run_row_avx2, gather_row_avx2, table_row_avx2};
+
+#else
+
+const TSimdKernels simd_avx2 = {BFT_SIMD_AVX2, "AVX2", NULL, NULL, NULL,
+   NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL};
+
+#endif
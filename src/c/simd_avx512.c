@@ -0,0 +1,124 @@
+/*********************************************************************
+ * NAME     : simd_avx512.c
+ * ABSTRACT : Inner loops of the beamforming kernels for AVX-512, eight
+ *            doubles per instruction, with gathered samples.
+ *            The file must be compiled with AVX-512F and AVX2 enabled
+ *            (-mavx512f -mavx2 or /arch:AVX512). Otherwise the table
+ *            is empty. As for AVX2, use -ffp-contract=off.
+ *********************************************************************/
+
+#include "../h/simd.h"
+
+#include <math.h>
+#include <stddef.h>
+
+#if defined(__AVX512F__) && defined(__AVX2__)
+
+#include <immintrin.h>
+
+#define VEC              __m512d
+#define VW               8
+#define IVEC             __m256i
+#define MASK             __mmask8
+#define SIMD(name)       name##_avx512
+
+#define VZERO()          _mm512_setzero_pd()
+#define VSET1(x)         _mm512_set1_pd(x)
+#define VLOAD(p)         _mm512_loadu_pd(p)
+#define FLOAD(p)         _mm512_cvtps_pd(_mm256_loadu_ps(p))
+#define VSTORE(p,v)      _mm512_storeu_pd(p,v)
+#define FSTORE(p,v)      _mm256_storeu_ps(p, _mm512_cvtpd_ps(v))
+#define VADD(a,b)        _mm512_add_pd(a,b)
+#define VSUB(a,b)        _mm512_sub_pd(a,b)
+#define VMUL(a,b)        _mm512_mul_pd(a,b)
+#define VSQRT(a)         _mm512_sqrt_pd(a)
+#define VHSUM(a)         hsum_avx512(a)
+#define VMASKZ(m,a)      _mm512_maskz_mov_pd(m,a)
+#define VRANGE(s,hi)     (__mmask8)(                                    \
+                  _mm512_cmp_pd_mask(s, _mm512_setzero_pd(), _CMP_GE_OQ) \
+                & _mm512_cmp_pd_mask(s, hi, _CMP_LT_OQ))
+#define VTRUNC(a)        _mm512_cvttpd_epi32(a)
+#define ITOV(i)          _mm512_cvtepi32_pd(i)
+
+#define ISET1(x)         _mm256_set1_epi32(x)
+#define ILOAD(p)         _mm256_loadu_si256((const __m256i*)(p))
+#define SLOAD(p)         _mm256_cvtepi16_epi32(_mm_loadu_si128((const __m128i*)(p)))
+#define ISTORE(p,i)      _mm256_storeu_si256((__m256i*)(p), i)
+#define IADD(a,b)        _mm256_add_epi32(a,b)
+#define ISUB(a,b)        _mm256_sub_epi32(a,b)
+#define IBELOW(i,hi)     below_avx512(i,hi)
+#define GATHER2(rf,off,m,s1,s2)                                         \
+   do{                                                                  \
+     (s1) = _mm512_mask_i32gather_pd(_mm512_setzero_pd(), m, off, rf, 8); \
+     (s2) = _mm512_mask_i32gather_pd(_mm512_setzero_pd(), m, off, (rf) + 1, 8); \
+   }while(0)
+#define F32GATHER2(rf,off,m,s1,s2)  gather2_f32_avx512(rf, off, m, &(s1), &(s2))
+#define I16GATHER2(rf,off,m,s1,s2)  gather2_i16_avx512(rf, off, m, &(s1), &(s2))
+
+
+static double hsum_avx512(__m512d a)
+{
+  __m256d h = _mm256_add_pd(_mm512_castpd512_pd256(a),
+                            _mm512_extractf64x4_pd(a, 1));
+  __m128d s = _mm_add_pd(_mm256_castpd256_pd128(h),
+                         _mm256_extractf128_pd(h, 1));
+  return _mm_cvtsd_f64(_mm_add_sd(s, _mm_unpackhi_pd(s, s)));
+}
+
+
+/*
+ *   Unsigned comparison, as a mask register
+ */
+static __mmask8 below_avx512(__m256i i, ui32 hi)
+{
+  __m256i bias = _mm256_set1_epi32((si32)0x80000000);
+  __m256i m = _mm256_cmpgt_epi32(_mm256_set1_epi32((si32)(hi ^ 0x80000000)),
+                                 _mm256_xor_si256(i, bias));
+  return (__mmask8)_mm256_movemask_ps(_mm256_castsi256_ps(m));
+}
+
+/*
+ *   Without AVX-512VL, the gathers of 32 bit lanes take 16 of them. Only
+ *   the lower 8 are in the mask.
+ */
+static void gather2_f32_avx512(const float *rf, __m256i off, __mmask8 m,
+                               __m512d *s1, __m512d *s2)
+{
+  __m512i off16 = _mm512_castsi256_si512(off);
+
+  *s1 = _mm512_cvtps_pd(_mm512_castps512_ps256(_mm512_mask_i32gather_ps(
+           _mm512_setzero_ps(), (__mmask16)m, off16, rf, 4)));
+  *s2 = _mm512_cvtps_pd(_mm512_castps512_ps256(_mm512_mask_i32gather_ps(
+           _mm512_setzero_ps(), (__mmask16)m, off16, rf + 1, 4)));
+}
+
+
+/*
+ *   One 32 bit gather reads the samples off and off+1. They are the 
+ *   lower and the upper half of every lane.
+ */
+static void gather2_i16_avx512(const si16 *rf, __m256i off, __mmask8 m,
+                               __m512d *s1, __m512d *s2)
+{
+  __m256i pair = _mm512_castsi512_si256(_mm512_mask_i32gather_epi32(
+           _mm512_setzero_si512(), (__mmask16)m,
+           _mm512_castsi256_si512(off), rf, 2));
+
+  *s1 = _mm512_cvtepi32_pd(_mm256_srai_epi32(_mm256_slli_epi32(pair, 16), 16));
+  *s2 = _mm512_cvtepi32_pd(_mm256_srai_epi32(pair, 16));
+}
+
+#include "simd_rows.inc"
+
+const TSimdKernels simd_avx512 = {BFT_SIMD_AVX512, "AVX-512",
+   times_row_avx512, dynamic_row_avx512, times_row_f32_avx512,
+   dynamic_row_f32_avx512, times_row_i16_avx512, dynamic_row_i16_avx512,
+   delays_row_avx512, grid_row_avx512, filter_row_avx512,
+   run_row_avx512, gather_row_avx512, table_row_avx512};
+
+#else
+
+const TSimdKernels simd_avx512 = {BFT_SIMD_AVX512, "AVX-512", NULL, NULL, NULL,
+   NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL};
+
+#endif
@@ -0,0 +1,123 @@
+/*********************************************************************
+ * NAME     : simd_sse2.c
+ * ABSTRACT : Inner loops of the beamforming kernels for SSE2, two
+ *            doubles per instruction. SSE2 has no gather instruction,
+ *            so the samples are loaded one at a time, and converted to
+ *            double as they are.
+ *            The file must be compiled with SSE2 enabled (always the
+ *            case on x86-64). Otherwise the table is empty.
+ *********************************************************************/
+
+#include "../h/simd.h"
+
+#include <math.h>
+#include <stddef.h>
+
+#if defined(__SSE2__) || defined(_M_X64) || (defined(_M_IX86_FP) && _M_IX86_FP >= 2)
+
+#include <emmintrin.h>
+
+#define VEC              __m128d
+#define VW               2
+#define IVEC             __m128i
+#define MASK             __m128d
+#define SIMD(name)       name##_sse2
+
+#define VZERO()          _mm_setzero_pd()
+#define VSET1(x)         _mm_set1_pd(x)
+#define VLOAD(p)         _mm_loadu_pd(p)
+#define FLOAD(p)         _mm_cvtps_pd(_mm_castsi128_ps(_mm_loadl_epi64((const __m128i*)(p))))
+#define VSTORE(p,v)      _mm_storeu_pd(p,v)
+#define FSTORE(p,v)      _mm_storel_pi((__m64*)(p), _mm_cvtpd_ps(v))
+#define VADD(a,b)        _mm_add_pd(a,b)
+#define VSUB(a,b)        _mm_sub_pd(a,b)
+#define VMUL(a,b)        _mm_mul_pd(a,b)
+#define VSQRT(a)         _mm_sqrt_pd(a)
+#define VHSUM(a)         hsum_sse2(a)
+#define VMASKZ(m,a)      _mm_and_pd(m,a)
+#define VRANGE(s,hi)     _mm_and_pd(_mm_cmpge_pd(s, _mm_setzero_pd()),   \
+                                    _mm_cmplt_pd(s, hi))
+#define VTRUNC(a)        _mm_cvttpd_epi32(a)
+#define ITOV(i)          _mm_cvtepi32_pd(i)
+
+#define ISET1(x)         _mm_set1_epi32(x)
+#define ILOAD(p)         _mm_loadl_epi64((const __m128i*)(p))
+#define SLOAD(p)         _mm_set_epi32(0, 0, (p)[1], (p)[0])
+#define ISTORE(p,i)      _mm_storel_epi64((__m128i*)(p), i)
+#define IADD(a,b)        _mm_add_epi32(a,b)
+#define ISUB(a,b)        _mm_sub_epi32(a,b)
+#define IBELOW(i,hi)     below_sse2(i,hi)
+#define GATHER2(rf,off,m,s1,s2)  gather2_sse2(rf, off, m, &(s1), &(s2))
+#define F32GATHER2(rf,off,m,s1,s2)  gather2_f32_sse2(rf, off, m, &(s1), &(s2))
+#define I16GATHER2(rf,off,m,s1,s2)  gather2_i16_sse2(rf, off, m, &(s1), &(s2))
+
+
+static double hsum_sse2(__m128d a)
+{
+  return _mm_cvtsd_f64(_mm_add_sd(a, _mm_unpackhi_pd(a, a)));
+}
+
+
+/*
+ *   Unsigned comparison of the two lower lanes, widened to 64 bits
+ */
+static __m128d below_sse2(__m128i i, ui32 hi)
+{
+  __m128i bias = _mm_set1_epi32((si32)0x80000000);
+  __m128i m = _mm_cmplt_epi32(_mm_xor_si128(i, bias),
+                              _mm_set1_epi32((si32)(hi ^ 0x80000000)));
+  return _mm_castsi128_pd(_mm_unpacklo_epi32(m, m));
+}
+
+
+static void gather2_sse2(const double *rf, __m128i off, __m128d m,
+                         __m128d *s1, __m128d *s2)
+{
+  int flags = _mm_movemask_pd(m);
+  si32 o0 = _mm_cvtsi128_si32(off);
+  si32 o1 = _mm_cvtsi128_si32(_mm_srli_si128(off, 4));
+
+  *s1 = _mm_set_pd((flags & 2) ? rf[o1] : 0.0, (flags & 1) ? rf[o0] : 0.0);
+  *s2 = _mm_set_pd((flags & 2) ? rf[o1+1] : 0.0,
+                   (flags & 1) ? rf[o0+1] : 0.0);
+}
+
+static void gather2_f32_sse2(const float *rf, __m128i off, __m128d m,
+                             __m128d *s1, __m128d *s2)
+{
+  int flags = _mm_movemask_pd(m);
+  si32 o0 = _mm_cvtsi128_si32(off);
+  si32 o1 = _mm_cvtsi128_si32(_mm_srli_si128(off, 4));
+
+  *s1 = _mm_set_pd((flags & 2) ? rf[o1] : 0.0, (flags & 1) ? rf[o0] : 0.0);
+  *s2 = _mm_set_pd((flags & 2) ? rf[o1+1] : 0.0,
+                   (flags & 1) ? rf[o0+1] : 0.0);
+}
+
+
+static void gather2_i16_sse2(const si16 *rf, __m128i off, __m128d m,
+                             __m128d *s1, __m128d *s2)
+{
+  int flags = _mm_movemask_pd(m);
+  si32 o0 = _mm_cvtsi128_si32(off);
+  si32 o1 = _mm_cvtsi128_si32(_mm_srli_si128(off, 4));
+
+  *s1 = _mm_set_pd((flags & 2) ? rf[o1] : 0.0, (flags & 1) ? rf[o0] : 0.0);
+  *s2 = _mm_set_pd((flags & 2) ? rf[o1+1] : 0.0,
+                   (flags & 1) ? rf[o0+1] : 0.0);
+}
+
+#include "simd_rows.inc"
+
+const TSimdKernels simd_sse2 = {BFT_SIMD_SSE2, "SSE2",
+   times_row_sse2, dynamic_row_sse2, times_row_f32_sse2,
+   dynamic_row_f32_sse2, times_row_i16_sse2, dynamic_row_i16_sse2,
+   delays_row_sse2, grid_row_sse2, filter_row_sse2,
+   run_row_sse2, gather_row_sse2, table_row_sse2};
+
+#else
+
+const TSimdKernels simd_sse2 = {BFT_SIMD_SSE2, "SSE2", NULL, NULL, NULL,
+   NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL};
+
+#endif
@@ -0,0 +1,429 @@
+/*********************************************************************
+ * NAME     : stream.c
+ * ABSTRACT : Streaming beamforming of one acquisition, which arrives
+ *            in blocks of samples. When the stream is created, the
+ *            lines are walked once without data, to find which input
+ *            samples every output sample needs. After every block, the
+ *            output samples whose input has arrived are beamformed,
+ *            and the lines continue from where the previous block
+ *            stopped. The walk mirrors beamform_lines.inc, as does
+ *            plan.c.
+ *********************************************************************/
+
+#include "../h/stream.h"
+#include "../h/beamform.h"
+#include "../h/error.h"
+
+#include <math.h>
+#include <stdlib.h>
+
+
+/*********************************************************************
+ * FUNCTION : stream_walk
+ * ABSTRACT : Advance line 'l' up to output sample 'end'. If 'need' is
+ *            not NULL, no data is read, and the range of input samples
+ *            used by every output sample is merged into 'need' and
+ *            'keep'. Otherwise the output samples are stored in 'out'.
+ *            'scratch' holds the delays of the dynamic focusing.
+ * RETURNS  : FALSE if the delay table of a dynamically focused line 
+ *            could not be allocated. The line is then not advanced.
+ *********************************************************************/
+static ui32 stream_walk(TBeamformStream *s, TStreamLine *l, ui32 end,
+        TDelayScratch *scratch, double *out, si32 *need, si32 *keep)
+{
+  TFocusTimeLine *ftl = l->ftl;
+  TApoTimeLine *atl = l->atl;
+  TApodization *zone = NULL;  /* Current apodization zone         */
+  ui32 no_elements = ftl->xdc->no_elements;
+  ui32 no_samples = s->no_samples;
+  ui32 mask = s->cap - 1;
+  ui32 *index = NULL;         /* Dynamic focusing                 */
+  double *frac = NULL;
+  si16 *d = NULL;             /* Focal zones                      */
+  float *a = NULL;
+  double *rf;
+  double w1, w2;              /* Weights of samples 'is', 'is+1'  */
+  double acc;
+  ui32 n;                     /* Number of summed channels        */
+  ui32 is;                    /* Index of the first input sample  */
+  ui32 k, ic;
+
+  if (ftl->dynamic == TRUE){
+     if (dynamic_table(ftl, s->sys, s->time, no_samples) == NULL)
+        return FALSE;
+     index = scratch->index;
+     frac = scratch->frac;
+  }else{
+     d = ftl->delay[l->id].d;
+     a = ftl->delay[l->id].a;
+  }
+  if (atl != NULL)
+     zone = atl->a + l->ia;
+
+  for (; l->os < end; l->os ++, l->o_abs_s ++){
+     if (l->os >= l->no_out){
+        if (out != NULL) *out++ = 0;
+        continue;
+     }
+     if (d != NULL && l->o_abs_s > ftl->delay[l->ind].time){
+        l->ind ++; l->id ++;
+        d = ftl->delay[l->id].d;
+        a = ftl->delay[l->id].a;
+     }
+     if (atl != NULL && l->o_abs_s > atl->a[l->ina].time){
+        l->ina ++; l->ia ++;
+        zone = atl->a + l->ia;
+     }
+     if (index != NULL)
+        dynamic_delays(ftl, l->os, s->tx, index, frac);
+
+     n = (zone != NULL) ? zone->no_active : no_elements;
+     acc = 0;
+     for (k = 0; k < n; k ++){
+        ic = (zone != NULL) ? zone->active[k] : k;
+        if (d != NULL){
+           is = l->os - d[ic] - 1;
+           if (is >= no_samples - 1) continue;
+           w1 = a[ic];
+           w2 = 1 - w1;
+        }else{
+           is = index[ic];
+           if (is >= no_samples - 2) continue;
+           w2 = frac[ic];
+           w1 = 1 - w2;
+        }
+
+        if (need != NULL){
+           if ((si32)is + 1 > need[l->os]) need[l->os] = (si32)is + 1;
+           if ((si32)is < keep[l->os]) keep[l->os] = (si32)is;
+           continue;
+        }
+        rf = s->ring + (size_t)ic*s->cap;
+        if (zone != NULL)
+           acc += (rf[is & mask]*w1 + rf[(is+1) & mask]*w2)*zone->a[ic];
+        else
+           acc += rf[is & mask]*w1 + rf[(is+1) & mask]*w2;
+     }
+     if (out != NULL) *out++ = acc;
+  }
+  return TRUE;
+}
+
+
+/*********************************************************************
+ * FUNCTION : stream_line_start
+ * ABSTRACT : Put a line at the first output sample. The choice of
+ *            routine is the same as in beamform_image().
+ *********************************************************************/
+static void stream_line_start(TBeamformStream *s, TStreamLine *l,
+        TFocusTimeLine *ftl, TApoTimeLine *atl, ui32 use_apo)
+{
+  l->ftl = ftl;
+  l->atl = (use_apo && atl->no_times > 0) ? atl : NULL;
+  l->os = 0;
+  l->o_abs_s = (ui32)floor(s->time * s->sys->fs);
+  l->id = 0; l->ind = 1;
+  l->ia = 0; l->ina = 1;
+
+  if (ftl->dynamic == TRUE){
+     /* The apodizing routines skip dynamic lines without apodization */
+     l->no_out = (use_apo && l->atl == NULL) ? 0 : s->no_samples - 1;
+  }else{
+     l->ind = find_delay(ftl, l->o_abs_s);
+     l->id = l->ind - 1;
+     l->no_out = (l->atl != NULL) ? s->no_samples - 1 : s->no_samples;
+  }
+  if (l->atl != NULL){
+     l->ina = find_apodization(l->atl, l->o_abs_s);
+     l->ia = l->ina - 1;
+  }
+}
+
+
+/*********************************************************************
+ * FUNCTION : new_beamform_stream
+ * ABSTRACT : Prepare the streaming beamforming of one acquisition with
+ *            the current focus and apodization settings. The settings
+ *            are used while the stream is running, and must not be
+ *            changed until the stream is deleted.
+ * ARGUMENTS: flc, alc, sys - Settings of the beamforming
+ *            time - Time of the first input sample
+ *            no_samples - Number of samples per channel in the whole
+ *                   acquisition, and in the beamformed lines.
+ *            no_elements - Number of channels in the input blocks
+ *            element_no, xmt - Transmit element or position for the
+ *                   dynamically focused lines, as for beamform_image().
+ * RETURNS  : Pointer to the stream, or NULL in case of wrong settings,
+ *            or if there is not enough memory.
+ *********************************************************************/
+TBeamformStream* new_beamform_stream(TFocusLineCollection *flc,
+        TApoLineCollection *alc, TSysParams *sys, double time,
+        ui32 no_samples, ui32 no_elements, ui32 element_no, TPoint3D *xmt)
+{
+  TBeamformStream *s;
+  TStreamLine walk;
+  TDelayScratch *scratch;
+  ui32 use_apo = FALSE;
+  ui32 i;
+  si32 os;
+
+  PFUNC
+  if (flc->no_focus_time_lines != alc->no_apo_time_lines
+      || flc->no_focus_time_lines == 0){
+     eprintf("\007 beamform_stream:\n");
+     eprintf("Error : the focus and apodization lines are not set\n");
+     return NULL;
+  }
+  if (no_samples < 2){
+     eprintf("\007 beamform_stream:\n");
+     eprintf("Error : the acquisition must have at least 2 samples\n");
+     return NULL;
+  }
+
+  for (i = 0; i < flc->no_focus_time_lines; i++){
+     if (flc->ftl[i].xdc == NULL
+         || flc->ftl[i].xdc->no_elements > no_elements){
+        eprintf("\007 beamform_stream:\n");
+        eprintf("Error : line %d needs more elements than the data has\n", i);
+        return NULL;
+     }
+     if (flc->ftl[i].pixel == TRUE){
+        eprintf("\007 beamform_stream:\n");
+        eprintf("Error : pixel based focusing can not be streamed\n");
+        return NULL;
+     }
+     if (alc->atl[i].no_times > 0)
+        use_apo = TRUE;
+  }
+
+  s = (TBeamformStream*)calloc(1, sizeof(TBeamformStream));
+  assert(s);
+  s->flc = flc;
+  s->sys = sys;
+  s->no_lines = flc->no_focus_time_lines;
+  s->no_samples = no_samples;
+  s->no_elements = no_elements;
+  s->time = time;
+  if (xmt != NULL || element_no < 64000){
+     s->point.type = BFT_TX_POINT;
+     s->point.angle = 0.0;
+     s->point.point = (xmt != NULL) ? *xmt : flc->ftl[0].xdc->c[element_no];
+     s->tx = &s->point;
+  }
+
+  s->line = (TStreamLine*)malloc(s->no_lines*sizeof(TStreamLine));
+  s->need = (si32*)malloc(no_samples*sizeof(si32));
+  s->keep = (si32*)malloc((no_samples + 1)*sizeof(si32));
+  assert(s->line && s->need && s->keep);
+
+  /*
+   *   Find the input samples needed by every output sample. 'need'
+   *   is made non-decreasing, so that the output samples become ready
+   *   in order, and 'keep' covers all later output samples.
+   */
+  for (os = 0; os < (si32)no_samples; os ++){
+     s->need[os] = -1;
+     s->keep[os] = (si32)no_samples;
+  }
+  s->keep[no_samples] = (si32)no_samples;
+
+  scratch = new_delay_scratch(flc, 1);
+  for (i = 0; i < s->no_lines && scratch != NULL; i++){
+     stream_line_start(s, s->line + i, flc->ftl + i, alc->atl + i, use_apo);
+     walk = s->line[i];
+     if (!stream_walk(s, &walk, no_samples, scratch, NULL, s->need, s->keep))
+        break;
+  }
+  del_delay_scratch(scratch);
+  if (scratch == NULL || i < s->no_lines){
+     del_beamform_stream(s);
+     return NULL;
+  }
+  for (os = 1; os < (si32)no_samples; os ++)
+     if (s->need[os] < s->need[os-1]) s->need[os] = s->need[os-1];
+  for (os = (si32)no_samples - 1; os >= 0; os --)
+     if (s->keep[os] > s->keep[os+1]) s->keep[os] = s->keep[os+1];
+
+  return s;
+}
+
+
+/*********************************************************************
+ * FUNCTION : del_beamform_stream
+ *********************************************************************/
+void del_beamform_stream(TBeamformStream *stream)
+{
+  PFUNC
+  if (stream == NULL) return;
+  free(stream->line);
+  free(stream->need);
+  free(stream->keep);
+  free(stream->ring);
+  free(stream);
+}
+
+
+/*********************************************************************
+ * FUNCTION : stream_reserve
+ * ABSTRACT : Make room in the ring buffers for samples up to 'last'-1,
+ *            keeping the samples which are still needed.
+ *********************************************************************/
+static void stream_reserve(TBeamformStream *s, ui32 last)
+{
+  ui32 first = s->received;     /* First sample, which must be kept */
+  ui32 cap;
+  double *ring;
+  ui32 ic, is;
+
+  if ((ui32)s->keep[s->done] < first)
+     first = (ui32)s->keep[s->done];
+  if (last - first <= s->cap)
+     return;
+
+  for (cap = 64; cap < last - first; cap *= 2) ;
+  ring = (double*)malloc((size_t)s->no_elements*cap*sizeof(double));
+  assert(ring);
+  for (ic = 0; ic < s->no_elements && s->ring != NULL; ic ++)
+     for (is = first; is < s->received; is ++)
+        ring[(size_t)ic*cap + (is & (cap-1))] =
+                s->ring[(size_t)ic*s->cap + (is & (s->cap-1))];
+
+  free(s->ring);
+  s->ring = ring;
+  s->cap = cap;
+}
+
+
+/*********************************************************************
+ * FUNCTION : beamform_stream_push
+ * ABSTRACT : Add the next block of samples to the stream.
+ * ARGUMENTS: data - 'no_elements' rows of 'block_len' samples, one row
+ *                   per channel.
+ *            sample_type - BFT_FLOAT64, BFT_FLOAT32 or BFT_INT16. The
+ *                   samples are stored, and summed, as double.
+ * RETURNS  : 'block_len', or 0 if the samples could not be added.
+ *********************************************************************/
+ui32 beamform_stream_push(TBeamformStream *stream, void *data,
+        ui32 sample_type, ui32 block_len)
+{
+  double *rf;
+  ui32 mask;
+  ui32 ic, k, is;
+
+  if (block_len > stream->no_samples - stream->received){
+     eprintf("\007 beamform_stream_push:\n");
+     eprintf("Error : more samples than the acquisition has\n");
+     return 0;
+  }
+  if (sample_type != BFT_FLOAT64 && sample_type != BFT_FLOAT32
+      && sample_type != BFT_INT16){
+     eprintf("\007 beamform_stream_push:\n");
+     eprintf("Error : unsupported type of samples\n");
+     return 0;
+  }
+
+  stream_reserve(stream, stream->received + block_len);
+  mask = stream->cap - 1;
+  for (ic = 0; ic < stream->no_elements; ic ++){
+     rf = stream->ring + (size_t)ic*stream->cap;
+     is = stream->received;
+     for (k = 0; k < block_len; k ++, is ++){
+        switch (sample_type){
+           case BFT_FLOAT64:
+              rf[is & mask] = ((double*)data)[(size_t)ic*block_len + k];
+              break;
+           case BFT_FLOAT32:
+              rf[is & mask] = ((float*)data)[(size_t)ic*block_len + k];
+              break;
+           default:
+              rf[is & mask] = ((si16*)data)[(size_t)ic*block_len + k];
+        }
+     }
+  }
+  stream->received += block_len;
+  return block_len;
+}
+
+
+/*********************************************************************
+ * FUNCTION : beamform_stream_ready
+ * RETURNS  : Number of output samples per line, which can be
+ *            beamformed with the samples received so far.
+ *********************************************************************/
+ui32 beamform_stream_ready(TBeamformStream *stream)
+{
+  ui32 os = stream->done;
+
+  while (os < stream->no_samples
+         && stream->need[os] < (si32)stream->received)
+     os ++;
+  return os - stream->done;
+}
+
+
+/*
+ *  Arguments of stream_line()
+ */
+typedef struct{
+   TBeamformStream *stream;
+   TThreadPool *pool;      /* The pool running the job               */
+   TDelayScratch *scratch; /* One per thread of 'pool'               */
+   ui32 failed;            /* Set if a line could not be beamformed  */
+   ui32 end;               /* Beamform up to this output sample      */
+   double *out;            /* One row per line                       */
+}TStreamJob;
+
+
+/*********************************************************************
+ * FUNCTION : stream_line
+ * ABSTRACT : Beamform the ready samples of line 'i'. Task of the
+ *            thread pool.
+ *********************************************************************/
+static void stream_line(void *arg, ui32 i)
+{
+  TStreamJob *job = (TStreamJob*)arg;
+  TBeamformStream *s = job->stream;
+
+  if (!stream_walk(s, s->line + i, job->end,
+                   job->scratch + thread_pool_worker(job->pool),
+                   job->out + (size_t)i*(job->end - s->done), NULL, NULL))
+     job->failed = TRUE;
+}
+
+
+/*********************************************************************
+ * FUNCTION : beamform_stream_run
+ * ABSTRACT : Beamform all output samples which are ready, see
+ *            beamform_stream_ready().
+ * ARGUMENTS: pool - Thread pool, which beamforms the lines, or NULL
+ *            stream - The stream
+ *            out - One row per line, with room for the ready samples.
+ * RETURNS  : Number of output samples per line stored in 'out'. 0 if
+ *            none are ready, or if there is not enough memory for the
+ *            delays of the dynamic focusing. The stream can not be 
+ *            continued after that.
+ *********************************************************************/
+ui32 beamform_stream_run(TThreadPool *pool, TBeamformStream *stream,
+        double *out)
+{
+  TStreamJob job;
+  ui32 n = beamform_stream_ready(stream);
+
+  if (n == 0)
+     return 0;
+
+  job.stream = stream;
+  job.pool = pool;
+  job.failed = FALSE;
+  job.end = stream->done + n;
+  job.out = out;
+  job.scratch = new_delay_scratch(stream->flc, thread_pool_size(pool));
+  if (job.scratch == NULL)
+     return 0;
+  thread_pool_run(pool, stream->no_lines, stream_line, &job);
+  del_delay_scratch(job.scratch);
+  if (job.failed)
+     return 0;
+  stream->done += n;
+  return n;
+}
@@ -0,0 +1,329 @@
+/*********************************************************************
+ * NAME     : threads.c
+ * ABSTRACT : A small pool of worker threads. The threads are created
+ *            once and sleep between the jobs. The thread calling
+ *            thread_pool_run() takes part in the work, hence a pool
+ *            of N threads starts N-1 workers.
+ *********************************************************************/
+
+#include "../h/threads.h"
+#include "../h/error.h"
+
+#include <stdlib.h>
+
+#ifdef _WIN32
+ #include <windows.h>
+
+ typedef HANDLE             TThread;
+ typedef CRITICAL_SECTION   TMutex;
+ typedef CONDITION_VARIABLE TCond;
+
+ #define mutex_init(m)      InitializeCriticalSection(m)
+ #define mutex_del(m)       DeleteCriticalSection(m)
+ #define mutex_lock(m)      EnterCriticalSection(m)
+ #define mutex_unlock(m)    LeaveCriticalSection(m)
+ #define cond_init(c)       InitializeConditionVariable(c)
+ #define cond_del(c)
+ #define cond_wait(c, m)    SleepConditionVariableCS(c, m, INFINITE)
+ #define cond_signal(c)     WakeConditionVariable(c)
+ #define cond_broadcast(c)  WakeAllConditionVariable(c)
+#else
+ #include <pthread.h>
+ #include <unistd.h>
+
+ typedef pthread_t          TThread;
+ typedef pthread_mutex_t    TMutex;
+ typedef pthread_cond_t     TCond;
+
+ #define mutex_init(m)      pthread_mutex_init(m, NULL)
+ #define mutex_del(m)       pthread_mutex_destroy(m)
+ #define mutex_lock(m)      pthread_mutex_lock(m)
+ #define mutex_unlock(m)    pthread_mutex_unlock(m)
+ #define cond_init(c)       pthread_cond_init(c, NULL)
+ #define cond_del(c)        pthread_cond_destroy(c)
+ #define cond_wait(c, m)    pthread_cond_wait(c, m)
+ #define cond_signal(c)     pthread_cond_signal(c)
+ #define cond_broadcast(c)  pthread_cond_broadcast(c)
+#endif
+
+
+/*
+ *  Lock for data shared by all threads of the process, e.g. the chain of
+ *  transducer definitions. Initialized statically, so it can be used
+ *  before anything else has been set up.
+ */
+#ifdef _WIN32
+ static SRWLOCK global_lock = SRWLOCK_INIT;
+#else
+ static pthread_mutex_t global_lock = PTHREAD_MUTEX_INITIALIZER;
+#endif
+
+
+struct thread_pool{
+   ui32 no_threads;        /* Number of threads, including the caller  */
+   ui32 quit;              /* Set when the workers must exit           */
+   ui32 generation;        /* Incremented for every new job            */
+   ui32 no_busy;           /* Workers, which have not finished the job */
+   ui32 next_item;         /* Next work item to hand out               */
+   ui32 no_items;          /* Number of work items in the current job  */
+   TParallelFunc func;     /* Function to call for every item          */
+   void* arg;              /* Argument passed to 'func'                */
+   TMutex lock;            /* Protects all of the above                */
+   TMutex run_lock;        /* Only one job at a time                   */
+   TCond work;             /* Signalled when a new job is available    */
+   TCond done;             /* Signalled when the last worker is done   */
+   TThread* workers;
+};
+
+
+/*********************************************************************
+ * FUNCTION : thread_pool_cpu_count
+ * ABSTRACT : Number of processors available to the process.
+ *********************************************************************/
+ui32 thread_pool_cpu_count(void)
+{
+#ifdef _WIN32
+   SYSTEM_INFO info;
+   GetSystemInfo(&info);
+   return (ui32)info.dwNumberOfProcessors;
+#else
+   long n = sysconf(_SC_NPROCESSORS_ONLN);
+   return (n > 0) ? (ui32)n : 1;
+#endif
+}
+
+
+/*********************************************************************
+ * FUNCTION : thread_global_lock, thread_global_unlock
+ * ABSTRACT : Acquire and release the process wide lock. The lock is
+ *            not recursive.
+ *********************************************************************/
+void thread_global_lock(void)
+{
+#ifdef _WIN32
+   AcquireSRWLockExclusive(&global_lock);
+#else
+   pthread_mutex_lock(&global_lock);
+#endif
+}
+
+
+void thread_global_unlock(void)
+{
+#ifdef _WIN32
+   ReleaseSRWLockExclusive(&global_lock);
+#else
+   pthread_mutex_unlock(&global_lock);
+#endif
+}
+
+
+/*********************************************************************
+ * FUNCTION : run_items
+ * ABSTRACT : Take work items from the pool until there are none left.
+ *********************************************************************/
+static void run_items(TThreadPool* pool)
+{
+   ui32 item;
+
+   for(;;){
+      mutex_lock(&pool->lock);
+      item = pool->next_item++;
+      mutex_unlock(&pool->lock);
+
+      if (item >= pool->no_items) break;
+      pool->func(pool->arg, item);
+   }
+}
+
+
+/*********************************************************************
+ * FUNCTION : worker
+ * ABSTRACT : Main loop of a worker thread.
+ *********************************************************************/
+#ifdef _WIN32
+static DWORD WINAPI worker(LPVOID p)
+#else
+static void* worker(void* p)
+#endif
+{
+   TThreadPool* pool = (TThreadPool*)p;
+   ui32 seen = 0;          /* The pool starts at generation 0. A job may
+                              be posted before the worker gets here.   */
+
+   mutex_lock(&pool->lock);
+   for(;;){
+      while (!pool->quit && pool->generation == seen)
+         cond_wait(&pool->work, &pool->lock);
+      if (pool->quit) break;
+      seen = pool->generation;
+
+      mutex_unlock(&pool->lock);
+      run_items(pool);
+      mutex_lock(&pool->lock);
+
+      if (--pool->no_busy == 0) cond_signal(&pool->done);
+   }
+   mutex_unlock(&pool->lock);
+   return 0;
+}
+
+
+/*********************************************************************
+ * FUNCTION : thread_pool_new
+ * ABSTRACT : Create a pool with 'no_threads' threads. If 'no_threads'
+ *            is 0, then one thread per processor is used.
+ * RETURNS  : Pointer to the pool, or NULL if it cannot be created.
+ *********************************************************************/
+TThreadPool* thread_pool_new(ui32 no_threads)
+{
+   TThreadPool* pool;
+   ui32 i;
+
+   PFUNC
+   if (no_threads == 0) no_threads = thread_pool_cpu_count();
+
+   pool = (TThreadPool*)calloc(1, sizeof(TThreadPool));
+   if (pool == NULL){
+      errprintf("%s", "Cannot allocate memory for the thread pool\n");
+      return NULL;
+   }
+
+   pool->workers = (TThread*)calloc(no_threads, sizeof(TThread));
+   if (pool->workers == NULL){
+      errprintf("%s", "Cannot allocate memory for the worker threads\n");
+      free(pool);
+      return NULL;
+   }
+
+   mutex_init(&pool->lock);
+   mutex_init(&pool->run_lock);
+   cond_init(&pool->work);
+   cond_init(&pool->done);
+
+   pool->no_threads = 1;
+   for (i = 1; i < no_threads; i++){
+#ifdef _WIN32
+      pool->workers[i] = CreateThread(NULL, 0, worker, pool, 0, NULL);
+      if (pool->workers[i] == NULL) break;
+#else
+      if (pthread_create(pool->workers + i, NULL, worker, pool) != 0) break;
+#endif
+      pool->no_threads ++;
+   }
+
+   if (pool->no_threads < no_threads){
+      errprintf("Could start only %d of %d threads\n",
+                pool->no_threads, no_threads);
+   }
+
+   return pool;
+}
+
+
+/*********************************************************************
+ * FUNCTION : thread_pool_del
+ * ABSTRACT : Stop the workers and release the pool.
+ *********************************************************************/
+void thread_pool_del(TThreadPool* pool)
+{
+   ui32 i;
+
+   PFUNC
+   if (pool == NULL) return;
+
+   mutex_lock(&pool->lock);
+   pool->quit = TRUE;
+   cond_broadcast(&pool->work);
+   mutex_unlock(&pool->lock);
+
+   for (i = 1; i < pool->no_threads; i++){
+#ifdef _WIN32
+      WaitForSingleObject(pool->workers[i], INFINITE);
+      CloseHandle(pool->workers[i]);
+#else
+      pthread_join(pool->workers[i], NULL);
+#endif
+   }
+
+   cond_del(&pool->work);
+   cond_del(&pool->done);
+   mutex_del(&pool->run_lock);
+   mutex_del(&pool->lock);
+   free(pool->workers);
+   free(pool);
+}
+
+
+/*********************************************************************
+ * FUNCTION : thread_pool_size
+ * ABSTRACT : Number of threads in the pool. A NULL pool has 1 thread.
+ *********************************************************************/
+ui32 thread_pool_size(TThreadPool* pool)
+{
+   return (pool == NULL) ? 1 : pool->no_threads;
+}
+
+
+/*********************************************************************
+ * FUNCTION : thread_pool_worker
+ * ABSTRACT : Index of the calling thread in the pool, 0 .. size-1. The
+ *            thread calling thread_pool_run() is 0, as is every thread
+ *            that is not a worker of the pool. Lets a job keep scratch
+ *            memory per thread instead of allocating it per work item.
+ *********************************************************************/
+ui32 thread_pool_worker(TThreadPool* pool)
+{
+   ui32 i;
+
+   if (pool == NULL) return 0;
+   for (i = 1; i < pool->no_threads; i++){
+#ifdef _WIN32
+      if (GetThreadId(pool->workers[i]) == GetCurrentThreadId()) return i;
+#else
+      if (pthread_equal(pool->workers[i], pthread_self())) return i;
+#endif
+   }
+   return 0;
+}
+
+
+/*********************************************************************
+ * FUNCTION : thread_pool_run
+ * ABSTRACT : Call func(arg, item) for item = 0 ... no_items-1, and
+ *            wait for all calls to finish. The items are processed in
+ *            arbitrary order, so 'func' must not depend on it.
+ *            If 'pool' is NULL, the items are processed in order by
+ *            the calling thread.
+ *********************************************************************/
+void thread_pool_run(TThreadPool* pool, ui32 no_items,
+                     TParallelFunc func, void* arg)
+{
+   ui32 i;
+
+   if (pool == NULL || pool->no_threads < 2 || no_items < 2){
+      for (i = 0; i < no_items; i++) func(arg, i);
+      return;
+   }
+
+   mutex_lock(&pool->run_lock);
+
+   mutex_lock(&pool->lock);
+   pool->func = func;
+   pool->arg = arg;
+   pool->no_items = no_items;
+   pool->next_item = 0;
+   pool->no_busy = pool->no_threads - 1;
+   pool->generation ++;
+   cond_broadcast(&pool->work);
+   mutex_unlock(&pool->lock);
+
+   run_items(pool);
+
+   mutex_lock(&pool->lock);
+   while (pool->no_busy > 0)
+      cond_wait(&pool->done, &pool->lock);
+   mutex_unlock(&pool->lock);
+
+   mutex_unlock(&pool->run_lock);
+}
@@ -5,10 +5,13 @@
  *********************************************************************/
  
 #include "../h/transducer.h"
+#include "../h/threads.h"
 #include <stdlib.h>
 
 static TTransducer *xdc = NULL;   /* Pointer to the transducer 
-                                   * definitions 
+                                   * definitions. Shared by all
+                                   * contexts and protected by
+                                   * thread_global_lock().
                                    */
 
 
@@ -17,25 +20,54 @@ static TTransducer *xdc = NULL;   /* Pointer to the transducer
  *     of transducer definitions.
  *********************************************************************/
 TTransducer* bft_transducer(ui32 no_elements, TPoint3D *p)
+{
+   return bft_transducer_owned(NULL, no_elements, p);
+}
+
+
+/*********************************************************************
+ *  bft_transducer_owned : Add a new transducer definition, which 
+ *     belongs to 'owner'. It is released by bft_free_owned_xdc(owner).
+ *********************************************************************/
+TTransducer* bft_transducer_owned(void* owner, ui32 no_elements, TPoint3D *p)
 {
    TTransducer *x = NULL;
    ui32 i;
    
-   x = xdc;
-   xdc = (TTransducer *) malloc(sizeof(TTransducer));
-   assert(xdc!=NULL);
-   xdc->next = x;
+   x = (TTransducer *) malloc(sizeof(TTransducer));
+   assert(x!=NULL);
    
-   xdc->no_elements = no_elements;
-   xdc->c = (TPoint3D*)malloc(no_elements * sizeof(TPoint3D));
+   x->no_elements = no_elements;
+   x->version = 0;
+   x->owner = owner;
+   x->c = (TPoint3D*)malloc(no_elements * sizeof(TPoint3D));
    
    for (i = 0; i < no_elements; i++) {
-       xdc->c[i].x = p[i].x;
-       xdc->c[i].y = p[i].y;
-       xdc->c[i].z = p[i].z;
+       x->c[i].x = p[i].x;
+       x->c[i].y = p[i].y;
+       x->c[i].z = p[i].z;
    }
+
+   thread_global_lock();
+   x->next = xdc;
+   xdc = x;
+   thread_global_unlock();
    
-   return xdc;     
+   return x;     
+}
+
+
+/*********************************************************************
+ *  find_xdc : Check if 'x' is in the chain. The caller must hold the
+ *     global lock.
+ *********************************************************************/
+static si32 find_xdc(TTransducer* x)
+{
+  TTransducer *c;
+
+  for (c = xdc; c != NULL; c = c->next)
+     if (c == x) return TRUE;
+  return FALSE;
 }
 
 
@@ -47,28 +79,32 @@ void bft_transducer_set(TTransducer* x, ui32 no_elements, TPoint3D *p)
 {
    
    ui32 i;
-	if (is_xdc_valid(x)){   
+   thread_global_lock();
+	if (find_xdc(x)){   
 		if (x->no_elements == no_elements){
 		   for (i = 0; i < no_elements; i++) {
       		x->c[i].x = p[i].x;
        		x->c[i].y = p[i].y;
 	       	x->c[i].z = p[i].z;
    		}
+   		x->version ++;
 		}
    }
+   thread_global_unlock();
 }
 
 
 /*********************************************************************
- *  bft_free_xdc  - Free a transducer definition. 
+ *  unlink_xdc - Remove 'x' from the chain and free it. The caller must
+ *     hold the global lock.
  *********************************************************************/
-void bft_free_xdc(TTransducer* x)
+static void unlink_xdc(TTransducer* x)
 {
    TTransducer *c, *p=NULL;
    
    if (xdc == NULL) return;
 #ifdef DEBUG
-  printf("Freeing at address %x \n", (ui32)x);
+  printf("Freeing at address %p \n", (void*)x);
 #endif   
    if (x == xdc) {
       xdc = xdc->next;
@@ -86,7 +122,33 @@ void bft_free_xdc(TTransducer* x)
          printf("bft_free_xdc: Cannot find object to free \n");
       }
    }
-  
+}
+
+
+/*********************************************************************
+ *  bft_free_xdc  - Free a transducer definition. 
+ *********************************************************************/
+void bft_free_xdc(TTransducer* x)
+{
+   thread_global_lock();
+   unlink_xdc(x);
+   thread_global_unlock();
+}
+
+
+/*********************************************************************
+ *  bft_free_owned_xdc - Free all transducer definitions of 'owner'
+ *********************************************************************/
+void bft_free_owned_xdc(void* owner)
+{
+  TTransducer *c, *next;
+
+  thread_global_lock();
+  for (c = xdc; c != NULL; c = next){
+     next = c->next;
+     if (c->owner == owner) unlink_xdc(c);
+  }
+  thread_global_unlock();
 }
 
 
@@ -96,7 +158,9 @@ void bft_free_xdc(TTransducer* x)
  
 void bft_free_all_xdc()
 {
-  while(xdc!=NULL) bft_free_xdc(xdc);
+  thread_global_lock();
+  while(xdc!=NULL) unlink_xdc(xdc);
+  thread_global_unlock();
 }
 
 
@@ -108,14 +172,14 @@ void bft_free_all_xdc()
  **********************************************************************/
 si32 is_xdc_valid(TTransducer* x)
 {
-  TTransducer *c;
-
-  if (xdc!= NULL && x!= NULL){
-     c = xdc;
-     while ((c != NULL) && (c!=x)){c = c->next;}
-     if (c == xdc) return TRUE;
-   }
-   return FALSE;
+  si32 found = FALSE;
+
+  if (x != NULL){
+     thread_global_lock();
+     found = find_xdc(x);
+     thread_global_unlock();
+  }
+  return found;
 }
 
 
@@ -128,4 +192,3 @@ void assert_xdc(TTransducer *x)
 {
   if (!is_xdc_valid(x)) abort();
 }
-
@@ -0,0 +1,93 @@
+'''Check the beamforming of an acquisition stored in a file
+(bft_beamform_file). The image must be the one of bft_beamform_sta of the
+same samples in memory, for any size of the chunks. An error of the
+beamforming must reach the caller, and must not be hidden by the closing
+of the memory mapped file.
+
+    python check_beamform_file.py
+'''
+from __future__ import print_function
+
+import os
+import os.path as osp
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, osp.join(osp.dirname(osp.abspath(__file__)), '..', 'pybft'))
+from pybft import BftContext, bft
+
+no_elements = 32
+no_emissions = 6
+no_samples = 1024
+no_lines = 4
+fs = 40e6
+header = 100               # Bytes before the samples
+
+
+def setup():
+    'Make a context with dynamically focused lines'
+    ctx = BftContext()
+    ctx.bft_param('fs', fs)
+    ctx.bft_param('c', 1540.0)
+    xdc = ctx.bft_linear_array(no_elements, 0.2e-3)
+    ctx.bft_no_lines(no_lines)
+    for l in range(no_lines):
+        ctx.bft_center_focus([(l - no_lines / 2.0) * 0.3e-3, 0, 0], l)
+        ctx.bft_dynamic_focus(xdc, 0, 0, l)
+    return ctx
+
+
+def check_chunks(ctx, path, data, elem):
+    'Beamform the file in chunks of several sizes'
+    shape = data.shape
+    ref = ctx.bft_beamform_sta(data, 1e-6, elem=elem)
+    emission_bytes = no_elements * no_samples * data.itemsize
+    ok = True
+    for chunk_size in [1 << 28, 4 * emission_bytes, 1]:
+        img = ctx.bft_beamform_file(path, shape, 1e-6, offset=header,
+                                    elem=elem, chunk_size=chunk_size)
+        err = np.abs(img - ref).max() / np.abs(ref).max()
+        print('chunks of {0:9d} bytes: relative difference {1:.2e}'.format(
+            chunk_size, err))
+        ok = ok and err < 1e-12
+    return ok
+
+
+def check_error(ctx, path, data):
+    'A transmit element, which does not exist, for the last emission'
+    elem = list(range(no_emissions - 1)) + [10 * no_elements]
+    ok = True
+    for chunk_size in [1 << 28, 1]:
+        try:
+            ctx.bft_beamform_file(path, data.shape, 1e-6, offset=header,
+                                  elem=elem, chunk_size=chunk_size)
+            error = None
+        except Exception as e:
+            error = type(e).__name__
+        print('bad element, chunks of {0:9d} bytes: {1}'.format(
+            chunk_size, error))
+        ok = ok and error == 'RuntimeError'
+    return ok
+
+
+if __name__ == '__main__':
+    bft.bft_init(True)
+    rng = np.random.RandomState(0)
+    data = (rng.randn(no_emissions, no_elements, no_samples)
+            * 1000).astype(np.int16)
+    (fd, path) = tempfile.mkstemp(suffix='.bin')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(b'\0' * header)
+        data.tofile(f)
+
+    ctx = setup()
+    try:
+        ok = check_chunks(ctx, path, data, np.arange(no_emissions) * 5)
+        ok = check_error(ctx, path, data) and ok
+    finally:
+        ctx.free()
+        os.remove(path)
+
+    sys.exit(0 if ok else 1)
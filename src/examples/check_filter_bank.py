@@ -0,0 +1,113 @@
+'''Check that a filter bank delays the samples as the linear interpolation
+does, in the delay of lines (bft_delay_lines) and in the beamforming
+(bft_interpolation('filterbank')).
+
+The bank is made of windowed sinc filters, filter f delaying a signal by
+Ntaps/2 - 1 + (f + 0.5)/Nf samples, as bft_set_filter_bank expects. The
+delayed lines are compared with the band limited signal delayed
+analytically, and the beamformed lines with the ones beamformed with
+linear interpolation of a signal sampled densely enough for it.
+
+    python check_filter_bank.py
+'''
+from __future__ import print_function
+
+import os.path as osp
+import sys
+
+import numpy as np
+
+sys.path.insert(0, osp.join(osp.dirname(osp.abspath(__file__)), '..', 'pybft'))
+from pybft import BftContext, bft
+
+fs = 40e6
+no_samples = 1024
+no_taps = 16
+no_filters = 64
+
+
+def sinc_bank(no_filters, no_taps):
+    'Windowed sinc filters, applied as convolutions'
+    k = np.arange(no_taps)
+    return np.array([np.sinc(k - (no_taps // 2 - 1 + (f + 0.5) / no_filters))
+                     * np.kaiser(no_taps, 6) for f in range(no_filters)])
+
+
+def pulse(t, t0, f0):
+    'Gaussian pulse with center frequency f0, centered at t0'
+    return (np.exp(-((t - t0) * f0 / 1.5) ** 2)
+            * np.cos(2 * np.pi * f0 * (t - t0)))
+
+
+def check_delay_lines(ctx):
+    'Delay a pulse by several delays, and compare with the delayed pulse'
+    t = np.arange(no_samples) / fs
+    t0 = 10e-6
+    src = pulse(t, t0, 4e6)[None, :]
+    ok = True
+    for d in [0.0, 0.37, 3.62, -2.25, 10.9]:
+        out = ctx.bft_delay_lines(src, [0], [d / fs], 0, 0,
+                                  interp='filterbank')[0]
+        err = np.abs(out - pulse(t, t0 + d / fs, 4e6)).max()
+        print('delay lines, {0:6.2f} samples: error {1:.4f}'.format(d, err))
+        ok = ok and err < 0.02
+    return ok
+
+
+def check_beamform(ctx):
+    'Beamform with the filter bank and with linear interpolation'
+    no_elements = 32
+    t = np.arange(no_samples) / fs
+    xdc = ctx.bft_linear_array(no_elements, 0.3e-3)
+    ctx.bft_no_lines(3)
+    for l in range(3):
+        ctx.bft_center_focus([(l - 1) * 1e-3, 0, 0], l)
+        ctx.bft_dynamic_focus(xdc, 0.1 * (l - 1), 0, l)
+        ctx.bft_apodization(xdc, 0, np.ones(no_elements), l)
+    ctx.bft_set_filter_bank(sinc_bank(no_filters, no_taps))
+
+    # A point scatterer at 15 mm, sampled 40 times per period
+    (x, z) = (0.0, 15e-3)
+    xe = (np.arange(no_elements) - (no_elements - 1) / 2.0) * 0.3e-3
+    tof = (z + np.sqrt((xe - x) ** 2 + z ** 2)) / 1540.0
+    data = np.array([pulse(t, ti, 1e6) for ti in tof])
+
+    ctx.bft_interpolation('linear')
+    linear = ctx.bft_beamform(data, 0)
+    # The mode of one call does not change the mode of the context
+    same = np.array_equal(ctx.bft_beamform(data, 0, interp='filterbank'),
+                          ctx.bft_beamform_frames(data[None], 0,
+                                                  interp='filterbank')[0])
+    same = same and np.array_equal(ctx.bft_beamform(data, 0), linear)
+    ctx.bft_interpolation('filterbank')
+    bank = ctx.bft_beamform(data, 0)
+    same = same and np.array_equal(ctx.bft_beamform(data, 0, interp='linear'),
+                                   linear)
+    err = np.abs(bank - linear).max() / np.abs(linear).max()
+    print('beamforming: relative difference {0:.4f}, per call {1}'.format(
+        err, 'same' if same else 'DIFFERENT'))
+
+    # The pixel grid interpolates linearly only
+    try:
+        ctx.bft_beamform_grid(xdc, data, 0, [0.0], [z])
+        refused = False
+    except RuntimeError:
+        refused = True
+    print('pixel grid with the filter bank: {0}'.format(
+        'refused' if refused else 'NOT REFUSED'))
+    ctx.bft_interpolation('linear')
+    return err < 0.01 and same and refused
+
+
+if __name__ == '__main__':
+    bft.bft_init(True)
+    ctx = BftContext()
+    ctx.bft_param('fs', fs)
+    ctx.bft_param('c', 1540.0)
+    ctx.bft_set_filter_bank(sinc_bank(no_filters, no_taps))
+
+    ok = check_delay_lines(ctx)
+    ok = check_beamform(ctx) and ok
+    ctx.free()
+
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,157 @@
+'''Check that the beamforming gives the same results at every level of
+vector instructions (bft_simd). The lines with focal zones ("times"),
+dynamically focused lines, pixel based focusing, the pixel grid, the
+beamforming plans and the delay of lines must be bit exact with the
+scalar code. The plans must also agree with bft_beamform up to the
+rounding of their float weights. Levels that the
+processor does not support are lowered by bft_simd, and are checked as
+the level they are lowered to.
+
+    python check_simd.py
+'''
+from __future__ import print_function
+
+import os.path as osp
+import sys
+
+import numpy as np
+
+sys.path.insert(0, osp.join(osp.dirname(osp.abspath(__file__)), '..', 'pybft'))
+from pybft import BftContext, bft
+
+no_elements = 61           # Not a multiple of the vector width
+no_lines = 16
+no_samples = 2048
+fs = 40e6
+c = 1540.0
+pitch = 0.2e-3
+start_time = 2e-6
+no_pixels = 400            # Pixels per line of the pixel based focusing
+
+
+def setup(kind):
+    'Make a context with the lines for one type of focusing'
+    ctx = BftContext()
+    ctx.bft_param('fs', fs)
+    ctx.bft_param('c', c)
+    xdc = ctx.bft_linear_array(no_elements, pitch)
+    ctx.bft_no_lines(no_lines)
+
+    apo = np.hamming(no_elements)
+    sparse = apo.copy()
+    sparse[::3] = 0
+    for l in range(no_lines):
+        x = (l - no_lines / 2.0) * 0.4e-3
+        ctx.bft_center_focus([x, 0, 0], l)
+        if kind == 'times':
+            ctx.bft_focus(xdc, [0, 10e-6, 30e-6],
+                          [[x, 0, 0.01], [x, 0, 0.02], [x, 0, 0.04]], l)
+        elif kind == 'dynamic':
+            ctx.bft_dynamic_focus(xdc, 0.01 * l, 0.0, l)
+        else:
+            z = np.linspace(5e-3, 40e-3, no_pixels)
+            ctx.bft_focus_pixel(xdc, np.c_[np.full(z.size, x),
+                                           np.zeros(z.size), z], l)
+        if (kind == 'times' and l % 2 == 0) or kind == 'dynamic':
+            ctx.bft_apodization(xdc, [0, 20e-6], np.vstack([apo, sparse]), l)
+    return (ctx, xdc)
+
+
+def run_lines(kind, data):
+    'Beamform all variants of the lines of one type of focusing'
+    results = []
+    for level in range(4):
+        (ctx, xdc) = setup(kind)
+        bft.bft_simd(level)
+        results.append([ctx.bft_beamform(data, start_time),
+                        ctx.bft_beamform(data, start_time, elem=7),
+                        ctx.bft_beamform(data, start_time, xmt=[0, 0, 0])])
+        ctx.free()
+    return results
+
+
+def run_grid(data):
+    'Beamform a pixel grid'
+    x = np.linspace(-5e-3, 5e-3, 37)
+    z = np.linspace(1e-3, 40e-3, 203)
+    results = []
+    for level in range(4):
+        (ctx, xdc) = setup('times')
+        bft.bft_simd(level)
+        results.append([ctx.bft_beamform_grid(xdc, data, start_time, x, z),
+                        ctx.bft_beamform_grid(xdc, data, start_time, x, z,
+                                              apo=np.hamming(no_elements),
+                                              elem=5)])
+        ctx.free()
+    return results
+
+
+def run_plan(data):
+    'Execute the plans of all types of focusing'
+    results = []
+    close = True
+    for level in range(4):
+        lines = []
+        for kind in ['times', 'dynamic', 'pixel']:
+            (ctx, xdc) = setup(kind)
+            bft.bft_simd(level)
+            plan = ctx.bft_plan(no_samples, no_elements, start_time, elem=7)
+            lines.append(plan.execute(data))
+            ref = ctx.bft_beamform(data, start_time, elem=7)
+            close = close and np.allclose(lines[-1], ref, rtol=0,
+                                          atol=1e-6 * np.abs(ref).max())
+            ctx.free()
+        results.append(lines)
+    print('plan     close to bft_beamform: {0}'.format(close))
+    return (results, close)
+
+
+def run_delay(lines):
+    'Delay lines with linear interpolation and with a filter bank'
+    times = [0, 20e-6]
+    delays = np.outer(np.linspace(-0.3e-6, 0.3e-6, lines.shape[0]), [1, 2])
+    taps = 8
+    phase = 4
+    k = np.arange(taps)
+    bank = np.array([np.sinc(k - (taps // 2 - 1 + (f + 0.5) / phase))
+                     for f in range(phase)])
+    results = []
+    for level in range(4):
+        (ctx, xdc) = setup('times')
+        ctx.bft_set_filter_bank(bank)
+        bft.bft_simd(level)
+        results.append([ctx.bft_delay_lines(lines, times, delays, start_time,
+                                            start_time),
+                        ctx.bft_delay_lines(lines, times, delays, start_time,
+                                            start_time, interp='filterbank')])
+        ctx.free()
+    return results
+
+
+def compare(name, results):
+    'Compare the results of all levels with the scalar code'
+    ok = True
+    for level in range(1, len(results)):
+        same = all(np.array_equal(a, b)
+                   for (a, b) in zip(results[level], results[0]))
+        print('{0:8s} level {1}: {2}'.format(name, level,
+                                             'same' if same else 'DIFFERENT'))
+        ok = ok and same
+    return ok
+
+
+if __name__ == '__main__':
+    bft.bft_init(True)
+    rng = np.random.RandomState(0)
+    data = rng.randn(no_elements, no_samples)
+
+    ok = compare('times', run_lines('times', data))
+    ok = compare('dynamic', run_lines('dynamic', data)) and ok
+    ok = compare('pixel', run_lines('pixel', data)) and ok
+    ok = compare('grid', run_grid(data)) and ok
+    (results, close) = run_plan(data)
+    ok = compare('plan', results) and close and ok
+    ok = compare('delay', run_delay(rng.randn(no_lines, no_samples))) and ok
+    bft.bft_end()
+
+    sys.exit(0 if ok else 1)
@@ -7,6 +7,7 @@
 #include "types.h"
 #include "focus.h"
 #include "geometry.h"
+#include "threads.h"
 #include <stdio.h>
 
 #ifdef _MSC_VER
@@ -15,31 +16,83 @@
  #include <malloc/malloc.h>
 #endif
 
+/*
+ *   Types of the RF samples passed to beamform_image_typed()
+ */
+#define BFT_FLOAT64     0
+#define BFT_FLOAT32     1
+#define BFT_INT16       2
+
+/*
+ *   Precision in which the delayed samples are summed
+ */
+#define BFT_ACC_DOUBLE  0
+#define BFT_ACC_FLOAT   1
+#define BFT_ACC_FIXED   2
+
 #ifdef __cplusplus
   extern"C"{
 #endif
 
 double* beamform_apo_line_dynamic(TFocusTimeLine *ftl, TApoTimeLine* atl,
-        TSysParams* sys, double time,  double **rf_data, ui32 no_samples);
+        TSysParams* sys, double time,  double **rf_data, ui32 no_samples,
+        ui32 out_start, ui32 out_count, TFilterBank *fb,
+        TDelayScratch *scratch, double *bf_line);
 
 double** beamform_image(TFocusLineCollection *flc, TApoLineCollection* alc,
    TSysParams* sys, double time, double **rf_data, ui32 no_samples, ui32 element_no, TPoint3D* xmt);
 
+double** beamform_image_mt(TThreadPool *pool, TFocusLineCollection *flc,
+   TApoLineCollection* alc, TSysParams* sys, double time, double **rf_data,
+   ui32 no_samples, ui32 element_no, TPoint3D* xmt);
+
+double** beamform_image_into(TThreadPool *pool, TFocusLineCollection *flc,
+   TApoLineCollection* alc, TSysParams* sys, double time, double **rf_data,
+   ui32 no_samples, ui32 element_no, TPoint3D* xmt, double **bf_lines);
+
+double** beamform_image_typed(TThreadPool *pool, TFocusLineCollection *flc,
+   TApoLineCollection* alc, TSysParams* sys, double time, void **rf_data,
+   ui32 sample_type, ui32 acc_type, ui32 no_samples, ui32 element_no,
+   TPoint3D* xmt, double **bf_lines);
+
+double** beamform_frames_typed(TThreadPool *pool, TFocusLineCollection *flc,
+   TApoLineCollection* alc, TSysParams* sys, double *times, void **rf_data,
+   ui32 sample_type, ui32 acc_type, ui32 no_frames, ui32 no_samples,
+   ui32 no_elements, ui32 element_no, TPoint3D* xmt, ui32 out_start,
+   ui32 out_count, double **bf_lines);
+
+double** beamform_speeds_typed(TThreadPool *pool, TFocusLineCollection *flc,
+   TApoLineCollection* alc, TSysParams* sys, double *c_values, ui32 no_c,
+   double time, void **rf_data, ui32 sample_type, ui32 acc_type,
+   ui32 no_samples, ui32 element_no, TPoint3D* xmt, ui32 out_start,
+   ui32 out_count, double **bf_lines);
+
+double** beamform_sta_typed(TThreadPool *pool, TFocusLineCollection *flc,
+   TApoLineCollection* alc, TApoLineCollection* salc, TSysParams* sys,
+   double time, void **rf_data, ui32 sample_type, ui32 acc_type,
+   ui32 no_emissions, ui32 no_samples, ui32 no_elements, ui32 *elements,
+   TTransmit* tx, double **hi_res);
+
 double* beamform_apo_line_times(TFocusTimeLine *ftl, TApoTimeLine* atl,
                             TSysParams* sys, double time, 
-                            double **rf_data, ui32 no_samples);
+                            double **rf_data, ui32 no_samples,
+                            ui32 out_start, ui32 out_count, TFilterBank *fb,
+        TDelayScratch *scratch, double *bf_line);
 
 double** apodize_fix(TApoTimeLine *atl, double **rf_data,
                                      ui32 no_samples, ui32 no_channels);
 
 double* beamform_line_times(TFocusTimeLine *ftl, TSysParams* sys,
-                        double time, double **rf_data, ui32 no_samples);
+                        double time, double **rf_data, ui32 no_samples,
+                        ui32 out_start, ui32 out_count, TFilterBank *fb,
+        TDelayScratch *scratch, double *bf_line);
                                      
 
 double* sum_lines_time(TFocusTimeLine *ftl, TApoTimeLine* atl, TSysParams* sys, 
                       double* rf_line1, ui32 element1, 
                       double* rf_line2, ui32 element2,
-                      double time,      ui32 no_samples);
+                      double time,      ui32 no_samples,
+                      double* sum_line);
 
 double **sum_images(TFocusLineCollection *flc, TApoLineCollection *alc,
                     TSysParams* sys,
@@ -47,6 +100,20 @@ double **sum_images(TFocusLineCollection *flc, TApoLineCollection *alc,
                     double **rf2, ui32 element2, 
                     double time, ui32 no_samples);
 
+double **sum_images_into(TFocusLineCollection *flc, TApoLineCollection *alc,
+                    TSysParams* sys,
+                    double **rf1, ui32 element1,
+                    double **rf2, ui32 element2, 
+                    double time, ui32 no_samples, double **sum_lines);
+
+void add_apo_lines_time(TFocusTimeLine *ftl, TApoTimeLine* atl,
+                    TSysParams* sys, double* hi_res, double* lo_res,
+                    ui32 element, double time, ui32 no_samples);
+
+void add_lines_time(TFocusTimeLine *ftl, TSysParams* sys,
+                    double* hi_res, double* lo_res, ui32 element,
+                    double time, ui32 no_samples);
+
 void add_images(TFocusLineCollection *flc, TApoLineCollection *alc,
                     TSysParams* sys, double **hi_res,
                     double **lo_res, ui32 element, 
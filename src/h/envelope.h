@@ -0,0 +1,47 @@
+#ifndef __envelope_h
+  #define __envelope_h
+/**********************************************************************
+ * NAME     : envelope.h
+ * ABSTRACT : Envelope detection and log compression of beamformed
+ *            lines, which turn the lines into a B-mode image ready to
+ *            be displayed. The envelope of RF lines is found with an
+ *            FIR Hilbert filter, and the envelope of IQ lines is their
+ *            magnitude. The lines are processed in place, one line per
+ *            work item of the thread pool.
+ **********************************************************************/
+#include "types.h"
+#include "threads.h"
+
+
+/*
+ *   Type of the display samples. The log compressed envelope is
+ *   stored either in dB as BFT_FLOAT32 (beamform.h), or scaled to
+ *   0 .. 255 as BFT_UINT8.
+ */
+#define BFT_UINT8  5
+
+
+/*
+ *   Settings of the envelope detection and the log compression
+ */
+typedef struct{
+   ui32 iq;                  /* The lines are IQ (I and Q interleaved) */
+   ui32 no_taps;             /* Taps of the Hilbert filter, odd        */
+   double dynamic_range;     /* Shown range in dB, below the reference */
+   double reference;         /* Envelope at 0 dB. 0 - the frame maximum */
+}TEnvelope;
+
+
+#ifdef __cplusplus
+  extern"C"{
+#endif
+
+ui32 envelope_lines(TThreadPool *pool, TEnvelope *env, double **lines,
+                    ui32 no_lines, ui32 no_samples, void *out,
+                    ui32 out_type);
+
+#ifdef __cplusplus
+  };
+#endif
+
+#endif
@@ -9,25 +9,41 @@
  *********************************************************************/
 
 #include "transducer.h" 
+#include "geometry.h"
 #include "sys_params.h"
+#include "threads.h"
 
 
 #define MAX_SAMPLE_NO   65365
 
+/*
+ *  Largest delay of a focal zone, in samples. The integer part of a 
+ *  delay is stored in 16 bits.
+ */
+#define MAX_DELAY       32767
+
 /*
  *  Definition of focus delay
  */
  
 typedef struct delay{
    double time;      /* Time after which the delay is valid          */
-   si32 *d;          /* The delay. One delay per channel             */
-   double *a;        /* Weighting coefficient for linear interpolation */
+   si16 *d;          /* The delay. One delay per channel             */
+   float *a;         /* Weighting coefficient for linear interpolation */
 }TDelay;
 
 
 
 /*
- *    Definition of filter bank
+ *    Definition of filter bank. Filter bank[f] is applied as a 
+ *    convolution, y[m] = bank[f][0]*x[m] + ... + bank[f][Ntaps-1]*x[m-Ntaps+1],
+ *    and delays a signal by Ntaps/2 - 1 + (f + 0.5)/Nf samples (Ntaps/2
+ *    rounded down), i.e. it interpolates the fractional delays 
+ *    f/Nf .. (f+1)/Nf. The sample at the fractional index n - mu is
+ *    therefore interpolated from the samples n - Ntaps/2 .. 
+ *    n - Ntaps/2 + Ntaps - 1, with the filter f = mu*Nf. The beamforming
+ *    (filter_sample() in beamform_lines.inc) and the delay of lines
+ *    (motion.c) use the filters in this way.
  */
 typedef struct filter_bank{
   double *  coefs;         /* Coefficients */
@@ -37,18 +53,66 @@ typedef struct filter_bank{
 }TFilterBank;
 
 
+/*
+ *   Interpolation between the samples used by the beamforming
+ */
+#define BFT_INTERP_LINEAR       0    /* Between two samples            */
+#define BFT_INTERP_FILTER_BANK  1    /* With the filter bank           */
+#define BFT_INTERP_CONTEXT      2    /* As set by bft_interpolation(),
+                                        for the calls that take a mode */
+
+
 
 /*
  *   Definition of apodization
  */
 typedef struct apodization{
   double time;      /* Time after which the associated apodization is valid */
-  double* a;        /* Apodization coefficient. One per channel             */
+  float* a;         /* Apodization coefficient. One per channel             */
+  ui32 no_active;   /* Number of channels with non-zero apodization         */
+  ui32* active;     /* Indices of these channels, in increasing order       */
 } TApodization;
 
 
 
 
+/*
+ *   Receive delays of a dynamically focused line, one entry per output
+ *   sample and channel (index [os*no_elements + ic]), in samples. The
+ *   delay of the transmit is added per output sample by
+ *   dynamic_shift(), so the same table serves the lines beamformed
+ *   with and without a transmitted wave. The table is calculated the
+ *   first time the line is beamformed, and is reused as long as the
+ *   parameters it was calculated for do not change.
+ */
+typedef struct dynamic_table{
+   ui32 valid;             /* Whether the table has been calculated      */
+   ui32 no_samples;        /* Number of input samples                    */
+   ui32 xdc_version;       /* Version of the transducer geometry         */
+   ui32 no_elements;       /* Number of elements                         */
+   double c;               /* Speed of sound                             */
+   double fs;              /* Sampling frequency                         */
+   double time;            /* Time of the first sample                   */
+   TPoint3D *point;        /* Focal point of every output sample         */
+   ui32 *index;            /* Integer part of the receive delay          */
+   float *frac;            /* Fractional part of the receive delay       */
+}TDynamicTable;
+
+
+/*
+ *   Room for the delays of one output sample of a dynamically focused
+ *   line, see dynamic_delays(), and for the coefficients of the focal
+ *   and apodization zone of a line, converted to fixed point by the
+ *   kernels with an integer accumulator. The beamforming keeps one per
+ *   thread, see new_delay_scratch().
+ */
+typedef struct delay_scratch{
+   ui32 *index;            /* Index of the first interpolated sample     */
+   double *frac;           /* Coefficient for linear interpolation       */
+   si32 *weights;          /* Fixed point coefficients, then apodization */
+}TDelayScratch;
+
+
 /*
  *   Focus time-line - collection of delays. 
  *   If the line is to be dynamically focused, then the delays are neglected,
@@ -67,6 +131,10 @@ typedef struct focus_time_line{
    double dir_yz;          /* Direction in YZ                               */
    TTransducer* xdc;       /* Used in the dynamic focusing                  */
    TDelay *delay;          /* Array of delays. One entry per focal zone     */
+   TPoint3D *focus;        /* Focal point of every zone, if the delays are
+                              set by set_focus() or set_focus_2way()        */
+   ui32 two_way;           /* Whether they are set by set_focus_2way()      */
+   TDynamicTable dyn;      /* Cached receive delays of the dynamic focusing */
 }TFocusTimeLine;
 
 
@@ -79,6 +147,7 @@ typedef struct{
    ui32 use_filter_bank;   /* Whether to use filter bank for delays calculation */
    TFocusTimeLine* ftl;
    TFilterBank filter_bank;  /* Filter bank, used to calculate the delays  */
+   ui32 interpolation;     /* BFT_INTERP_LINEAR or BFT_INTERP_FILTER_BANK   */
 }TFocusLineCollection;
 
 
@@ -118,6 +187,30 @@ typedef struct{
 
 void del_focus_time_line(TFocusTimeLine* p);
 
+void del_dynamic_table(TDynamicTable* t);
+
+void dynamic_path_terms(TFocusTimeLine *ftl, double *terms);
+
+TDynamicTable* dynamic_speed_table(TFocusTimeLine *ftl, TSysParams* sys,
+                     double time, ui32 no_samples, double *terms);
+
+TDynamicTable* dynamic_table(TFocusTimeLine *ftl, TSysParams* sys,
+                     double time, ui32 no_samples);
+
+TDelayScratch* new_delay_scratch(TFocusLineCollection *flc, ui32 no_threads);
+
+void del_delay_scratch(TDelayScratch *scratch);
+
+double dynamic_shift(TFocusTimeLine *ftl, ui32 os, TTransmit *tx,
+                     ui32 *base);
+
+void dynamic_delays(TFocusTimeLine *ftl, ui32 os, TTransmit *tx,
+                    ui32 *index, double *frac);
+
+ui32 find_delay(TFocusTimeLine *ftl, double sample);
+
+ui32 find_apodization(TApoTimeLine *atl, double sample);
+
 TFocusLineCollection* new_focus_line_collection(void);
 
 void del_focus_line_collection(TFocusLineCollection* f);
@@ -131,18 +224,23 @@ void set_center_focus(TFocusLineCollection *flc, TPoint3D *p, ui32 line_no);
 void set_dynamic_focus(TFocusLineCollection *flc, TTransducer* xdc,
                              ui32 line_no, double dir_xz, double dir_yz);
 
-void set_focus_times(TFocusLineCollection *flc, TSysParams* sys, 
+ui32 set_focus_times(TFocusLineCollection *flc, TSysParams* sys, 
                      TTransducer* xdc, double* times, double *delays, 
                      ui32 no_times,  ui32 line_no);
 
-void set_focus(TFocusLineCollection *flc, TSysParams* sys, 
+ui32 set_focus(TFocusLineCollection *flc, TSysParams* sys, 
                      TTransducer* xdc, double* times, TPoint3D *points, 
                      ui32 no_times,  ui32 line_no);
 
-void set_focus_2way(TFocusLineCollection *flc, TSysParams* sys, 
+ui32 set_focus_2way(TFocusLineCollection *flc, TSysParams* sys, 
                      TTransducer* xdc, double* times, TPoint3D *points, 
                      ui32 no_times,  ui32 line_no);
 
+void focus_path_lengths(TFocusTimeLine *ftl, TSysParams* sys, double *paths);
+
+TDelay* focus_speed_delays(TFocusTimeLine *ftl, TSysParams* sys,
+                           double *paths);
+
 void set_focus_pixel(TFocusLineCollection *flc, TSysParams* sys, 
                       TTransducer* xdc, TPoint3D *points, 
                       ui32 no_points,  ui32 line_no);
@@ -154,6 +252,15 @@ void set_apodization(TApoLineCollection *alc, TSysParams* sys,
 
 
 
+ui32 set_focus_lines(TThreadPool *pool, TFocusLineCollection *flc, 
+                     TSysParams* sys, TTransducer* xdc, TPoint3D *centers,
+                     double* times, TPoint3D *points, ui32 no_times,
+                     ui32 no_lines);
+
+ui32 set_apodization_lines(TThreadPool *pool, TApoLineCollection *alc,
+                     TSysParams* sys, TTransducer* xdc, double* times,
+                     double *apo, ui32 no_times, ui32 no_lines);
+
 void set_filter_bank( TFocusLineCollection *flc, ui32 Nf, ui32 Ntaps, 
                                                          double *coef);
                      
@@ -1,4 +1,5 @@
 #ifndef __geometry_h
+  #define __geometry_h
 /*********************************************************************
  * NAME     : geometry.h
  * ABSTRACT : Geometrical functions and primitives definitions
@@ -8,12 +9,34 @@
 #include "types.h"
 #include <math.h>
 
+
+/*
+ *   Transmitted waves. The transmit distance of a point is the path
+ *   the wave has travelled, when it reaches the point. Plane and 
+ *   diverging waves start at time 0, when they pass the origin.
+ */
+#define BFT_TX_POINT       0  /* Spherical wave from 'point'            */
+#define BFT_TX_PLANE       1  /* Plane wave, steered by 'angle'         */
+#define BFT_TX_DIVERGING   2  /* Spherical wave from the virtual source
+                                 'point' behind the transducer          */
+
+typedef struct transmit{
+   ui32 type;              /* One of BFT_TX_xxx                         */
+   double angle;           /* Steering angle in the x-z plane [rad]     */
+   TPoint3D point;         /* Source of a spherical wave                */
+}TTransmit;
+
+
 #ifdef __cplusplus
   extern"C"{
 #endif
 
 double distance( TPoint3D *p1, TPoint3D *p2);
 
+double transmit_distance(TTransmit *tx, TPoint3D *p);
+
+TTransmit* transmit_waves(double *angles, ui32 no_angles, double source);
+
 #ifdef __cplusplus
   };
 #endif
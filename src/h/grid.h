@@ -0,0 +1,49 @@
+#ifndef __grid_h
+  #define __grid_h
+/**********************************************************************
+ * NAME     : grid.h
+ * ABSTRACT : Pixel based beamforming of a whole rectilinear grid in
+ *            one call. The grid is given by the coordinates of its
+ *            lines along x, y and z, and the image is beamformed one
+ *            column (fixed x and y) at a time.
+ **********************************************************************/
+#include "types.h"
+#include "geometry.h"
+#include "transducer.h"
+#include "sys_params.h"
+#include "threads.h"
+
+
+/*
+ *  Pixel (ix, iy, iz) is at (x[ix], y[iy], z[iz]), and its value is
+ *  stored in out[(iy*nx + ix)*nz + iz].
+ */
+typedef struct pixel_grid{
+   ui32 nx;                /* Number of grid lines along x              */
+   ui32 ny;                /* Number of grid lines along y              */
+   ui32 nz;                /* Number of grid lines along z              */
+   double *x;              /* Coordinates of the grid lines along x     */
+   double *y;              /* Coordinates of the grid lines along y     */
+   double *z;              /* Coordinates of the grid lines along z     */
+}TPixelGrid;
+
+
+#ifdef __cplusplus
+  extern"C"{
+#endif
+
+double* beamform_grid(TThreadPool *pool, TPixelGrid *grid,
+        TTransducer *xdc, TSysParams *sys, double time, void **rf_data,
+        ui32 sample_type, ui32 no_samples, double *apo, ui32 element_no,
+        TPoint3D *xmt, double *out);
+
+double* beamform_grid_waves(TThreadPool *pool, TPixelGrid *grid,
+        TTransducer *xdc, TSysParams *sys, double time, void **rf_data,
+        ui32 sample_type, ui32 no_samples, double *apo, TTransmit *tx,
+        ui32 no_tx, double *out);
+
+#ifdef __cplusplus
+  };
+#endif
+
+#endif
@@ -40,6 +40,10 @@ BFT_API void bft_end(void);
 
 BFT_API double bft_param(char* id, double val);
 
+BFT_API ui32 bft_threads(ui32 no_threads);
+
+BFT_API ui32 bft_interpolation(ui32 mode);
+
 BFT_API ui32 bft_no_lines(ui32 no_lines);
 
 BFT_API void* bft_xdc(double* centers, ui32 nelem);
@@ -48,16 +52,16 @@ BFT_API void bft_xdc_free(void* xdc);
 
 BFT_API void bft_center_focus(double* point, ui32 line_no);
 
-BFT_API void bft_focus(void* xdc, double* times, double* focus, 
+BFT_API ui32 bft_focus(void* xdc, double* times, double* focus, 
     ui32 no_times, ui32 line_no);
 
 BFT_API void bft_focus_pixel(void* xdc, double* points,
     ui32 no_points, ui32 line_no);
 
-BFT_API void bft_focus_2way(void* xdc, double* times, double* delays, 
+BFT_API ui32 bft_focus_2way(void* xdc, double* times, double* delays, 
     ui32 no_times, ui32 line_no);
 
-BFT_API void bft_focus_times(void* xdc, double* times, double* delays,
+BFT_API ui32 bft_focus_times(void* xdc, double* times, double* delays,
     ui32 no_times, ui32 line_no);
 
 BFT_API void bft_apodization(void* xdc, double* times, double* apodization,
@@ -68,6 +72,22 @@ BFT_API void bft_sum_apodization(void* xdc, double* times, double* apodization,
 
 BFT_API void bft_dynamic_focus(void* xdc, ui32 line_no, double dir_xz, double dir_yz);
 
+BFT_API ui32 bft_focus_lines(void* xdc, double* centers, double* times,
+    double* focus, ui32 no_times, ui32 no_lines);
+
+BFT_API ui32 bft_apodization_lines(void* xdc, double* times,
+    double* apodization, ui32 no_times, ui32 no_lines);
+
+BFT_API ui32 bft_sum_apodization_lines(void* xdc, double* times,
+    double* apodization, ui32 no_times, ui32 no_lines);
+
+BFT_API ui32 bft_dynamic_focus_lines(void* xdc, double* centers,
+    double* dir_xz, double* dir_yz, ui32 no_lines);
+
+BFT_API ui32 bft_scan_phased(void* xdc, double sector, ui32 no_lines,
+    double depth, ui32 no_focal_zones, double* apo_times,
+    double* apodization, ui32 no_apo_times);
+
 /*
 BFT_API double* bft_beamform(double* data, double Time, ui32 no_samples,
     ui32 no_elements, ui32 element_no, double* xmt);
@@ -76,9 +96,90 @@ BFT_API double* bft_beamform(double* data, double Time, ui32 no_samples,
 BFT_API double* bft_beamform(ui32* no_lines, ui32 *no_out_samples, double* data,
     double Time, ui32 no_samples, ui32 no_elements, ui32 element_no, double* xmt);
 
+BFT_API void bft_beamform_size(ui32* no_lines, ui32 *no_out_samples, ui32 no_samples);
+
+BFT_API ui32 bft_beamform_out(double* out, ui32 no_lines, ui32 no_out_samples,
+    double* data, double Time, ui32 no_samples, ui32 no_elements,
+    ui32 element_no, double* xmt);
+
+BFT_API ui32 bft_beamform_typed(double* out, ui32 no_lines, ui32 no_out_samples,
+    void* data, ui32 data_type, ui32 acc_type, double Time, ui32 no_samples,
+    ui32 no_elements, ui32 element_no, double* xmt);
+
+BFT_API ui32 bft_beamform_frames(double* out, ui32 no_frames, ui32 no_lines,
+    ui32 no_out_samples, void* data, ui32 data_type, ui32 acc_type,
+    double* times, ui32 no_samples, ui32 no_elements, ui32 element_no,
+    double* xmt);
+
+BFT_API ui32 bft_beamform_window(double* out, ui32 no_frames, ui32 no_lines,
+    ui32 out_start, ui32 out_count, void* data, ui32 data_type,
+    ui32 acc_type, ui32 interp, double* times, ui32 no_samples,
+    ui32 no_elements, ui32 element_no, double* xmt);
+
+BFT_API ui32 bft_beamform_speeds(double* out, ui32 no_c, double* c_values,
+    ui32 no_lines, ui32 out_start, ui32 out_count, void* data,
+    ui32 data_type, ui32 acc_type, ui32 interp, double Time,
+    ui32 no_samples, ui32 no_elements, ui32 element_no, double* xmt);
+
+BFT_API ui32 bft_beamform_iq(double* out, ui32 no_lines, void* data,
+    ui32 data_type, double Time, ui32 no_samples, ui32 no_elements,
+    ui32 element_no, double* xmt);
+
+BFT_API ui32 bft_beamform_bmode(void* out, ui32 out_type, ui32 no_lines,
+    void* data, ui32 data_type, ui32 acc_type, double Time,
+    ui32 no_samples, ui32 no_elements, ui32 element_no, double* xmt);
+
+BFT_API ui32 bft_scan_convert(void* out, void* lines, ui32 data_type,
+    ui32 no_lines, ui32 no_samples, double Time, double* x, ui32 nx,
+    double* z, ui32 nz);
+
+BFT_API ui32 bft_beamform_sta(double* out, ui32 no_lines, ui32 no_out_samples,
+    void* data, ui32 data_type, ui32 acc_type, double Time, ui32 no_samples,
+    ui32 no_elements, ui32 no_emissions, ui32* elements, double* xmt);
+
+BFT_API ui32 bft_beamform_waves(double* out, ui32 no_lines,
+    ui32 no_out_samples, void* data, ui32 data_type, ui32 acc_type,
+    double Time, ui32 no_samples, ui32 no_elements, ui32 no_angles,
+    double* angles, double source);
+
+BFT_API ui32 bft_beamform_grid(double* out, void* xdc, void* data,
+    ui32 data_type, double Time, ui32 no_samples, ui32 no_elements,
+    double* x, ui32 nx, double* y, ui32 ny, double* z, ui32 nz,
+    double* apo, ui32 element_no, double* xmt);
+
+BFT_API ui32 bft_beamform_grid_waves(double* out, void* xdc, void* data,
+    ui32 data_type, double Time, ui32 no_samples, ui32 no_elements,
+    double* x, ui32 nx, double* y, ui32 ny, double* z, ui32 nz,
+    double* apo, ui32 no_angles, double* angles, double source);
+
+BFT_API void* bft_plan(ui32 no_samples, ui32 no_elements, double Time,
+    ui32 element_no, double* xmt);
+
+BFT_API void bft_plan_size(void* plan, ui32* no_lines, ui32* no_out_samples);
+
+BFT_API ui32 bft_plan_execute(void* plan, double* out, double* data);
+
+BFT_API void bft_plan_free(void* plan);
+
+BFT_API void* bft_stream(ui32 no_samples, ui32 no_elements, double Time,
+    ui32 element_no, double* xmt);
+
+BFT_API ui32 bft_stream_push(void* stream, void* data, ui32 data_type,
+    ui32 block_len);
+
+BFT_API void bft_stream_size(void* stream, ui32* no_lines, ui32* no_ready,
+    ui32* no_done);
+
+BFT_API ui32 bft_stream_beamform(void* stream, double* out);
+
+BFT_API void bft_stream_free(void* stream);
+
 BFT_API double * bft_sum_images(double* data1, ui32 element1, double* data2,
     ui32 element2, double time, ui32 no_samples);
 
+BFT_API ui32 bft_sum_images_out(double* out, double* data1, ui32 element1,
+    double* data2, ui32 element2, double time, ui32 no_samples);
+
 BFT_API void bft_add_images(double *hires, double *lores, ui32 no_samples,
     double time, ui32 element);
 
@@ -91,6 +192,186 @@ BFT_API double* bft_delay(double*src, ui32 src_len, double* times, double* delay
     ui32 times_len, double src_start_time, double dest_start_time, 
     ui32 dest_len, ui32 method);
 
+BFT_API ui32 bft_delay_lines(double* out, double* src, ui32 no_lines,
+    ui32 src_len, double* times, double* delays, ui32 times_len,
+    double src_start_time, double dest_start_time, ui32 dest_len,
+    ui32 method);
+
 BFT_API void bft_xdc_set(void* xdc, double* centers, ui32 no_elements);
 
-BFT_API void bft_free_mem(void * ptr);
\ No newline at end of file
+BFT_API void bft_free_mem(void * ptr);
+
+/*
+ *  Instruction set used by the beamforming kernels, see simd.h. The
+ *  best one supported by the CPU is selected by bft_init(). 'level' can
+ *  lower it, 0 selects the scalar code. Returns the selected level.
+ *  The setting is shared by all contexts.
+ */
+BFT_API ui32 bft_simd(ui32 level);
+
+/*
+ *  Beamforming contexts. Every context holds its own focusing,
+ *  apodization, system parameters, threads and transducers. The
+ *  functions above work on the default context created by bft_init().
+ *  Each of them has a variant, which takes the context as the first 
+ *  argument. Passing NULL as context selects the default one.
+ *  A context must not be used by two threads at the same time, but 
+ *  different contexts can be used in parallel.
+ */
+
+BFT_API void* bft_context_new(void);
+
+BFT_API void bft_context_free(void* ctx);
+
+BFT_API double bft_ctx_param(void* ctx, char* id, double val);
+
+BFT_API ui32 bft_ctx_threads(void* ctx, ui32 no_threads);
+
+BFT_API ui32 bft_ctx_interpolation(void* ctx, ui32 mode);
+
+BFT_API ui32 bft_ctx_no_lines(void* ctx, ui32 no_lines);
+
+BFT_API void* bft_ctx_xdc(void* ctx, double* centers, ui32 nelem);
+
+BFT_API void bft_ctx_xdc_free(void* ctx, void* xdc);
+
+BFT_API void bft_ctx_xdc_set(void* ctx, void* xdc, double* centers,
+    ui32 no_elements);
+
+BFT_API void bft_ctx_center_focus(void* ctx, double* point, ui32 line_no);
+
+BFT_API ui32 bft_ctx_focus(void* ctx, void* xdc, double* times, double* focus,
+    ui32 no_times, ui32 line_no);
+
+BFT_API void bft_ctx_focus_pixel(void* ctx, void* xdc, double* points,
+    ui32 no_points, ui32 line_no);
+
+BFT_API ui32 bft_ctx_focus_2way(void* ctx, void* xdc, double* times,
+    double* delays, ui32 no_times, ui32 line_no);
+
+BFT_API ui32 bft_ctx_focus_times(void* ctx, void* xdc, double* times,
+    double* delays, ui32 no_times, ui32 line_no);
+
+BFT_API void bft_ctx_apodization(void* ctx, void* xdc, double* times,
+    double* apodization, ui32 no_times, ui32 line_no);
+
+BFT_API void bft_ctx_sum_apodization(void* ctx, void* xdc, double* times,
+    double* apodization, ui32 no_times, ui32 line_no);
+
+BFT_API void bft_ctx_dynamic_focus(void* ctx, void* xdc, ui32 line_no,
+    double dir_xz, double dir_yz);
+
+BFT_API ui32 bft_ctx_focus_lines(void* ctx, void* xdc, double* centers,
+    double* times, double* focus, ui32 no_times, ui32 no_lines);
+
+BFT_API ui32 bft_ctx_apodization_lines(void* ctx, void* xdc, double* times,
+    double* apodization, ui32 no_times, ui32 no_lines);
+
+BFT_API ui32 bft_ctx_sum_apodization_lines(void* ctx, void* xdc,
+    double* times, double* apodization, ui32 no_times, ui32 no_lines);
+
+BFT_API ui32 bft_ctx_dynamic_focus_lines(void* ctx, void* xdc,
+    double* centers, double* dir_xz, double* dir_yz, ui32 no_lines);
+
+BFT_API ui32 bft_ctx_scan_phased(void* ctx, void* xdc, double sector,
+    ui32 no_lines, double depth, ui32 no_focal_zones, double* apo_times,
+    double* apodization, ui32 no_apo_times);
+
+BFT_API double* bft_ctx_beamform(void* ctx, ui32* no_lines,
+    ui32 *no_out_samples, double* data, double Time, ui32 no_samples,
+    ui32 no_elements, ui32 element_no, double* xmt);
+
+BFT_API void bft_ctx_beamform_size(void* ctx, ui32* no_lines,
+    ui32 *no_out_samples, ui32 no_samples);
+
+BFT_API ui32 bft_ctx_beamform_out(void* ctx, double* out, ui32 no_lines,
+    ui32 no_out_samples, double* data, double Time, ui32 no_samples,
+    ui32 no_elements, ui32 element_no, double* xmt);
+
+BFT_API ui32 bft_ctx_beamform_typed(void* ctx, double* out, ui32 no_lines,
+    ui32 no_out_samples, void* data, ui32 data_type, ui32 acc_type,
+    double Time, ui32 no_samples, ui32 no_elements, ui32 element_no,
+    double* xmt);
+
+BFT_API ui32 bft_ctx_beamform_frames(void* ctx, double* out, ui32 no_frames,
+    ui32 no_lines, ui32 no_out_samples, void* data, ui32 data_type,
+    ui32 acc_type, double* times, ui32 no_samples, ui32 no_elements,
+    ui32 element_no, double* xmt);
+
+BFT_API ui32 bft_ctx_beamform_window(void* ctx, double* out,
+    ui32 no_frames, ui32 no_lines, ui32 out_start, ui32 out_count,
+    void* data, ui32 data_type, ui32 acc_type, ui32 interp, double* times,
+    ui32 no_samples, ui32 no_elements, ui32 element_no, double* xmt);
+
+BFT_API ui32 bft_ctx_beamform_speeds(void* ctx, double* out, ui32 no_c,
+    double* c_values, ui32 no_lines, ui32 out_start, ui32 out_count,
+    void* data, ui32 data_type, ui32 acc_type, ui32 interp, double Time,
+    ui32 no_samples, ui32 no_elements, ui32 element_no, double* xmt);
+
+BFT_API ui32 bft_ctx_beamform_iq(void* ctx, double* out, ui32 no_lines,
+    void* data, ui32 data_type, double Time, ui32 no_samples,
+    ui32 no_elements, ui32 element_no, double* xmt);
+
+BFT_API ui32 bft_ctx_beamform_bmode(void* ctx, void* out, ui32 out_type,
+    ui32 no_lines, void* data, ui32 data_type, ui32 acc_type, double Time,
+    ui32 no_samples, ui32 no_elements, ui32 element_no, double* xmt);
+
+BFT_API ui32 bft_ctx_scan_convert(void* ctx, void* out, void* lines,
+    ui32 data_type, ui32 no_lines, ui32 no_samples, double Time,
+    double* x, ui32 nx, double* z, ui32 nz);
+
+BFT_API ui32 bft_ctx_beamform_sta(void* ctx, double* out, ui32 no_lines,
+    ui32 no_out_samples, void* data, ui32 data_type, ui32 acc_type,
+    double Time, ui32 no_samples, ui32 no_elements, ui32 no_emissions,
+    ui32* elements, double* xmt);
+
+BFT_API ui32 bft_ctx_beamform_waves(void* ctx, double* out, ui32 no_lines,
+    ui32 no_out_samples, void* data, ui32 data_type, ui32 acc_type,
+    double Time, ui32 no_samples, ui32 no_elements, ui32 no_angles,
+    double* angles, double source);
+
+BFT_API ui32 bft_ctx_beamform_grid(void* ctx, double* out, void* xdc,
+    void* data, ui32 data_type, double Time, ui32 no_samples,
+    ui32 no_elements, double* x, ui32 nx, double* y, ui32 ny, double* z,
+    ui32 nz, double* apo, ui32 element_no, double* xmt);
+
+BFT_API ui32 bft_ctx_beamform_grid_waves(void* ctx, double* out, void* xdc,
+    void* data, ui32 data_type, double Time, ui32 no_samples,
+    ui32 no_elements, double* x, ui32 nx, double* y, ui32 ny, double* z,
+    ui32 nz, double* apo, ui32 no_angles, double* angles, double source);
+
+BFT_API void* bft_ctx_plan(void* ctx, ui32 no_samples, ui32 no_elements,
+    double Time, ui32 element_no, double* xmt);
+
+BFT_API ui32 bft_ctx_plan_execute(void* ctx, void* plan, double* out,
+    double* data);
+
+BFT_API void* bft_ctx_stream(void* ctx, ui32 no_samples, ui32 no_elements,
+    double Time, ui32 element_no, double* xmt);
+
+BFT_API ui32 bft_ctx_stream_beamform(void* ctx, void* stream, double* out);
+
+BFT_API double * bft_ctx_sum_images(void* ctx, double* data1, ui32 element1,
+    double* data2, ui32 element2, double time, ui32 no_samples);
+
+BFT_API ui32 bft_ctx_sum_images_out(void* ctx, double* out, double* data1,
+    ui32 element1, double* data2, ui32 element2, double time,
+    ui32 no_samples);
+
+BFT_API void bft_ctx_add_images(void* ctx, double *hires, double *lores,
+    ui32 no_samples, double time, ui32 element);
+
+BFT_API void bft_ctx_sub_images(void* ctx, double *hires, double *lores,
+    ui32 no_samples, double time, ui32 element);
+
+BFT_API void bft_ctx_set_filter_bank(void* ctx, double* coef, ui32 Nf,
+    ui32 Ntaps);
+
+BFT_API double* bft_ctx_delay(void* ctx, double*src, ui32 src_len,
+    double* times, double* delays, ui32 times_len, double src_start_time,
+    double dest_start_time, ui32 dest_len, ui32 method);
+
+BFT_API ui32 bft_ctx_delay_lines(void* ctx, double* out, double* src,
+    ui32 no_lines, ui32 src_len, double* times, double* delays,
+    ui32 times_len, double src_start_time, double dest_start_time,
+    ui32 dest_len, ui32 method);
@@ -0,0 +1,40 @@
+#ifndef __iq_h
+  #define __iq_h
+/**********************************************************************
+ * NAME     : iq.h
+ * ABSTRACT : Beamforming of complex baseband (IQ) data. The channels
+ *            are demodulated with the frequency f0 and decimated by an
+ *            integer factor before the beamforming, so that there are
+ *            fewer samples to delay and sum. A delayed IQ sample is
+ *            interpolated linearly, and is rotated by the phase of the
+ *            delay at f0. The focusing and apodization are the same as
+ *            for the RF data at the full sampling frequency.
+ **********************************************************************/
+#include "types.h"
+#include "focus.h"
+#include "geometry.h"
+#include "threads.h"
+
+
+/*
+ *   Types of the IQ samples passed to beamform_iq(). A sample is a
+ *   pair (I, Q) of numbers.
+ */
+#define BFT_COMPLEX128  3
+#define BFT_COMPLEX64   4
+
+
+#ifdef __cplusplus
+  extern"C"{
+#endif
+
+double** beamform_iq(TThreadPool *pool, TFocusLineCollection *flc,
+        TApoLineCollection *alc, TSysParams *sys, double f0, ui32 decimation,
+        double time, void **iq_data, ui32 sample_type, ui32 no_samples,
+        ui32 element_no, TPoint3D *xmt, double **bf_lines);
+
+#ifdef __cplusplus
+  };
+#endif
+
+#endif
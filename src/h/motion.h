@@ -5,6 +5,8 @@
  * ABSTRACT : Header file for the motion compensation functions.
  **********************************************************************/
 #include "types.h"
+#include "focus.h"
+#include "threads.h"
    /*     
 #ifdef __cpluscplus 
   extern "C"{
@@ -21,6 +23,12 @@ double* delay_line_filter(TSysParams *sys, TFilterBank* fb,
                           double src_start_time, double dest_start_time,
                           ui32 dest_no_samples);
 
+ui32 delay_lines(TThreadPool *pool, TSysParams *sys, TFilterBank* fb,
+                 ui32 no_lines, double *src, ui32 src_no_samples,
+                 double *times, double *delays, ui32 no_delays,
+                 double src_start_time, double dest_start_time,
+                 double *out, ui32 dest_no_samples);
+
 /*
 #ifdef __cplusplus
   };
@@ -0,0 +1,79 @@
+#ifndef __plan_h
+  #define __plan_h
+/**********************************************************************
+ * NAME     : plan.h
+ * ABSTRACT : Beamforming plans. A plan is compiled once from the focus
+ *            and apodization settings, and contains for every output
+ *            sample the list of input samples and their weights.
+ *            Executing the plan is a plain weighted sum, without any
+ *            decisions about focal zones, apodization zones or the
+ *            type of focusing.
+ **********************************************************************/
+#include "types.h"
+#include "focus.h"
+#include "threads.h"
+
+
+/*
+ *  The output samples of a line are split into runs. Sample os + j of
+ *  a run adds for every tap k of the run
+ *
+ *     w1[k] * data[index[k] + j]  +  w2[k] * data[index[k] + j + 1]
+ *
+ *  where data is the input array with one row of 'no_samples' samples
+ *  per element. Lines with focal zones have a run per zone, in which
+ *  the channels in the data do not change. Dynamically focused and
+ *  pixel lines have runs of up to PLAN_BLOCK samples, where every
+ *  sample has its own taps. These are stored channel by channel, and
+ *  sample os + j adds tap k + j of every channel instead:
+ *
+ *     w1[k + j] * data[index[k + j]]  +  w2[k + j] * data[index[k + j] + 1]
+ *
+ *  Samples without a run are 0.
+ */
+#define PLAN_BLOCK 256
+
+typedef struct plan_run{
+   ui32 os;                /* First output sample of the run            */
+   ui32 n;                 /* Number of output samples                  */
+   ui32 gather;            /* TRUE if every sample has its own taps     */
+   size_t tap;             /* First tap, up to the first of the next run */
+}TPlanRun;
+
+typedef struct beamform_plan{
+   ui32 no_lines;          /* Number of beamformed lines                */
+   ui32 no_out_samples;    /* Number of samples per beamformed line     */
+   ui32 no_samples;        /* Number of input samples per element       */
+   ui32 no_elements;       /* Number of elements in the input data      */
+   double time;            /* Time of the first input sample            */
+   size_t *line;           /* First run of every line, and no_runs      */
+   size_t no_runs;         /* Number of used entries in runs            */
+   size_t max_runs;        /* Number of allocated entries               */
+   TPlanRun *runs;
+   size_t no_taps;         /* Number of used entries in index, w1, w2   */
+   size_t max_taps;        /* Number of allocated entries               */
+   ui32 *index;            /* Index of the first of the two samples     */
+   float *w1;              /* Weight of data[index]                     */
+   float *w2;              /* Weight of data[index + 1]                 */
+}TBeamformPlan;
+
+
+#ifdef __cplusplus
+  extern"C"{
+#endif
+
+TBeamformPlan* new_beamform_plan(TFocusLineCollection *flc,
+        TApoLineCollection *alc, TSysParams *sys, double time,
+        ui32 no_samples, ui32 no_elements, ui32 no_out_samples,
+        ui32 element_no, TPoint3D *xmt);
+
+void del_beamform_plan(TBeamformPlan *plan);
+
+void execute_beamform_plan(TThreadPool *pool, TBeamformPlan *plan,
+        double *data, double *out);
+
+#ifdef __cplusplus
+  };
+#endif
+
+#endif
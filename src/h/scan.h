@@ -0,0 +1,67 @@
+#ifndef __scan_h
+  #define __scan_h
+/**********************************************************************
+ * NAME     : scan.h
+ * ABSTRACT : Scan conversion of beamformed lines to a Cartesian image.
+ *            The lines are rays given by the geometry of the focus time
+ *            lines (center and direction), e.g. a sector scan of a
+ *            phased array or the lines of a convex array. A pixel is
+ *            interpolated bilinearly between the two lines around it,
+ *            and the weights of all pixels are kept in a table that is
+ *            reused as long as the geometry does not change.
+ **********************************************************************/
+#include "types.h"
+#include "geometry.h"
+#include "focus.h"
+#include "sys_params.h"
+#include "threads.h"
+
+
+/*
+ *  Interpolation table of a Cartesian image in the xz-plane. Pixel
+ *  (ix, iz) is at (x[ix], 0, z[iz]), and its value is stored in
+ *  out[ix*nz + iz]. It is the sum of
+ *
+ *     w[4*k] * line[offset[2*k]] + w[4*k + 1] * line[offset[2*k] + 1]
+ *   + w[4*k + 2] * line[offset[2*k + 1]] + w[4*k + 3] * line[offset[2*k + 1] + 1]
+ *
+ *  where k = ix*nz + iz, and an offset is the index of a sample in the
+ *  frame of lines. Pixels outside of the scanned region have the
+ *  offsets (ui32)-1 and are set to 0.
+ */
+typedef struct scan_table{
+   ui32 valid;             /* Whether the table has been calculated      */
+   ui32 no_lines;          /* Number of lines                            */
+   ui32 no_samples;        /* Number of samples per line                 */
+   double c;               /* Speed of sound                             */
+   double fs;              /* Sampling frequency                         */
+   double time;            /* Time of the first sample                   */
+   ui32 nx;                /* Number of pixels along x                   */
+   ui32 nz;                /* Number of pixels along z                   */
+   double *x;              /* Coordinates of the pixels along x          */
+   double *z;              /* Coordinates of the pixels along z          */
+   TPoint3D *center;       /* Origin of every line                       */
+   TPoint3D *dir;          /* Unit vector along every line               */
+   ui32 *offset;           /* Two offsets per pixel, see above           */
+   double *w;              /* Four weights per pixel                     */
+}TScanTable;
+
+
+#ifdef __cplusplus
+  extern"C"{
+#endif
+
+void del_scan_table(TScanTable *t);
+
+TScanTable* scan_table(TThreadPool *pool, TScanTable *t,
+        TFocusLineCollection *flc, TSysParams *sys, double time,
+        ui32 no_samples, double *x, ui32 nx, double *z, ui32 nz);
+
+void* scan_convert(TThreadPool *pool, TScanTable *t, void *lines,
+        ui32 sample_type, void *out);
+
+#ifdef __cplusplus
+  };
+#endif
+
+#endif
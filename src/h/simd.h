@@ -0,0 +1,218 @@
+#ifndef __simd_h
+  #define __simd_h
+/**********************************************************************
+ * NAME     : simd.h
+ * ABSTRACT : Vectorized inner loops of the beamforming kernels. Every
+ *            instruction set has its own table of functions, compiled
+ *            in a separate file with the matching compiler flags.
+ *            The table is chosen at run time, depending on the CPU.
+ *            The scalar code in beamform_lines.inc, grid_column.inc
+ *            and plan.c is used for the pixel grid, the filters and
+ *            the plans if no table is selected, and is the reference. The sums over the channels
+ *            have a scalar version in simd.c, which adds the channels
+ *            in the same order as the vector code.
+ *
+ *            This changed the reference order of the sums. Without
+ *            vector instructions (BFT_SIMD_NONE), the channels of a
+ *            double image used to be added one after another. They are
+ *            now added in SIMD_LANES partial sums, see TSimdTimesRow, 
+ *            at every level. The images differ from those of earlier 
+ *            versions by rounding, in the last bits of every sample.
+ *
+ *            The inner loops read the channels from one block of
+ *            memory: channel 'ic' starts at rf + ic*stride. The sums
+ *            over the channels exist for double, float and 16 bit
+ *            samples (the _f32 and _i16 members of TSimdKernels). The
+ *            delays of the focal zones are 16 bit integers, and their
+ *            coefficients and the apodization are floats. Samples and
+ *            coefficients are converted to double when they are 
+ *            loaded, so that the arithmetic is done in double.
+ **********************************************************************/
+#include "types.h"
+
+
+/*
+ *   Instruction sets, in increasing order
+ */
+#define BFT_SIMD_NONE     0
+#define BFT_SIMD_SSE2     1
+#define BFT_SIMD_AVX2     2
+#define BFT_SIMD_AVX512   3
+
+
+/*
+ *   Number of partial sums over the channels, see TSimdTimesRow
+ */
+#define SIMD_LANES        8
+
+
+/*
+ *  Sum of one output sample of a line with focal zones, over the
+ *  channels first .. end-1. With idx = os - d[ic] - 1, channel ic adds
+ *
+ *     apo[ic]*(rf[idx+1]*(1 - a[ic]) + rf[idx]*a[ic])  if idx < limit
+ *
+ *  'apo' may be NULL, in which case the apodization is 1.
+ *
+ *  Blocks of SIMD_LANES channels are summed first, channel first + k 
+ *  of every block into the partial sum p[k]. The partial sums are 
+ *  added in halves, p[k] += p[k + n] for n = 4, 2, 1, and the channels 
+ *  after the last full block are then added one by one to p[0]. The 
+ *  result is the same for all instruction sets.
+ */
+typedef double (*TSimdTimesRow)(const double *rf, ui32 stride, ui32 os,
+        const si16 *d, const float *a, const float *apo,
+        ui32 first, ui32 end, ui32 limit);
+
+/*
+ *  Sum of one output sample of a dynamically focused line, from the
+ *  receive delays index[ic] + frac[ic] of the row of TDynamicTable and
+ *  the transmit delay base + shift, 0 <= shift < 1. With
+ *
+ *     A = frac[ic] + shift,  idx = index[ic] + base
+ *     A -= 1, idx += 1  if A >= 1
+ *
+ *  channel ic adds
+ *
+ *     apo[ic]*(rf[idx]*(1 - A) + rf[idx+1]*A)  if idx < limit
+ *
+ *  in the order of TSimdTimesRow.
+ */
+typedef double (*TSimdDynamicRow)(const double *rf, ui32 stride,
+        const ui32 *index, const float *frac, ui32 base, double shift,
+        const float *apo, ui32 first, ui32 end, ui32 limit);
+
+/*
+ *  TSimdTimesRow and TSimdDynamicRow of float and 16 bit samples
+ */
+typedef double (*TSimdTimesRowF32)(const float *rf, ui32 stride, ui32 os,
+        const si16 *d, const float *a, const float *apo,
+        ui32 first, ui32 end, ui32 limit);
+
+typedef double (*TSimdTimesRowI16)(const si16 *rf, ui32 stride, ui32 os,
+        const si16 *d, const float *a, const float *apo,
+        ui32 first, ui32 end, ui32 limit);
+
+typedef double (*TSimdDynamicRowF32)(const float *rf, ui32 stride,
+        const ui32 *index, const float *frac, ui32 base, double shift,
+        const float *apo, ui32 first, ui32 end, ui32 limit);
+
+typedef double (*TSimdDynamicRowI16)(const si16 *rf, ui32 stride,
+        const ui32 *index, const float *frac, ui32 base, double shift,
+        const float *apo, ui32 first, ui32 end, ui32 limit);
+
+/*
+ *  Delays of 'n' channels of one output sample of a dynamically focused
+ *  line, for the code that is not vectorized. With the notation of
+ *  TSimdDynamicRow, index[ic] = idx and frac[ic] = A. The result is bit
+ *  exact with the scalar code.
+ */
+typedef void (*TSimdDelaysRow)(ui32 *index, double *frac,
+        const ui32 *rx_index, const float *rx_frac, ui32 base,
+        double shift, ui32 n);
+
+/*
+ *  Add one channel to a column of a pixel grid. For every pixel iz
+ *
+ *     s = sqrt(dxy2 + dz2[iz])*rx_scale + tx[iz]
+ *     line[iz] += w*(rf[i]*(1 - A) + rf[i+1]*A)  if 0 <= s < last
+ *
+ *  where i is the integer part of s, and A = s - i. The result is
+ *  bit exact with the scalar code.
+ */
+typedef void (*TSimdGridRow)(double *line, const double *rf,
+        const double *dz2, double dxy2, double rx_scale, const double *tx,
+        double w, ui32 nz, ui32 last);
+
+
+/*
+ *  FIR filter of a run of output samples with the same coefficients,
+ *  e.g. a fractional delay. For o = 0 .. n-1
+ *
+ *     out[o] = h[0]*src[o] + h[1]*src[o+1] + ... + h[ntaps-1]*src[o+ntaps-1]
+ *
+ *  summed from the first tap to the last, starting from 0. The result
+ *  is bit exact with the scalar code.
+ */
+typedef void (*TSimdFilterRow)(double *out, const double *src,
+        const double *h, ui32 ntaps, ui32 n);
+
+
+/*
+ *  Add one tap to a run of output samples of a beamforming plan. For
+ *  o = 0 .. n-1
+ *
+ *     out[o] += w1*src[o] + w2*src[o+1]
+ *
+ *  The result is bit exact with the scalar code.
+ */
+typedef void (*TSimdRunRow)(double *out, const double *src,
+        double w1, double w2, ui32 n);
+
+/*
+ *  Add one channel to a run of output samples of a beamforming plan,
+ *  where every sample has its own tap. For o = 0 .. n-1
+ *
+ *     out[o] += w1[o]*data[index[o]] + w2[o]*data[index[o] + 1]
+ *
+ *  The indices are below 2^31. The result is bit exact with the scalar
+ *  code.
+ */
+typedef void (*TSimdGatherRow)(double *out, const double *data,
+        const ui32 *index, const float *w1, const float *w2, ui32 n);
+
+/*
+ *  One output sample of the table of a dynamically focused line, see
+ *  dynamic_speed_table(). For ic = 0 .. n-1
+ *
+ *     q = r2[ic]*scale2 + n_scale*ru[ic] + nn
+ *     s = sqrt(q) if q > 0, 0 otherwise
+ *     index[ic] = integer part of s, frac[ic] = (float)(s - index[ic])
+ *
+ *  and a fraction, which is rounded to 1, is carried to the index. The
+ *  result is bit exact with the scalar code.
+ */
+typedef void (*TSimdTableRow)(ui32 *index, float *frac, const double *r2,
+        const double *ru, double scale2, double n_scale, double nn,
+        ui32 n);
+
+
+typedef struct simd_kernels{
+   ui32 level;                 /* One of BFT_SIMD_xxx                    */
+   const char *name;           /* Name of the instruction set            */
+   TSimdTimesRow times_row;    /* NULL if not compiled in                */
+   TSimdDynamicRow dynamic_row;
+   TSimdTimesRowF32 times_row_f32;
+   TSimdDynamicRowF32 dynamic_row_f32;
+   TSimdTimesRowI16 times_row_i16;
+   TSimdDynamicRowI16 dynamic_row_i16;
+   TSimdDelaysRow delays_row;
+   TSimdGridRow grid_row;
+   TSimdFilterRow filter_row;
+   TSimdRunRow run_row;
+   TSimdGatherRow gather_row;
+   TSimdTableRow table_row;
+}TSimdKernels;
+
+
+#ifdef __cplusplus
+  extern"C"{
+#endif
+
+extern const TSimdKernels simd_sse2;
+extern const TSimdKernels simd_avx2;
+extern const TSimdKernels simd_avx512;
+
+ui32 simd_detect(void);
+
+ui32 simd_select(ui32 level);
+
+const TSimdKernels* simd_kernels(void);
+
+ui32 rf_stride(void **rf_data, ui32 no_channels, ui32 sample_size);
+
+#ifdef __cplusplus
+  };
+#endif
+
+#endif
@@ -0,0 +1,79 @@
+#ifndef __stream_h
+  #define __stream_h
+/**********************************************************************
+ * NAME     : stream.h
+ * ABSTRACT : Streaming beamforming. The samples of one acquisition
+ *            arrive in blocks, and every output sample is beamformed
+ *            as soon as all input samples it depends on have arrived.
+ *            Only the samples which are still needed are kept, in a
+ *            ring buffer per channel. The focal and apodization zones
+ *            of every line continue from one block to the next, so the
+ *            result is the same as beamforming the whole acquisition
+ *            at once with double accumulation.
+ **********************************************************************/
+#include "types.h"
+#include "focus.h"
+#include "geometry.h"
+#include "threads.h"
+
+
+/*
+ *  Where a line is in the stream. The zone indices have the same
+ *  meaning as in beamform_lines.inc.
+ */
+typedef struct stream_line{
+   TFocusTimeLine *ftl;
+   TApoTimeLine *atl;      /* Apodization, or NULL                      */
+   ui32 no_out;            /* Computed output samples, the rest are 0   */
+   ui32 os;                /* Next output sample                        */
+   ui32 o_abs_s;           /* Absolute index of 'os'                    */
+   ui32 id, ind;           /* Focal zone, and next focal zone           */
+   ui32 ia, ina;           /* Apodization zone, and next zone           */
+}TStreamLine;
+
+
+typedef struct beamform_stream{
+   TFocusLineCollection *flc;
+   TSysParams *sys;
+   ui32 no_lines;          /* Number of beamformed lines                */
+   ui32 no_samples;        /* Input (and output) samples per channel    */
+   ui32 no_elements;       /* Number of channels in the input blocks    */
+   double time;            /* Time of the first input sample            */
+   TTransmit *tx;          /* Transmit for dynamic focusing, or NULL    */
+   TTransmit point;        /* 'tx' for a transmit element or position   */
+   TStreamLine *line;      /* State of every line                       */
+   si32 *need;             /* Output 'os' is ready, when input samples
+                              0 .. need[os] have arrived                */
+   si32 *keep;             /* Outputs >= 'os' read no input sample
+                              before keep[os]                           */
+   ui32 received;          /* Input samples received per channel        */
+   ui32 done;              /* Output samples beamformed per line        */
+   ui32 cap;               /* Ring buffer length per channel, 2^k       */
+   double *ring;           /* Input sample 'is' of channel 'ic' is at
+                              ring[ic*cap + (is & (cap-1))]             */
+}TBeamformStream;
+
+
+#ifdef __cplusplus
+  extern"C"{
+#endif
+
+TBeamformStream* new_beamform_stream(TFocusLineCollection *flc,
+        TApoLineCollection *alc, TSysParams *sys, double time,
+        ui32 no_samples, ui32 no_elements, ui32 element_no, TPoint3D *xmt);
+
+void del_beamform_stream(TBeamformStream *stream);
+
+ui32 beamform_stream_push(TBeamformStream *stream, void *data,
+        ui32 sample_type, ui32 block_len);
+
+ui32 beamform_stream_ready(TBeamformStream *stream);
+
+ui32 beamform_stream_run(TThreadPool *pool, TBeamformStream *stream,
+        double *out);
+
+#ifdef __cplusplus
+  };
+#endif
+
+#endif
@@ -0,0 +1,46 @@
+#ifndef __threads_h
+  #define __threads_h
+/*********************************************************************
+ * NAME     : threads.h
+ * ABSTRACT : A small pool of worker threads. The work is split in
+ *            independent items (e.g. scan lines) which are handed
+ *            out to the workers one at a time.
+ *********************************************************************/
+
+#include "types.h"
+
+typedef struct thread_pool TThreadPool;
+
+/*
+ *  Function executed for every work item. 'arg' is the pointer given
+ *  to thread_pool_run, and 'item' is the index of the work item.
+ */
+typedef void (*TParallelFunc)(void* arg, ui32 item);
+
+
+#ifdef __cplusplus
+  extern"C"{
+#endif
+
+ui32 thread_pool_cpu_count(void);
+
+TThreadPool* thread_pool_new(ui32 no_threads);
+
+void thread_pool_del(TThreadPool* pool);
+
+ui32 thread_pool_size(TThreadPool* pool);
+
+ui32 thread_pool_worker(TThreadPool* pool);
+
+void thread_pool_run(TThreadPool* pool, ui32 no_items,
+                     TParallelFunc func, void* arg);
+
+void thread_global_lock(void);
+
+void thread_global_unlock(void);
+
+#ifdef __cplusplus
+  };
+#endif
+
+#endif
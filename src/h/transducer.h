@@ -6,9 +6,11 @@
 
 typedef struct transducer{
    ui16 no_elements;              /* Number of elements             */
-   ui16 reserved[3];              /* Padding in case of 64-bit      */
+   ui16 reserved;                 /* Padding in case of 64-bit      */
+   ui32 version;                  /* Incremented when elements move */
    TPoint3D* c;                   /*  Center of the transducer      */
    struct transducer *next;
+   void *owner;                   /* Context, which created it      */
 }TTransducer;
 
 
@@ -17,8 +19,10 @@ typedef struct transducer{
 #endif
 
 TTransducer* bft_transducer(ui32 no_elements, TPoint3D *p);
+TTransducer* bft_transducer_owned(void* owner, ui32 no_elements, TPoint3D *p);
 void bft_transducer_set(TTransducer* x, ui32 no_elements, TPoint3D *p);
 void bft_free_xdc(TTransducer* x);
+void bft_free_owned_xdc(void* owner);
 void bft_free_all_xdc(void);
 si32 is_xdc_valid(TTransducer* x);
 void assert_xdc(TTransducer *x);
@@ -4,9 +4,27 @@ import ctypes as ct
 from ctypes.util import find_library
 import os.path as osp
 
+import copy
 import inspect
+import mmap
 import sys
+import traceback
+from collections import deque
 import numpy as np
+
+from timeit import default_timer as timer
+
+try:
+    from concurrent import futures
+except ImportError:
+    futures = None
+
+try:
+    import multiprocessing as mp
+    import queue
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
 from numpy import (c_, r_, zeros_like)
 
 import pdb
@@ -67,6 +85,10 @@ fillprototype(libbft.bft_end,  None, None)
 
 fillprototype(libbft.bft_param, ct.c_double, [ct.c_char_p, ct.c_double])
 
+fillprototype(libbft.bft_threads, ct.c_uint32, [ct.c_uint32])
+
+fillprototype(libbft.bft_interpolation, ct.c_uint32, [ct.c_uint32])
+
 fillprototype(libbft.bft_no_lines, ct.c_uint32, [ct.c_uint32])
 
 fillprototype(libbft.bft_xdc, ct.c_void_p,
@@ -77,11 +99,12 @@ fillprototype(libbft.bft_xdc_free, None, [ct.c_void_p])
 fillprototype(libbft.bft_center_focus, None,
               [ct.POINTER(ct.c_double), ct.c_uint32])
 
-fillprototype(libbft.bft_focus, None,
+fillprototype(libbft.bft_focus, ct.c_uint32,
               [ct.c_void_p,              # xdc
                ct.POINTER(ct.c_double),  # times
                ct.POINTER(ct.c_double),  # focus points
-               ct.c_uint32])
+               ct.c_uint32,              # no_times
+               ct.c_uint32])             # line_no
 
 fillprototype(libbft.bft_focus_pixel, None,
               [ct.c_void_p,
@@ -89,14 +112,14 @@ fillprototype(libbft.bft_focus_pixel, None,
                ct.c_uint32,
                ct.c_uint32])
 
-fillprototype(libbft.bft_focus_2way, None,
+fillprototype(libbft.bft_focus_2way, ct.c_uint32,
               [ct.c_void_p,
                ct.POINTER(ct.c_double),
                ct.POINTER(ct.c_double),
                ct.c_uint32,
                ct.c_uint32])
 
-fillprototype(libbft.bft_focus_times, None,
+fillprototype(libbft.bft_focus_times, ct.c_uint32,
               [ct.c_void_p,
                ct.POINTER(ct.c_double),
                ct.POINTER(ct.c_double),
@@ -110,12 +133,58 @@ fillprototype(libbft.bft_apodization, None,
                ct.c_uint32,
                ct.c_uint32])
 
+fillprototype(libbft.bft_sum_apodization, None,
+              [ct.c_void_p,
+               ct.POINTER(ct.c_double),
+               ct.POINTER(ct.c_double),
+               ct.c_uint32,
+               ct.c_uint32])
+
 fillprototype(libbft.bft_dynamic_focus, None,
               [ct.c_void_p,
                ct.c_uint32,
                ct.c_double,
                ct.c_double])
 
+fillprototype(libbft.bft_focus_lines, ct.c_uint32,
+              [ct.c_void_p,
+               ct.POINTER(ct.c_double),
+               ct.POINTER(ct.c_double),
+               ct.POINTER(ct.c_double),
+               ct.c_uint32,
+               ct.c_uint32])
+
+fillprototype(libbft.bft_apodization_lines, ct.c_uint32,
+              [ct.c_void_p,
+               ct.POINTER(ct.c_double),
+               ct.POINTER(ct.c_double),
+               ct.c_uint32,
+               ct.c_uint32])
+
+fillprototype(libbft.bft_sum_apodization_lines, ct.c_uint32,
+              [ct.c_void_p,
+               ct.POINTER(ct.c_double),
+               ct.POINTER(ct.c_double),
+               ct.c_uint32,
+               ct.c_uint32])
+
+fillprototype(libbft.bft_dynamic_focus_lines, ct.c_uint32,
+              [ct.c_void_p,
+               ct.POINTER(ct.c_double),
+               ct.POINTER(ct.c_double),
+               ct.POINTER(ct.c_double),
+               ct.c_uint32])
+
+fillprototype(libbft.bft_scan_phased, ct.c_uint32,
+              [ct.c_void_p,
+               ct.c_double,
+               ct.c_uint32,
+               ct.c_double,
+               ct.c_uint32,
+               ct.POINTER(ct.c_double),
+               ct.POINTER(ct.c_double),
+               ct.c_uint32])
+
 
 #fillprototype(libbft.bft_beamform, ct.POINTER(ct.c_double),
 #              [ct.POINTER(ct.c_double),
@@ -134,6 +203,236 @@ fillprototype(libbft.bft_beamform, ct.POINTER(ct.c_double),
                ct.c_uint32,
                ct.c_uint32,
                ct.POINTER(ct.c_double)])
+fillprototype(libbft.bft_beamform_size, None,
+              [PtrUint32,
+               PtrUint32,
+               ct.c_uint32])
+
+fillprototype(libbft.bft_beamform_out, ct.c_uint32,
+              [PtrDouble,
+               ct.c_uint32,
+               ct.c_uint32,
+               PtrDouble,
+               ct.c_double,
+               ct.c_uint32,
+               ct.c_uint32,
+               ct.c_uint32,
+               PtrDouble])
+
+fillprototype(libbft.bft_beamform_typed, ct.c_uint32,
+              [PtrDouble,
+               ct.c_uint32,
+               ct.c_uint32,
+               ct.c_void_p,
+               ct.c_uint32,
+               ct.c_uint32,
+               ct.c_double,
+               ct.c_uint32,
+               ct.c_uint32,
+               ct.c_uint32,
+               PtrDouble])
+
+fillprototype(libbft.bft_beamform_frames, ct.c_uint32,
+              [PtrDouble,
+               ct.c_uint32,
+               ct.c_uint32,
+               ct.c_uint32,
+               ct.c_void_p,
+               ct.c_uint32,
+               ct.c_uint32,
+               PtrDouble,
+               ct.c_uint32,
+               ct.c_uint32,
+               ct.c_uint32,
+               PtrDouble])
+
+fillprototype(libbft.bft_beamform_window, ct.c_uint32,
+              [PtrDouble,
+               ct.c_uint32,
+               ct.c_uint32,
+               ct.c_uint32,
+               ct.c_uint32,
+               ct.c_void_p,
+               ct.c_uint32,
+               ct.c_uint32,
+               ct.c_uint32,
+               PtrDouble,
+               ct.c_uint32,
+               ct.c_uint32,
+               ct.c_uint32,
+               PtrDouble])
+
+fillprototype(libbft.bft_beamform_speeds, ct.c_uint32,
+              [PtrDouble,
+               ct.c_uint32,
+               PtrDouble,
+               ct.c_uint32,
+               ct.c_uint32,
+               ct.c_uint32,
+               ct.c_void_p,
+               ct.c_uint32,
+               ct.c_uint32,
+               ct.c_uint32,
+               ct.c_double,
+               ct.c_uint32,
+               ct.c_uint32,
+               ct.c_uint32,
+               PtrDouble])
+
+fillprototype(libbft.bft_beamform_iq, ct.c_uint32,
+              [PtrDouble,
+               ct.c_uint32,
+               ct.c_void_p,
+               ct.c_uint32,
+               ct.c_double,
+               ct.c_uint32,
+               ct.c_uint32,
+               ct.c_uint32,
+               PtrDouble])
+
+fillprototype(libbft.bft_beamform_bmode, ct.c_uint32,
+              [ct.c_void_p,
+               ct.c_uint32,
+               ct.c_uint32,
+               ct.c_void_p,
+               ct.c_uint32,
+               ct.c_uint32,
+               ct.c_double,
+               ct.c_uint32,
+               ct.c_uint32,
+               ct.c_uint32,
+               PtrDouble])
+
+fillprototype(libbft.bft_scan_convert, ct.c_uint32,
+              [ct.c_void_p,
+               ct.c_void_p,
+               ct.c_uint32,
+               ct.c_uint32,
+               ct.c_uint32,
+               ct.c_double,
+               PtrDouble,
+               ct.c_uint32,
+               PtrDouble,
+               ct.c_uint32])
+
+fillprototype(libbft.bft_beamform_sta, ct.c_uint32,
+              [PtrDouble,
+               ct.c_uint32,
+               ct.c_uint32,
+               ct.c_void_p,
+               ct.c_uint32,
+               ct.c_uint32,
+               ct.c_double,
+               ct.c_uint32,
+               ct.c_uint32,
+               ct.c_uint32,
+               ct.POINTER(ct.c_uint32),
+               PtrDouble])
+
+fillprototype(libbft.bft_beamform_waves, ct.c_uint32,
+              [PtrDouble,
+               ct.c_uint32,
+               ct.c_uint32,
+               ct.c_void_p,
+               ct.c_uint32,
+               ct.c_uint32,
+               ct.c_double,
+               ct.c_uint32,
+               ct.c_uint32,
+               ct.c_uint32,
+               PtrDouble,
+               ct.c_double])
+
+fillprototype(libbft.bft_beamform_grid_waves, ct.c_uint32,
+              [PtrDouble,
+               ct.c_void_p,
+               ct.c_void_p,
+               ct.c_uint32,
+               ct.c_double,
+               ct.c_uint32,
+               ct.c_uint32,
+               PtrDouble,
+               ct.c_uint32,
+               PtrDouble,
+               ct.c_uint32,
+               PtrDouble,
+               ct.c_uint32,
+               PtrDouble,
+               ct.c_uint32,
+               PtrDouble,
+               ct.c_double])
+
+fillprototype(libbft.bft_beamform_grid, ct.c_uint32,
+              [PtrDouble,
+               ct.c_void_p,
+               ct.c_void_p,
+               ct.c_uint32,
+               ct.c_double,
+               ct.c_uint32,
+               ct.c_uint32,
+               PtrDouble,
+               ct.c_uint32,
+               PtrDouble,
+               ct.c_uint32,
+               PtrDouble,
+               ct.c_uint32,
+               PtrDouble,
+               ct.c_uint32,
+               PtrDouble])
+
+fillprototype(libbft.bft_plan, ct.c_void_p,
+              [ct.c_uint32,
+               ct.c_uint32,
+               ct.c_double,
+               ct.c_uint32,
+               PtrDouble])
+
+fillprototype(libbft.bft_plan_size, None,
+              [ct.c_void_p,
+               PtrUint32,
+               PtrUint32])
+
+fillprototype(libbft.bft_plan_execute, ct.c_uint32,
+              [ct.c_void_p,
+               PtrDouble,
+               PtrDouble])
+
+fillprototype(libbft.bft_plan_free, None, [ct.c_void_p])
+
+fillprototype(libbft.bft_stream, ct.c_void_p,
+              [ct.c_uint32,
+               ct.c_uint32,
+               ct.c_double,
+               ct.c_uint32,
+               PtrDouble])
+
+fillprototype(libbft.bft_stream_push, ct.c_uint32,
+              [ct.c_void_p,
+               ct.c_void_p,
+               ct.c_uint32,
+               ct.c_uint32])
+
+fillprototype(libbft.bft_stream_size, None,
+              [ct.c_void_p,
+               PtrUint32,
+               PtrUint32,
+               PtrUint32])
+
+fillprototype(libbft.bft_stream_beamform, ct.c_uint32,
+              [ct.c_void_p,
+               PtrDouble])
+
+fillprototype(libbft.bft_stream_free, None, [ct.c_void_p])
+
+fillprototype(libbft.bft_sum_images_out, ct.c_uint32,
+              [PtrDouble,
+               PtrDouble,
+               ct.c_uint32,
+               PtrDouble,
+               ct.c_uint32,
+               ct.c_double,
+               ct.c_uint32])
+
 fillprototype(libbft.bft_sum_images, ct.POINTER(ct.c_double),
               [ct.POINTER(ct.c_double),
                ct.c_uint32,
@@ -172,6 +471,19 @@ fillprototype(libbft.bft_delay, None,
                ct.c_uint32,
                ct.c_uint32])
 
+fillprototype(libbft.bft_delay_lines, ct.c_uint32,
+              [ct.POINTER(ct.c_double),
+               ct.POINTER(ct.c_double),
+               ct.c_uint32,
+               ct.c_uint32,
+               ct.POINTER(ct.c_double),
+               ct.POINTER(ct.c_double),
+               ct.c_uint32,
+               ct.c_double,
+               ct.c_double,
+               ct.c_uint32,
+               ct.c_uint32])
+
 fillprototype(libbft.bft_xdc_set, None,
               [ct.c_void_p,
                ct.POINTER(ct.c_double),
@@ -180,52 +492,415 @@ fillprototype(libbft.bft_xdc_set, None,
 fillprototype(libbft.bft_free_mem, None, 
               [ct.c_void_p])
 
+fillprototype(libbft.bft_simd, ct.c_uint32, [ct.c_uint32])
+
+fillprototype(libbft.bft_context_new, ct.c_void_p, [])
+
+fillprototype(libbft.bft_context_free, None, [ct.c_void_p])
+
+# The functions working on a context take it as their first argument
+for _name in ['bft_param', 'bft_threads', 'bft_interpolation', 'bft_no_lines', 'bft_xdc',
+              'bft_xdc_free', 'bft_xdc_set', 'bft_center_focus', 'bft_focus',
+              'bft_focus_pixel', 'bft_focus_2way', 'bft_focus_times',
+              'bft_apodization', 'bft_sum_apodization', 'bft_dynamic_focus',
+              'bft_focus_lines', 'bft_apodization_lines',
+              'bft_sum_apodization_lines', 'bft_dynamic_focus_lines',
+              'bft_scan_phased',
+              'bft_beamform', 'bft_beamform_size', 'bft_beamform_out',
+              'bft_beamform_typed', 'bft_beamform_frames',
+              'bft_beamform_window', 'bft_beamform_speeds', 'bft_beamform_iq',
+              'bft_beamform_bmode', 'bft_scan_convert',
+              'bft_beamform_sta', 'bft_beamform_waves',
+              'bft_beamform_grid', 'bft_beamform_grid_waves', 'bft_plan', 'bft_plan_execute',
+              'bft_stream', 'bft_stream_beamform',
+              'bft_sum_images', 'bft_sum_images_out', 'bft_add_images',
+              'bft_sub_images', 'bft_set_filter_bank', 'bft_delay',
+              'bft_delay_lines']:
+    _func = getattr(libbft, _name)
+    fillprototype(getattr(libbft, _name.replace('bft_', 'bft_ctx_', 1)),
+                  _func.restype, [ct.c_void_p] + list(_func.argtypes))
+
+
+# Sample types of the RF data, and precision of the accumulation (beamform.h)
+SAMPLE_TYPES = {np.dtype(np.float64): 0,
+                np.dtype(np.float32): 1,
+                np.dtype(np.int16): 2}
+
+ACC_TYPES = {'double': 0,
+             'float': 1,
+             'fixed': 2}
+
+# Sample types of the IQ data (iq.h)
+IQ_TYPES = {np.dtype(np.complex128): 3,
+            np.dtype(np.complex64): 4}
+
+# Types of the samples of B-mode images (envelope.h)
+DISPLAY_TYPES = {np.dtype(np.float32): 1,
+                 np.dtype(np.uint8): 5}
+
+# Types of the lines that can be scan converted (scan.h)
+SCAN_TYPES = {np.dtype(np.float64): 0,
+              np.dtype(np.float32): 1,
+              np.dtype(np.uint8): 5}
+
+# Interpolation between the samples (focus.h)
+INTERPOLATIONS = {'linear': 0,
+                  'filterbank': 1}
+
+# The interpolation of the context, for the calls that take a mode
+INTERP_CONTEXT = 2
+
+
 # ---------------------------------------------------------------------------
-class bft:
+def interp_mode(options):
+    'The interpolation of one call, as passed to the library'
+    if options['interp'] is None:
+        return INTERP_CONTEXT
+    if options['interp'] not in INTERPOLATIONS:
+        raise RuntimeError('interp must be one of {0}'.format(
+            sorted(INTERPOLATIONS.keys())))
+    return INTERPOLATIONS[options['interp']]
 
-    '''Class encapsulating all functions from the Beamforming Toolbox.
-The toolbox is implemented in pure C, and has no objects, hence it can
-be used only as a singleton.
 
-The user does not need to create an object of the class bft, and can call
-the functions directly.
+# ---------------------------------------------------------------------------
+def out_array(out, shape, dtype=np.float64):
+    'Check an output buffer supplied by the user, or allocate a new one'
+    if out is None:
+        return np.empty(shape, dtype=dtype)
+
+    if not isinstance(out, np.ndarray) or out.dtype != dtype:
+        raise RuntimeError('out must be a numpy array of type {0}'.format(
+            np.dtype(dtype).name))
+    if out.shape != tuple(shape):
+        raise RuntimeError('out must have shape {0}'.format(tuple(shape)))
+    if not (out.flags.c_contiguous and out.flags.writeable):
+        raise RuntimeError('out must be C-contiguous and writeable')
+    return out
+# out_array()
 
-Allways start by calling `bft_init` first, which initializes memory and sets
-some default parameters
 
-    >>> from pybft import bft
-    >>> bft.bft_init()
-    >>> bft.bft_end()
+# ---------------------------------------------------------------------------
+def out_window(options, no_out_samples):
+    'First output sample and number of output samples to beamform'
+    out_start = int(options['out_start'])
+    out_count = options['out_count']
+    if out_count is None:
+        out_count = no_out_samples - out_start
+    out_count = int(out_count)
+
+    if out_start < 0 or out_count < 0 or \
+            out_start + out_count > no_out_samples:
+        raise RuntimeError('out_start and out_count must select a window '
+                           'within {0} output samples'.format(no_out_samples))
+    return (out_start, out_count)
+# out_window()
 
-Note:
-All parameters and values are given in SI units.
 
+# ---------------------------------------------------------------------------
+class BeamformPlan:
+
+    '''Compiled beamforming setup, created by `bft.bft_plan`.
+
+The plan holds, for every output sample, the input samples and weights
+which make it. Executing the plan does not look at the focusing and
+apodization settings any more, so later calls to `bft_focus`,
+`bft_apodization` etc. do not change the plan.
     '''
-    @staticmethod
-    def bft_init(suppress=False):
-        '''Initialize the BeamForming Toolbox. This command must be executed
-        first in order to set some parameters and allocate necessary memory.
 
-        Subsequent calls will result in clearing the memory.
+    def __init__(self, context, handle, no_samples, no_elements):
+        self.context = context
+        self.handle = handle
+        self.no_samples = no_samples
+        self.no_elements = no_elements
 
-        Parameters:
-        -----------
-        suppress: boolean, scalar
-            A greeting message is displayed if False.
-        '''
-        libbft.bft_init(print_func, ct.c_uint32(suppress))
-    # bft_init()
+        no_lines = ct.c_uint32(0)
+        no_out_samples = ct.c_uint32(0)
+        libbft.bft_plan_size(ct.c_void_p(handle),
+                             ct.byref(no_lines),
+                             ct.byref(no_out_samples))
+        self.shape = (int(no_lines.value), int(no_out_samples.value))
 
-    # ------------------------------------------------------------------------
-    @staticmethod
-    def bft_end():
-        '''Release all resources, allocated by the beamforming toolbox.'''
-        libbft.bft_end()
-    # bft_end()
+    def execute(self, data, out=None):
+        '''Beamform one frame.
+
+    Parameters:
+    -----------
+    data: array_like, double
+        Data received on individual elements, with the shape
+        (no_elements, no_samples) given to `bft_plan`.
+
+    out: ndarray, double, optional
+        C-contiguous array with shape `plan.shape` for the beams.
+
+    Returns:
+    --------
+    beams: ndarray, double
+        The beamformed lines. This is `out`, if it was given.
+        '''
+        data = np.ascontiguousarray(data, dtype=np.float64)
+        if data.shape != (self.no_elements, self.no_samples):
+            raise RuntimeError('data must have shape {0}'.format(
+                (self.no_elements, self.no_samples)))
+
+        out = out_array(out, self.shape)
+        libbft.bft_ctx_plan_execute(self.context.handle,
+                                    ct.c_void_p(self.handle),
+                                    out.ctypes.data_as(PtrDouble),
+                                    data.ctypes.data_as(PtrDouble))
+        return out
+
+    def __del__(self):
+        if self.handle:
+            libbft.bft_plan_free(ct.c_void_p(self.handle))
+            self.handle = None
+# BeamformPlan
+
+
+# ---------------------------------------------------------------------------
+class BeamformStream:
+
+    '''Streaming beamforming of one acquisition, created by `bft.bft_stream`.
+
+The samples arrive in blocks, and every call to `push` returns the output
+samples whose input samples have all arrived. The focusing and
+apodization settings are used while the stream is running, and must not
+be changed before the last block has been pushed.
+    '''
+
+    def __init__(self, context, handle, no_samples, no_elements):
+        self.context = context
+        self.handle = handle
+        self.no_samples = no_samples
+        self.no_elements = no_elements
+
+    def size(self):
+        '''Number of lines, number of output samples per line which are
+    ready, and number of output samples per line returned so far.'''
+        no_lines = ct.c_uint32(0)
+        no_ready = ct.c_uint32(0)
+        no_done = ct.c_uint32(0)
+        libbft.bft_stream_size(ct.c_void_p(self.handle),
+                               ct.byref(no_lines),
+                               ct.byref(no_ready),
+                               ct.byref(no_done))
+        return (int(no_lines.value), int(no_ready.value),
+                int(no_done.value))
+
+    def push(self, block):
+        '''Add the next block of samples, and beamform what is ready.
+
+    Parameters:
+    -----------
+    block: array_like, double, float32 or int16
+        The next samples, with the shape (no_elements, block_length).
+        The blocks of an acquisition may have different lengths, and
+        have `no_samples` samples per element in total.
+
+    Returns:
+    --------
+    beams: ndarray, double
+        The new output samples, with the shape (no_lines, n). The
+        output samples are returned in order, and after the last block
+        all `no_samples` samples of every line have been returned.
+        '''
+        block = np.asarray(block)
+        if block.dtype not in SAMPLE_TYPES:
+            block = block.astype(np.float64)
+        block = np.ascontiguousarray(block)
+        if block.ndim != 2 or block.shape[0] != self.no_elements:
+            raise RuntimeError('block must have shape ({0}, n)'.format(
+                self.no_elements))
+
+        if block.shape[1] > 0:
+            res = libbft.bft_stream_push(ct.c_void_p(self.handle),
+                                         block.ctypes.data_as(ct.c_void_p),
+                                         SAMPLE_TYPES[block.dtype],
+                                         block.shape[1])
+            if res == 0:
+                raise RuntimeError('The block does not fit in the '
+                                   'acquisition.')
+
+        (no_lines, no_ready, _) = self.size()
+        out = np.empty((no_lines, no_ready))
+        if no_ready > 0:
+            res = libbft.bft_ctx_stream_beamform(self.context.handle,
+                                                 ct.c_void_p(self.handle),
+                                                 out.ctypes.data_as(PtrDouble))
+            if res != no_ready:
+                raise RuntimeError('Beamforming the block failed. Not '
+                                   'enough memory for the delay tables.')
+        return out
+
+    def __del__(self):
+        if self.handle:
+            libbft.bft_stream_free(ct.c_void_p(self.handle))
+            self.handle = None
+# BeamformStream
+
+
+# ---------------------------------------------------------------------------
+class BeamformPipeline:
+
+    '''Beamforming of a sequence of frames in a worker thread, created by
+`bft.bft_pipeline`.
+
+`submit` queues a frame and returns at once, `get` returns the beams of
+the frames in the order they were submitted. The library releases the GIL
+while it beamforms, so the acquisition of the next frame overlaps with
+the beamforming of the current one:
+
+    >>> pipe = ctx.bft_pipeline(depth=2)
+    >>> pipe.submit(frame0, t0)
+    >>> for (frame, t) in frames:
+    ...     pipe.submit(frame, t)
+    ...     show(pipe.get())
+    >>> show(pipe.get())
+    >>> pipe.close()
+
+At most `depth` frames are in flight (submitted, but not returned by
+`get`), and `submit` raises RuntimeError when the pipeline is full, as
+`get` must be called first. The example above keeps two frames in flight,
+so it needs `depth` >= 2. The beams are written in `depth + 1` buffers,
+which are reused: an array returned by `get` is valid until the next call
+to `get`.
+
+The worker uses the context, so the context must not be used otherwise
+until the pipeline is closed. The data of a frame must not be changed
+until its beams are returned.
+    '''
+
+    def __init__(self, context, depth, method, kwarg):
+        if futures is None:
+            raise RuntimeError('The pipeline needs concurrent.futures')
+        if depth < 1:
+            raise RuntimeError('depth must be at least 1')
+
+        self.context = context
+        self.method = getattr(context, method)
+        self.kwarg = kwarg
+        self.depth = depth
+        self.buffers = [None] * (depth + 1)
+        self.no_frames = 0
+        self.pending = deque()
+        self.executor = futures.ThreadPoolExecutor(max_workers=1)
+
+    def _run(self, data, time, slot):
+        out = self.method(data, time, out=self.buffers[slot], **self.kwarg)
+        self.buffers[slot] = out
+        return out
+
+    def submit(self, data, time):
+        '''Queue a frame for beamforming.
+
+    Parameters:
+    -----------
+    data, time:
+        The frame and the time of its first sample, as for the
+        beamforming function of the pipeline.
+
+    Returns:
+    --------
+    future: concurrent.futures.Future
+        Future of the beams of the frame. `asyncio.wrap_future(future)`
+        can be awaited in a coroutine.
+        '''
+        if self.executor is None:
+            raise RuntimeError('The pipeline is closed')
+        if len(self.pending) >= self.depth:
+            raise RuntimeError('The pipeline is full, get the beams of a '
+                               'frame first')
+
+        slot = self.no_frames % (self.depth + 1)
+        self.no_frames += 1
+        future = self.executor.submit(self._run, data, time, slot)
+        self.pending.append(future)
+        return future
+
+    def get(self, timeout=None):
+        '''Wait for the oldest frame, and return its beams.
+
+    Errors of the beamforming (RuntimeError) are raised here.
+        '''
+        if not self.pending:
+            raise RuntimeError('No frames have been submitted')
+
+        future = self.pending[0]
+        futures.wait([future], timeout)
+        if not future.done():
+            raise futures.TimeoutError()
+
+        self.pending.popleft()
+        return future.result()
+
+    def __len__(self):
+        '''Number of frames in flight'''
+        return len(self.pending)
+
+    def close(self):
+        '''Wait for the frames in flight, and stop the worker. The beams
+    which have not been returned by `get` are discarded.'''
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        self.pending.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        self.close()
+# BeamformPipeline
+
+
+# ---------------------------------------------------------------------------
+class BftContext:
+
+    '''Independent instance of the Beamforming Toolbox.
+Every context has its own parameters, transducers, focusing and apodization
+settings and threads, so several beamformers with different setups can live
+in one process, and can be used from different Python threads at the same
+time. A single context must not be used by two threads at once.
+
+The functions of the class `bft` work on the default context, which is
+created by `bft_init`.
+
+    >>> from pybft import BftContext
+    >>> ctx = BftContext()
+    >>> ctx.bft_param('fs', 100e6)
+    >>> xdc = ctx.bft_linear_array(192, 0.2e-3)
+    >>> ...
+    >>> ctx.free()
+
+Transducers belong to the context which created them, and are released
+together with it.
+    '''
+
+    def __init__(self, default=False):
+        '''Create a new context, or a handle to the default one.'''
+        if default:
+            self.handle = None
+        else:
+            self.handle = libbft.bft_context_new()
+            if not self.handle:
+                raise RuntimeError('Could not create a beamforming context.')
+        self.own = not default
+
+    # -----------------------------------------------------------------------
+    def free(self):
+        '''Release the context and all transducers created in it.'''
+        if self.own and self.handle:
+            libbft.bft_context_free(ct.c_void_p(self.handle))
+            self.handle = None
+    # free()
+
+    def __del__(self):
+        self.free()
 
     # ------------------------------------------------------------------------
-    @staticmethod
-    def bft_param(identifier, value):
+    def bft_param(self, identifier, value):
         '''Set a paramater of the BeamForming Toolbox
 
     Parameters:
@@ -235,29 +910,84 @@ All parameters and values are given in SI units.
     value: scalar, double
         Value to set for that parameter
 
-    ========================================================================
-    identifier         Meaning                      Default value      Unit
-    ---------- ------------------------------------ ----------------- ------
-    'c'        Speef of sound                        1540              m/s
-    'fs'       Sampling frequency                    40.0e6            Hz
-    ========================================================================
+    ================ ===================================== ======== ====
+    identifier       Meaning                               Default  Unit
+    ---------------- ------------------------------------- -------- ----
+    'c'              Speef of sound                        1540     m/s
+    'fs'             Sampling frequency                    40.0e6   Hz
+    'threads'        Number of beamforming threads         1        -
+    'f0'             Demodulation frequency of IQ data     0        Hz
+    'decimation'     IQ data are sampled at fs/decimation  1        -
+    'dynamic_range'  Shown range of the B-mode images      60       dB
+    'reference'      Envelope at 0 dB, 0 - frame maximum   0        -
+    'hilbert_taps'   Taps of the Hilbert filter, odd       31       -
+    ================ ===================================== ======== ====
 
     Returns:
     --------
     The value that was set. If not successful, the returned value will be
     negated. E.g. in case of failure,  if vaule=5, then return value is -5.
         '''
-        if not(identifier in ['c', 'fs']):
+        if not(identifier in ['c', 'fs', 'threads', 'f0', 'decimation',
+                              'dynamic_range', 'reference',
+                              'hilbert_taps']):
             raise RuntimeError('Unknown identifier "{0}"'.format(identifier))
         if sys.version_info.major > 2:
             identifier = identifier.encode('utf8')
 
-        return libbft.bft_param(identifier, ct.c_double(value))
+        return libbft.bft_ctx_param(self.handle, identifier,
+                                    ct.c_double(value))
     # bft_param
 
     # -----------------------------------------------------------------------
-    @staticmethod
-    def bft_no_lines(no_lines):
+    def bft_threads(self, no_threads):
+        '''Set the number of threads used by `bft_beamform`.
+    The lines of an image are distributed among the threads. Every line is
+    beamformed by a single thread, so the result is identical to the one
+    obtained with one thread.
+
+    Parameters:
+    -----------
+    no_threads: scalar, integer
+        Number of threads. 1 (the default) beamforms the lines one after
+        another in the calling thread. 0 starts one thread per processor.
+
+    Returns:
+    --------
+    The number of threads that will be used.
+        '''
+        return libbft.bft_ctx_threads(self.handle, ct.c_uint32(no_threads))
+    # bft_threads()
+
+    # -----------------------------------------------------------------------
+    def bft_interpolation(self, mode):
+        '''Set how `bft_beamform` interpolates between the samples.
+
+    Parameters:
+    -----------
+    mode: string
+        'linear' (the default) between two samples, or 'filterbank' with
+        the polyphase filter bank set by `bft_set_filter_bank`. A good
+        filter bank keeps the sidelobes low at a lower sampling frequency.
+        The filter bank is used by the beamforming of lines, frames,
+        sound speed sweeps and synthetic aperture images. The grid, plan,
+        stream and IQ beamformers interpolate linearly only, and fail
+        if the mode is 'filterbank'.
+
+    Returns:
+    --------
+    The previous mode.
+        '''
+        if mode not in INTERPOLATIONS:
+            raise RuntimeError('mode must be one of {0}'.format(
+                sorted(INTERPOLATIONS.keys())))
+        previous = libbft.bft_ctx_interpolation(self.handle,
+                                                INTERPOLATIONS[mode])
+        return [k for (k, v) in INTERPOLATIONS.items() if v == previous][0]
+    # bft_interpolation()
+
+    # -----------------------------------------------------------------------
+    def bft_no_lines(self, no_lines):
         '''Set the number of lines that will be beamformed in parallel.
     After calling `bft_init`, the number of lines that are beamformed in
     parallel is 1. If the user wants to beamform a whole image in one
@@ -273,12 +1003,11 @@ All parameters and values are given in SI units.
     --------
     The number of lines that will be beamformed in parallel
         '''
-        return libbft.bft_no_lines(ct.c_uint32(no_lines))
+        return libbft.bft_ctx_no_lines(self.handle, ct.c_uint32(no_lines))
     # bft_no_lines()
 
     # -----------------------------------------------------------------------
-    @staticmethod
-    def bft_xdc(centers):
+    def bft_xdc(self, centers):
         ''' Create a new transducer definition.
     The transducer definition is necessary for the calculation of
     the delays.
@@ -299,13 +1028,13 @@ All parameters and values are given in SI units.
 
         no_elements = centers.shape[0]
 
-        return libbft.bft_xdc(centers.ctypes.data_as(ct.POINTER(ct.c_double)),
-                              ct.c_uint32(no_elements))
+        return libbft.bft_ctx_xdc(self.handle,
+                                  centers.ctypes.data_as(PtrDouble),
+                                  ct.c_uint32(no_elements))
     # bft_xdc()
 
     # -----------------------------------------------------------------------
-    @staticmethod
-    def bft_linear_array(no_elements, *arg):
+    def bft_linear_array(self, no_elements, *arg):
         ''' Create a linear array.
 
         Usage:
@@ -343,12 +1072,11 @@ All parameters and values are given in SI units.
         x = r_[-(no_elements - 1) / 2.0: no_elements / 2.0] * pitch
         centers = c_[x, zeros_like(x), zeros_like(x)]
 
-        return bft.bft_xdc(centers)
+        return self.bft_xdc(centers)
     # bft_linear_array
 
     # -----------------------------------------------------------------------
-    @staticmethod
-    def bft_convex_array(no_elements, *arg):
+    def bft_convex_array(self, no_elements, *arg):
         '''Define a curved linear array transducer.
 
     Usage:
@@ -393,12 +1121,11 @@ All parameters and values are given in SI units.
         y = np.zeros(no_elements)
 
         centers = c_[x, y, z]
-        return bft.bft_xdc(centers)
+        return self.bft_xdc(centers)
     # bft_convex_array()
 
     # -----------------------------------------------------------------------
-    @staticmethod
-    def bft_xdc_free(xdc):
+    def bft_xdc_free(self, xdc):
         """Release the memory allocated for a transducer definition.
 
     Parameters:
@@ -407,12 +1134,11 @@ All parameters and values are given in SI units.
     xdc: pointer,
         This is the handle (pointer) returned by aperture creation functions
         """
-        libbft.bft_xdc_free(ct.c_void_p(xdc))
+        libbft.bft_ctx_xdc_free(self.handle, ct.c_void_p(xdc))
     # bft_xdc_free()
 
     # -----------------------------------------------------------------------
-    @staticmethod
-    def bft_center_focus(point, line_no=0):
+    def bft_center_focus(self, point, line_no=0):
         '''Set the reference point for beamforming a line.
     The point is typically on the surface of the transducer. It is also
     used as the "origin" of the line.
@@ -428,13 +1154,13 @@ All parameters and values are given in SI units.
         point = np.array(point)
         assert point.size == 3
 
-        libbft.bft_center_focus(point.ctypes.data_as(PtrDouble),
-                                ct.c_uint32(line_no))
+        libbft.bft_ctx_center_focus(self.handle,
+                                    point.ctypes.data_as(PtrDouble),
+                                    ct.c_uint32(line_no))
     # bft_center_focus
 
     # -----------------------------------------------------------------------
-    @staticmethod
-    def bft_focus(xdc, times, points, line_no=0):
+    def bft_focus(self, xdc, times, points, line_no=0):
         '''Create a focus time line defined by focal points.
 
         Parameters:
@@ -452,6 +1178,10 @@ All parameters and values are given in SI units.
         line_no: scalar, integer
             Number of line for which we set the focus.
             If skipped, 'line_no' is assumed equal to '0'.
+
+        The delays are kept as a 16 bit number of samples and a float32
+        fraction. RuntimeError is raised, and the line is not changed, if
+        a delay exceeds 32767 samples.
         '''
         times = np.array(times)
         points = np.array(points)
@@ -460,20 +1190,25 @@ All parameters and values are given in SI units.
         if (no_times > 1):
             assert points.shape[0] == no_times
 
-        libbft.bft_focus(ct.c_void_p(xdc),
-                         times.ctypes.data_as(PtrDouble),
-                         points.ctypes.data_as(PtrDouble),
-                         ct.c_uint32(no_times),
-                         ct.c_uint32(line_no))
+        ok = libbft.bft_ctx_focus(self.handle,
+                                  ct.c_void_p(xdc),
+                                  times.ctypes.data_as(PtrDouble),
+                                  points.ctypes.data_as(PtrDouble),
+                                  ct.c_uint32(no_times),
+                                  ct.c_uint32(line_no))
+        if not ok:
+            raise RuntimeError('The focus is not set. Check line_no, and that '
+                               'the delays do not exceed 32767 samples.')
 
     # -----------------------------------------------------------------------
-    @staticmethod
-    def bft_focus_pixel(xdc, points, line_no=0):
+    def bft_focus_pixel(self, xdc, points, line_no=0):
         '''Set the coordinates of the focal pixels
     This type of focusing is meant to be based on pixels not
     on lines. Therefore the term "focus-time-line" is non
     valid. The user will get back as many focused samples as
     the number of points he/she has passed to this function.
+    The lines of an image have the samples of the longest line,
+    and a line with fewer pixels is padded with zeros.
 
     Parameters:
     -----------
@@ -488,19 +1223,19 @@ All parameters and values are given in SI units.
     line_no: scalar, integer
         Index of line for which we set the focus. Default value is 0.
         '''
-        points = np.array_like(points)
+        points = np.ascontiguousarray(points, dtype=np.float64)
         assert points.shape[1] == 3
         no_points = points.shape[0]
 
-        libbft.bft_focus_pixel(ct.c_void_p(xdc),
-                               points.ctypes.data_as(PtrDouble),
-                               ct.c_uint32(no_points),
-                               ct.c_uint32(line_no))
+        libbft.bft_ctx_focus_pixel(self.handle,
+                                   ct.c_void_p(xdc),
+                                   points.ctypes.data_as(PtrDouble),
+                                   ct.c_uint32(no_points),
+                                   ct.c_uint32(line_no))
     # bft_focus_pixel()
 
     # -----------------------------------------------------------------------
-    @staticmethod
-    def bft_focus_2way(xdc, times, delays, line_no=0):
+    def bft_focus_2way(self, xdc, times, delays, line_no=0):
         '''Create a 2way focus time line defined by focal points.
     These focus settings are relevant only for synthetic aperture imaging.
     This is the classical monostatic synthetic aperture focusing
@@ -526,16 +1261,19 @@ All parameters and values are given in SI units.
         no_times = times.size
         assert delays.shape[0] == no_times
 
-        libbft.bft_focus_2way(ct.c_void_p(xdc),
-                              times.ctypes.data_as(PtrDouble),
-                              delays.ctypes.data_as(PtrDouble),
-                              ct.c_uint32(no_times),
-                              ct.c_uint32(line_no))
+        ok = libbft.bft_ctx_focus_2way(self.handle,
+                                       ct.c_void_p(xdc),
+                                       times.ctypes.data_as(PtrDouble),
+                                       delays.ctypes.data_as(PtrDouble),
+                                       ct.c_uint32(no_times),
+                                       ct.c_uint32(line_no))
+        if not ok:
+            raise RuntimeError('The focus is not set. Check line_no, and that '
+                               'the delays do not exceed 32767 samples.')
     # bft_focus_2way
 
     # -----------------------------------------------------------------------
-    @staticmethod
-    def bft_focus_times(xdc, times, delays, line_no=0):
+    def bft_focus_times(self, xdc, times, delays, line_no=0):
         '''Create a focus time line defined by focus delays.
     The user supplies the delay times for each element.
 
@@ -558,16 +1296,19 @@ All parameters and values are given in SI units.
         no_times = times.size
         assert delays.shape[0] == no_times
 
-        libbft.bft_focus_times(ct.c_void_p(xdc),
-                               times.ctypes.data_as(PtrDouble),
-                               delays.ctypes.data_as(PtrDouble),
-                               ct.c_uint32(no_times),
-                               ct.c_uint32(line_no))
+        ok = libbft.bft_ctx_focus_times(self.handle,
+                                        ct.c_void_p(xdc),
+                                        times.ctypes.data_as(PtrDouble),
+                                        delays.ctypes.data_as(PtrDouble),
+                                        ct.c_uint32(no_times),
+                                        ct.c_uint32(line_no))
+        if not ok:
+            raise RuntimeError('The focus is not set. Check line_no, and that '
+                               'the delays do not exceed 32767 samples.')
     # bft_focus_times
 
     # -----------------------------------------------------------------------
-    @staticmethod
-    def bft_apodization(xdc, times, apodization, line_no=0):
+    def bft_apodization(self, xdc, times, apodization, line_no=0):
         '''Create an apodization time line.
 
     Parameters:
@@ -582,6 +1323,8 @@ All parameters and values are given in SI units.
     values: array_like, double,
         Apodization values. Matrix with one row for each time value and a number
         of columns equal to the number of physical elements in the aperture.
+        Elements with 0 apodization are skipped by `bft_beamform`, so a
+        small active aperture on a large array costs only its elements.
 
     line_no: scalar, integer,
         Index of line to set the apodization for. Default value is 0.
@@ -593,16 +1336,16 @@ All parameters and values are given in SI units.
         if (no_times > 1):
             assert apodization.shape[0] == no_times
 
-        libbft.bft_apodization(ct.c_void_p(xdc),
-                               times.ctypes.data_as(PtrDouble),
-                               apodization.ctypes.data_as(PtrDouble),
-                               ct.c_uint32(no_times),
-                               ct.c_uint32(line_no))
+        libbft.bft_ctx_apodization(self.handle,
+                                   ct.c_void_p(xdc),
+                                   times.ctypes.data_as(PtrDouble),
+                                   apodization.ctypes.data_as(PtrDouble),
+                                   ct.c_uint32(no_times),
+                                   ct.c_uint32(line_no))
     # bft_apodization()
 
     # -----------------------------------------------------------------------
-    @staticmethod
-    def bft_sum_apodization(xdc, times, apodization, line_no=0):
+    def bft_sum_apodization(self, xdc, times, apodization, line_no=0):
         '''Create an apodization time line used when beams from 2 emissions are summed.
 
     Parameters:
@@ -629,18 +1372,28 @@ All parameters and values are given in SI units.
         if (no_times > 1):
             assert apodization.shape[0] == no_times
 
-        libbft.bft_sum_apodization(ct.c_void_p(xdc),
-                                   times.ctypes.data_as(PtrDouble),
-                                   apodization.ctypes.data_as(PtrDouble),
-                                   ct.c_uint32(no_times),
-                                   ct.c_uint32(line_no))
+        libbft.bft_ctx_sum_apodization(self.handle,
+                                       ct.c_void_p(xdc),
+                                       times.ctypes.data_as(PtrDouble),
+                                       apodization.ctypes.data_as(PtrDouble),
+                                       ct.c_uint32(no_times),
+                                       ct.c_uint32(line_no))
     # bft_sum_apodization
 
     # -----------------------------------------------------------------------
-    @staticmethod
-    def bft_dynamic_focus(xdc, dir_xz, dir_yz, line_no=0):
+    def bft_dynamic_focus(self, xdc, dir_xz, dir_yz, line_no=0):
         ''' Set dynamic focusing for a line
 
+    The receive delays are calculated the first time the line is
+    beamformed, and are kept for the following calls to `bft_beamform`.
+    They are recalculated when the speed of sound, the sampling frequency,
+    the start time, the number of samples or the element positions change.
+    The transmit delay is added per sample, so calls with different `elem`,
+    `xmt` or plane wave angles share the table. The table of a line takes
+    (number_of_samples - 1) * number_of_elements * 8 bytes, e.g. 3 MB for
+    4096 samples and 96 elements, and every dynamically focused line has
+    its own. The beamforming raises RuntimeError if it cannot be allocated.
+
     Parameters:
     -----------
 
@@ -660,15 +1413,215 @@ All parameters and values are given in SI units.
     line_no: scalar, integer,
         Index of line to set focusing for. Default value is 0.
         '''
-        libbft.bft_dynamic_focus(ct.c_void_p(xdc),
-                                 ct.c_uint32(line_no),
-                                 ct.c_double(dir_xz),
-                                 ct.c_double(dir_yz))
+        libbft.bft_ctx_dynamic_focus(self.handle,
+                                     ct.c_void_p(xdc),
+                                     ct.c_uint32(line_no),
+                                     ct.c_double(dir_xz),
+                                     ct.c_double(dir_yz))
     # bft_dynamic_focus
 
+    # -----------------------------------------------------------------------
+    def bft_focus_lines(self, xdc, centers, times, points):
+        '''Set the center focus and the focal points of many lines in one call.
+    Line number l gets the same focusing as from
+
+        bft_center_focus(centers[l], l)
+        bft_focus(xdc, times[l], points[l], l)
+
+    and the delays of the lines are calculated in parallel by the threads
+    set with `bft_threads`.
+
+    Parameters:
+    -----------
+    xdc: integer (pointer)
+        Pointer to aperture.
+
+    centers: array_like[L,3], double, or None
+        Center focus of every line. None keeps the present ones.
+
+    times: array_like[L,Z] or [Z], double
+        Times after which the focal zones of every line are valid. A vector
+        is used for all lines.
+
+    points: array_like[L,Z,3], double
+        Focal points of every line.
+
+    Lines 0 .. L-1 are set, and L must not exceed the number of lines.
+        '''
+        points = np.ascontiguousarray(points, dtype=np.float64)
+        assert points.ndim == 3 and points.shape[2] == 3
+        (no_lines, no_times) = points.shape[:2]
+        times = np.ascontiguousarray(
+            np.broadcast_to(np.asarray(times, dtype=np.float64),
+                            (no_lines, no_times)))
+        if centers is None:
+            centers_ptr = None
+        else:
+            centers = np.ascontiguousarray(centers, dtype=np.float64)
+            assert centers.shape == (no_lines, 3)
+            centers_ptr = centers.ctypes.data_as(PtrDouble)
+
+        ok = libbft.bft_ctx_focus_lines(self.handle,
+                                        ct.c_void_p(xdc),
+                                        centers_ptr,
+                                        times.ctypes.data_as(PtrDouble),
+                                        points.ctypes.data_as(PtrDouble),
+                                        ct.c_uint32(no_times),
+                                        ct.c_uint32(no_lines))
+        if not ok:
+            raise RuntimeError('There are fewer lines than focal points, or '
+                               'the delays exceed 32767 samples.')
+    # bft_focus_lines()
+
+    # -----------------------------------------------------------------------
+    def _apodization_lines(self, func, xdc, times, apodization):
+        apodization = np.ascontiguousarray(apodization, dtype=np.float64)
+        assert apodization.ndim == 3
+        (no_lines, no_times) = apodization.shape[:2]
+        times = np.ascontiguousarray(
+            np.broadcast_to(np.asarray(times, dtype=np.float64),
+                            (no_lines, no_times)))
+
+        ok = func(self.handle,
+                  ct.c_void_p(xdc),
+                  times.ctypes.data_as(PtrDouble),
+                  apodization.ctypes.data_as(PtrDouble),
+                  ct.c_uint32(no_times),
+                  ct.c_uint32(no_lines))
+        if not ok:
+            raise RuntimeError('There are fewer lines than apodizations.')
+
+    # -----------------------------------------------------------------------
+    def bft_apodization_lines(self, xdc, times, apodization):
+        '''Set the apodization of many lines in one call, as `bft_apodization`
+    does for one line.
+
+    Parameters:
+    -----------
+    xdc: integer (pointer)
+        Pointer to a transducer aperture
+
+    times: array_like[L,Z] or [Z], double
+        Times after which the apodizations of every line are valid. A vector
+        is used for all lines.
+
+    apodization: array_like[L,Z,E], double
+        Apodization values, Z rows with one value per element for every line.
+
+    Lines 0 .. L-1 are set, and L must not exceed the number of lines.
+        '''
+        self._apodization_lines(libbft.bft_ctx_apodization_lines,
+                                xdc, times, apodization)
+    # bft_apodization_lines()
+
+    # -----------------------------------------------------------------------
+    def bft_sum_apodization_lines(self, xdc, times, apodization):
+        '''Set the apodization used when beams from 2 emissions are summed,
+    for many lines in one call. The arguments are as for
+    `bft_apodization_lines`.
+        '''
+        self._apodization_lines(libbft.bft_ctx_sum_apodization_lines,
+                                xdc, times, apodization)
+    # bft_sum_apodization_lines()
+
+    # -----------------------------------------------------------------------
+    def bft_dynamic_focus_lines(self, xdc, centers, dir_xz, dir_yz):
+        '''Set dynamic focusing for many lines in one call. Line number l
+    gets the same focusing as from
+
+        bft_center_focus(centers[l], l)
+        bft_dynamic_focus(xdc, dir_xz[l], dir_yz[l], l)
+
+    Parameters:
+    -----------
+    xdc: integer,
+        Pointer to the transducer aperture
+
+    centers: array_like[L,3], double, or None
+        Center focus of every line. None keeps the present ones.
+
+    dir_xz, dir_yz: array_like[L], double
+        Directions of the lines in radians. A scalar is used for all lines.
+        '''
+        dir_xz = np.atleast_1d(np.asarray(dir_xz, dtype=np.float64))
+        dir_yz = np.atleast_1d(np.asarray(dir_yz, dtype=np.float64))
+        no_lines = max(dir_xz.size, dir_yz.size)
+        if centers is None:
+            centers_ptr = None
+        else:
+            centers = np.ascontiguousarray(centers, dtype=np.float64)
+            assert centers.ndim == 2 and centers.shape[1] == 3
+            no_lines = max(no_lines, centers.shape[0])
+            assert centers.shape[0] == no_lines
+            centers_ptr = centers.ctypes.data_as(PtrDouble)
+        dir_xz = np.ascontiguousarray(np.broadcast_to(dir_xz, (no_lines,)))
+        dir_yz = np.ascontiguousarray(np.broadcast_to(dir_yz, (no_lines,)))
+
+        ok = libbft.bft_ctx_dynamic_focus_lines(self.handle,
+                                                ct.c_void_p(xdc),
+                                                centers_ptr,
+                                                dir_xz.ctypes.data_as(PtrDouble),
+                                                dir_yz.ctypes.data_as(PtrDouble),
+                                                ct.c_uint32(no_lines))
+        if not ok:
+            raise RuntimeError('There are fewer lines than directions.')
+    # bft_dynamic_focus_lines()
+
+    # -----------------------------------------------------------------------
+    def bft_scan_phased(self, xdc, sector, no_lines, depth, no_focal_zones,
+                        apodization, times=0.0):
+        '''Define a phased-array sector scan, as bft_scan_phased.m
+
+    The number of lines is set to `no_lines`, and the lines are spread
+    evenly over the sector with their center focus at the origin. The focal
+    zones of a line are evenly spaced up to `depth`. All lines get the same
+    apodization, and a sum apodization of 1 (see `bft_sum_apodization`).
+
+    Parameters:
+    -----------
+    xdc: integer (pointer)
+        Pointer to a transducer aperture
+
+    sector: scalar, double
+        Size of the sector. If sector > pi, it is in degrees, otherwise
+        in radians.
+
+    no_lines: scalar, integer
+        Number of lines in the sector.
+
+    depth: scalar, double
+        Depth of the scan (depth = Tprf * c/2) [m]
+
+    no_focal_zones: scalar, integer
+        Number of focal zones per line.
+
+    apodization: array_like, double
+        Apodization values. One row per time and one column per element.
+
+    times: array_like, double
+        Times after which the rows of `apodization` are valid.
+        '''
+        times = np.ascontiguousarray(np.atleast_1d(times), dtype=np.float64)
+        apodization = np.ascontiguousarray(apodization, dtype=np.float64)
+        no_times = times.size
+        assert apodization.size % no_times == 0
+
+        ok = libbft.bft_ctx_scan_phased(self.handle,
+                                        ct.c_void_p(xdc),
+                                        ct.c_double(sector),
+                                        ct.c_uint32(no_lines),
+                                        ct.c_double(depth),
+                                        ct.c_uint32(no_focal_zones),
+                                        times.ctypes.data_as(PtrDouble),
+                                        apodization.ctypes.data_as(PtrDouble),
+                                        ct.c_uint32(no_times))
+        if not ok:
+            raise RuntimeError('A sector scan needs at least one line and '
+                               'focal zone.')
+    # bft_scan_phased()
+
     # -------------------------------------------------------------------------
-    @staticmethod
-    def bft_beamform(data, time, **kwarg):
+    def bft_beamform(self, data, time, **kwarg):
         '''Beamform a set of data and produce a set of beams.
 
     The number of the simultaneously formed beams is set
@@ -689,10 +1642,16 @@ All parameters and values are given in SI units.
     will be the sum of the _normal_ receive delay, *and* of the difference
     in propagation time from the transmit position (defined by `elem` or `xmt`)
 
+    The GIL is released while the library beamforms, so other Python threads
+    (e.g. data acquisition) keep running. The lines are beamformed in
+    parallel if `bft_threads` has been set to more than one thread.
+
     Parameters:
     -----------
-    data: array_like, double
+    data: array_like, double, float32 or int16
         Data received on individual elements. Two dimensional array.
+        Arrays of type float32 and int16 are beamformed as they are,
+        without conversion to double. Other types are converted to double.
 
         >>> from numpy import zeros
         >>> data = zeros(192, 4096)
@@ -701,21 +1660,59 @@ All parameters and values are given in SI units.
     time: array_like, (or scalar), double
         Time instance of the first sample in the collected `data`
 
+    out: ndarray, double, optional
+        C-contiguous array with shape (number_of_lines, number_of_samples)
+        in which the beams are stored. The library writes the beams directly
+        in `out`, so no memory is allocated when the same buffer is reused
+        for every frame.
+
+    acc: string, optional
+        Precision in which the delayed samples are summed:
+
+        =========  ==========================================
+        'double'   Double precision (default). Any data type.
+        'float'    Single precision. float32 and int16 data.
+        'fixed'    32 bit fixed point. int16 data only. The
+                   apodization values must be in (-2, 2).
+        =========  ==========================================
+
+    out_start, out_count: scalar, integer, optional
+        Beamform only the output samples out_start .. out_start +
+        out_count - 1 of every line, e.g. a region of interest in depth.
+        The default is all samples. The lines of the result, and of
+        `out`, have `out_count` samples. The samples are the same as in
+        the whole lines.
+
+    interp: string, optional
+        'linear' or 'filterbank' for this call only. The default is the
+        mode set by `bft_interpolation`.
+
     Returns:
     --------
     beams: array_like, double
+        The beamformed lines. This is `out`, if it was given.
 
         '''
         options = {
             'elem': 65535,
             'xmt': None,
+            'out': None,
+            'acc': 'double',
+            'out_start': 0,
+            'out_count': None,
+            'interp': None,
         }
 
         options.update(kwarg)
+        interp = interp_mode(options)
 
         elem = options['elem']
         xmt = options['xmt']
 
+        if options['acc'] not in ACC_TYPES:
+            raise RuntimeError('acc must be one of {0}'.format(
+                sorted(ACC_TYPES.keys())))
+
         if (elem < 65535) and (xmt is not None):
             print('Either choose element index, or transmit position.')
             raise RuntimeError('Confusing options for beamforming procedure.')
@@ -723,126 +1720,1864 @@ All parameters and values are given in SI units.
         if xmt is None:
             xmt = ct.cast(0, PtrDouble)
         else:
-            xmt = ct.array(xmt).ctypes.data_as(PtrDouble)
-
-        data = np.array(data)
+            xmt = np.ascontiguousarray(xmt, dtype=np.float64)
+            assert xmt.size == 3
+            xmt = xmt.ctypes.data_as(PtrDouble)
+
+        data = np.asarray(data)
+        if data.dtype not in SAMPLE_TYPES:
+            data = data.astype(np.float64)
+        data = np.ascontiguousarray(data)
         no_samples = data.shape[1]
         no_elements = data.shape[0]
 
         no_beams = ct.c_uint32(0)
         no_out_samples = ct.c_uint32(0)
 
-        res = libbft.bft_beamform(ct.byref(no_beams),
-                                  ct.byref(no_out_samples),
-                                  data.ctypes.data_as(PtrDouble),
-                                  ct.c_double(time),
-                                  ct.c_uint32(no_samples),
-                                  ct.c_uint32(no_elements),
-                                  ct.c_uint32(elem),
-                                  PtrDouble(xmt))
+        libbft.bft_ctx_beamform_size(self.handle,
+                                     ct.byref(no_beams),
+                                     ct.byref(no_out_samples),
+                                     ct.c_uint32(no_samples))
 
-        # int(no_beams.value) does a conversion from ctypes to python type
-        shp = (int(no_beams.value), int(no_out_samples.value))
+        (out_start, out_count) = out_window(options,
+                                            int(no_out_samples.value))
 
-        lores = np.ctypeslib.as_array(res, shape=shp).copy() 
-        libbft.bft_free_mem(res)
-        #return np.ctypeslib.as_array(res, shape=shp)
-        return lores
+        # int(no_beams.value) does a conversion from ctypes to python type
+        shp = (int(no_beams.value), out_count)
+        out = out_array(options['out'], shp)
+        times = np.full(1, time, dtype=np.float64)
+
+        res = libbft.bft_ctx_beamform_window(self.handle,
+                                             out.ctypes.data_as(PtrDouble),
+                                             1,
+                                             no_beams,
+                                             out_start,
+                                             out_count,
+                                             data.ctypes.data_as(ct.c_void_p),
+                                             SAMPLE_TYPES[data.dtype],
+                                             ACC_TYPES[options['acc']],
+                                             interp,
+                                             times.ctypes.data_as(PtrDouble),
+                                             ct.c_uint32(no_samples),
+                                             ct.c_uint32(no_elements),
+                                             ct.c_uint32(elem),
+                                             xmt)
+        if res == 0:
+            raise RuntimeError('Beamforming failed. Check the data type, acc '
+                               'and the filter bank.')
+        return out
     # bft_beamform()
 
     # -------------------------------------------------------------------------
-    @staticmethod
-    def bft_sum_images(image1, elem1, image2, elem2, Time):
-        '''Sum 2 low resolution images in 1 high resolution.
+    def bft_beamform_iq(self, data, time, **kwarg):
+        '''Beamform complex baseband (IQ) data.
+
+    The IQ data are the analytic signals of the channels, multiplied by
+    exp(-2j*pi*f0*t) and decimated, where f0 is set by
+    `bft_param('f0', f0)`, and t is the time of the sample. They are
+    sampled at fs/decimation, with the decimation set by
+    `bft_param('decimation', decimation)`. The focusing and apodization
+    are set up as for the RF data at the sampling frequency fs.
+
+    The delayed samples are interpolated linearly, and rotated by the
+    phase of their delay at f0. The lines are demodulated in the same way
+    as the input, and have the samples of the IQ data. A line beamformed
+    with pixel based focusing has one complex value per pixel, which is
+    not demodulated. Its real part is the value beamformed from RF data.
 
     Parameters:
     -----------
-    image1: array_like, double
-        Matrix with the RF data for the image.
+    data: array_like, complex128 or complex64
+        IQ data of the individual elements, one row per element.
+        complex64 data are beamformed as they are, other types are
+        converted to complex128.
 
-        >>> [no_lines, no_samples] = image1.shape
-
-    ele1: scalar, integer
-        Transmit element index, used to acquire `image1`
+    time: scalar, double
+        Time of the first sample in `data`
 
-    image2: array_like, double
-        Matrix with the RF data for the image. Same dimensions as `image1`
+    elem, xmt: optional
+        Transmit element or position, as for `bft_beamform`.
 
-    ele2: scalar, integer
-        Transmit element index used to acquire `image2`
+    out: ndarray, complex128, optional
+        C-contiguous array with shape (number_of_lines, number_of_samples)
+        in which the lines are stored.
 
-    time   -  The arrival time of the first samples. The two images
-                    must be aligned in time
+    Returns:
+    --------
+    beams: ndarray, complex128
+        The beamformed lines. This is `out`, if it was given.
         '''
-        image1 = np.array(image1)
-        image2 = np.array(image2)
+        options = {
+            'elem': 65535,
+            'xmt': None,
+            'out': None,
+        }
 
-        [no_lines, no_samples] = image1.shape
-        assert (no_lines, no_samples) == image2.shape
+        options.update(kwarg)
 
-        hirestmp = libbft.bft_sum_images(image1.ctypes.data_as(PtrDouble),
-                                      ct.c_uint32(elem1),
-                                      image2.ctypes.data_as(PtrDouble),
-                                      ct.c_uint32(elem2),
-                                      ct.c_double(Time),
-                                      ct.c_uint32(no_samples))
-        hires = np.ctypeslib.as_array(hirestmp, shape=(no_lines, no_samples)).copy()
-        
-        libbft.bft_free_mem(hirestmp)
-        #return np.ctypeslib.as_array(hires, shape=(no_lines, no_samples))
-        return hires
-    # bft_sum_images()
+        elem = options['elem']
+        xmt = options['xmt']
+
+        if (elem < 65535) and (xmt is not None):
+            raise RuntimeError('Confusing options for beamforming procedure.')
+
+        if xmt is None:
+            xmt = ct.cast(0, PtrDouble)
+        else:
+            xmt = np.ascontiguousarray(xmt, dtype=np.float64)
+            assert xmt.size == 3
+            xmt = xmt.ctypes.data_as(PtrDouble)
+
+        data = np.asarray(data)
+        if data.dtype not in IQ_TYPES:
+            data = data.astype(np.complex128)
+        data = np.ascontiguousarray(data)
+        (no_elements, no_samples) = data.shape
+
+        no_beams = ct.c_uint32(0)
+        no_out_samples = ct.c_uint32(0)
+        libbft.bft_ctx_beamform_size(self.handle,
+                                     ct.byref(no_beams),
+                                     ct.byref(no_out_samples),
+                                     ct.c_uint32(no_samples))
+
+        shp = (int(no_beams.value), int(no_out_samples.value))
+        out = out_array(options['out'], shp, np.complex128)
+
+        res = libbft.bft_ctx_beamform_iq(self.handle,
+                                         out.ctypes.data_as(PtrDouble),
+                                         no_beams,
+                                         data.ctypes.data_as(ct.c_void_p),
+                                         IQ_TYPES[data.dtype],
+                                         ct.c_double(time),
+                                         ct.c_uint32(no_samples),
+                                         ct.c_uint32(no_elements),
+                                         ct.c_uint32(elem),
+                                         xmt)
+        if res == 0:
+            raise RuntimeError('Beamforming failed. Check the decimation, '
+                               'and that the interpolation is linear.')
+        return out
+    # bft_beamform_iq()
 
     # -------------------------------------------------------------------------
-    @staticmethod
-    def bft_add_image(hires, lores, element, start_time):
-        '''  Add a low resolution to a high resolution image.
+    def bft_beamform_bmode(self, data, time, **kwarg):
+        '''Beamform a B-mode image, ready to be displayed.
+
+    The lines are beamformed, their envelope is detected and log
+    compressed in one call, without temporary arrays in Python. The
+    envelope of RF lines is found with a Hilbert filter with
+    `bft_param('hilbert_taps', n)` taps. IQ data (complex) are beamformed
+    as by `bft_beamform_iq`, and the envelope is their magnitude.
+
+    The levels from `bft_param('reference', r)` down to
+    `bft_param('dynamic_range', dr)` dB below it are shown, the others
+    are clipped. The reference 0 (default) is the largest envelope of
+    the image.
 
     Parameters:
     -----------
+    data: array_like
+        RF data as for `bft_beamform`, or IQ data as for
+        `bft_beamform_iq`.
 
-    hires: array_like, double
-        High resolution RF image. One row per scan line
-
-    lores: array_like, double
-        Low resolution RF image. Same dimensions as `hires`
+    time: scalar, double
+        Time of the first sample in `data`
 
-        >>> assert hires.shape == lores.shape
+    dtype: numpy dtype, optional
+        uint8 (default) scales the image to 0 .. 255, float32 gives the
+        levels in dB, from -dr to 0.
 
-    element: scalar, integer
-        Element index, used to acquire the low resolution image
+    elem, xmt, acc: optional
+        As for `bft_beamform`. `acc` is used for RF data only.
 
-    start_time: scalar, double,
-        Arrival time of the first sample of the RF lines.
+    out: ndarray, optional
+        C-contiguous array of type `dtype` with shape (number_of_lines,
+        number_of_samples) in which the image is stored.
 
     Returns:
     --------
-    hires - The high resolution image
+    image: ndarray, uint8 or float32
+        The B-mode image. This is `out`, if it was given.
         '''
-        hires = np.array(hires)
-        lores = np.array(lores)
+        options = {
+            'elem': 65535,
+            'xmt': None,
+            'out': None,
+            'acc': 'double',
+            'dtype': np.uint8,
+        }
 
-        assert hires.ndim == 2
-        assert lores.shape == hires.shape
-        assert hires.dtype == lores.dtype == np.float64
-        (no_lines, no_samples) = hires.shape
+        options.update(kwarg)
 
-        libbft.bft_add_images(hires.ctypes.data_as(PtrDouble),
-                              lores.ctypes.data_as(PtrDouble),
-                              ct.c_uint32(no_samples),
-                              ct.c_double(start_time),
-                              ct.c_uint32(element)
-                              )
-        return hires
-    # bft_add_image()
+        elem = options['elem']
+        xmt = options['xmt']
+        dtype = np.dtype(options['dtype'])
 
-    # -------------------------------------------------------------------------
-    @staticmethod
-    def bft_free_mem(ptr):
-      "Release memory allocated by malloc() by the BFT DLL"
-      libbft.bft_free_mem(ptr)
-    # bft_free_mem()
-# bft . . . . . . . . . .  . . . . . . . . . . . . . . . . . . . . . . . . . .
+        if dtype not in DISPLAY_TYPES:
+            raise RuntimeError('dtype must be uint8 or float32')
+        if options['acc'] not in ACC_TYPES:
+            raise RuntimeError('acc must be one of {0}'.format(
+                sorted(ACC_TYPES.keys())))
+
+        if (elem < 65535) and (xmt is not None):
+            raise RuntimeError('Confusing options for beamforming procedure.')
+
+        if xmt is None:
+            xmt = ct.cast(0, PtrDouble)
+        else:
+            xmt = np.ascontiguousarray(xmt, dtype=np.float64)
+            assert xmt.size == 3
+            xmt = xmt.ctypes.data_as(PtrDouble)
+
+        data = np.asarray(data)
+        if np.iscomplexobj(data):
+            if data.dtype not in IQ_TYPES:
+                data = data.astype(np.complex128)
+            data_type = IQ_TYPES[data.dtype]
+        else:
+            if data.dtype not in SAMPLE_TYPES:
+                data = data.astype(np.float64)
+            data_type = SAMPLE_TYPES[data.dtype]
+        data = np.ascontiguousarray(data)
+        (no_elements, no_samples) = data.shape
+
+        no_beams = ct.c_uint32(0)
+        no_out_samples = ct.c_uint32(0)
+        libbft.bft_ctx_beamform_size(self.handle,
+                                     ct.byref(no_beams),
+                                     ct.byref(no_out_samples),
+                                     ct.c_uint32(no_samples))
+
+        shp = (int(no_beams.value), int(no_out_samples.value))
+        out = out_array(options['out'], shp, dtype)
+
+        res = libbft.bft_ctx_beamform_bmode(self.handle,
+                                            out.ctypes.data_as(ct.c_void_p),
+                                            DISPLAY_TYPES[dtype],
+                                            no_beams,
+                                            data.ctypes.data_as(ct.c_void_p),
+                                            data_type,
+                                            ACC_TYPES[options['acc']],
+                                            ct.c_double(time),
+                                            ct.c_uint32(no_samples),
+                                            ct.c_uint32(no_elements),
+                                            ct.c_uint32(elem),
+                                            xmt)
+        if res == 0:
+            raise RuntimeError('Beamforming failed. Check the data type, acc '
+                               'and the B-mode settings.')
+        return out
+    # bft_beamform_bmode()
+
+    # -------------------------------------------------------------------------
+    def bft_scan_convert(self, lines, time, x, z, out=None):
+        '''Convert beamformed lines to a Cartesian image.
+
+    The lines are rays from the centers of focus, along the direction of
+    their last focal point, or along `dir_xz` and `dir_yz` for dynamic
+    focusing, e.g. a sector scan or the lines of a convex array. Sample
+    `n` of a line is at the distance (floor(time*fs) + n)*c/(2*fs) from
+    the center, as in the beamforming. A pixel is interpolated bilinearly from the two lines around
+    it. Pixels outside of the scanned region are 0.
+
+    The interpolation table is calculated at the first call, and is
+    reused as long as the lines, `c`, `fs`, `time` and the pixels stay
+    the same, so converting a sequence of frames costs one gather per
+    frame.
+
+    Parameters:
+    -----------
+    lines: array_like, float64, float32 or uint8
+        The beamformed lines, one row per line, e.g. from
+        `bft_beamform` or `bft_beamform_bmode`. Other types are
+        converted to float64.
+
+    time: scalar, double
+        Time of the first sample of the lines
+
+    x, z: array_like, double
+        Coordinates of the pixels along x and z, in the plane y = 0
+
+    out: ndarray, optional
+        C-contiguous array with shape (len(x), len(z)) and the type of
+        `lines`, in which the image is stored.
+
+    Returns:
+    --------
+    image: ndarray
+        Array with shape (len(x), len(z)). This is `out`, if it was given.
+        '''
+        lines = np.asarray(lines)
+        if lines.dtype not in SCAN_TYPES:
+            lines = lines.astype(np.float64)
+        lines = np.ascontiguousarray(lines)
+        (no_lines, no_samples) = lines.shape
+
+        x = np.ascontiguousarray(x, dtype=np.float64).ravel()
+        z = np.ascontiguousarray(z, dtype=np.float64).ravel()
+        out = out_array(out, (x.size, z.size), lines.dtype)
+
+        res = libbft.bft_ctx_scan_convert(self.handle,
+                                          out.ctypes.data_as(ct.c_void_p),
+                                          lines.ctypes.data_as(ct.c_void_p),
+                                          SCAN_TYPES[lines.dtype],
+                                          ct.c_uint32(no_lines),
+                                          ct.c_uint32(no_samples),
+                                          ct.c_double(time),
+                                          x.ctypes.data_as(PtrDouble),
+                                          ct.c_uint32(x.size),
+                                          z.ctypes.data_as(PtrDouble),
+                                          ct.c_uint32(z.size))
+        if res == 0 and out.size > 0:
+            raise RuntimeError('Scan conversion failed. Check the number '
+                               'of lines and their focusing.')
+        return out
+    # bft_scan_convert()
+
+    # -------------------------------------------------------------------------
+    def bft_beamform_c_sweep(self, data, time, c_values, **kwarg):
+        '''Beamform one acquisition with several speeds of sound, e.g. for
+    autofocusing.
+
+    The image for c_values[k] is the same as the one from `bft_beamform`
+    after `bft_param('c', c_values[k])` and setting up the focusing again.
+    The speed of sound set by `bft_param` is not changed. The distances
+    from the elements to the focal points are calculated once for all
+    speeds, and the delays and the lines of all speeds are calculated in
+    parallel by the threads set with `bft_threads`. The focal zones set
+    by `bft_focus_times` are delays in time, and do not change with the
+    speed of sound.
+
+    Parameters:
+    -----------
+    data: array_like, double, float32 or int16
+        Data received on individual elements, as for `bft_beamform`.
+
+    time: scalar, double
+        Time instance of the first sample in the collected `data`
+
+    c_values: array_like, double
+        The speeds of sound [m/s]
+
+    elem, xmt, acc, out_start, out_count, interp: optional
+        As for `bft_beamform`.
+
+    out: ndarray, double, optional
+        C-contiguous array with shape (len(c_values), number_of_lines,
+        number_of_samples) in which the beams are stored.
+
+    Returns:
+    --------
+    beams: array_like, double
+        The beamformed lines, with shape (len(c_values), number_of_lines,
+        number_of_samples). This is `out`, if it was given.
+        '''
+        options = {
+            'elem': 65535,
+            'xmt': None,
+            'out': None,
+            'acc': 'double',
+            'out_start': 0,
+            'out_count': None,
+            'interp': None,
+        }
+
+        options.update(kwarg)
+        interp = interp_mode(options)
+
+        elem = options['elem']
+        xmt = options['xmt']
+
+        if options['acc'] not in ACC_TYPES:
+            raise RuntimeError('acc must be one of {0}'.format(
+                sorted(ACC_TYPES.keys())))
+
+        if (elem < 65535) and (xmt is not None):
+            print('Either choose element index, or transmit position.')
+            raise RuntimeError('Confusing options for beamforming procedure.')
+
+        if xmt is None:
+            xmt = ct.cast(0, PtrDouble)
+        else:
+            xmt = np.ascontiguousarray(xmt, dtype=np.float64)
+            assert xmt.size == 3
+            xmt = xmt.ctypes.data_as(PtrDouble)
+
+        c_values = np.ascontiguousarray(np.atleast_1d(c_values),
+                                        dtype=np.float64)
+        assert c_values.ndim == 1
+
+        data = np.asarray(data)
+        if data.dtype not in SAMPLE_TYPES:
+            data = data.astype(np.float64)
+        data = np.ascontiguousarray(data)
+        (no_elements, no_samples) = data.shape
+
+        no_beams = ct.c_uint32(0)
+        no_out_samples = ct.c_uint32(0)
+
+        libbft.bft_ctx_beamform_size(self.handle,
+                                     ct.byref(no_beams),
+                                     ct.byref(no_out_samples),
+                                     ct.c_uint32(no_samples))
+
+        (out_start, out_count) = out_window(options,
+                                            int(no_out_samples.value))
+
+        shp = (c_values.size, int(no_beams.value), out_count)
+        out = out_array(options['out'], shp)
+
+        res = libbft.bft_ctx_beamform_speeds(self.handle,
+                                             out.ctypes.data_as(PtrDouble),
+                                             c_values.size,
+                                             c_values.ctypes.data_as(PtrDouble),
+                                             no_beams,
+                                             out_start,
+                                             out_count,
+                                             data.ctypes.data_as(ct.c_void_p),
+                                             SAMPLE_TYPES[data.dtype],
+                                             ACC_TYPES[options['acc']],
+                                             interp,
+                                             ct.c_double(time),
+                                             ct.c_uint32(no_samples),
+                                             ct.c_uint32(no_elements),
+                                             ct.c_uint32(elem),
+                                             xmt)
+        if res == 0:
+            raise RuntimeError('Beamforming failed. Check the data type, acc '
+                               'and the speeds of sound.')
+        return out
+    # bft_beamform_c_sweep()
+
+    # -------------------------------------------------------------------------
+    def bft_beamform_frames(self, data, times, **kwarg):
+        '''Beamform a stack of frames, recorded with the same setup.
+
+    Does the same as calling `bft_beamform` for every frame, but in one
+    call to the library. The lines of all frames are distributed among the
+    threads, and frames with the same start time share the delays of the
+    dynamically focused lines.
+
+    Parameters:
+    -----------
+    data: array_like, double, float32 or int16
+        Three dimensional array with the shape
+        (number_of_frames, number_of_elements, number_of_samples).
+
+    times: array_like (or scalar), double
+        Time instance of the first sample of every frame. A scalar is
+        used for all frames.
+
+    out: ndarray, double, optional
+        C-contiguous array with shape
+        (number_of_frames, number_of_lines, number_of_samples).
+
+    The options `elem`, `xmt`, `acc`, `out_start`, `out_count` and `interp`
+    are as for `bft_beamform`.
+
+    Returns:
+    --------
+    beams: ndarray, double
+        The beamformed lines of all frames. This is `out`, if it was given.
+        '''
+        options = {
+            'elem': 65535,
+            'xmt': None,
+            'out': None,
+            'acc': 'double',
+            'out_start': 0,
+            'out_count': None,
+            'interp': None,
+        }
+
+        options.update(kwarg)
+        interp = interp_mode(options)
+
+        elem = options['elem']
+        xmt = options['xmt']
+
+        if options['acc'] not in ACC_TYPES:
+            raise RuntimeError('acc must be one of {0}'.format(
+                sorted(ACC_TYPES.keys())))
+
+        if (elem < 65535) and (xmt is not None):
+            raise RuntimeError('Confusing options for beamforming procedure.')
+
+        if xmt is None:
+            xmt = ct.cast(0, PtrDouble)
+        else:
+            xmt = np.ascontiguousarray(xmt, dtype=np.float64)
+            assert xmt.size == 3
+            xmt = xmt.ctypes.data_as(PtrDouble)
+
+        data = np.asarray(data)
+        if data.ndim != 3:
+            raise RuntimeError('data must have 3 dimensions '
+                               '(frames, elements, samples)')
+        if data.dtype not in SAMPLE_TYPES:
+            data = data.astype(np.float64)
+        data = np.ascontiguousarray(data)
+        (no_frames, no_elements, no_samples) = data.shape
+
+        times = np.ascontiguousarray(times, dtype=np.float64)
+        if times.size == 1:
+            times = np.repeat(times.ravel(), no_frames)
+        if times.size != no_frames:
+            raise RuntimeError('times must have one value per frame')
+
+        no_beams = ct.c_uint32(0)
+        no_out_samples = ct.c_uint32(0)
+
+        libbft.bft_ctx_beamform_size(self.handle,
+                                     ct.byref(no_beams),
+                                     ct.byref(no_out_samples),
+                                     ct.c_uint32(no_samples))
+
+        (out_start, out_count) = out_window(options,
+                                            int(no_out_samples.value))
+
+        shp = (no_frames, int(no_beams.value), out_count)
+        out = out_array(options['out'], shp)
+
+        res = libbft.bft_ctx_beamform_window(self.handle,
+                                             out.ctypes.data_as(PtrDouble),
+                                             no_frames,
+                                             no_beams,
+                                             out_start,
+                                             out_count,
+                                             data.ctypes.data_as(ct.c_void_p),
+                                             SAMPLE_TYPES[data.dtype],
+                                             ACC_TYPES[options['acc']],
+                                             interp,
+                                             times.ctypes.data_as(PtrDouble),
+                                             no_samples,
+                                             no_elements,
+                                             elem,
+                                             xmt)
+        if res == 0 and no_frames > 0:
+            raise RuntimeError('Beamforming failed. Check the data type and acc.')
+        return out
+    # bft_beamform_frames()
+
+    # -------------------------------------------------------------------------
+    def bft_beamform_sta(self, data, time, **kwarg):
+        '''Synthetic transmit aperture imaging. Beamform all emissions of a
+    frame and sum them into one high resolution image.
+
+    Gives the same result as beamforming every emission with `bft_beamform`
+    and adding it with `bft_add_image` (lines with focal zones), or summing
+    the images (dynamically focused lines), but in one call to the library.
+    The lines are distributed among the threads, and no low resolution
+    images are made.
+
+    Parameters:
+    -----------
+    data: array_like, double, float32 or int16
+        Three dimensional array with the shape
+        (number_of_emissions, number_of_elements, number_of_samples).
+
+    time: scalar, double
+        Time instance of the first sample of all emissions.
+
+    elem: array_like, integer
+        Transmit element of every emission. Needed by the lines with focal
+        zones, which are added using the sum apodization
+        (see `bft_sum_apodization`).
+
+    xmt: array_like, double
+        Transmit position of every emission, with the shape
+        (number_of_emissions, 3). Used instead of `elem` for dynamically
+        focused lines.
+
+    out: ndarray, double, optional
+        C-contiguous array with shape (number_of_lines, number_of_samples).
+
+    acc: string, optional
+        As for `bft_beamform`.
+
+    Returns:
+    --------
+    hires: ndarray, double
+        The high resolution image. This is `out`, if it was given.
+        '''
+        options = {
+            'elem': None,
+            'xmt': None,
+            'out': None,
+            'acc': 'double',
+        }
+
+        options.update(kwarg)
+
+        elem = options['elem']
+        xmt = options['xmt']
+
+        if options['acc'] not in ACC_TYPES:
+            raise RuntimeError('acc must be one of {0}'.format(
+                sorted(ACC_TYPES.keys())))
+
+        if (elem is None) == (xmt is None):
+            raise RuntimeError('Give either elem or xmt for every emission.')
+
+        data = np.asarray(data)
+        if data.ndim != 3:
+            raise RuntimeError('data must have 3 dimensions '
+                               '(emissions, elements, samples)')
+        if data.dtype not in SAMPLE_TYPES:
+            data = data.astype(np.float64)
+        data = np.ascontiguousarray(data)
+        (no_emissions, no_elements, no_samples) = data.shape
+
+        if elem is not None:
+            elem = np.ascontiguousarray(elem, dtype=np.uint32).ravel()
+            if elem.size != no_emissions:
+                raise RuntimeError('elem must have one value per emission')
+            p_elem = elem.ctypes.data_as(ct.POINTER(ct.c_uint32))
+            p_xmt = ct.cast(0, PtrDouble)
+        else:
+            xmt = np.ascontiguousarray(xmt, dtype=np.float64)
+            if xmt.size != 3 * no_emissions:
+                raise RuntimeError('xmt must have one position per emission')
+            p_elem = ct.cast(0, ct.POINTER(ct.c_uint32))
+            p_xmt = xmt.ctypes.data_as(PtrDouble)
+
+        no_beams = ct.c_uint32(0)
+        no_out_samples = ct.c_uint32(0)
+
+        libbft.bft_ctx_beamform_size(self.handle,
+                                     ct.byref(no_beams),
+                                     ct.byref(no_out_samples),
+                                     ct.c_uint32(no_samples))
+
+        shp = (int(no_beams.value), no_samples)
+        out = out_array(options['out'], shp)
+
+        res = libbft.bft_ctx_beamform_sta(self.handle,
+                                          out.ctypes.data_as(PtrDouble),
+                                          no_beams,
+                                          no_out_samples,
+                                          data.ctypes.data_as(ct.c_void_p),
+                                          SAMPLE_TYPES[data.dtype],
+                                          ACC_TYPES[options['acc']],
+                                          time,
+                                          no_samples,
+                                          no_elements,
+                                          no_emissions,
+                                          p_elem,
+                                          p_xmt)
+        if res == 0:
+            raise RuntimeError('Beamforming failed. Check the focusing, '
+                               'the data type and acc.')
+        return out
+    # bft_beamform_sta()
+
+    # -------------------------------------------------------------------------
+    def bft_beamform_waves(self, data, time, angles, source=0.0, **kwarg):
+        '''Coherent compounding of plane or diverging waves. Beamform the
+    emissions of all steering angles and sum them into one image.
+
+    The lines must be dynamically focused (`bft_dynamic_focus`). The
+    transmit delay of a point is the time the wave needs to reach it. The
+    waves are steered in the x-z plane, and pass the origin at time 0.
+
+    Parameters:
+    -----------
+    data: array_like, double, float32 or int16
+        Three dimensional array with the shape
+        (number_of_angles, number_of_elements, number_of_samples).
+
+    time: scalar, double
+        Time instance of the first sample of all emissions.
+
+    angles: array_like, double
+        Steering angle of every emission [rad].
+
+    source: scalar, double, optional
+        0 for plane waves. Otherwise the waves are diverging from a
+        virtual source at this distance behind the origin, in the
+        direction of the steering angle.
+
+    The options `out` and `acc` are as for `bft_beamform_sta`.
+
+    Returns:
+    --------
+    image: ndarray, double
+        The compounded image. This is `out`, if it was given.
+        '''
+        options = {
+            'out': None,
+            'acc': 'double',
+        }
+
+        options.update(kwarg)
+
+        if options['acc'] not in ACC_TYPES:
+            raise RuntimeError('acc must be one of {0}'.format(
+                sorted(ACC_TYPES.keys())))
+
+        data = np.asarray(data)
+        if data.ndim != 3:
+            raise RuntimeError('data must have 3 dimensions '
+                               '(angles, elements, samples)')
+        if data.dtype not in SAMPLE_TYPES:
+            data = data.astype(np.float64)
+        data = np.ascontiguousarray(data)
+        (no_angles, no_elements, no_samples) = data.shape
+
+        angles = np.ascontiguousarray(angles, dtype=np.float64).ravel()
+        if angles.size != no_angles:
+            raise RuntimeError('angles must have one value per emission')
+
+        no_beams = ct.c_uint32(0)
+        no_out_samples = ct.c_uint32(0)
+
+        libbft.bft_ctx_beamform_size(self.handle,
+                                     ct.byref(no_beams),
+                                     ct.byref(no_out_samples),
+                                     ct.c_uint32(no_samples))
+
+        shp = (int(no_beams.value), no_samples)
+        out = out_array(options['out'], shp)
+
+        res = libbft.bft_ctx_beamform_waves(self.handle,
+                                            out.ctypes.data_as(PtrDouble),
+                                            no_beams,
+                                            no_out_samples,
+                                            data.ctypes.data_as(ct.c_void_p),
+                                            SAMPLE_TYPES[data.dtype],
+                                            ACC_TYPES[options['acc']],
+                                            time,
+                                            no_samples,
+                                            no_elements,
+                                            no_angles,
+                                            angles.ctypes.data_as(PtrDouble),
+                                            source)
+        if res == 0:
+            raise RuntimeError('Beamforming failed. Check the focusing, '
+                               'the data type and acc.')
+        return out
+    # bft_beamform_waves()
+
+    # -------------------------------------------------------------------------
+    def bft_beamform_file(self, path, shape, time, **kwarg):
+        '''Beamform a multi-emission acquisition stored in a file.
+
+    The file is memory mapped, and the emissions are beamformed in chunks
+    of at most `chunk_size` bytes straight from the mapped pages, without
+    converting or copying the samples. The chunks are summed into one
+    image as by `bft_beamform_sta` (`elem` or `xmt`) or by
+    `bft_beamform_waves` (`angles`). The file is read sequentially, and
+    the pages of a chunk are released after it has been beamformed, so
+    the memory used does not grow with the size of the file.
+
+        >>> img = bft.bft_beamform_file('sta.bin', (128, 128, 4096), 0.0,
+        ...                             elem=range(128))
+
+    Parameters:
+    -----------
+    path: string
+        Name of the file
+
+    shape: tuple of 3 integers
+        (number_of_emissions, number_of_elements, number_of_samples). The
+        samples of an element are consecutive in the file, then the
+        elements of an emission, then the emissions.
+
+    time: scalar, double
+        Time instance of the first sample of all emissions.
+
+    dtype: numpy dtype, optional
+        int16 (default), float32 or float64
+
+    offset: scalar, integer, optional
+        Size of the header of the file in bytes
+
+    emissions: array_like, integer, optional
+        Emissions to beamform. All by default.
+
+    elem, xmt: array_like, optional
+        Transmit element or position of every emission in the file, as
+        for `bft_beamform_sta`.
+
+    angles, source: optional
+        Steering angle of every emission in the file, and the virtual
+        source, as for `bft_beamform_waves`.
+
+    chunk_size: scalar, integer, optional
+        Maximal number of bytes beamformed in one call (256 MB by
+        default). A chunk has at least one emission.
+
+    acc, out: optional
+        As for `bft_beamform_sta`.
+
+    Returns:
+    --------
+    image: ndarray, double
+        The sum of the beamformed emissions. This is `out`, if it was
+        given.
+        '''
+        options = {
+            'dtype': np.int16,
+            'offset': 0,
+            'emissions': None,
+            'elem': None,
+            'xmt': None,
+            'angles': None,
+            'source': 0.0,
+            'chunk_size': 1 << 28,
+            'acc': 'double',
+            'out': None,
+        }
+
+        options.update(kwarg)
+
+        dtype = np.dtype(options['dtype'])
+        if dtype not in SAMPLE_TYPES:
+            raise RuntimeError('dtype must be one of int16, float32 and '
+                               'float64')
+
+        (no_emissions, no_elements, no_samples) = [int(n) for n in shape]
+        emission_bytes = no_elements * no_samples * dtype.itemsize
+        offset = int(options['offset'])
+
+        emissions = options['emissions']
+        if emissions is None:
+            emissions = np.arange(no_emissions)
+        emissions = np.asarray(emissions, dtype=np.intp).ravel()
+        if emissions.size == 0 or emissions.min() < 0 \
+                or emissions.max() >= no_emissions:
+            raise RuntimeError('emissions must be in 0 .. {0}'.format(
+                no_emissions - 1))
+
+        per_emission = {}
+        for name in ['elem', 'xmt', 'angles']:
+            if options[name] is not None:
+                per_emission[name] = np.asarray(options[name])
+        if ('angles' in per_emission) == \
+                ('elem' in per_emission or 'xmt' in per_emission):
+            raise RuntimeError('Give either angles, or elem or xmt for every '
+                               'emission.')
+        for (name, value) in per_emission.items():
+            if len(value) != no_emissions:
+                raise RuntimeError('{0} must have one entry per emission '
+                                   'in the file'.format(name))
+
+        per_chunk = max(1, options['chunk_size'] // max(1, emission_bytes))
+        page = mmap.PAGESIZE
+
+        with open(path, 'rb') as f:
+            if osp.getsize(path) < offset + no_emissions * emission_bytes:
+                raise RuntimeError('The file is smaller than the data')
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        data = chunk = None
+        try:
+            if hasattr(mm, 'madvise'):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            data = np.frombuffer(mm, dtype, no_emissions * no_elements *
+                                 no_samples, offset)
+            data = data.reshape(no_emissions, no_elements, no_samples)
+
+            out = options['out']
+            part = None
+            for start in range(0, emissions.size, per_chunk):
+                idx = emissions[start:start + per_chunk]
+                consecutive = np.all(np.diff(idx) == 1)
+                if consecutive:
+                    chunk = data[idx[0]:idx[-1] + 1]
+                else:
+                    chunk = data[idx]
+
+                kw = dict((name, value[idx])
+                          for (name, value) in per_emission.items())
+                dest = out if start == 0 else part
+                if 'angles' in kw:
+                    dest = self.bft_beamform_waves(chunk, time, kw['angles'],
+                                                   options['source'],
+                                                   acc=options['acc'],
+                                                   out=dest)
+                else:
+                    dest = self.bft_beamform_sta(chunk, time,
+                                                 acc=options['acc'], out=dest,
+                                                 **kw)
+                chunk = None
+                if start == 0:
+                    out = dest
+                else:
+                    part = dest
+                    out += part
+
+                if consecutive and hasattr(mm, 'madvise'):
+                    first = (offset + idx[0] * emission_bytes) // page * page
+                    last = (offset + (idx[-1] + 1) * emission_bytes) \
+                        // page * page
+                    if last > first:
+                        mm.madvise(mmap.MADV_DONTNEED, first, last - first)
+        except BaseException:
+            # The frames of the traceback hold views of the mapped pages
+            if hasattr(traceback, 'clear_frames'):
+                traceback.clear_frames(sys.exc_info()[2])
+            raise
+        finally:
+            data = chunk = None
+            try:
+                mm.close()
+            except BufferError:
+                # A view is still referenced. The pages are unmapped when
+                # it is released, and the original exception is raised.
+                pass
+
+        return out
+    # bft_beamform_file()
+
+    # -------------------------------------------------------------------------
+    def bft_beamform_grid(self, xdc, data, time, x, z, y=None, **kwarg):
+        '''Beamform all pixels of a rectilinear grid.
+
+    Unlike `bft_focus_pixel`, the grid does not depend on the focusing
+    and apodization of the lines set with `bft_no_lines`, and the whole
+    image is beamformed in one call. The columns of the grid are
+    distributed among the threads set with `bft_threads`.
+
+    The delays are calculated as in `bft_focus_pixel`: from the transmit
+    element `elem` or position `xmt` to the pixel and back to every
+    element. If neither is given, the way back is taken twice.
+
+    If `angles` is given, the emissions of plane or diverging waves are
+    compounded, as in `bft_beamform_waves`. The transmit delays of every
+    column of the grid are then calculated once per angle.
+
+    Parameters:
+    -----------
+    xdc: pointer(integer),
+        Transducer with one element per row of `data`.
+
+    data: array_like, double, float32 or int16
+        Data received on individual elements, as for `bft_beamform`.
+
+    time: scalar, double
+        Time instance of the first sample in `data`.
+
+    x, z: array_like, double
+        Coordinates of the grid lines along x and z.
+
+    y: array_like, double, optional
+        Coordinates of the grid lines along y. If skipped, the grid lies
+        in the plane y = 0.
+
+    apo: array_like, double, optional
+        Apodization, one value per element. Elements with 0 apodization
+        are skipped.
+
+    elem: scalar, integer, optional
+        Transmit element.
+
+    xmt: array_like, double, optional
+        Transmit position (x, y, z).
+
+    angles: array_like, double, optional
+        Steering angles of the plane or diverging waves [rad]. `data` has
+        then the shape (number_of_angles, number_of_elements,
+        number_of_samples).
+
+    source: scalar, double, optional
+        Distance to the virtual source of diverging waves, see
+        `bft_beamform_waves`. 0 (default) for plane waves.
+
+    out: ndarray, double, optional
+        C-contiguous array for the image, see Returns.
+
+    Returns:
+    --------
+    image: ndarray, double
+        Array with shape (len(x), len(z)), or (len(y), len(x), len(z)) if
+        `y` is given. This is `out`, if it was given.
+        '''
+        options = {
+            'elem': 65535,
+            'xmt': None,
+            'apo': None,
+            'angles': None,
+            'source': 0.0,
+            'out': None,
+        }
+
+        options.update(kwarg)
+
+        elem = options['elem']
+        xmt = options['xmt']
+        apo = options['apo']
+        angles = options['angles']
+
+        if ((elem < 65535) + (xmt is not None) + (angles is not None)) > 1:
+            raise RuntimeError('Confusing options for beamforming procedure.')
+
+        if xmt is None:
+            xmt = ct.cast(0, PtrDouble)
+        else:
+            xmt = np.ascontiguousarray(xmt, dtype=np.float64)
+            assert xmt.size == 3
+            xmt = xmt.ctypes.data_as(PtrDouble)
+
+        data = np.asarray(data)
+        if data.dtype not in SAMPLE_TYPES:
+            data = data.astype(np.float64)
+        data = np.ascontiguousarray(data)
+        if angles is None:
+            (no_elements, no_samples) = data.shape
+        else:
+            (no_angles, no_elements, no_samples) = data.shape
+            angles = np.ascontiguousarray(angles, dtype=np.float64).ravel()
+            if angles.size != no_angles:
+                raise RuntimeError('angles must have one value per emission')
+
+        if apo is None:
+            apo_ptr = ct.cast(0, PtrDouble)
+        else:
+            apo = np.ascontiguousarray(apo, dtype=np.float64)
+            if apo.size != no_elements:
+                raise RuntimeError('apo must have one value per element')
+            apo_ptr = apo.ctypes.data_as(PtrDouble)
+
+        x = np.ascontiguousarray(x, dtype=np.float64).ravel()
+        z = np.ascontiguousarray(z, dtype=np.float64).ravel()
+        if y is None:
+            shp = (x.size, z.size)
+            y = np.zeros(1)
+        else:
+            y = np.ascontiguousarray(y, dtype=np.float64).ravel()
+            shp = (y.size, x.size, z.size)
+
+        out = out_array(options['out'], shp)
+
+        if angles is not None:
+            res = libbft.bft_ctx_beamform_grid_waves(
+                self.handle,
+                out.ctypes.data_as(PtrDouble),
+                ct.c_void_p(xdc),
+                data.ctypes.data_as(ct.c_void_p),
+                SAMPLE_TYPES[data.dtype],
+                time,
+                no_samples,
+                no_elements,
+                x.ctypes.data_as(PtrDouble),
+                x.size,
+                y.ctypes.data_as(PtrDouble),
+                y.size,
+                z.ctypes.data_as(PtrDouble),
+                z.size,
+                apo_ptr,
+                no_angles,
+                angles.ctypes.data_as(PtrDouble),
+                options['source'])
+        else:
+            res = libbft.bft_ctx_beamform_grid(self.handle,
+                                               out.ctypes.data_as(PtrDouble),
+                                               ct.c_void_p(xdc),
+                                               data.ctypes.data_as(ct.c_void_p),
+                                               SAMPLE_TYPES[data.dtype],
+                                               time,
+                                               no_samples,
+                                               no_elements,
+                                               x.ctypes.data_as(PtrDouble),
+                                               x.size,
+                                               y.ctypes.data_as(PtrDouble),
+                                               y.size,
+                                               z.ctypes.data_as(PtrDouble),
+                                               z.size,
+                                               apo_ptr,
+                                               elem,
+                                               xmt)
+        if res == 0 and out.size > 0:
+            raise RuntimeError('Beamforming failed. Check the transducer, '
+                               'the data, and that the interpolation is '
+                               'linear.')
+        return out
+    # bft_beamform_grid()
+
+    # -------------------------------------------------------------------------
+    def bft_plan(self, no_samples, no_elements, start_time, **kwarg):
+        '''Compile the current focusing and apodization into a plan.
+
+    The delays, interpolation weights and apodization of all lines are
+    computed once, for data with a fixed size and start time. The plan
+    is then executed for every frame:
+
+        >>> plan = bft.bft_plan(4096, 192, 0.0)
+        >>> beams = plan.execute(data)
+
+    The result is the same as for `bft_beamform` up to rounding errors.
+    The weights of the plan are floats, which gives relative errors of
+    about 1e-7. A line with focal zones takes 12 bytes per element and
+    focal or apodization zone, while dynamically focused and pixel lines
+    take 12 bytes per element and output sample.
+
+    The plan interpolates linearly, and cannot be compiled while the
+    interpolation is set to 'filterbank'.
+
+    Parameters:
+    -----------
+    no_samples: scalar, integer
+        Number of samples per element in the data
+
+    no_elements: scalar, integer
+        Number of elements (rows) in the data
+
+    start_time: scalar, double
+        Time instance of the first sample in the data
+
+    elem, xmt: optional
+        Transmit element or transmit position, as for `bft_beamform`
+
+    Returns:
+    --------
+    plan: BeamformPlan
+        '''
+        options = {
+            'elem': 65535,
+            'xmt': None,
+        }
+        options.update(kwarg)
+
+        elem = options['elem']
+        xmt = options['xmt']
+
+        if (elem < 65535) and (xmt is not None):
+            raise RuntimeError('Confusing options for beamforming procedure.')
+
+        if xmt is None:
+            xmt = ct.cast(0, PtrDouble)
+        else:
+            xmt = np.ascontiguousarray(xmt, dtype=np.float64)
+            assert xmt.size == 3
+            xmt = xmt.ctypes.data_as(PtrDouble)
+
+        handle = libbft.bft_ctx_plan(self.handle,
+                                     ct.c_uint32(no_samples),
+                                     ct.c_uint32(no_elements),
+                                     ct.c_double(start_time),
+                                     ct.c_uint32(elem),
+                                     xmt)
+        if not handle:
+            raise RuntimeError('Could not create a plan for the current '
+                               'setup. The plan interpolates linearly only.')
+
+        return BeamformPlan(self, handle, no_samples, no_elements)
+    # bft_plan()
+
+    # -------------------------------------------------------------------------
+    def bft_stream(self, start_time, no_samples, no_elements, **kwarg):
+        '''Start the streaming beamforming of one acquisition.
+
+    The data is pushed in blocks as it arrives, and the output samples
+    are beamformed as soon as their input samples are there:
+
+        >>> stream = bft.bft_stream(0.0, 4096, 192)
+        >>> for block in blocks:
+        ...     beams = stream.push(block)
+
+    Only the samples which are still needed are kept. The lines are the
+    same as the ones from `bft_beamform` with the whole acquisition, and
+    the sums are in double precision. Lines with pixel based focusing
+    can not be streamed.
+
+    Parameters:
+    -----------
+    start_time: scalar, double
+        Time instance of the first sample of the acquisition
+
+    no_samples: scalar, integer
+        Number of samples per element in the whole acquisition
+
+    no_elements: scalar, integer
+        Number of elements (rows) in every block
+
+    elem, xmt: optional
+        Transmit element or transmit position, as for `bft_beamform`
+
+    Returns:
+    --------
+    stream: BeamformStream
+        '''
+        options = {
+            'elem': 65535,
+            'xmt': None,
+        }
+        options.update(kwarg)
+
+        elem = options['elem']
+        xmt = options['xmt']
+
+        if (elem < 65535) and (xmt is not None):
+            raise RuntimeError('Confusing options for beamforming procedure.')
+
+        if xmt is None:
+            xmt = ct.cast(0, PtrDouble)
+        else:
+            xmt = np.ascontiguousarray(xmt, dtype=np.float64)
+            assert xmt.size == 3
+            xmt = xmt.ctypes.data_as(PtrDouble)
+
+        handle = libbft.bft_ctx_stream(self.handle,
+                                       ct.c_uint32(no_samples),
+                                       ct.c_uint32(no_elements),
+                                       ct.c_double(start_time),
+                                       ct.c_uint32(elem),
+                                       xmt)
+        if not handle:
+            raise RuntimeError('Could not create a stream for the current '
+                               'setup. The stream interpolates linearly only.')
+
+        return BeamformStream(self, handle, no_samples, no_elements)
+    # bft_stream()
+
+    # -------------------------------------------------------------------------
+    def bft_pipeline(self, depth=2, method='bft_beamform', **kwarg):
+        '''Start beamforming a sequence of frames in a worker thread.
+
+    The frames are queued with `submit` and their beams are returned in
+    order by `get`, so that the transfer of the next frame overlaps with
+    the beamforming of the current one (see `BeamformPipeline`):
+
+        >>> with bft.bft_pipeline(depth=2) as pipe:
+        ...     pipe.submit(frame0, t0)
+        ...     for (frame, t) in frames:
+        ...         pipe.submit(frame, t)
+        ...         show(pipe.get())
+        ...     show(pipe.get())
+
+    Parameters:
+    -----------
+    depth: scalar, integer, optional
+        Maximal number of frames in flight: 2 for double and 3 for triple
+        buffering. `submit` raises RuntimeError if `depth` frames have not
+        been returned by `get`, so the example above needs `depth` >= 2.
+
+    method: string, optional
+        'bft_beamform' (default), 'bft_beamform_iq' or
+        'bft_beamform_bmode'.
+
+    kwarg: optional
+        Options of `method`, used for every frame, e.g. `elem`, `acc` or
+        `dtype`. The output buffers are managed by the pipeline.
+
+    Returns:
+    --------
+    pipeline: BeamformPipeline
+        '''
+        if method not in ['bft_beamform', 'bft_beamform_iq',
+                          'bft_beamform_bmode']:
+            raise RuntimeError('Unknown method "{0}"'.format(method))
+        if 'out' in kwarg:
+            raise RuntimeError('The pipeline manages the output buffers')
+
+        return BeamformPipeline(self, depth, method, kwarg)
+    # bft_pipeline()
+
+    # -------------------------------------------------------------------------
+    def bft_sum_images(self, image1, elem1, image2, elem2, Time, out=None):
+        '''Sum 2 low resolution images in 1 high resolution.
+
+    Parameters:
+    -----------
+    image1: array_like, double
+        Matrix with the RF data for the image.
+
+        >>> [no_lines, no_samples] = image1.shape
+
+    ele1: scalar, integer
+        Transmit element index, used to acquire `image1`
+
+    image2: array_like, double
+        Matrix with the RF data for the image. Same dimensions as `image1`
+
+    ele2: scalar, integer
+        Transmit element index used to acquire `image2`
+
+    time   -  The arrival time of the first samples. The two images
+                    must be aligned in time
+
+    out: ndarray, double, optional
+        C-contiguous array with the same shape as `image1`, in which the high
+        resolution image is stored.
+        '''
+        image1 = np.ascontiguousarray(image1, dtype=np.float64)
+        image2 = np.ascontiguousarray(image2, dtype=np.float64)
+
+        [no_lines, no_samples] = image1.shape
+        assert (no_lines, no_samples) == image2.shape
+
+        hires = out_array(out, (no_lines, no_samples))
+        libbft.bft_ctx_sum_images_out(self.handle,
+                                      hires.ctypes.data_as(PtrDouble),
+                                      image1.ctypes.data_as(PtrDouble),
+                                      ct.c_uint32(elem1),
+                                      image2.ctypes.data_as(PtrDouble),
+                                      ct.c_uint32(elem2),
+                                      ct.c_double(Time),
+                                      ct.c_uint32(no_samples))
+        return hires
+    # bft_sum_images()
+
+    # -------------------------------------------------------------------------
+    def bft_add_image(self, hires, lores, element, start_time):
+        '''  Add a low resolution to a high resolution image.
+
+    Parameters:
+    -----------
+
+    hires: array_like, double
+        High resolution RF image. One row per scan line
+
+    lores: array_like, double
+        Low resolution RF image. Same dimensions as `hires`
+
+        >>> assert hires.shape == lores.shape
+
+    element: scalar, integer
+        Element index, used to acquire the low resolution image
+
+    start_time: scalar, double,
+        Arrival time of the first sample of the RF lines.
+
+    Returns:
+    --------
+    hires - The high resolution image
+        '''
+        hires = np.array(hires)
+        lores = np.array(lores)
+
+        assert hires.ndim == 2
+        assert lores.shape == hires.shape
+        assert hires.dtype == lores.dtype == np.float64
+        (no_lines, no_samples) = hires.shape
+
+        libbft.bft_ctx_add_images(self.handle,
+                                  hires.ctypes.data_as(PtrDouble),
+                                  lores.ctypes.data_as(PtrDouble),
+                                  ct.c_uint32(no_samples),
+                                  ct.c_double(start_time),
+                                  ct.c_uint32(element)
+                                  )
+        return hires
+    # bft_add_image()
+
+    # -------------------------------------------------------------------------
+    def bft_set_filter_bank(self, coefs):
+        '''Set the filter bank used by `bft_delay_lines`, and by the
+    beamforming if `bft_interpolation` is 'filterbank'.
+
+    Parameters:
+    -----------
+    coefs: array_like[Nf,Ntaps], double
+        Coefficients of the filters. Filter number f is applied as a
+        convolution, y[m] = h[0]*x[m] + ... + h[Ntaps-1]*x[m-Ntaps+1], and
+        delays a signal by Ntaps/2 - 1 + (f + 0.5)/Nf samples, e.g.
+        h[k] = sinc(k - Ntaps/2 + 1 - (f + 0.5)/Nf) times a window
+        (src/examples/check_filter_bank.py).
+        '''
+        coefs = np.asarray(coefs, dtype=np.float64)
+        assert coefs.ndim == 2
+        (Nf, Ntaps) = coefs.shape
+        # The C library expects the coefficients column by column
+        coefs = np.ascontiguousarray(coefs.T)
+        libbft.bft_ctx_set_filter_bank(self.handle,
+                                       coefs.ctypes.data_as(PtrDouble),
+                                       ct.c_uint32(Nf),
+                                       ct.c_uint32(Ntaps))
+    # bft_set_filter_bank()
+
+    # -------------------------------------------------------------------------
+    def bft_delay_lines(self, src, times, delays, src_start_time,
+                        dest_start_time, dest_len=None, interp='linear',
+                        out=None):
+        '''Delay every line of an image, e.g. to compensate for motion.
+    Line l is delayed by delays[l][k] after times[l][k], and the lines are
+    delayed in parallel by the threads set with `bft_threads`.
+
+    Parameters:
+    -----------
+    src: array_like[L,N], double
+        Lines to delay, one per row.
+
+    times: array_like[L,K] or [K], double
+        Times after which the delays are valid. A vector is used for all
+        lines.
+
+    delays: array_like[L,K] or [K], double
+        Delays in seconds.
+
+    src_start_time: scalar, double
+        Time of the first sample of `src`.
+
+    dest_start_time: scalar, double
+        Time of the first sample of the output.
+
+    dest_len: scalar, integer, optional
+        Number of output samples per line. Default is N.
+
+    interp: 'linear' or 'filterbank'
+        Linear interpolation between the samples, or the filter bank set
+        with `bft_set_filter_bank`.
+
+    out: ndarray[L,dest_len], double, optional
+        C-contiguous array, in which the output is stored.
+
+    Returns:
+    --------
+    out - The delayed lines. The samples, which need input samples outside
+          `src`, are 0.
+        '''
+        if interp not in INTERPOLATIONS:
+            raise RuntimeError('interp must be one of {0}'.format(
+                sorted(INTERPOLATIONS.keys())))
+
+        src = np.ascontiguousarray(src, dtype=np.float64)
+        assert src.ndim == 2
+        (no_lines, src_len) = src.shape
+        delays = np.asarray(delays, dtype=np.float64)
+        no_delays = delays.shape[-1]
+        times = np.ascontiguousarray(
+            np.broadcast_to(np.asarray(times, dtype=np.float64),
+                            (no_lines, no_delays)))
+        delays = np.ascontiguousarray(
+            np.broadcast_to(delays, (no_lines, no_delays)))
+        if dest_len is None:
+            dest_len = src_len
+        out = out_array(out, (no_lines, int(dest_len)))
+
+        ok = libbft.bft_ctx_delay_lines(self.handle,
+                                        out.ctypes.data_as(PtrDouble),
+                                        src.ctypes.data_as(PtrDouble),
+                                        ct.c_uint32(no_lines),
+                                        ct.c_uint32(src_len),
+                                        times.ctypes.data_as(PtrDouble),
+                                        delays.ctypes.data_as(PtrDouble),
+                                        ct.c_uint32(no_delays),
+                                        ct.c_double(src_start_time),
+                                        ct.c_double(dest_start_time),
+                                        ct.c_uint32(dest_len),
+                                        ct.c_uint32(interp == 'linear'))
+        if not ok:
+            raise RuntimeError('Set the filter bank first.')
+        return out
+    # bft_delay_lines()
+# BftContext
+
+
+# ---------------------------------------------------------------------------
+class bft:
+
+    '''Class encapsulating all functions from the Beamforming Toolbox.
+The functions work on the default context of the toolbox, which is shared
+by the whole process. Use `BftContext` for independent beamformers.
+
+The user does not need to create an object of the class bft, and can call
+the functions directly.
+
+Allways start by calling `bft_init` first, which initializes memory and sets
+some default parameters
+
+    >>> from pybft import bft
+    >>> bft.bft_init()
+    >>> bft.bft_end()
+
+Note:
+All parameters and values are given in SI units.
+
+    '''
+    @staticmethod
+    def bft_init(suppress=False):
+        '''Initialize the BeamForming Toolbox. This command must be executed
+        first in order to set some parameters and allocate necessary memory.
+
+        Subsequent calls will result in clearing the memory.
+
+        Parameters:
+        -----------
+        suppress: boolean, scalar
+            A greeting message is displayed if False.
+        '''
+        libbft.bft_init(print_func, ct.c_uint32(suppress))
+    # bft_init()
+
+    # ------------------------------------------------------------------------
+    @staticmethod
+    def bft_end():
+        '''Release all resources, allocated by the beamforming toolbox.'''
+        libbft.bft_end()
+    # bft_end()
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def bft_free_mem(ptr):
+      "Release memory allocated by malloc() by the BFT DLL"
+      libbft.bft_free_mem(ptr)
+    # bft_free_mem()
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def bft_simd(level=3):
+        '''Select the vector instructions used by the beamforming kernels.
+        The best set supported by the processor is selected by `bft_init`,
+        or by the first beamforming if `bft_init` has not been called.
+
+        Parameters:
+        -----------
+        level: scalar, integer
+            0 - none (scalar code), 1 - SSE2, 2 - AVX2, 3 - AVX-512.
+            Levels above the one supported by the processor are lowered.
+
+        Returns:
+        --------
+        The selected level.
+
+        The vector code is used for samples of type float64 with a float64
+        accumulator. The channels are summed in the same order at all
+        levels, so the results do not depend on the level
+        (src/examples/check_simd.py). This order, in 8 partial sums, is
+        also used at level 0, so the images differ in the last bits from
+        those of versions without vector code, which added the channels
+        one after another.
+        '''
+        return libbft.bft_simd(ct.c_uint32(level))
+    # bft_simd()
+
+
+# All other functions of `bft` are those of the default context
+_default = BftContext(default=True)
+for _name in dir(BftContext):
+    if _name.startswith('bft_'):
+        setattr(bft, _name, staticmethod(getattr(_default, _name)))
+# bft . . . . . . . . . .  . . . . . . . . . . . . . . . . . . . . . . . . . .
+
+
+# ---------------------------------------------------------------------------
+class XdcRef(int):
+
+    '''Transducer made by call number `index` of a `BftSetup`. It is the
+handle of the transducer in the context of the setup, and stands for the
+transducer made by the same call when the setup is replayed.'''
+
+    def __new__(cls, handle, index):
+        self = int.__new__(cls, handle)
+        self.index = index
+        return self
+
+    def __getnewargs__(self):
+        return (int(self), self.index)
+# XdcRef
+
+
+# ---------------------------------------------------------------------------
+class BftSetup:
+
+    '''Beamforming setup which can be replayed in other processes.
+
+The `bft_*` functions of `BftContext` which set up the beamforming
+(parameters, transducers, focusing, apodization, filter bank) are called
+through the setup. They are applied to the context of the setup, so errors
+show at once, and are recorded in `calls`. The arrays are recorded as
+copies, so changing them later does not change the setup. The transducers
+are returned as `XdcRef`, and are recorded as references to the calls
+which made them.
+
+    >>> setup = BftSetup()
+    >>> setup.bft_param('fs', 40e6)
+    >>> xdc = setup.bft_linear_array(192, 0.2e-3)
+    >>> setup.bft_dynamic_focus(xdc, 0, 0)
+    >>> ctx = BftContext()
+    >>> setup.replay(ctx)
+    '''
+
+    # Functions which make transducers, whose handles differ per process
+    XDC_FUNCS = ['bft_xdc', 'bft_linear_array', 'bft_convex_array']
+
+    # Functions which beamform or process data, and are not recorded
+    DATA_FUNCS = ['bft_plan', 'bft_stream', 'bft_pipeline',
+                  'bft_scan_convert', 'bft_sum_images', 'bft_add_image',
+                  'bft_delay_lines']
+
+    def __init__(self):
+        self.context = BftContext()
+        self.calls = []
+
+    def __getattr__(self, name):
+        if (not name.startswith('bft_') or name.startswith('bft_beamform')
+                or name in self.DATA_FUNCS or not hasattr(BftContext, name)):
+            raise AttributeError(name)
+        func = getattr(self.context, name)
+
+        def record(*arg, **kwarg):
+            result = func(*arg, **kwarg)
+            self.calls.append((name, [self._copy(a) for a in arg],
+                               dict((k, self._copy(v))
+                                    for (k, v) in kwarg.items())))
+            if name in self.XDC_FUNCS:
+                result = XdcRef(result, len(self.calls) - 1)
+            return result
+        return record
+
+    @staticmethod
+    def _copy(value):
+        if isinstance(value, np.ndarray):
+            return np.array(value, copy=True)
+        if isinstance(value, (list, tuple)):
+            return copy.deepcopy(value)
+        return value
+
+    def replay(self, context):
+        '''Make the same setup in `context`'''
+        replay_calls(self.calls, context)
+
+    def free(self):
+        '''Release the context of the setup'''
+        self.context.free()
+# BftSetup
+
+
+def replay_calls(calls, context):
+    '''Apply the calls recorded by a `BftSetup` to `context`'''
+    results = {}
+
+    def value(v):
+        return results[v.index] if isinstance(v, XdcRef) else v
+
+    for (n, (name, arg, kwarg)) in enumerate(calls):
+        results[n] = getattr(context, name)(
+            *[value(a) for a in arg],
+            **dict((k, value(v)) for (k, v) in kwarg.items()))
+# replay_calls()
+
+
+def batch_worker(worker_no, calls, method, kwarg, inputs, outputs, tasks,
+                 results):
+    '''Process of a `BatchBeamformer`. Beamforms the frames whose numbers
+    come from `tasks`, until it gets None, and reports the number of
+    frames and the time spent beamforming them to `results`.'''
+    shm_in = shm_out = data = out = None
+    ctx = None
+    no_frames = 0
+    busy = 0.0
+    error = None
+    try:
+        bft.bft_init(True)
+        ctx = BftContext()
+        replay_calls(calls, ctx)
+        func = getattr(ctx, method)
+
+        shm_in = shared_memory.SharedMemory(name=inputs[0])
+        shm_out = shared_memory.SharedMemory(name=outputs[0])
+        data = np.ndarray(inputs[1], dtype=inputs[2], buffer=shm_in.buf)
+        out = np.ndarray(outputs[1], dtype=outputs[2], buffer=shm_out.buf)
+
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            (n, start_time) = task
+            t0 = timer()
+            func(data[n], start_time, out=out[n], **kwarg)
+            busy += timer() - t0
+            no_frames += 1
+    except Exception as e:
+        error = '{0}: {1}'.format(type(e).__name__, e)
+    finally:
+        data = out = None
+        for shm in [shm_in, shm_out]:
+            if shm is not None:
+                shm.close()
+        if ctx is not None:
+            ctx.free()
+        results.put((worker_no, no_frames, busy, error))
+# batch_worker()
+
+
+# ---------------------------------------------------------------------------
+class BatchBeamformer:
+
+    '''Beamforming of many frames by a pool of worker processes.
+
+Every worker has its own instance of the library, initialized with
+`bft_init`, and replays the `BftSetup`. The frames and the beams are
+passed through shared memory (`multiprocessing.shared_memory`), and the
+workers only receive the numbers of the frames to beamform.
+
+    >>> batch = BatchBeamformer(setup, no_workers=32)
+    >>> beams = batch.run(frames, times)
+    >>> for s in batch.stats:
+    ...     print(s['worker'], s['frames_per_second'])
+
+The workers are started with the 'spawn' method by default, so the main
+module of a script must be guarded by `if __name__ == '__main__':`.
+    '''
+
+    # Functions which beamform one frame (or one acquisition) into `out`
+    METHODS = ['bft_beamform', 'bft_beamform_iq', 'bft_beamform_bmode',
+               'bft_beamform_sta', 'bft_beamform_waves']
+
+    def __init__(self, setup, no_workers=None, method='bft_beamform',
+                 start_method='spawn', **kwarg):
+        '''
+    Parameters:
+    -----------
+    setup: BftSetup
+        The focusing and apodization of all frames
+
+    no_workers: scalar, integer, optional
+        Number of processes. The number of CPUs by default.
+
+    method: string, optional
+        Function of `BftContext` which beamforms a frame, one of
+        `METHODS`.
+
+    start_method: string, optional
+        How to start the processes, see `multiprocessing.get_context`.
+
+    kwarg: optional
+        Options of `method`, used for every frame, e.g. `elem` or
+        `angles`. The output buffers are managed by the workers.
+        '''
+        if shared_memory is None:
+            raise RuntimeError('The batch beamformer needs '
+                               'multiprocessing.shared_memory')
+        if method not in self.METHODS:
+            raise RuntimeError('Unknown method "{0}"'.format(method))
+        if 'out' in kwarg:
+            raise RuntimeError('The workers manage the output buffers')
+
+        self.setup = setup
+        self.no_workers = no_workers if no_workers else mp.cpu_count()
+        self.method = method
+        self.start_method = start_method
+        self.kwarg = kwarg
+        self.stats = []
+
+    def result_type(self, no_samples):
+        '''Shape and type of the result of `method` for one frame with
+    `no_samples` samples per channel.'''
+        no_beams = ct.c_uint32(0)
+        no_out_samples = ct.c_uint32(0)
+        libbft.bft_ctx_beamform_size(self.setup.context.handle,
+                                     ct.byref(no_beams),
+                                     ct.byref(no_out_samples),
+                                     ct.c_uint32(no_samples))
+        no_beams = int(no_beams.value)
+        no_out_samples = int(no_out_samples.value)
+
+        if self.method == 'bft_beamform':
+            options = {'out_start': 0, 'out_count': None}
+            options.update(self.kwarg)
+            (_, out_count) = out_window(options, no_out_samples)
+            return ((no_beams, out_count), np.dtype(np.float64))
+        if self.method == 'bft_beamform_iq':
+            return ((no_beams, no_out_samples), np.dtype(np.complex128))
+        if self.method == 'bft_beamform_bmode':
+            dtype = np.dtype(self.kwarg.get('dtype', np.uint8))
+            if dtype not in DISPLAY_TYPES:
+                raise RuntimeError('dtype must be uint8 or float32')
+            return ((no_beams, no_out_samples), dtype)
+        return ((no_beams, no_samples), np.dtype(np.float64))
+
+    def run(self, frames, times, out=None):
+        '''Beamform the frames.
+
+    Parameters:
+    -----------
+    frames: array_like
+        Frames stacked along the first axis. Every frame is data for
+        `method`.
+
+    times: array_like or scalar, double
+        Time of the first sample of every frame
+
+    out: ndarray, optional
+        C-contiguous array for the results, with the shape
+        (number_of_frames,) + shape of the result of `method`.
+
+    Returns:
+    --------
+    beams: ndarray
+        The results of all frames. This is `out`, if it was given.
+
+    The time spent by every worker is in `stats`, one dictionary per
+    worker with the keys 'worker', 'frames', 'seconds' and
+    'frames_per_second'.
+        '''
+        frames = np.asarray(frames)
+        if frames.dtype not in SAMPLE_TYPES and \
+                frames.dtype not in IQ_TYPES:
+            frames = frames.astype(np.complex128 if np.iscomplexobj(frames)
+                                   else np.float64)
+        frames = np.ascontiguousarray(frames)
+        no_frames = frames.shape[0]
+        times = np.broadcast_to(np.asarray(times, dtype=np.float64),
+                                (no_frames,))
+
+        (shape, dtype) = self.result_type(frames.shape[-1])
+        shape = (no_frames,) + shape
+        if out is None:
+            out = np.empty(shape, dtype=dtype)
+        elif (not isinstance(out, np.ndarray) or out.shape != shape
+              or out.dtype != dtype or not out.flags.c_contiguous):
+            raise RuntimeError('out must be a C-contiguous array of {0} '
+                               'with shape {1}'.format(dtype.name, shape))
+
+        ctx = mp.get_context(self.start_method)
+        tasks = ctx.Queue()
+        results = ctx.Queue()
+        shm_in = shared_memory.SharedMemory(create=True,
+                                            size=max(1, frames.nbytes))
+        shm_out = shared_memory.SharedMemory(create=True,
+                                             size=max(1, out.nbytes))
+        try:
+            np.ndarray(frames.shape, frames.dtype, shm_in.buf)[...] = frames
+            inputs = (shm_in.name, frames.shape, frames.dtype.str)
+            outputs = (shm_out.name, shape, out.dtype.str)
+
+            workers = [ctx.Process(target=batch_worker,
+                                   args=(w, self.setup.calls, self.method,
+                                         self.kwarg, inputs, outputs, tasks,
+                                         results))
+                       for w in range(self.no_workers)]
+            for p in workers:
+                p.start()
+            for n in range(no_frames):
+                tasks.put((n, float(times[n])))
+            for p in workers:
+                tasks.put(None)
+
+            reports = []
+            while len(reports) < len(workers):
+                try:
+                    reports.append(results.get(timeout=1.0))
+                except queue.Empty:
+                    if not any(p.is_alive() for p in workers):
+                        break
+            for p in workers:
+                p.join()
+
+            errors = [r[3] for r in reports if r[3] is not None]
+            if len(reports) < len(workers):
+                errors.append('a worker exited without a report')
+            if errors or sum(r[1] for r in reports) != no_frames:
+                raise RuntimeError('Batch beamforming failed: {0}'.format(
+                    '; '.join(errors) if errors else 'frames are missing'))
+
+            out[...] = np.ndarray(shape, out.dtype, shm_out.buf)
+        finally:
+            for shm in [shm_in, shm_out]:
+                shm.close()
+                shm.unlink()
+
+        self.stats = [{'worker': w,
+                       'frames': n,
+                       'seconds': busy,
+                       'frames_per_second': n / busy if busy > 0 else 0.0}
+                      for (w, n, busy, _) in sorted(reports)]
+        return out
+# BatchBeamformer
 
 if __name__ == "__main__":
     from pylab import *